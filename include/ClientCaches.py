@@ -10,9 +10,12 @@ import HydrusFileHandling
 import HydrusPaths
 import HydrusSerialisable
 import HydrusThreading
+import itertools
 import json
+import mmap
 import os
 import random
+import struct
 import threading
 import time
 import wx
@@ -26,7 +29,7 @@ import traceback
 import weakref
 
 # important thing here, and reason why it is recursive, is because we want to preserve the parent-grandparent interleaving
-def BuildServiceKeysToChildrenToParents( service_keys_to_simple_children_to_parents ):
+def BuildChildrenToParents( simple_children_to_parents ):
     
     def AddParents( simple_children_to_parents, children_to_parents, child, parents ):
         
@@ -46,16 +49,37 @@ def BuildServiceKeysToChildrenToParents( service_keys_to_simple_children_to_pare
             
         
     
+    children_to_parents = HydrusData.default_dict_list()
+    
+    for ( child, parents ) in simple_children_to_parents.items():
+        
+        AddParents( simple_children_to_parents, children_to_parents, child, parents )
+        
+    
+    return children_to_parents
+    
+def BuildChildrenToParentsFromGroupsOfPairs( groups_of_pairs ):
+    
+    pairs = set()
+    
+    for group_of_pairs in groups_of_pairs:
+        
+        pairs.update( group_of_pairs )
+        
+    
+    # sorted so loops are broken the same way whether we do the whole graph or just a bit of it
+    
+    simple_children_to_parents = BuildSimpleChildrenToParents( sorted( pairs ) )
+    
+    return BuildChildrenToParents( simple_children_to_parents )
+    
+def BuildServiceKeysToChildrenToParents( service_keys_to_simple_children_to_parents ):
+    
     service_keys_to_children_to_parents = collections.defaultdict( HydrusData.default_dict_list )
     
     for ( service_key, simple_children_to_parents ) in service_keys_to_simple_children_to_parents.items():
         
-        children_to_parents = service_keys_to_children_to_parents[ service_key ]
-        
-        for ( child, parents ) in simple_children_to_parents.items():
-            
-            AddParents( simple_children_to_parents, children_to_parents, child, parents )
-            
+        service_keys_to_children_to_parents[ service_key ] = BuildChildrenToParents( simple_children_to_parents )
         
     
     return service_keys_to_children_to_parents
@@ -256,6 +280,10 @@ class ClientFilesManager( object ):
         
         self._lock = threading.Lock()
         
+        self._import_condition = threading.Condition()
+        self._pending_import_entries = []
+        self._import_write_in_progress = False
+        
         self._prefixes_to_locations = {}
         
         self._bad_error_occurred = False
@@ -264,6 +292,20 @@ class ClientFilesManager( object ):
         self._Reinit()
         
     
+    def _AddImportedFile( self, file_import_job ):
+        
+        ( temp_path, thumbnail ) = file_import_job.GetTempPathAndThumbnail()
+        
+        hash = file_import_job.GetHash()
+        
+        self.LocklessAddFile( hash, file_import_job.GetMime(), temp_path )
+        
+        if thumbnail is not None:
+            
+            self.LocklessAddFullSizeThumbnail( hash, thumbnail )
+            
+        
+    
     def _GenerateExpectedFilePath( self, hash, mime ):
         
         hash_encoded = hash.encode( 'hex' )
@@ -569,6 +611,51 @@ class ClientFilesManager( object ):
         return None
         
     
+    def _ImportFileImportJobs( self, file_import_jobs ):
+        
+        # whichever importer finds no import write going on writes everything that is waiting, so busy importers share db jobs
+        
+        entries = [ [ file_import_job, None, None ] for file_import_job in file_import_jobs ]
+        
+        with self._import_condition:
+            
+            self._pending_import_entries.extend( entries )
+            
+            while True in ( result is None and exception is None for ( file_import_job, result, exception ) in entries ):
+                
+                if self._import_write_in_progress:
+                    
+                    self._import_condition.wait()
+                    
+                    continue
+                    
+                
+                self._import_write_in_progress = True
+                
+                batch = self._pending_import_entries
+                
+                self._pending_import_entries = []
+                
+                self._import_condition.release()
+                
+                try:
+                    
+                    self._WriteImportEntries( batch )
+                    
+                finally:
+                    
+                    self._import_condition.acquire()
+                    
+                    self._import_write_in_progress = False
+                    
+                    self._import_condition.notify_all()
+                    
+                
+            
+        
+        return [ ( result, exception ) for ( file_import_job, result, exception ) in entries ]
+        
+    
     def _IterateAllFilePaths( self ):
         
         for ( prefix, location ) in self._prefixes_to_locations.items():
@@ -724,6 +811,56 @@ class ClientFilesManager( object ):
             
         
     
+    def _WriteImportEntries( self, entries ):
+        
+        with self._lock:
+            
+            file_import_jobs = [ file_import_job for ( file_import_job, result, exception ) in entries ]
+            
+            try:
+                
+                for file_import_job in file_import_jobs:
+                    
+                    self._AddImportedFile( file_import_job )
+                    
+                
+                results = self._controller.WriteSynchronous( 'import_files', file_import_jobs )
+                
+                for ( entry, result ) in zip( entries, results ):
+                    
+                    entry[1] = result
+                    
+                
+            except Exception as e:
+                
+                if len( entries ) == 1:
+                    
+                    entries[0][2] = e
+                    
+                    return
+                    
+                
+                # the failed job was rolled back, so go again one at a time, so one bad file does not fail the rest
+                
+                for entry in entries:
+                    
+                    file_import_job = entry[0]
+                    
+                    try:
+                        
+                        self._AddImportedFile( file_import_job )
+                        
+                        ( entry[1], ) = self._controller.WriteSynchronous( 'import_files', [ file_import_job ] )
+                        
+                    except Exception as e:
+                        
+                        entry[2] = e
+                        
+                    
+                
+            
+        
+    
     def AllLocationsAreDefault( self ):
         
         with self._lock:
@@ -1060,6 +1197,8 @@ class ClientFilesManager( object ):
             big_pauser.Pause()
             
         
+        self._controller.pub( 'clear_thumbnails', set( hashes ) )
+        
     
     def GetFilePath( self, hash, mime = None, check_file_exists = True ):
         
@@ -1089,22 +1228,15 @@ class ClientFilesManager( object ):
             
             file_import_job.CheckIsGoodToImport()
             
-            ( temp_path, thumbnail ) = file_import_job.GetTempPathAndThumbnail()
-            
-            mime = file_import_job.GetMime()
+            [ ( result, exception ) ] = self._ImportFileImportJobs( [ file_import_job ] )
             
-            with self._lock:
-                
-                self.LocklessAddFile( hash, mime, temp_path )
-                
-                if thumbnail is not None:
-                    
-                    self.LocklessAddFullSizeThumbnail( hash, thumbnail )
-                    
+            if exception is not None:
                 
-                ( import_status, note ) = self._controller.WriteSynchronous( 'import_file', file_import_job )
+                raise exception
                 
             
+            ( import_status, note ) = result
+            
         else:
             
             import_status = pre_import_status
@@ -1115,6 +1247,14 @@ class ClientFilesManager( object ):
         return ( import_status, hash, note )
         
     
+    def ImportFiles( self, file_import_jobs ):
+        
+        # these jobs are new to the db and have already had their info generated and checked
+        # comes back with a ( result, exception ) for each job, where result is ( import_status, note )
+        
+        return self._ImportFileImportJobs( file_import_jobs )
+        
+    
     def LocklessGetFilePath( self, hash, mime = None, check_file_exists = True ):
         
         if HG.file_report_mode:
@@ -1321,6 +1461,8 @@ class ClientFilesManager( object ):
             
             num_broken = 0
             
+            regenerated_hashes = set()
+            
             for ( i, path ) in enumerate( self._IterateAllFilePaths() ):
                 
                 try:
@@ -1335,6 +1477,8 @@ class ClientFilesManager( object ):
                             
                             HydrusData.Print( job_key.ToString() )
                             
+                            self._controller.pub( 'clear_thumbnails', regenerated_hashes )
+                            
                             return
                             
                         
@@ -1367,6 +1511,8 @@ class ClientFilesManager( object ):
                         
                         self._GenerateFullSizeThumbnail( hash, mime )
                         
+                        regenerated_hashes.add( hash )
+                        
                         thumbnail_resized_path = self._GenerateExpectedResizedThumbnailPath( hash )
                         
                         if os.path.exists( thumbnail_resized_path ):
@@ -1397,21 +1543,41 @@ class ClientFilesManager( object ):
             
             job_key.Finish()
             
+            self._controller.pub( 'clear_thumbnails', regenerated_hashes )
+            
         
     
 class DataCache( object ):
     
-    def __init__( self, controller, cache_size, timeout = 1200 ):
+    def __init__( self, controller, cache_size, timeout = 1200, policy = CC.DATA_CACHE_POLICY_LRU ):
         
         self._controller = controller
         self._cache_size = cache_size
         self._timeout = timeout
         
+        if policy == CC.DATA_CACHE_POLICY_SIZE_WEIGHTED_LRU:
+            
+            self._policy = DataCachePolicySizeWeightedLRU( cache_size )
+            
+        elif policy == CC.DATA_CACHE_POLICY_2Q:
+            
+            self._policy = DataCachePolicy2Q( cache_size )
+            
+        else:
+            
+            self._policy = DataCachePolicyLRU( cache_size )
+            
+        
         self._keys_to_data = {}
-        self._keys_fifo = collections.OrderedDict()
+        self._keys_to_footprints = {}
         
         self._total_estimated_memory_footprint = 0
         
+        self._num_hits = 0
+        self._num_misses = 0
+        self._num_evictions = 0
+        self._num_timeouts = 0
+        
         self._lock = threading.Lock()
         
         self._controller.sub( self, 'MaintainCache', 'memory_maintenance_pulse' )
@@ -1424,34 +1590,24 @@ class DataCache( object ):
             return
             
         
-        deletee_data = self._keys_to_data[ key ]
-        
         del self._keys_to_data[ key ]
         
-        self._RecalcMemoryUsage()
-        
-    
-    def _DeleteItem( self ):
+        self._total_estimated_memory_footprint -= self._keys_to_footprints[ key ]
         
-        ( deletee_key, last_access_time ) = self._keys_fifo.popitem( last = False )
+        del self._keys_to_footprints[ key ]
         
-        self._Delete( deletee_key )
+        self._policy.Remove( key )
         
     
-    def _RecalcMemoryUsage( self ):
+    def _DeleteItem( self ):
         
-        self._total_estimated_memory_footprint = sum( ( data.GetEstimatedMemoryFootprint() for data in self._keys_to_data.values() ) )
+        deletee_key = self._policy.GetVictim()
         
-    
-    def _TouchKey( self, key ):
+        self._policy.Evict( deletee_key )
         
-        # have to delete first, rather than overwriting, so the ordereddict updates its internal order
-        if key in self._keys_fifo:
-            
-            del self._keys_fifo[ key ]
-            
+        self._Delete( deletee_key )
         
-        self._keys_fifo[ key ] = HydrusData.GetNow()
+        self._num_evictions += 1
         
     
     def Clear( self ):
@@ -1459,7 +1615,9 @@ class DataCache( object ):
         with self._lock:
             
             self._keys_to_data = {}
-            self._keys_fifo = collections.OrderedDict()
+            self._keys_to_footprints = {}
+            
+            self._policy.Clear()
             
             self._total_estimated_memory_footprint = 0
             
@@ -1476,11 +1634,15 @@ class DataCache( object ):
                     self._DeleteItem()
                     
                 
+                # we record the footprint now so we can take it off again without asking every item each time
+                footprint = data.GetEstimatedMemoryFootprint()
+                
                 self._keys_to_data[ key ] = data
+                self._keys_to_footprints[ key ] = footprint
                 
-                self._TouchKey( key )
+                self._total_estimated_memory_footprint += footprint
                 
-                self._RecalcMemoryUsage()
+                self._policy.Add( key, footprint )
                 
             
         
@@ -1499,10 +1661,14 @@ class DataCache( object ):
             
             if key not in self._keys_to_data:
                 
+                self._num_misses += 1
+                
                 raise Exception( 'Cache error! Looking for ' + HydrusData.ToUnicode( key ) + ', but it was missing.' )
                 
             
-            self._TouchKey( key )
+            self._num_hits += 1
+            
+            self._policy.Touch( key )
             
             return self._keys_to_data[ key ]
             
@@ -1514,17 +1680,29 @@ class DataCache( object ):
             
             if key in self._keys_to_data:
                 
-                self._TouchKey( key )
+                self._num_hits += 1
+                
+                self._policy.Touch( key )
                 
                 return self._keys_to_data[ key ]
                 
             else:
                 
+                self._num_misses += 1
+                
                 return None
                 
             
         
     
+    def GetStats( self ):
+        
+        with self._lock:
+            
+            return ( len( self._keys_to_data ), self._total_estimated_memory_footprint, self._cache_size, self._num_hits, self._num_misses, self._num_evictions, self._num_timeouts )
+            
+        
+    
     def HasData( self, key ):
         
         with self._lock:
@@ -1539,128 +1717,402 @@ class DataCache( object ):
             
             while True:
                 
-                if len( self._keys_fifo ) == 0:
+                key = self._policy.GetStaleKey( self._timeout )
+                
+                if key is None:
                     
                     break
                     
-                else:
-                    
-                    ( key, last_access_time ) = next( self._keys_fifo.iteritems() )
-                    
-                    if HydrusData.TimeHasPassed( last_access_time + self._timeout ):
-                        
-                        self._DeleteItem()
-                        
-                    else:
-                        
-                        break
-                        
-                    
+                
+                self._Delete( key )
+                
+                self._num_timeouts += 1
                 
             
         
     
-class FileViewingStatsManager( object ):
+class DataCachePolicy2Q( object ):
     
-    def __init__( self, controller ):
+    CORRELATED_REFERENCE_PERIOD = 5
+    
+    def __init__( self, cache_size ):
         
-        self._controller = controller
+        self._cache_size = cache_size
         
-        self._lock = threading.Lock()
+        # new items sit in a fifo probation area and are only promoted to the main lru if they are asked for again later
+        # a long scroll through a huge page will churn the probation area but leave the main lru alone
         
-        self._pending_updates = {}
+        self._probation_size = cache_size // 4
+        self._ghost_size = cache_size // 2
         
-        self._last_update = HydrusData.GetNow()
+        self._probation_keys_fifo = collections.OrderedDict()
+        self._probation_footprint = 0
         
-        self._my_flush_job = self._controller.CallRepeating( 5, 60, self.REPEATINGFlush )
+        self._ghost_keys_fifo = collections.OrderedDict()
+        self._ghost_footprint = 0
         
-    
-    def REPEATINGFlush( self ):
+        self._main_keys_fifo = collections.OrderedDict()
         
-        self.Flush()
+        self._keys_to_footprints = {}
         
     
-    def Flush( self ):
+    def Add( self, key, footprint ):
         
-        with self._lock:
+        self._keys_to_footprints[ key ] = footprint
+        
+        now = HydrusData.GetNow()
+        
+        if key in self._ghost_keys_fifo:
             
-            if len( self._pending_updates ) > 0:
-                
-                content_updates = []
-                
-                for ( hash, ( preview_views_delta, preview_viewtime_delta, media_views_delta, media_viewtime_delta ) ) in self._pending_updates.items():
-                    
-                    row = ( hash, preview_views_delta, preview_viewtime_delta, media_views_delta, media_viewtime_delta )
-                    
-                    content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILE_VIEWING_STATS, HC.CONTENT_UPDATE_ADD, row )
-                    
-                    content_updates.append( content_update )
-                    
-                
-                service_keys_to_content_updates = { CC.COMBINED_LOCAL_FILE_SERVICE_KEY : content_updates }
-                
-                # non-synchronous
-                self._controller.Write( 'content_updates', service_keys_to_content_updates, do_pubsubs = False )
-                
-                self._pending_updates = {}
-                
+            # this was dropped from probation recently and is wanted again, so it deserves a proper place
+            
+            self._ghost_footprint -= self._ghost_keys_fifo[ key ]
+            
+            del self._ghost_keys_fifo[ key ]
+            
+            self._main_keys_fifo[ key ] = now
+            
+        else:
+            
+            self._probation_keys_fifo[ key ] = ( now, now )
+            
+            self._probation_footprint += footprint
             
         
     
-    def Update( self, viewtype, hash, views_delta, viewtime_delta ):
+    def Clear( self ):
         
-        if not HG.client_controller.new_options.GetBoolean( 'file_viewing_statistics_active' ):
+        self._probation_keys_fifo = collections.OrderedDict()
+        self._probation_footprint = 0
+        
+        self._ghost_keys_fifo = collections.OrderedDict()
+        self._ghost_footprint = 0
+        
+        self._main_keys_fifo = collections.OrderedDict()
+        
+        self._keys_to_footprints = {}
+        
+    
+    def Evict( self, key ):
+        
+        if key in self._probation_keys_fifo:
             
-            return
+            footprint = self._keys_to_footprints[ key ]
             
-        
-        with self._lock:
+            self._ghost_keys_fifo[ key ] = footprint
             
-            preview_views_delta = 0
-            preview_viewtime_delta = 0
-            media_views_delta = 0
-            media_viewtime_delta = 0
+            self._ghost_footprint += footprint
             
-            if viewtype == 'preview':
-                
-                preview_views_delta = views_delta
-                preview_viewtime_delta = viewtime_delta
+            while self._ghost_footprint > self._ghost_size and len( self._ghost_keys_fifo ) > 0:
                 
-            elif viewtype == 'media':
+                ( ghost_key, ghost_footprint ) = self._ghost_keys_fifo.popitem( last = False )
                 
-                media_views_delta = views_delta
-                media_viewtime_delta = viewtime_delta
+                self._ghost_footprint -= ghost_footprint
                 
             
-            if hash not in self._pending_updates:
-                
-                self._pending_updates[ hash ] = ( preview_views_delta, preview_viewtime_delta, media_views_delta, media_viewtime_delta )
+        
+    
+    def GetStaleKey( self, timeout ):
+        
+        if len( self._probation_keys_fifo ) > 0:
+            
+            ( key, ( insert_time, last_access_time ) ) = next( self._probation_keys_fifo.iteritems() )
+            
+            if HydrusData.TimeHasPassed( last_access_time + timeout ):
                 
-            else:
+                return key
                 
-                ( existing_preview_views_delta, existing_preview_viewtime_delta, existing_media_views_delta, existing_media_viewtime_delta ) = self._pending_updates[ hash ]
+            
+        
+        if len( self._main_keys_fifo ) > 0:
+            
+            ( key, last_access_time ) = next( self._main_keys_fifo.iteritems() )
+            
+            if HydrusData.TimeHasPassed( last_access_time + timeout ):
                 
-                self._pending_updates[ hash ] = ( existing_preview_views_delta + preview_views_delta, existing_preview_viewtime_delta + preview_viewtime_delta, existing_media_views_delta + media_views_delta, existing_media_viewtime_delta + media_viewtime_delta )
+                return key
                 
             
         
-        row = ( hash, preview_views_delta, preview_viewtime_delta, media_views_delta, media_viewtime_delta )
-        
-        content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILE_VIEWING_STATS, HC.CONTENT_UPDATE_ADD, row )
-        
-        service_keys_to_content_updates = { CC.COMBINED_LOCAL_FILE_SERVICE_KEY : [ content_update ] }
-        
-        HG.client_controller.pub( 'content_updates_data', service_keys_to_content_updates )
-        HG.client_controller.pub( 'content_updates_gui', service_keys_to_content_updates )
+        return None
         
-
-class LocalBooruCache( object ):
     
-    def __init__( self, controller ):
+    def GetVictim( self ):
         
-        self._controller = controller
+        if len( self._main_keys_fifo ) == 0 or ( self._probation_footprint > self._probation_size and len( self._probation_keys_fifo ) > 0 ):
+            
+            return next( iter( self._probation_keys_fifo ) )
+            
+        else:
+            
+            return next( iter( self._main_keys_fifo ) )
+            
         
-        self._lock = threading.Lock()
+    
+    def Remove( self, key ):
+        
+        if key in self._probation_keys_fifo:
+            
+            del self._probation_keys_fifo[ key ]
+            
+            self._probation_footprint -= self._keys_to_footprints[ key ]
+            
+        elif key in self._main_keys_fifo:
+            
+            del self._main_keys_fifo[ key ]
+            
+        
+        if key in self._keys_to_footprints:
+            
+            del self._keys_to_footprints[ key ]
+            
+        
+    
+    def Touch( self, key ):
+        
+        now = HydrusData.GetNow()
+        
+        if key in self._main_keys_fifo:
+            
+            del self._main_keys_fifo[ key ]
+            
+            self._main_keys_fifo[ key ] = now
+            
+        elif key in self._probation_keys_fifo:
+            
+            ( insert_time, last_access_time ) = self._probation_keys_fifo[ key ]
+            
+            # the draws that come right after an item is loaded are all part of the same use, so they do not count
+            
+            if HydrusData.TimeHasPassed( insert_time + self.CORRELATED_REFERENCE_PERIOD ):
+                
+                del self._probation_keys_fifo[ key ]
+                
+                self._probation_footprint -= self._keys_to_footprints[ key ]
+                
+                self._main_keys_fifo[ key ] = now
+                
+            else:
+                
+                # probation is fifo, so we keep our place
+                
+                self._probation_keys_fifo[ key ] = ( insert_time, now )
+                
+            
+        
+    
+class DataCachePolicyLRU( object ):
+    
+    def __init__( self, cache_size ):
+        
+        self._cache_size = cache_size
+        
+        self._keys_fifo = collections.OrderedDict()
+        
+    
+    def Add( self, key, footprint ):
+        
+        self.Touch( key )
+        
+    
+    def Clear( self ):
+        
+        self._keys_fifo = collections.OrderedDict()
+        
+    
+    def Evict( self, key ):
+        
+        pass
+        
+    
+    def GetStaleKey( self, timeout ):
+        
+        if len( self._keys_fifo ) > 0:
+            
+            ( key, last_access_time ) = next( self._keys_fifo.iteritems() )
+            
+            if HydrusData.TimeHasPassed( last_access_time + timeout ):
+                
+                return key
+                
+            
+        
+        return None
+        
+    
+    def GetVictim( self ):
+        
+        return next( iter( self._keys_fifo ) )
+        
+    
+    def Remove( self, key ):
+        
+        if key in self._keys_fifo:
+            
+            del self._keys_fifo[ key ]
+            
+        
+    
+    def Touch( self, key ):
+        
+        # have to delete first, rather than overwriting, so the ordereddict updates its internal order
+        if key in self._keys_fifo:
+            
+            del self._keys_fifo[ key ]
+            
+        
+        self._keys_fifo[ key ] = HydrusData.GetNow()
+        
+    
+class DataCachePolicySizeWeightedLRU( DataCachePolicyLRU ):
+    
+    NUM_CANDIDATES = 8
+    
+    def __init__( self, cache_size ):
+        
+        DataCachePolicyLRU.__init__( self, cache_size )
+        
+        self._keys_to_footprints = {}
+        
+    
+    def Add( self, key, footprint ):
+        
+        self._keys_to_footprints[ key ] = footprint
+        
+        DataCachePolicyLRU.Add( self, key, footprint )
+        
+    
+    def Clear( self ):
+        
+        DataCachePolicyLRU.Clear( self )
+        
+        self._keys_to_footprints = {}
+        
+    
+    def GetVictim( self ):
+        
+        # of the few oldest items, drop the one that frees the most memory for the least recency
+        
+        now = HydrusData.GetNow()
+        
+        candidates = itertools.islice( self._keys_fifo.iteritems(), self.NUM_CANDIDATES )
+        
+        ( score, key ) = max( ( ( self._keys_to_footprints[ key ] * ( now - last_access_time + 1 ), key ) for ( key, last_access_time ) in candidates ) )
+        
+        return key
+        
+    
+    def Remove( self, key ):
+        
+        DataCachePolicyLRU.Remove( self, key )
+        
+        if key in self._keys_to_footprints:
+            
+            del self._keys_to_footprints[ key ]
+            
+        
+    
+class FileViewingStatsManager( object ):
+    
+    def __init__( self, controller ):
+        
+        self._controller = controller
+        
+        self._lock = threading.Lock()
+        
+        self._pending_updates = {}
+        
+        self._last_update = HydrusData.GetNow()
+        
+        self._my_flush_job = self._controller.CallRepeating( 5, 60, self.REPEATINGFlush )
+        
+    
+    def REPEATINGFlush( self ):
+        
+        self.Flush()
+        
+    
+    def Flush( self ):
+        
+        with self._lock:
+            
+            if len( self._pending_updates ) > 0:
+                
+                content_updates = []
+                
+                for ( hash, ( preview_views_delta, preview_viewtime_delta, media_views_delta, media_viewtime_delta ) ) in self._pending_updates.items():
+                    
+                    row = ( hash, preview_views_delta, preview_viewtime_delta, media_views_delta, media_viewtime_delta )
+                    
+                    content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILE_VIEWING_STATS, HC.CONTENT_UPDATE_ADD, row )
+                    
+                    content_updates.append( content_update )
+                    
+                
+                service_keys_to_content_updates = { CC.COMBINED_LOCAL_FILE_SERVICE_KEY : content_updates }
+                
+                # non-synchronous
+                self._controller.Write( 'content_updates', service_keys_to_content_updates, do_pubsubs = False )
+                
+                self._pending_updates = {}
+                
+            
+        
+    
+    def Update( self, viewtype, hash, views_delta, viewtime_delta ):
+        
+        if not HG.client_controller.new_options.GetBoolean( 'file_viewing_statistics_active' ):
+            
+            return
+            
+        
+        with self._lock:
+            
+            preview_views_delta = 0
+            preview_viewtime_delta = 0
+            media_views_delta = 0
+            media_viewtime_delta = 0
+            
+            if viewtype == 'preview':
+                
+                preview_views_delta = views_delta
+                preview_viewtime_delta = viewtime_delta
+                
+            elif viewtype == 'media':
+                
+                media_views_delta = views_delta
+                media_viewtime_delta = viewtime_delta
+                
+            
+            if hash not in self._pending_updates:
+                
+                self._pending_updates[ hash ] = ( preview_views_delta, preview_viewtime_delta, media_views_delta, media_viewtime_delta )
+                
+            else:
+                
+                ( existing_preview_views_delta, existing_preview_viewtime_delta, existing_media_views_delta, existing_media_viewtime_delta ) = self._pending_updates[ hash ]
+                
+                self._pending_updates[ hash ] = ( existing_preview_views_delta + preview_views_delta, existing_preview_viewtime_delta + preview_viewtime_delta, existing_media_views_delta + media_views_delta, existing_media_viewtime_delta + media_viewtime_delta )
+                
+            
+        
+        row = ( hash, preview_views_delta, preview_viewtime_delta, media_views_delta, media_viewtime_delta )
+        
+        content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILE_VIEWING_STATS, HC.CONTENT_UPDATE_ADD, row )
+        
+        service_keys_to_content_updates = { CC.COMBINED_LOCAL_FILE_SERVICE_KEY : [ content_update ] }
+        
+        HG.client_controller.pub( 'content_updates_data', service_keys_to_content_updates )
+        HG.client_controller.pub( 'content_updates_gui', service_keys_to_content_updates )
+        
+
+class LocalBooruCache( object ):
+    
+    def __init__( self, controller ):
+        
+        self._controller = controller
+        
+        self._lock = threading.Lock()
         
         self._RefreshShares()
         
@@ -1816,7 +2268,7 @@ class MediaResultCache( object ):
         HG.client_controller.sub( self, 'ProcessContentUpdates', 'content_updates_data' )
         HG.client_controller.sub( self, 'ProcessServiceUpdates', 'service_updates_data' )
         HG.client_controller.sub( self, 'NewForceRefreshTags', 'notify_new_force_refresh_tags_data' )
-        HG.client_controller.sub( self, 'NewSiblings', 'notify_new_siblings_data' )
+        HG.client_controller.sub( self, 'NewSiblings', 'notify_new_siblings_tags_data' )
         
     
     def AddMediaResults( self, media_results ):
@@ -1885,13 +2337,13 @@ class MediaResultCache( object ):
             
         
     
-    def NewSiblings( self ):
+    def NewSiblings( self, changed_tags = None ):
         
         with self._lock:
             
             for media_result in self._hash_ids_to_media_results.values():
                 
-                media_result.GetTagsManager().NewSiblings()
+                media_result.GetTagsManager().NewSiblings( changed_tags )
                 
             
         
@@ -2050,6 +2502,7 @@ class ParsingCache( object ):
         
         self._next_clean_cache_time = HydrusData.GetNow()
         
+        self._html_to_lxml_trees = {}
         self._html_to_soups = {}
         self._json_to_jsons = {}
         
@@ -2060,7 +2513,7 @@ class ParsingCache( object ):
         
         if HydrusData.TimeHasPassed( self._next_clean_cache_time ):
             
-            for cache in ( self._html_to_soups, self._json_to_jsons ):
+            for cache in ( self._html_to_lxml_trees, self._html_to_soups, self._json_to_jsons ):
                 
                 dead_datas = set()
                 
@@ -2119,6 +2572,35 @@ class ParsingCache( object ):
             
         
     
+    def GetLXMLTree( self, html ):
+        
+        with self._lock:
+            
+            now = HydrusData.GetNow()
+            
+            if html not in self._html_to_lxml_trees:
+                
+                lxml_tree = ClientParsing.GetLXMLTree( html )
+                
+                self._html_to_lxml_trees[ html ] = ( now, lxml_tree )
+                
+            
+            ( last_accessed, lxml_tree ) = self._html_to_lxml_trees[ html ]
+            
+            if last_accessed != now:
+                
+                self._html_to_lxml_trees[ html ] = ( now, lxml_tree )
+                
+            
+            if len( self._html_to_lxml_trees ) > 10:
+                
+                self._CleanCache()
+                
+            
+            return lxml_tree
+            
+        
+    
     def GetSoup( self, html ):
         
         with self._lock:
@@ -2187,6 +2669,11 @@ class RenderedImageCache( object ):
         return image_renderer
         
     
+    def GetStats( self ):
+        
+        return self._data_cache.GetStats()
+        
+    
     def HasImageRenderer( self, hash ):
         
         key = hash
@@ -2202,26 +2689,63 @@ class ThumbnailCache( object ):
         
         cache_size = self._controller.options[ 'thumbnail_cache_size' ]
         cache_timeout = self._controller.new_options.GetInteger( 'thumbnail_cache_timeout' )
+        cache_policy = self._controller.new_options.GetInteger( 'thumbnail_cache_policy' )
         
-        self._data_cache = DataCache( self._controller, cache_size, timeout = cache_timeout )
+        self._data_cache = DataCache( self._controller, cache_size, timeout = cache_timeout, policy = cache_policy )
+        
+        packed_store_path = os.path.join( self._controller.GetDBDir(), 'client_thumbnail_packs' )
+        
+        if self._controller.new_options.GetBoolean( 'use_packed_thumbnail_store' ):
+            
+            self._packed_store = ThumbnailPackStore( packed_store_path, self._controller.options[ 'thumbnail_dimensions' ] )
+            
+        else:
+            
+            self._packed_store = None
+            
+            if os.path.exists( packed_store_path ):
+                
+                HydrusPaths.DeletePath( packed_store_path )
+                
+            
         
         self._lock = threading.Lock()
         
         self._waterfall_queue_quick = set()
+        self._waterfall_queue_priority = set()
         self._waterfall_queue_random = []
+        self._waterfall_in_flight = set()
         
-        self._waterfall_event = threading.Event()
+        self._waterfall_page_keys_to_rendered_medias = collections.defaultdict( list )
+        
+        self._waterfall_condition = threading.Condition( self._lock )
+        self._waterfall_results_event = threading.Event()
         
         self._special_thumbs = {}
         
         self.Clear()
         
+        num_workers = max( 1, self._controller.new_options.GetInteger( 'thumbnail_waterfall_num_workers' ) )
+        
+        for i in range( num_workers ):
+            
+            self._controller.CallToThreadLongRunning( self.THREADWaterfallWorker )
+            
+        
         self._controller.CallToThreadLongRunning( self.DAEMONWaterfall )
         
         self._controller.sub( self, 'Clear', 'thumbnail_resize' )
         self._controller.sub( self, 'ClearThumbnails', 'clear_thumbnails' )
         
     
+    def _ClearPackedThumbnails( self, hashes ):
+        
+        if self._packed_store is not None:
+            
+            self._packed_store.ClearThumbnails( hashes )
+            
+        
+    
     def _GetResizedHydrusBitmapFromHardDrive( self, display_media ):
         
         thumbnail_dimensions = self._controller.options[ 'thumbnail_dimensions' ]
@@ -2238,11 +2762,26 @@ class ThumbnailCache( object ):
         hash = display_media.GetHash()
         mime = display_media.GetMime()
         
-        locations_manager = display_media.GetLocationsManager()
-        
-        try:
+        if self._packed_store is not None:
             
-            if full_size:
+            packed_data = self._packed_store.GetThumbnail( hash )
+            
+            if packed_data is not None:
+                
+                ( data, size, depth, compressed ) = packed_data
+                
+                if ClientRendering.LZ4_OK or not compressed:
+                    
+                    return ClientRendering.GenerateHydrusBitmapFromPackedData( packed_data )
+                    
+                
+            
+        
+        locations_manager = display_media.GetLocationsManager()
+        
+        try:
+            
+            if full_size:
                 
                 path = self._controller.client_files_manager.GetFullSizeThumbnailPath( hash, mime )
                 
@@ -2273,6 +2812,8 @@ class ThumbnailCache( object ):
                 
                 self._controller.client_files_manager.RegenerateResizedThumbnail( hash, mime )
                 
+                self._ClearPackedThumbnails( ( hash, ) )
+                
                 try:
                     
                     hydrus_bitmap = ClientRendering.GenerateHydrusBitmap( path, mime )
@@ -2306,9 +2847,16 @@ class ThumbnailCache( object ):
             
             self._controller.client_files_manager.RegenerateResizedThumbnail( hash, mime )
             
+            self._ClearPackedThumbnails( ( hash, ) )
+            
             hydrus_bitmap = ClientRendering.GenerateHydrusBitmap( path, mime )
             
         
+        if self._packed_store is not None:
+            
+            self._packed_store.AddThumbnail( hash, hydrus_bitmap.GetPackedData() )
+            
+        
         return hydrus_bitmap
         
     
@@ -2316,9 +2864,13 @@ class ThumbnailCache( object ):
         
         # here we sort by the hash since this is both breddy random and more likely to access faster on a well defragged hard drive!
         
-        def sort_by_hash_key( ( page_key, media ) ):
+        # we pop from the end, so whatever is in the viewport goes first
+        
+        def sort_by_hash_key( result ):
+            
+            ( page_key, media ) = result
             
-            return media.GetDisplayMedia().GetHash()
+            return ( result in self._waterfall_queue_priority, media.GetDisplayMedia().GetHash() )
             
         
         self._waterfall_queue_random = list( self._waterfall_queue_quick )
@@ -2330,7 +2882,14 @@ class ThumbnailCache( object ):
         
         with self._lock:
             
-            self._waterfall_queue_quick.difference_update( ( ( page_key, media ) for media in medias ) )
+            results = [ ( page_key, media ) for media in medias ]
+            
+            self._waterfall_queue_quick.difference_update( results )
+            self._waterfall_queue_priority.difference_update( results )
+            
+            # anything a worker is already decoding will still be cached, but not delivered
+            
+            self._waterfall_in_flight.difference_update( results )
             
             self._RecalcWaterfallQueueRandom()
             
@@ -2342,6 +2901,11 @@ class ThumbnailCache( object ):
             
             self._data_cache.Clear()
             
+            if self._packed_store is not None:
+                
+                self._packed_store.SetThumbnailDimensions( self._controller.options[ 'thumbnail_dimensions' ] )
+                
+            
             self._special_thumbs = {}
             
             names = [ 'hydrus', 'pdf', 'audio', 'video', 'zip' ]
@@ -2384,174 +2948,556 @@ class ThumbnailCache( object ):
                 self._data_cache.DeleteData( hash )
                 
             
+            self._ClearPackedThumbnails( hashes )
+            
         
     
     def DoingWork( self ):
         
         with self._lock:
             
-            return len( self._waterfall_queue_random ) > 0
+            return len( self._waterfall_queue_random ) > 0 or len( self._waterfall_in_flight ) > 0
+            
+        
+    
+    def GetThumbnail( self, media ):
+        
+        try:
+            
+            display_media = media.GetDisplayMedia()
+            
+        except:
+            
+            # sometimes media can get switched around during a collect event, and if this happens during waterfall, we have a problem here
+            # just return for now, we'll see how it goes
+            
+            return self._special_thumbs[ 'hydrus' ]
+            
+        
+        locations_manager = display_media.GetLocationsManager()
+        
+        if locations_manager.ShouldIdeallyHaveThumbnail():
+            
+            mime = display_media.GetMime()
+            
+            if mime in HC.MIMES_WITH_THUMBNAILS:
+                
+                hash = display_media.GetHash()
+                
+                result = self._data_cache.GetIfHasData( hash )
+                
+                if result is None:
+                    
+                    if locations_manager.ShouldDefinitelyHaveThumbnail():
+                        
+                        # local file, should be able to regen if needed
+                        
+                        hydrus_bitmap = self._GetResizedHydrusBitmapFromHardDrive( display_media )
+                        
+                    else:
+                        
+                        # repository file, maybe not actually available yet
+                        
+                        try:
+                            
+                            hydrus_bitmap = self._GetResizedHydrusBitmapFromHardDrive( display_media )
+                            
+                        except:
+                            
+                            hydrus_bitmap = self._special_thumbs[ 'hydrus' ]
+                            
+                        
+                    
+                    self._data_cache.AddData( hash, hydrus_bitmap )
+                    
+                else:
+                    
+                    hydrus_bitmap = result
+                    
+                
+                return hydrus_bitmap
+                
+            elif mime in HC.AUDIO: return self._special_thumbs[ 'audio' ]
+            elif mime in HC.VIDEO: return self._special_thumbs[ 'video' ]
+            elif mime == HC.APPLICATION_PDF: return self._special_thumbs[ 'pdf' ]
+            elif mime in HC.ARCHIVES: return self._special_thumbs[ 'zip' ]
+            else: return self._special_thumbs[ 'hydrus' ]
+            
+        else:
+            
+            return self._special_thumbs[ 'hydrus' ]
+            
+        
+    
+    def GetStats( self ):
+        
+        return self._data_cache.GetStats()
+        
+    
+    def HasThumbnailCached( self, media ):
+        
+        display_media = media.GetDisplayMedia()
+        
+        mime = display_media.GetMime()
+        
+        if mime in HC.MIMES_WITH_THUMBNAILS:
+            
+            hash = display_media.GetHash()
+            
+            return self._data_cache.HasData( hash )
+            
+        else:
+            
+            return True
+            
+        
+    
+    def Shutdown( self ):
+        
+        with self._lock:
+            
+            if self._packed_store is not None:
+                
+                self._packed_store.Close()
+                
+            
+        
+    
+    def Waterfall( self, page_key, medias, visible = False ):
+        
+        with self._lock:
+            
+            results = [ ( page_key, media ) for media in medias ]
+            
+            self._waterfall_queue_quick.update( results )
+            
+            if visible:
+                
+                self._waterfall_queue_priority.update( results )
+                
+            
+            self._RecalcWaterfallQueueRandom()
+            
+            self._waterfall_condition.notify_all()
+            
+        
+    
+    def DAEMONWaterfall( self ):
+        
+        while not HydrusThreading.IsThreadShuttingDown():
+            
+            self._waterfall_results_event.wait( 1 )
+            
+            self._waterfall_results_event.clear()
+            
+            time.sleep( 0.005 ) # a bit of a typical frame, so results arrive in batches
+            
+            with self._lock:
+                
+                page_keys_to_rendered_medias = self._waterfall_page_keys_to_rendered_medias
+                
+                self._waterfall_page_keys_to_rendered_medias = collections.defaultdict( list )
+                
+            
+            for ( page_key, rendered_medias ) in page_keys_to_rendered_medias.items():
+                
+                self._controller.pub( 'waterfall_thumbnails', page_key, rendered_medias )
+                
+            
+        
+    
+    def THREADWaterfallWorker( self ):
+        
+        while not HydrusThreading.IsThreadShuttingDown():
+            
+            with self._lock:
+                
+                if len( self._waterfall_queue_random ) == 0:
+                    
+                    self._waterfall_condition.wait( 1 )
+                    
+                    continue
+                    
+                
+                result = self._waterfall_queue_random.pop()
+                
+                self._waterfall_queue_quick.discard( result )
+                self._waterfall_queue_priority.discard( result )
+                
+                self._waterfall_in_flight.add( result )
+                
+            
+            ( page_key, media ) = result
+            
+            try:
+                
+                self.GetThumbnail( media ) # to load it
+                
+                rendered = True
+                
+            except Exception as e:
+                
+                HydrusData.ShowException( e )
+                
+                rendered = False
+                
+            
+            with self._lock:
+                
+                if result in self._waterfall_in_flight:
+                    
+                    self._waterfall_in_flight.discard( result )
+                    
+                    if rendered:
+                        
+                        self._waterfall_page_keys_to_rendered_medias[ page_key ].append( media )
+                        
+                    
+                
+            
+            self._waterfall_results_event.set()
+            
+        
+    
+class ThumbnailPack( object ):
+    
+    INDEX_RECORD_FORMAT = '>32sQIHHBB'
+    INDEX_RECORD_SIZE = struct.calcsize( INDEX_RECORD_FORMAT )
+    
+    def __init__( self, pack_path, index_path ):
+        
+        self._pack_path = pack_path
+        self._index_path = index_path
+        
+        self._hashes_to_records = {}
+        self._num_dead_bytes = 0
+        
+        self._mmap = None
+        
+        self._LoadIndex()
+        
+        self._pack_file = open( self._pack_path, 'a+b' )
+        self._index_file = open( self._index_path, 'ab' )
+        
+        pack_size = os.path.getsize( self._pack_path )
+        
+        if self._num_dead_bytes > pack_size // 4:
+            
+            self._Compact()
+            
+        
+    
+    def _CloseFiles( self ):
+        
+        if self._mmap is not None:
+            
+            self._mmap.close()
+            
+            self._mmap = None
+            
+        
+        self._pack_file.close()
+        self._index_file.close()
+        
+    
+    def _Compact( self ):
+        
+        # rewrite in hash order, which is the order the waterfall asks for things in
+        
+        self._RemapFile()
+        
+        temp_pack_path = self._pack_path + '.temp'
+        temp_index_path = self._index_path + '.temp'
+        
+        hashes_to_records = {}
+        
+        with open( temp_pack_path, 'wb' ) as pack_f:
+            
+            with open( temp_index_path, 'wb' ) as index_f:
+                
+                for hash in sorted( self._hashes_to_records.keys() ):
+                    
+                    ( offset, length, width, height, depth, compressed ) = self._hashes_to_records[ hash ]
+                    
+                    data = self._mmap[ offset : offset + length ]
+                    
+                    record = ( pack_f.tell(), length, width, height, depth, compressed )
+                    
+                    pack_f.write( data )
+                    index_f.write( struct.pack( self.INDEX_RECORD_FORMAT, hash, *record ) )
+                    
+                    hashes_to_records[ hash ] = record
+                    
+                
+            
+        
+        self._CloseFiles()
+        
+        for ( temp_path, path ) in ( ( temp_pack_path, self._pack_path ), ( temp_index_path, self._index_path ) ):
+            
+            os.remove( path )
+            
+            os.rename( temp_path, path )
+            
+        
+        self._hashes_to_records = hashes_to_records
+        self._num_dead_bytes = 0
+        
+        self._pack_file = open( self._pack_path, 'a+b' )
+        self._index_file = open( self._index_path, 'ab' )
+        
+    
+    def _LoadIndex( self ):
+        
+        if not os.path.exists( self._index_path ):
+            
+            return
+            
+        
+        pack_size = os.path.getsize( self._pack_path ) if os.path.exists( self._pack_path ) else 0
+        
+        with open( self._index_path, 'rb' ) as f:
+            
+            index_data = f.read()
+            
+        
+        # a half-written record at the end, from a crash or similar, is just ignored
+        
+        num_records = len( index_data ) // self.INDEX_RECORD_SIZE
+        
+        for i in range( num_records ):
+            
+            ( hash, offset, length, width, height, depth, compressed ) = struct.unpack_from( self.INDEX_RECORD_FORMAT, index_data, i * self.INDEX_RECORD_SIZE )
+            
+            if hash in self._hashes_to_records:
+                
+                self._num_dead_bytes += self._hashes_to_records[ hash ][1]
+                
+                del self._hashes_to_records[ hash ]
+                
+            
+            if length > 0 and offset + length <= pack_size:
+                
+                self._hashes_to_records[ hash ] = ( offset, length, width, height, depth, compressed )
+                
+            
+        
+    
+    def _RemapFile( self ):
+        
+        if self._mmap is not None:
+            
+            self._mmap.close()
+            
+            self._mmap = None
+            
+        
+        self._pack_file.flush()
+        
+        if os.path.getsize( self._pack_path ) > 0:
+            
+            self._mmap = mmap.mmap( self._pack_file.fileno(), 0, access = mmap.ACCESS_READ )
+            
+        
+    
+    def AddThumbnail( self, hash, packed_data ):
+        
+        ( data, ( width, height ), depth, compressed ) = packed_data
+        
+        if hash in self._hashes_to_records:
+            
+            self._num_dead_bytes += self._hashes_to_records[ hash ][1]
+            
+        
+        self._pack_file.seek( 0, os.SEEK_END )
+        
+        record = ( self._pack_file.tell(), len( data ), width, height, depth, compressed )
+        
+        self._pack_file.write( data )
+        self._pack_file.flush()
+        
+        self._index_file.write( struct.pack( self.INDEX_RECORD_FORMAT, hash, *record ) )
+        self._index_file.flush()
+        
+        self._hashes_to_records[ hash ] = record
+        
+    
+    def Close( self ):
+        
+        self._CloseFiles()
+        
+    
+    def GetThumbnail( self, hash ):
+        
+        if hash not in self._hashes_to_records:
+            
+            return None
+            
+        
+        ( offset, length, width, height, depth, compressed ) = self._hashes_to_records[ hash ]
+        
+        if self._mmap is None or len( self._mmap ) < offset + length:
+            
+            self._RemapFile()
+            
+        
+        data = self._mmap[ offset : offset + length ]
+        
+        return ( data, ( width, height ), depth, compressed == 1 )
+        
+    
+    def RemoveThumbnail( self, hash ):
+        
+        if hash in self._hashes_to_records:
+            
+            self._num_dead_bytes += self._hashes_to_records[ hash ][1]
+            
+            del self._hashes_to_records[ hash ]
+            
+            self._index_file.write( struct.pack( self.INDEX_RECORD_FORMAT, hash, 0, 0, 0, 0, 0, 0 ) )
+            self._index_file.flush()
+            
+        
+    
+class ThumbnailPackStore( object ):
+    
+    def __init__( self, path, thumbnail_dimensions, max_open_packs = 32 ):
+        
+        self._path = path
+        self._max_open_packs = max_open_packs
+        
+        self._lock = threading.Lock()
+        
+        self._prefixes_to_packs = collections.OrderedDict()
+        
+        HydrusPaths.MakeSureDirectoryExists( self._path )
+        
+        self._thumbnail_dimensions = None
+        
+        self.SetThumbnailDimensions( thumbnail_dimensions )
+        
+    
+    def _ClosePacks( self ):
+        
+        for pack in self._prefixes_to_packs.values():
+            
+            pack.Close()
             
         
+        self._prefixes_to_packs = collections.OrderedDict()
+        
     
-    def GetThumbnail( self, media ):
+    def _GetPack( self, hash ):
         
-        try:
-            
-            display_media = media.GetDisplayMedia()
-            
-        except:
+        prefix = 'p' + hash.encode( 'hex' )[:2]
+        
+        if prefix in self._prefixes_to_packs:
             
-            # sometimes media can get switched around during a collect event, and if this happens during waterfall, we have a problem here
-            # just return for now, we'll see how it goes
+            pack = self._prefixes_to_packs.pop( prefix )
             
-            return self._special_thumbs[ 'hydrus' ]
+        else:
             
-        
-        locations_manager = display_media.GetLocationsManager()
-        
-        if locations_manager.ShouldIdeallyHaveThumbnail():
+            pack_path = os.path.join( self._path, prefix + '.pack' )
+            index_path = os.path.join( self._path, prefix + '.index' )
             
-            mime = display_media.GetMime()
+            pack = ThumbnailPack( pack_path, index_path )
             
-            if mime in HC.MIMES_WITH_THUMBNAILS:
-                
-                hash = display_media.GetHash()
+            while len( self._prefixes_to_packs ) >= self._max_open_packs:
                 
-                result = self._data_cache.GetIfHasData( hash )
-                
-                if result is None:
-                    
-                    if locations_manager.ShouldDefinitelyHaveThumbnail():
-                        
-                        # local file, should be able to regen if needed
-                        
-                        hydrus_bitmap = self._GetResizedHydrusBitmapFromHardDrive( display_media )
-                        
-                    else:
-                        
-                        # repository file, maybe not actually available yet
-                        
-                        try:
-                            
-                            hydrus_bitmap = self._GetResizedHydrusBitmapFromHardDrive( display_media )
-                            
-                        except:
-                            
-                            hydrus_bitmap = self._special_thumbs[ 'hydrus' ]
-                            
-                        
-                    
-                    self._data_cache.AddData( hash, hydrus_bitmap )
-                    
-                else:
-                    
-                    hydrus_bitmap = result
-                    
+                ( stale_prefix, stale_pack ) = self._prefixes_to_packs.popitem( last = False )
                 
-                return hydrus_bitmap
+                stale_pack.Close()
                 
-            elif mime in HC.AUDIO: return self._special_thumbs[ 'audio' ]
-            elif mime in HC.VIDEO: return self._special_thumbs[ 'video' ]
-            elif mime == HC.APPLICATION_PDF: return self._special_thumbs[ 'pdf' ]
-            elif mime in HC.ARCHIVES: return self._special_thumbs[ 'zip' ]
-            else: return self._special_thumbs[ 'hydrus' ]
-            
-        else:
-            
-            return self._special_thumbs[ 'hydrus' ]
             
         
-    
-    def HasThumbnailCached( self, media ):
+        self._prefixes_to_packs[ prefix ] = pack
         
-        display_media = media.GetDisplayMedia()
+        return pack
         
-        mime = display_media.GetMime()
+    
+    def AddThumbnail( self, hash, packed_data ):
         
-        if mime in HC.MIMES_WITH_THUMBNAILS:
+        with self._lock:
             
-            hash = display_media.GetHash()
+            self._GetPack( hash ).AddThumbnail( hash, packed_data )
             
-            return self._data_cache.HasData( hash )
+        
+    
+    def ClearThumbnails( self, hashes ):
+        
+        with self._lock:
             
-        else:
+            # sorted, so each pack is opened once
             
-            return True
+            for hash in sorted( hashes ):
+                
+                self._GetPack( hash ).RemoveThumbnail( hash )
+                
             
         
     
-    def Waterfall( self, page_key, medias ):
+    def Close( self ):
         
         with self._lock:
             
-            self._waterfall_queue_quick.update( ( ( page_key, media ) for media in medias ) )
-            
-            self._RecalcWaterfallQueueRandom()
+            self._ClosePacks()
             
         
-        self._waterfall_event.set()
-        
     
-    def DAEMONWaterfall( self ):
+    def GetThumbnail( self, hash ):
+        
+        with self._lock:
+            
+            return self._GetPack( hash ).GetThumbnail( hash )
+            
         
-        last_paused = HydrusData.GetNowPrecise()
+    
+    def SetThumbnailDimensions( self, thumbnail_dimensions ):
         
-        while not HydrusThreading.IsThreadShuttingDown():
+        with self._lock:
             
-            with self._lock:
+            thumbnail_dimensions = tuple( thumbnail_dimensions )
+            
+            if thumbnail_dimensions == self._thumbnail_dimensions:
                 
-                do_wait = len( self._waterfall_queue_random ) == 0
+                return
                 
             
-            if do_wait:
+            dimensions_path = os.path.join( self._path, 'thumbnail_dimensions.txt' )
+            
+            dimensions_text = '%dx%d' % thumbnail_dimensions
+            
+            if os.path.exists( dimensions_path ):
                 
-                self._waterfall_event.wait( 1 )
+                with open( dimensions_path, 'rb' ) as f:
+                    
+                    existing_dimensions_text = f.read().strip()
+                    
                 
-                self._waterfall_event.clear()
+            else:
                 
-                last_paused = HydrusData.GetNowPrecise()
+                existing_dimensions_text = None
                 
             
-            start_time = HydrusData.GetNowPrecise()
-            stop_time = start_time + 0.005 # a bit of a typical frame
-            
-            page_keys_to_rendered_medias = collections.defaultdict( list )
-            
-            while not HydrusData.TimeHasPassedPrecise( stop_time ):
+            if existing_dimensions_text != dimensions_text:
+                
+                self._ClosePacks()
                 
-                with self._lock:
+                for filename in os.listdir( self._path ):
                     
-                    if len( self._waterfall_queue_random ) == 0:
+                    if filename.endswith( '.pack' ) or filename.endswith( '.index' ) or filename.endswith( '.temp' ):
                         
-                        break
+                        os.remove( os.path.join( self._path, filename ) )
                         
                     
-                    result = self._waterfall_queue_random.pop()
-                    
-                    self._waterfall_queue_quick.discard( result )
-                    
-                
-                ( page_key, media ) = result
                 
-                try:
-                    
-                    self.GetThumbnail( media ) # to load it
-                    
-                    page_keys_to_rendered_medias[ page_key ].append( media )
-                    
-                except Exception as e:
+                with open( dimensions_path, 'wb' ) as f:
                     
-                    HydrusData.ShowException( e )
+                    f.write( dimensions_text )
                     
                 
             
-            for ( page_key, rendered_medias ) in page_keys_to_rendered_medias.items():
-                
-                self._controller.pub( 'waterfall_thumbnails', page_key, rendered_medias )
-                
-            
-            time.sleep( 0.00001 )
+            self._thumbnail_dimensions = thumbnail_dimensions
             
         
     
@@ -2885,6 +3831,148 @@ class TagCensorshipManager( object ):
         return tags
         
     
+class TagPairsGraph( object ):
+    
+    def __init__( self, calculate_callable ):
+        
+        # calculate_callable takes groups of pairs in descending order of precedence and returns a dict of tag->value
+        # it has to make its decisions per connected component of the pair graph, which sibling collapse and parent loop checks do
+        
+        self._calculate_callable = calculate_callable
+        
+        self._groups_of_pairs = []
+        self._tags_to_pairs = collections.defaultdict( set )
+        
+        self._tags_to_values = {}
+        
+    
+    def _GetConnectedTags( self, tags ):
+        
+        connected_tags = set()
+        
+        tags_to_check = set( tags )
+        
+        while len( tags_to_check ) > 0:
+            
+            tag = tags_to_check.pop()
+            
+            if tag in connected_tags:
+                
+                continue
+                
+            
+            connected_tags.add( tag )
+            
+            if tag in self._tags_to_pairs:
+                
+                for ( a, b ) in self._tags_to_pairs[ tag ]:
+                    
+                    tags_to_check.add( a )
+                    tags_to_check.add( b )
+                    
+                
+            
+        
+        return connected_tags
+        
+    
+    def GetTagsToValues( self ):
+        
+        return self._tags_to_values
+        
+    
+    def SetPairs( self, groups_of_pairs ):
+        
+        groups_of_pairs = [ set( group_of_pairs ) for group_of_pairs in groups_of_pairs ]
+        
+        num_groups = max( len( groups_of_pairs ), len( self._groups_of_pairs ) )
+        
+        changed_pairs = set()
+        
+        for index in range( num_groups ):
+            
+            old_pairs = self._groups_of_pairs[ index ] if index < len( self._groups_of_pairs ) else set()
+            new_pairs = groups_of_pairs[ index ] if index < len( groups_of_pairs ) else set()
+            
+            changed_pairs.update( old_pairs.symmetric_difference( new_pairs ) )
+            
+        
+        if len( changed_pairs ) == 0:
+            
+            return {}
+            
+        
+        touched_tags = set()
+        
+        for ( a, b ) in changed_pairs:
+            
+            touched_tags.add( a )
+            touched_tags.add( b )
+            
+        
+        affected_tags = self._GetConnectedTags( touched_tags )
+        
+        self._groups_of_pairs = groups_of_pairs
+        
+        for pair in changed_pairs:
+            
+            in_graph = True in ( pair in group_of_pairs for group_of_pairs in groups_of_pairs )
+            
+            for tag in pair:
+                
+                if in_graph:
+                    
+                    self._tags_to_pairs[ tag ].add( pair )
+                    
+                elif tag in self._tags_to_pairs:
+                    
+                    self._tags_to_pairs[ tag ].discard( pair )
+                    
+                    if len( self._tags_to_pairs[ tag ] ) == 0:
+                        
+                        del self._tags_to_pairs[ tag ]
+                        
+                    
+                
+            
+        
+        affected_tags.update( self._GetConnectedTags( touched_tags ) )
+        
+        affected_pairs = set()
+        
+        for tag in affected_tags:
+            
+            if tag in self._tags_to_pairs:
+                
+                affected_pairs.update( self._tags_to_pairs[ tag ] )
+                
+            
+        
+        affected_groups_of_pairs = [ group_of_pairs.intersection( affected_pairs ) for group_of_pairs in groups_of_pairs ]
+        
+        new_tags_to_values = self._calculate_callable( affected_groups_of_pairs )
+        
+        tags_to_changes = {}
+        
+        for tag in affected_tags:
+            
+            old_value = self._tags_to_values.pop( tag, None )
+            new_value = new_tags_to_values[ tag ] if tag in new_tags_to_values else None
+            
+            if new_value is not None:
+                
+                self._tags_to_values[ tag ] = new_value
+                
+            
+            if old_value != new_value:
+                
+                tags_to_changes[ tag ] = ( old_value, new_value )
+                
+            
+        
+        return tags_to_changes
+        
+    
 class TagParentsManager( object ):
     
     def __init__( self, controller ):
@@ -2894,7 +3982,8 @@ class TagParentsManager( object ):
         self._dirty = False
         self._refresh_job = None
         
-        self._service_keys_to_children_to_parents = collections.defaultdict( HydrusData.default_dict_list )
+        self._service_keys_to_graphs = {}
+        self._service_keys_to_children_to_parents = collections.defaultdict( dict )
         
         self._RefreshParents()
         
@@ -2903,6 +3992,20 @@ class TagParentsManager( object ):
         self._controller.sub( self, 'NotifyNewParents', 'notify_new_parents' )
         
     
+    def _GetParents( self, service_key, tag ):
+        
+        children_to_parents = self._service_keys_to_children_to_parents[ service_key ]
+        
+        if tag in children_to_parents:
+            
+            return children_to_parents[ tag ]
+            
+        else:
+            
+            return []
+            
+        
+    
     def _RefreshParents( self ):
         
         service_keys_to_statuses_to_pairs = self._controller.Read( 'tag_parents' )
@@ -2947,11 +4050,38 @@ class TagParentsManager( object ):
         
         service_keys_to_pairs_flat[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_pairs_flat
         
-        #
+        # services that have gone away
+        
+        for service_key in self._service_keys_to_graphs.keys():
+            
+            if service_key not in service_keys_to_pairs_flat:
+                
+                service_keys_to_pairs_flat[ service_key ] = set()
+                
+            
+        
+        # now only recalculate the bits of each graph whose pairs changed
         
-        service_keys_to_simple_children_to_parents = BuildServiceKeysToSimpleChildrenToParents( service_keys_to_pairs_flat )
+        changed_tags = set()
+        
+        for ( service_key, pairs_flat ) in service_keys_to_pairs_flat.items():
+            
+            if service_key not in self._service_keys_to_graphs:
+                
+                graph = TagPairsGraph( BuildChildrenToParentsFromGroupsOfPairs )
+                
+                self._service_keys_to_graphs[ service_key ] = graph
+                self._service_keys_to_children_to_parents[ service_key ] = graph.GetTagsToValues()
+                
+            
+            graph = self._service_keys_to_graphs[ service_key ]
+            
+            tags_to_changes = graph.SetPairs( [ pairs_flat ] )
+            
+            changed_tags.update( tags_to_changes.keys() )
+            
         
-        self._service_keys_to_children_to_parents = BuildServiceKeysToChildrenToParents( service_keys_to_simple_children_to_parents )
+        return changed_tags
         
     
     def ExpandPredicates( self, service_key, predicates ):
@@ -2973,7 +4103,7 @@ class TagParentsManager( object ):
                     
                     tag = predicate.GetValue()
                     
-                    parents = self._service_keys_to_children_to_parents[ service_key ][ tag ]
+                    parents = self._GetParents( service_key, tag )
                     
                     for parent in parents:
                         
@@ -3001,7 +4131,7 @@ class TagParentsManager( object ):
             
             for tag in tags:
                 
-                tags_results.update( self._service_keys_to_children_to_parents[ service_key ][ tag ] )
+                tags_results.update( self._GetParents( service_key, tag ) )
                 
             
             return tags_results
@@ -3017,7 +4147,7 @@ class TagParentsManager( object ):
         
         with self._lock:
             
-            return self._service_keys_to_children_to_parents[ service_key ][ tag ]
+            return self._GetParents( service_key, tag )
             
         
     
@@ -3042,10 +4172,15 @@ class TagParentsManager( object ):
             
             if self._dirty:
                 
-                self._RefreshParents()
+                changed_tags = self._RefreshParents()
                 
                 self._dirty = False
                 
+                if len( changed_tags ) > 0:
+                    
+                    self._controller.pub( 'notify_new_parents_gui', changed_tags )
+                    
+                
             
         
     
@@ -3058,6 +4193,7 @@ class TagSiblingsManager( object ):
         self._dirty = False
         self._refresh_job = None
         
+        self._service_keys_to_graphs = {}
         self._service_keys_to_siblings = collections.defaultdict( dict )
         self._service_keys_to_reverse_lookup = collections.defaultdict( dict )
         
@@ -3077,13 +4213,12 @@ class TagSiblingsManager( object ):
     
     def _RefreshSiblings( self ):
         
-        self._service_keys_to_siblings = collections.defaultdict( dict )
-        self._service_keys_to_reverse_lookup = collections.defaultdict( dict )
-        
         local_tags_pairs = set()
         
         tag_repo_pairs = set()
         
+        service_keys_to_groups_of_pairs = {}
+        
         service_keys_to_statuses_to_pairs = self._controller.Read( 'tag_siblings' )
         
         for ( service_key, statuses_to_pairs ) in service_keys_to_statuses_to_pairs.items():
@@ -3099,35 +4234,70 @@ class TagSiblingsManager( object ):
                 tag_repo_pairs.update( all_pairs )
                 
             
-            siblings = CollapseTagSiblingPairs( [ all_pairs ] )
+            service_keys_to_groups_of_pairs[ service_key ] = [ all_pairs ]
             
-            self._service_keys_to_siblings[ service_key ] = siblings
-            
-            reverse_lookup = collections.defaultdict( list )
+        
+        service_keys_to_groups_of_pairs[ CC.COMBINED_TAG_SERVICE_KEY ] = [ local_tags_pairs, tag_repo_pairs ]
+        
+        # services that have gone away
+        
+        for service_key in self._service_keys_to_graphs.keys():
             
-            for ( bad, good ) in siblings.items():
+            if service_key not in service_keys_to_groups_of_pairs:
                 
-                reverse_lookup[ good ].append( bad )
+                service_keys_to_groups_of_pairs[ service_key ] = []
                 
             
-            self._service_keys_to_reverse_lookup[ service_key ] = reverse_lookup
-            
-        
-        combined_siblings = CollapseTagSiblingPairs( [ local_tags_pairs, tag_repo_pairs ] )
         
-        self._service_keys_to_siblings[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_siblings
+        # now only recalculate the bits of each graph whose pairs changed, and keep the reverse lookup in step
         
-        combined_reverse_lookup = collections.defaultdict( list )
+        changed_tags = set()
         
-        for ( bad, good ) in combined_siblings.items():
+        for ( service_key, groups_of_pairs ) in service_keys_to_groups_of_pairs.items():
             
-            combined_reverse_lookup[ good ].append( bad )
+            if service_key not in self._service_keys_to_graphs:
+                
+                graph = TagPairsGraph( CollapseTagSiblingPairs )
+                
+                self._service_keys_to_graphs[ service_key ] = graph
+                self._service_keys_to_siblings[ service_key ] = graph.GetTagsToValues()
+                self._service_keys_to_reverse_lookup[ service_key ] = collections.defaultdict( list )
+                
+            
+            graph = self._service_keys_to_graphs[ service_key ]
+            reverse_lookup = self._service_keys_to_reverse_lookup[ service_key ]
+            
+            tags_to_changes = graph.SetPairs( groups_of_pairs )
+            
+            for ( bad, ( old_good, new_good ) ) in tags_to_changes.items():
+                
+                changed_tags.add( bad )
+                
+                if old_good is not None:
+                    
+                    changed_tags.add( old_good )
+                    
+                    reverse_lookup[ old_good ].remove( bad )
+                    
+                    if len( reverse_lookup[ old_good ] ) == 0:
+                        
+                        del reverse_lookup[ old_good ]
+                        
+                    
+                
+                if new_good is not None:
+                    
+                    changed_tags.add( new_good )
+                    
+                    reverse_lookup[ new_good ].append( bad )
+                    
+                
             
-        
-        self._service_keys_to_reverse_lookup[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_reverse_lookup
         
         self._controller.pub( 'new_siblings_gui' )
         
+        return changed_tags
+        
     
     def CollapsePredicates( self, service_key, predicates ):
         
@@ -3378,11 +4548,15 @@ class TagSiblingsManager( object ):
             
             if self._dirty:
                 
-                self._RefreshSiblings()
+                changed_tags = self._RefreshSiblings()
                 
                 self._dirty = False
                 
-                self._controller.pub( 'notify_new_siblings_gui' )
+                if len( changed_tags ) > 0:
+                    
+                    self._controller.pub( 'notify_new_siblings_tags_data', changed_tags )
+                    self._controller.pub( 'notify_new_siblings_gui', changed_tags )
+                    
                 
             
         
@@ -87,6 +87,16 @@ else:
     DELETE_KEYS = ( wx.WXK_DELETE, wx.WXK_NUMPAD_DELETE )
     
 
+DATA_CACHE_POLICY_LRU = 0
+DATA_CACHE_POLICY_SIZE_WEIGHTED_LRU = 1
+DATA_CACHE_POLICY_2Q = 2
+
+data_cache_policy_string_lookup = {}
+
+data_cache_policy_string_lookup[ DATA_CACHE_POLICY_LRU ] = 'drop the least recently used'
+data_cache_policy_string_lookup[ DATA_CACHE_POLICY_SIZE_WEIGHTED_LRU ] = 'drop the least recently used, preferring big items'
+data_cache_policy_string_lookup[ DATA_CACHE_POLICY_2Q ] = 'scan resistant: drop items that were only seen once first'
+
 DISCRIMINANT_INBOX = 0
 DISCRIMINANT_LOCAL = 1
 DISCRIMINANT_NOT_LOCAL = 2
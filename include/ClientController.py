@@ -1206,6 +1206,11 @@ class Controller( HydrusController.HydrusController ):
             self.SaveDirtyObjects()
             
         
+        if 'thumbnail' in self._caches:
+            
+            self._caches[ 'thumbnail' ].Shutdown()
+            
+        
         HydrusController.HydrusController.ShutdownModel( self )
         
     
@@ -1,6 +1,7 @@
 import ClientCaches
 import ClientData
 import ClientDefaults
+import ClientDuplicates
 import ClientGUIShortcuts
 import ClientImageHandling
 import ClientMedia
@@ -34,11 +35,13 @@ import HydrusTagArchive
 import HydrusTags
 import HydrusVideoHandling
 import ClientConstants as CC
+import numpy
 import os
 import psutil
 import random
 import re
 import sqlite3
+import threading
 import time
 import traceback
 import wx
@@ -53,6 +56,9 @@ YAML_DUMP_ID_EXPORT_FOLDER = 6
 YAML_DUMP_ID_SUBSCRIPTION = 7
 YAML_DUMP_ID_LOCAL_BOORU = 8
 
+# rows in these tables feed the non-tag half of a media result, so a change to any of them invalidates that file's summary
+MEDIA_RESULT_SUMMARY_SOURCE_TABLES = ( 'current_files', 'deleted_files', 'file_petitions', 'file_transfers', 'file_viewing_stats', 'files_info', 'local_ratings', 'service_filenames', 'url_map' )
+
 # Sqlite can handle -( 2 ** 63 ) -> ( 2 ** 63 ) - 1, but the user won't be searching that distance, so np
 MIN_CACHED_INTEGER = -99999999
 MAX_CACHED_INTEGER = 99999999
@@ -116,12 +122,19 @@ def GenerateSpecificMappingsCacheTableNames( file_service_id, tag_service_id ):
     
     return ( cache_files_table_name, cache_current_mappings_table_name, cache_deleted_mappings_table_name, cache_pending_mappings_table_name, ac_cache_table_name )
     
-def report_content_speed_to_job_key( job_key, rows_done, total_rows, precise_timestamp, num_rows, row_name ):
+def report_content_speed_to_job_key( job_key, rows_done, total_rows, precise_timestamp, num_rows, row_name, row_names_to_speed_stats = None ):
     
     it_took = HydrusData.GetNowPrecise() - precise_timestamp
     
     rows_s = HydrusData.ToHumanInt( num_rows / it_took )
     
+    if row_names_to_speed_stats is not None:
+        
+        ( total_num_rows, total_time_took ) = row_names_to_speed_stats.get( row_name, ( 0, 0.0 ) )
+        
+        row_names_to_speed_stats[ row_name ] = ( total_num_rows + num_rows, total_time_took + it_took )
+        
+    
     popup_message = 'content row ' + HydrusData.ConvertValueRangeToPrettyString( rows_done, total_rows ) + ': processing ' + row_name + ' at ' + rows_s + ' rows/s'
     
     HG.client_controller.pub( 'splash_set_status_text', popup_message, print_to_log = False )
@@ -138,6 +151,15 @@ def report_speed_to_job_key( job_key, precise_timestamp, num_rows, row_name ):
     HG.client_controller.pub( 'splash_set_status_text', popup_message, print_to_log = False )
     job_key.SetVariable( 'popup_text_2', popup_message )
     
+def report_speed_stats_to_log( row_names_to_speed_stats ):
+    
+    for ( row_name, ( num_rows, time_took ) ) in sorted( row_names_to_speed_stats.items() ):
+        
+        rows_s = HydrusData.ToHumanInt( num_rows / max( time_took, 0.001 ) )
+        
+        HydrusData.Print( 'processed ' + HydrusData.ToHumanInt( num_rows ) + ' ' + row_name + ' at ' + rows_s + ' rows/s' )
+        
+    
 def report_speed_to_log( precise_timestamp, num_rows, row_name ):
     
     it_took = HydrusData.GetNowPrecise() - precise_timestamp
@@ -148,14 +170,175 @@ def report_speed_to_log( precise_timestamp, num_rows, row_name ):
     
     HydrusData.Print( summary )
     
+def ConvertSpeedStatsToPrettyString( row_names_to_speed_stats ):
+    
+    pretty_speeds = []
+    
+    for ( row_name, ( num_rows, time_took ) ) in sorted( row_names_to_speed_stats.items() ):
+        
+        pretty_speeds.append( row_name + ': ' + HydrusData.ToHumanInt( num_rows / max( time_took, 0.001 ) ) + ' rows/s' )
+        
+    
+    return os.linesep.join( pretty_speeds )
+    
+class RepositoryUpdateLoader( object ):
+    
+    def __init__( self, client_files_manager, hash_ids_and_hashes, mime, max_num_loaded = 3, max_bytes_loaded = 64 * 1048576 ):
+        
+        self._client_files_manager = client_files_manager
+        self._hash_ids_and_hashes = hash_ids_and_hashes
+        self._mime = mime
+        self._max_num_loaded = max_num_loaded
+        self._max_bytes_loaded = max_bytes_loaded
+        
+        self._condition = threading.Condition()
+        
+        self._loaded_updates = collections.deque()
+        self._num_bytes_loaded = 0
+        
+        self._loading_done = False
+        self._stop = False
+        
+        HG.client_controller.CallToThreadLongRunning( self.THREADLoadUpdates )
+        
+    
+    def _LoadIsFull( self ):
+        
+        if len( self._loaded_updates ) == 0:
+            
+            return False
+            
+        
+        return len( self._loaded_updates ) >= self._max_num_loaded or self._num_bytes_loaded >= self._max_bytes_loaded
+        
+    
+    def IterateUpdates( self ):
+        
+        for i in range( len( self._hash_ids_and_hashes ) ):
+            
+            with self._condition:
+                
+                while len( self._loaded_updates ) == 0 and not self._loading_done:
+                    
+                    self._condition.wait( 1.0 )
+                    
+                
+                if len( self._loaded_updates ) == 0:
+                    
+                    return
+                    
+                
+                ( hash_id, update, num_bytes, load_exception ) = self._loaded_updates.popleft()
+                
+                self._num_bytes_loaded -= num_bytes
+                
+                self._condition.notify_all()
+                
+            
+            if load_exception is not None:
+                
+                raise load_exception
+                
+            
+            yield ( hash_id, update )
+            
+        
+    
+    def Stop( self ):
+        
+        with self._condition:
+            
+            self._stop = True
+            
+            self._loaded_updates.clear()
+            self._num_bytes_loaded = 0
+            
+            self._condition.notify_all()
+            
+        
+    
+    def THREADLoadUpdates( self ):
+        
+        try:
+            
+            for ( hash_id, update_hash ) in self._hash_ids_and_hashes:
+                
+                with self._condition:
+                    
+                    while self._LoadIsFull() and not self._stop and not HG.model_shutdown:
+                        
+                        self._condition.wait( 1.0 )
+                        
+                    
+                    if self._stop or HG.model_shutdown:
+                        
+                        return
+                        
+                    
+                
+                update = None
+                num_bytes = 0
+                load_exception = None
+                
+                try:
+                    
+                    update_path = self._client_files_manager.LocklessGetFilePath( update_hash, self._mime )
+                    
+                    with open( update_path, 'rb' ) as f:
+                        
+                        update_network_string = f.read()
+                        
+                    
+                    num_bytes = len( update_network_string )
+                    
+                    update = HydrusSerialisable.CreateFromNetworkString( update_network_string )
+                    
+                except Exception as e:
+                    
+                    load_exception = e
+                    
+                
+                with self._condition:
+                    
+                    if self._stop:
+                        
+                        return
+                        
+                    
+                    self._loaded_updates.append( ( hash_id, update, num_bytes, load_exception ) )
+                    self._num_bytes_loaded += num_bytes
+                    
+                    self._condition.notify_all()
+                    
+                
+                if load_exception is not None:
+                    
+                    return
+                    
+                
+            
+        finally:
+            
+            with self._condition:
+                
+                self._loading_done = True
+                
+                self._condition.notify_all()
+                
+            
+        
+    
 class DB( HydrusDB.HydrusDB ):
     
+    CONCURRENT_READ_ACTIONS = [ 'autocomplete_predicates', 'force_refresh_tags_managers', 'media_result_placeholder_data', 'media_results_from_ids', 'sorted_hash_ids' ]
     READ_WRITE_ACTIONS = [ 'service_info', 'system_predicates', 'missing_thumbnail_hashes' ]
     
     def __init__( self, controller, db_dir, db_name, no_wal = False ):
         
         self._initial_messages = []
         
+        self._media_result_summaries_ok = False
+        
         HydrusDB.HydrusDB.__init__( self, controller, db_dir, db_name, no_wal = no_wal )
         
         self._controller.pub( 'splash_set_title_text', u'booting db\u2026' )
@@ -527,6 +710,39 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _BenchmarkMediaResults( self, num_files ):
+        
+        hash_ids = self._STL( self._c.execute( 'SELECT hash_id FROM current_files WHERE service_id = ? LIMIT ?;', ( self._combined_local_file_service_id, num_files ) ) )
+        
+        self._PopulateHashIdsToHashesCache( hash_ids )
+        
+        runs = []
+        
+        runs.append( ( 'chunked selects', len( hash_ids ) + 1, False ) )
+        runs.append( ( 'temp table joins', 0, False ) )
+        
+        if self._media_result_summaries_ok:
+            
+            runs.append( ( 'summary table, filling', 0, True ) )
+            runs.append( ( 'summary table, filled', 0, True ) )
+            
+        
+        results = []
+        
+        for ( name, table_threshold, use_summaries ) in runs:
+            
+            start_time = HydrusData.GetNowPrecise()
+            
+            media_results = self._GenerateMediaResults( hash_ids, table_threshold = table_threshold, use_summaries = use_summaries )
+            
+            time_took = HydrusData.GetNowPrecise() - start_time
+            
+            results.append( ( name, len( media_results ), time_took ) )
+            
+        
+        return results
+        
+    
     def _CacheCombinedFilesMappingsDrop( self, service_id ):
         
         ac_cache_table_name = GenerateCombinedFilesMappingsCacheTableName( service_id )
@@ -803,19 +1019,26 @@ class DB( HydrusDB.HydrusDB ):
     
     def _CacheSimilarFilesAssociatePHashes( self, hash_id, phashes ):
         
-        phash_ids = set()
+        phash_ids_to_phashes = {}
         
         for phash in phashes:
             
             phash_id = self._CacheSimilarFilesGetPHashId( phash )
             
-            phash_ids.add( phash_id )
+            phash_ids_to_phashes[ phash_id ] = phash
             
         
+        phash_ids = set( phash_ids_to_phashes.keys() )
+        
         self._c.executemany( 'INSERT OR IGNORE INTO shape_perceptual_hash_map ( phash_id, hash_id ) VALUES ( ?, ? );', ( ( phash_id, hash_id ) for phash_id in phash_ids ) )
         
         if self._GetRowCount() > 0:
             
+            if self._phash_search_index is not None:
+                
+                self._phash_search_index.AddPHashes( phash_ids_to_phashes.items() )
+                
+            
             self._c.execute( 'REPLACE INTO shape_search_cache ( hash_id, searched_distance ) VALUES ( ?, ? );', ( hash_id, None ) )
             
         
@@ -857,95 +1080,195 @@ class DB( HydrusDB.HydrusDB ):
         
         self._c.executemany( 'INSERT OR IGNORE INTO shape_maintenance_branch_regen ( phash_id ) VALUES ( ? );', ( ( phash_id, ) for phash_id in useless_phash_ids ) )
         
-    
-    def _CacheSimilarFilesGenerateBranch( self, job_key, parent_id, phash_id, phash, children ):
-        
-        process_queue = collections.deque()
-        
-        process_queue.append( ( parent_id, phash_id, phash, children ) )
+        if self._phash_search_index is not None:
+            
+            self._phash_search_index.RemovePHashIds( useless_phash_ids )
+            
         
-        insert_rows = []
+    
+    def _CacheSimilarFilesDiscoverDuplicatePairsBatched( self, phash_ids, phashes_array, sorted_bands, search_distance, hash_ids, job_key, stop_time = None, job_key_pub_time = None ):
         
-        num_done = 0
-        num_to_do = len( children ) + 1
+        # rather than searching once per file, we pull every pair within the search distance out of the phash index in one go
+        # returns whether all the given files were searched, and the job_key_pub_time left, which is None once the job_key is pubbed
         
-        while len( process_queue ) > 0:
+        with HydrusDB.TemporaryIntegerTable( self._c, hash_ids, 'hash_id' ) as temp_hash_ids_table_name:
             
-            job_key.SetVariable( 'popup_text_2', 'generating new branch -- ' + HydrusData.ConvertValueRangeToPrettyString( num_done, num_to_do ) )
+            pending_phash_ids = self._STL( self._c.execute( 'SELECT DISTINCT phash_id FROM shape_perceptual_hash_map NATURAL JOIN ' + temp_hash_ids_table_name + ';' ) )
             
-            ( parent_id, phash_id, phash, children ) = process_queue.popleft()
+            pending_mask = numpy.in1d( phash_ids, numpy.array( pending_phash_ids, dtype = 'int64' ) )
             
-            if len( children ) == 0:
-                
-                inner_id = None
-                inner_population = 0
-                
-                outer_id = None
-                outer_population = 0
+            temp_phash_pairs_table_name = 'mem.tempphashpairs' + os.urandom( 32 ).encode( 'hex' )
+            
+            self._c.execute( 'CREATE TABLE ' + temp_phash_pairs_table_name + ' ( phash_id_a INTEGER, phash_id_b INTEGER );' )
+            
+            try:
                 
-                radius = None
+                insert_phash_pairs_statement = 'INSERT INTO ' + temp_phash_pairs_table_name + ' ( phash_id_a, phash_id_b ) VALUES ( ?, ? );'
                 
-            else:
+                # different files that share a phash are at distance 0 from each other
                 
-                children = [ ( HydrusData.Get64BitHammingDistance( phash, child_phash ), child_id, child_phash ) for ( child_id, child_phash ) in children ]
+                self._c.executemany( insert_phash_pairs_statement, ( ( phash_id, phash_id ) for phash_id in pending_phash_ids ) )
                 
-                children.sort()
+                num_phash_pairs_waiting = len( pending_phash_ids )
                 
-                median_index = len( children ) / 2
+                write_pairs_statement = 'INSERT OR IGNORE INTO duplicate_pairs ( smaller_hash_id, larger_hash_id, duplicate_type ) SELECT MIN( a.hash_id, b.hash_id ), MAX( a.hash_id, b.hash_id ), ? FROM ' + temp_phash_pairs_table_name + ' CROSS JOIN shape_perceptual_hash_map AS a ON ( a.phash_id = phash_id_a ) CROSS JOIN shape_perceptual_hash_map AS b ON ( b.phash_id = phash_id_b ) WHERE a.hash_id != b.hash_id AND ( a.hash_id IN ' + temp_hash_ids_table_name + ' OR b.hash_id IN ' + temp_hash_ids_table_name + ' );'
                 
-                median_radius = children[ median_index ][0]
+                pairs_found = 0
                 
-                inner_children = [ ( child_id, child_phash ) for ( distance, child_id, child_phash ) in children if distance < median_radius ]
-                radius_children = [ ( child_id, child_phash ) for ( distance, child_id, child_phash ) in children if distance == median_radius ]
-                outer_children = [ ( child_id, child_phash ) for ( distance, child_id, child_phash ) in children if distance > median_radius ]
+                time_started_precise = HydrusData.GetNowPrecise()
                 
-                if len( inner_children ) <= len( outer_children ):
+                for ( band_index, num_bands, num_groups_done, num_groups, phash_pairs ) in ClientDuplicates.IteratePHashPairsWithinDistance( phash_ids, phashes_array, pending_mask, search_distance, sorted_bands = sorted_bands ):
                     
-                    radius = median_radius
+                    ( i_paused, should_quit ) = job_key.WaitIfNeeded()
                     
-                    inner_children.extend( radius_children )
+                    should_stop = stop_time is not None and HydrusData.TimeHasPassed( stop_time )
                     
-                else:
+                    if should_quit or should_stop:
+                        
+                        return ( False, job_key_pub_time )
+                        
                     
-                    radius = median_radius - 1
+                    if job_key_pub_time is not None and HydrusData.TimeHasPassed( job_key_pub_time ):
+                        
+                        self._controller.pub( 'modal_message', job_key )
+                        
+                        job_key_pub_time = None
+                        
                     
-                    outer_children.extend( radius_children )
+                    self._c.executemany( insert_phash_pairs_statement, phash_pairs.tolist() )
                     
-                
-                inner_population = len( inner_children )
-                outer_population = len( outer_children )
-                
-                ( inner_id, inner_phash ) = self._CacheSimilarFilesPopBestRootNode( inner_children ) #HydrusData.MedianPop( inner_children )
-                
-                if len( outer_children ) == 0:
+                    num_phash_pairs_waiting += len( phash_pairs )
                     
-                    outer_id = None
+                    if num_phash_pairs_waiting > 100000 or num_groups_done == num_groups:
+                        
+                        self._c.execute( write_pairs_statement, ( HC.DUPLICATE_UNKNOWN, ) )
+                        
+                        pairs_found += self._GetRowCount()
+                        
+                        self._c.execute( 'DELETE FROM ' + temp_phash_pairs_table_name + ';' )
+                        
+                        num_phash_pairs_waiting = 0
+                        
                     
-                else:
+                    if num_groups == 0:
+                        
+                        band_progress = 1.0
+                        
+                    else:
+                        
+                        band_progress = float( num_groups_done ) / num_groups
+                        
+                    
+                    progress = ( band_index + band_progress ) / num_bands
+                    
+                    text = 'searching ' + HydrusData.ToHumanInt( len( hash_ids ) ) + ' files in bulk - band ' + HydrusData.ConvertValueRangeToPrettyString( band_index + 1, num_bands ) + ' - ' + HydrusData.ToHumanInt( pairs_found ) + ' pairs found'
+                    
+                    job_key.SetVariable( 'popup_text_2', text )
+                    job_key.SetVariable( 'popup_gauge_2', ( int( progress * 1000 ), 1000 ) )
                     
-                    ( outer_id, outer_phash ) = self._CacheSimilarFilesPopBestRootNode( outer_children ) #HydrusData.MedianPop( outer_children )
+                
+                if num_phash_pairs_waiting > 0:
+                    
+                    self._c.execute( write_pairs_statement, ( HC.DUPLICATE_UNKNOWN, ) )
                     
+                    pairs_found += self._GetRowCount()
+                    
+                
+            finally:
+                
+                self._c.execute( 'DROP TABLE ' + temp_phash_pairs_table_name + ';' )
                 
             
-            insert_rows.append( ( phash_id, parent_id, radius, inner_id, inner_population, outer_id, outer_population ) )
+        
+        self._c.executemany( 'UPDATE shape_search_cache SET searched_distance = ? WHERE hash_id = ?;', ( ( search_distance, hash_id ) for hash_id in hash_ids ) )
+        
+        if HG.db_report_mode:
+            
+            HydrusData.ShowText( 'Bulk similar files search of ' + HydrusData.ToHumanInt( len( hash_ids ) ) + ' files found ' + HydrusData.ToHumanInt( pairs_found ) + ' new pairs in ' + HydrusData.TimeDeltaToPrettyTimeDelta( HydrusData.GetNowPrecise() - time_started_precise ) + '.' )
             
-            if inner_id is not None:
+        
+        return ( True, job_key_pub_time )
+        
+    
+    def _CacheSimilarFilesDiscoveryBenchmark( self, search_distance ):
+        
+        job_key = ClientThreading.JobKey( cancellable = True )
+        
+        job_key.SetVariable( 'popup_title', 'similar files discovery benchmark' )
+        
+        self._controller.pub( 'modal_message', job_key )
+        
+        try:
+            
+            all_hash_ids = self._STL( self._c.execute( 'SELECT hash_id FROM shape_search_cache;' ) )
+            
+            sample_hash_ids = random.sample( all_hash_ids, min( 100, len( all_hash_ids ) ) )
+            
+            job_key.SetVariable( 'popup_text_1', 'searching ' + HydrusData.ToHumanInt( len( sample_hash_ids ) ) + ' files one at a time using the tree' )
+            
+            time_started_precise = HydrusData.GetNowPrecise()
+            
+            for hash_id in sample_hash_ids:
                 
-                process_queue.append( ( phash_id, inner_id, inner_phash, inner_children ) )
+                self._CacheSimilarFilesSearch( hash_id, search_distance, use_phash_search_index = False )
                 
             
-            if outer_id is not None:
+            tree_time_took = HydrusData.GetNowPrecise() - time_started_precise
+            
+            job_key.SetVariable( 'popup_text_1', 'loading phash index' )
+            
+            phash_search_index = ClientDuplicates.PHashSearchIndex()
+            
+            phash_search_index.AddPHashes( self._c.execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes;' ) )
+            
+            ( phash_ids, phashes_array ) = phash_search_index.GetArrays()
+            
+            job_key.SetVariable( 'popup_text_1', 'searching all ' + HydrusData.ToHumanInt( len( phash_ids ) ) + ' phashes in bulk' )
+            
+            pending_mask = numpy.ones( len( phash_ids ), dtype = 'bool' )
+            
+            num_phash_pairs = 0
+            
+            time_started_precise = HydrusData.GetNowPrecise()
+            
+            for ( band_index, num_bands, num_groups_done, num_groups, phash_pairs ) in ClientDuplicates.IteratePHashPairsWithinDistance( phash_ids, phashes_array, pending_mask, search_distance ):
                 
-                process_queue.append( ( phash_id, outer_id, outer_phash, outer_children ) )
+                if job_key.IsCancelled():
+                    
+                    return
+                    
                 
+                num_phash_pairs += len( phash_pairs )
+                
+            
+            batched_time_took = HydrusData.GetNowPrecise() - time_started_precise
+            
+            text = 'At search distance ' + str( search_distance ) + ':'
+            text += os.linesep
+            text += 'per-file tree search: ' + HydrusData.ToHumanInt( len( sample_hash_ids ) ) + ' files in ' + HydrusData.TimeDeltaToPrettyTimeDelta( tree_time_took ) + ', ' + HydrusData.ToHumanInt( int( len( sample_hash_ids ) / max( tree_time_took, 0.001 ) ) ) + ' files/s'
+            text += os.linesep
+            text += 'bulk search: ' + HydrusData.ToHumanInt( len( phash_ids ) ) + ' phashes (' + HydrusData.ToHumanInt( num_phash_pairs ) + ' candidate pairs) in ' + HydrusData.TimeDeltaToPrettyTimeDelta( batched_time_took ) + ', ' + HydrusData.ToHumanInt( int( len( phash_ids ) / max( batched_time_took, 0.001 ) ) ) + ' phashes/s'
+            
+            job_key.SetVariable( 'popup_text_1', text )
             
-            num_done += 1
+            HydrusData.Print( text )
             
+        finally:
+            
+            job_key.Finish()
+            
+        
+    
+    def _CacheSimilarFilesGenerateBranch( self, job_key, parent_id, phash_ids, phashes_array ):
+        
+        ( root_phash_id, insert_rows ) = ClientDuplicates.GenerateVPTreeRows( parent_id, phash_ids, phashes_array, job_key = job_key )
         
         job_key.SetVariable( 'popup_text_2', 'branch constructed, now committing' )
         
         self._c.executemany( 'INSERT OR REPLACE INTO shape_vptree ( phash_id, parent_id, radius, inner_id, inner_population, outer_id, outer_population ) VALUES ( ?, ?, ?, ?, ?, ?, ? );', insert_rows )
         
+        return root_phash_id
+        
     
     def _CacheSimilarFilesGetDuplicateHashes( self, file_service_key, hash, duplicate_type ):
         
@@ -1201,6 +1524,27 @@ class DB( HydrusDB.HydrusDB ):
         return ( num_phashes_to_regen, num_branches_to_regen, searched_distances_to_count, duplicate_types_to_count )
         
     
+    def _CacheSimilarFilesGetPHashSearchIndex( self ):
+        
+        if not HG.client_controller.new_options.GetBoolean( 'similar_files_use_in_memory_search' ):
+            
+            self._phash_search_index = None
+            
+            return None
+            
+        
+        if self._phash_search_index is None:
+            
+            phash_search_index = ClientDuplicates.PHashSearchIndex()
+            
+            phash_search_index.AddPHashes( self._c.execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes;' ) )
+            
+            self._phash_search_index = phash_search_index
+            
+        
+        return self._phash_search_index
+        
+    
     def _CacheSimilarFilesGetPHashId( self, phash ):
         
         result = self._c.execute( 'SELECT phash_id FROM shape_perceptual_hashes WHERE phash = ?;', ( sqlite3.Binary( phash ), ) ).fetchone()
@@ -1352,6 +1696,91 @@ class DB( HydrusDB.HydrusDB ):
             
             total_done_previously = total_num_hash_ids_in_cache - len( hash_ids )
             
+            phash_search_index = self._CacheSimilarFilesGetPHashSearchIndex()
+            
+            # a bulk pass has to look over every phash, so it is only worth it when there are more than a handful of files to search
+            # a chunk only counts once all its bands are done, so with a stop_time we start small and size later chunks to fit the time left
+            
+            if phash_search_index is not None and len( hash_ids ) >= 100:
+                
+                job_key.SetVariable( 'popup_title', 'similar files duplicate pair discovery' )
+                
+                # like the one-at-a-time search, the popup only shows if this takes a while
+                
+                if pub_job_key:
+                    
+                    job_key_pub_time = time_started + 5
+                    
+                else:
+                    
+                    job_key_pub_time = None
+                    
+                
+                job_key.SetVariable( 'popup_text_1', 'preparing bulk search' )
+                
+                ( phash_ids, phashes_array ) = phash_search_index.GetArrays()
+                
+                sorted_bands = ClientDuplicates.GetSortedPHashBands( phashes_array, search_distance )
+                
+                time_started_precise = HydrusData.GetNowPrecise()
+                
+                num_done = 0
+                
+                if stop_time is None:
+                    
+                    chunk_size = 10000
+                    
+                else:
+                    
+                    chunk_size = 100
+                    
+                
+                while num_done < len( hash_ids ):
+                    
+                    chunk_of_hash_ids = hash_ids[ num_done : num_done + chunk_size ]
+                    
+                    text = 'searched ' + HydrusData.ConvertValueRangeToPrettyString( total_done_previously + num_done, total_num_hash_ids_in_cache ) + ' files'
+                    
+                    if num_done > 0:
+                        
+                        time_took = HydrusData.GetNowPrecise() - time_started_precise
+                        
+                        time_remaining = time_took * ( len( hash_ids ) - num_done ) / num_done
+                        
+                        text += ' - about ' + HydrusData.TimeDeltaToPrettyTimeDelta( time_remaining ) + ' left'
+                        
+                    
+                    job_key.SetVariable( 'popup_text_1', text )
+                    job_key.SetVariable( 'popup_gauge_1', ( total_done_previously + num_done, total_num_hash_ids_in_cache ) )
+                    
+                    HG.client_controller.pub( 'splash_set_status_subtext', text )
+                    
+                    chunk_time_started = HydrusData.GetNowPrecise()
+                    
+                    ( completed, job_key_pub_time ) = self._CacheSimilarFilesDiscoverDuplicatePairsBatched( phash_ids, phashes_array, sorted_bands, search_distance, chunk_of_hash_ids, job_key, stop_time = stop_time, job_key_pub_time = job_key_pub_time )
+                    
+                    if not completed:
+                        
+                        return
+                        
+                    
+                    num_done += len( chunk_of_hash_ids )
+                    
+                    if stop_time is not None:
+                        
+                        time_per_file = max( HydrusData.GetNowPrecise() - chunk_time_started, 0.001 ) / len( chunk_of_hash_ids )
+                        
+                        time_left = stop_time - HydrusData.GetNowPrecise()
+                        
+                        # leave plenty of slack, as a chunk that runs out of time is thrown away
+                        
+                        chunk_size = int( min( 10000, max( 100, ( time_left / 2 ) / time_per_file ) ) )
+                        
+                    
+                
+                return
+                
+            
             for ( i, hash_id ) in enumerate( hash_ids ):
                 
                 job_key.SetVariable( 'popup_title', 'similar files duplicate pair discovery' )
@@ -1397,6 +1826,8 @@ class DB( HydrusDB.HydrusDB ):
             
             job_key.SetVariable( 'popup_text_1', 'done!' )
             job_key.DeleteVariable( 'popup_gauge_1' )
+            job_key.DeleteVariable( 'popup_text_2' ) # used in the bulk search
+            job_key.DeleteVariable( 'popup_gauge_2' )
             
             job_key.Finish()
             
@@ -1427,7 +1858,11 @@ class DB( HydrusDB.HydrusDB ):
             
             total_done_previously = total_num_hash_ids_in_cache - len( hash_ids )
             
-            for ( i, hash_id ) in enumerate( hash_ids ):
+            num_workers = self._controller.new_options.GetInteger( 'file_import_num_workers' )
+            
+            i = 0
+            
+            for block_of_hash_ids in HydrusData.SplitListIntoChunks( hash_ids, num_workers * 8 ):
                 
                 job_key.SetVariable( 'popup_title', 'similar files metadata maintenance' )
                 
@@ -1447,67 +1882,68 @@ class DB( HydrusDB.HydrusDB ):
                     return
                     
                 
-                if i % 50 == 0:
-                    
-                    gc.collect()
-                    
+                gc.collect()
                 
-                if i % 10 == 0:
-                    
-                    text = 'regenerating similar file metadata - ' + HydrusData.ConvertValueRangeToPrettyString( total_done_previously + i, total_num_hash_ids_in_cache )
-                    
-                    HG.client_controller.pub( 'splash_set_status_subtext', text )
-                    job_key.SetVariable( 'popup_text_1', text )
-                    job_key.SetVariable( 'popup_gauge_1', ( total_done_previously + i, total_num_hash_ids_in_cache ) )
-                    
+                text = 'regenerating similar file metadata - ' + HydrusData.ConvertValueRangeToPrettyString( total_done_previously + i, total_num_hash_ids_in_cache )
                 
-                try:
-                    
-                    hash = self._GetHash( hash_id )
-                    mime = self._GetMime( hash_id )
+                HG.client_controller.pub( 'splash_set_status_subtext', text )
+                job_key.SetVariable( 'popup_text_1', text )
+                job_key.SetVariable( 'popup_gauge_1', ( total_done_previously + i, total_num_hash_ids_in_cache ) )
+                
+                hash_ids_to_paths_and_mimes = {}
+                
+                for hash_id in block_of_hash_ids:
                     
-                    if mime in HC.MIMES_WE_CAN_PHASH:
+                    try:
                         
-                        path = client_files_manager.GetFilePath( hash, mime )
+                        hash = self._GetHash( hash_id )
+                        mime = self._GetMime( hash_id )
                         
                         if mime in HC.MIMES_WE_CAN_PHASH:
                             
-                            try:
-                                
-                                phashes = ClientImageHandling.GenerateShapePerceptualHashes( path, mime )
-                                
-                            except Exception as e:
-                                
-                                HydrusData.Print( 'Could not generate phashes for ' + path )
-                                
-                                HydrusData.PrintException( e )
-                                
-                                phashes = []
-                                
+                            path = client_files_manager.GetFilePath( hash, mime )
+                            
+                            hash_ids_to_paths_and_mimes[ hash_id ] = ( path, mime )
                             
                         
-                    else:
+                    except HydrusExceptions.FileMissingException:
                         
-                        phashes = []
+                        pass
                         
                     
-                except HydrusExceptions.FileMissingException:
-                    
-                    phashes = []
-                    
                 
-                existing_phash_ids = self._STS( self._c.execute( 'SELECT phash_id FROM shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) )
+                phashable_hash_ids = list( hash_ids_to_paths_and_mimes.keys() )
                 
-                correct_phash_ids = self._CacheSimilarFilesAssociatePHashes( hash_id, phashes )
+                all_phashes = ClientImageHandling.GenerateShapePerceptualHashesForPaths( [ hash_ids_to_paths_and_mimes[ hash_id ] for hash_id in phashable_hash_ids ], num_workers = num_workers )
                 
-                incorrect_phash_ids = existing_phash_ids.difference( correct_phash_ids )
+                hash_ids_to_phashes = dict( zip( phashable_hash_ids, all_phashes ) )
                 
-                if len( incorrect_phash_ids ) > 0:
+                for hash_id in block_of_hash_ids:
+                    
+                    if hash_id in hash_ids_to_phashes:
+                        
+                        phashes = hash_ids_to_phashes[ hash_id ]
+                        
+                    else:
+                        
+                        phashes = []
+                        
+                    
+                    existing_phash_ids = self._STS( self._c.execute( 'SELECT phash_id FROM shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) )
                     
-                    self._CacheSimilarFilesDisassociatePHashes( hash_id, incorrect_phash_ids )
+                    correct_phash_ids = self._CacheSimilarFilesAssociatePHashes( hash_id, phashes )
+                    
+                    incorrect_phash_ids = existing_phash_ids.difference( correct_phash_ids )
+                    
+                    if len( incorrect_phash_ids ) > 0:
+                        
+                        self._CacheSimilarFilesDisassociatePHashes( hash_id, incorrect_phash_ids )
+                        
+                    
+                    self._c.execute( 'DELETE FROM shape_maintenance_phash_regen WHERE hash_id = ?;', ( hash_id, ) )
                     
                 
-                self._c.execute( 'DELETE FROM shape_maintenance_phash_regen WHERE hash_id = ?;', ( hash_id, ) )
+                i += len( block_of_hash_ids )
                 
             
         finally:
@@ -1628,93 +2064,89 @@ class DB( HydrusDB.HydrusDB ):
         return False
         
     
-    def _CacheSimilarFilesPopBestRootNode( self, node_rows ):
+    def _CacheSimilarFilesPHashGenerationBenchmark( self, num_files ):
         
-        if len( node_rows ) == 1:
-            
-            root_row = node_rows.pop()
-            
-            return root_row
-            
+        job_key = ClientThreading.JobKey( cancellable = True )
         
-        MAX_VIEWPOINTS = 256
-        MAX_SAMPLE = 64
+        job_key.SetVariable( 'popup_title', 'similar files phash generation benchmark' )
         
-        if len( node_rows ) > MAX_VIEWPOINTS:
-            
-            viewpoints = random.sample( node_rows, MAX_VIEWPOINTS )
-            
-        else:
-            
-            viewpoints = node_rows
-            
+        self._controller.pub( 'modal_message', job_key )
         
-        if len( node_rows ) > MAX_SAMPLE:
-            
-            sample = random.sample( node_rows, MAX_SAMPLE )
-            
-        else:
+        try:
             
-            sample = node_rows
+            all_hash_ids = self._STL( self._c.execute( 'SELECT hash_id FROM shape_search_cache;' ) )
             
-        
-        final_scores = []
-        
-        for ( v_id, v_phash ) in viewpoints:
+            sample_hash_ids = random.sample( all_hash_ids, min( num_files, len( all_hash_ids ) ) )
             
-            views = [ HydrusData.Get64BitHammingDistance( v_phash, s_phash ) for ( s_id, s_phash ) in sample if v_id != s_id ]
+            client_files_manager = self._controller.client_files_manager
             
-            views.sort()
+            paths_and_mimes = []
             
-            # let's figure out the ratio of left_children to right_children, preferring 1:1, and convert it to a discrete integer score
+            for hash_id in sample_hash_ids:
+                
+                hash = self._GetHash( hash_id )
+                mime = self._GetMime( hash_id )
+                
+                try:
+                    
+                    paths_and_mimes.append( ( client_files_manager.GetFilePath( hash, mime ), mime ) )
+                    
+                except HydrusExceptions.FileMissingException:
+                    
+                    continue
+                    
+                
             
-            median_index = len( views ) / 2
+            job_key.SetVariable( 'popup_text_1', 'generating phashes for ' + HydrusData.ToHumanInt( len( paths_and_mimes ) ) + ' files one at a time' )
             
-            radius = views[ median_index ]
+            time_started_precise = HydrusData.GetNowPrecise()
             
-            num_left = float( len( [ 1 for view in views if view < radius ] ) )
-            num_radius = float( len( [ 1 for view in views if view == radius ] ) )
-            num_right = float( len( [ 1 for view in views if view > radius ] ) )
+            single_phashes = []
             
-            if num_left <= num_right:
+            for ( path, mime ) in paths_and_mimes:
                 
-                num_left += num_radius
-                
-            else:
+                if job_key.IsCancelled():
+                    
+                    return
+                    
                 
-                num_right += num_radius
+                try:
+                    
+                    single_phashes.append( ClientImageHandling.GenerateShapePerceptualHashes( path, mime ) )
+                    
+                except:
+                    
+                    single_phashes.append( set() )
+                    
                 
             
-            smaller = min( num_left, num_right )
-            larger = max( num_left, num_right )
+            single_time_took = HydrusData.GetNowPrecise() - time_started_precise
             
-            ratio = smaller / larger
+            num_workers = self._controller.new_options.GetInteger( 'file_import_num_workers' )
             
-            ratio_score = int( ratio * MAX_SAMPLE / 2 )
+            job_key.SetVariable( 'popup_text_1', 'generating phashes for ' + HydrusData.ToHumanInt( len( paths_and_mimes ) ) + ' files in a batch' )
             
-            # now let's calc the standard deviation--larger sd tends to mean less sphere overlap when searching
+            time_started_precise = HydrusData.GetNowPrecise()
             
-            mean_view = sum( views ) / float( len( views ) )
-            squared_diffs = [ ( view - mean_view  ) ** 2 for view in views ]
-            sd = ( sum( squared_diffs ) / len( squared_diffs ) ) ** 0.5
+            batched_phashes = ClientImageHandling.GenerateShapePerceptualHashesForPaths( paths_and_mimes, num_workers = num_workers )
             
-            final_scores.append( ( ratio_score, sd, v_id ) )
+            batched_time_took = HydrusData.GetNowPrecise() - time_started_precise
             
-        
-        final_scores.sort()
-        
-        # we now have a list like [ ( 11, 4.0, [id] ), ( 15, 3.7, [id] ), ( 15, 4.3, [id] ) ]
-        
-        ( ratio_gumpf, sd_gumpf, root_id ) = final_scores.pop()
-        
-        for ( i, ( v_id, v_phash ) ) in enumerate( node_rows ):
+            num_different = len( [ 1 for ( single, batched ) in zip( single_phashes, batched_phashes ) if single != batched ] )
             
-            if v_id == root_id:
-                
-                root_row = node_rows.pop( i )
-                
-                return root_row
-                
+            text = 'one at a time: ' + HydrusData.ToHumanInt( len( paths_and_mimes ) ) + ' files in ' + HydrusData.TimeDeltaToPrettyTimeDelta( single_time_took ) + ', ' + HydrusData.ToHumanInt( int( len( paths_and_mimes ) / max( single_time_took, 0.001 ) ) ) + ' files/s'
+            text += os.linesep
+            text += 'batched with ' + HydrusData.ToHumanInt( num_workers ) + ' threads: ' + HydrusData.ToHumanInt( len( paths_and_mimes ) ) + ' files in ' + HydrusData.TimeDeltaToPrettyTimeDelta( batched_time_took ) + ', ' + HydrusData.ToHumanInt( int( len( paths_and_mimes ) / max( batched_time_took, 0.001 ) ) ) + ' files/s'
+            text += os.linesep
+            text += 'files with different phashes: ' + HydrusData.ToHumanInt( num_different )
+            
+            job_key.SetVariable( 'popup_text_1', text )
+            
+            HydrusData.Print( text )
+            
+        finally:
+            
+            job_key.Finish()
             
         
     
@@ -1752,15 +2184,23 @@ class DB( HydrusDB.HydrusDB ):
         
         self._c.executemany( 'DELETE FROM shape_perceptual_hashes WHERE phash_id = ?;', ( ( p_id, ) for p_id in orphan_phash_ids ) )
         
+        if self._phash_search_index is not None:
+            
+            self._phash_search_index.RemovePHashIds( orphan_phash_ids )
+            
+        
         useful_nodes = [ row for row in unbalanced_nodes if row[0] in useful_phash_ids ]
         
         useful_population = len( useful_nodes )
         
-        # now create the new branch, starting by choosing a new root and updating the parent's left/right reference to that
+        # now create the new branch and update the parent's left/right reference to its root
         
         if useful_population > 0:
             
-            ( new_phash_id, new_phash ) = self._CacheSimilarFilesPopBestRootNode( useful_nodes ) #HydrusData.RandomPop( useful_nodes )
+            phash_ids = numpy.array( [ p_id for ( p_id, p_h ) in useful_nodes ], dtype = 'int64' )
+            phashes_array = ClientDuplicates.ConvertPHashesToNumPyArray( [ p_h for ( p_id, p_h ) in useful_nodes ] )
+            
+            new_phash_id = self._CacheSimilarFilesGenerateBranch( job_key, parent_id, phash_ids, phashes_array )
             
         else:
             
@@ -1783,11 +2223,6 @@ class DB( HydrusDB.HydrusDB ):
             self._c.execute( query, ( new_phash_id, useful_population, parent_id ) )
             
         
-        if useful_population > 0:
-            
-            self._CacheSimilarFilesGenerateBranch( job_key, parent_id, new_phash_id, new_phash, useful_nodes )
-            
-        
     
     def _CacheSimilarFilesRegenerateTree( self ):
         
@@ -1811,9 +2246,15 @@ class DB( HydrusDB.HydrusDB ):
             
             job_key.SetVariable( 'popup_text_1', HydrusData.ToHumanInt( len( all_nodes ) ) + ' leaves found, now regenerating' )
             
-            ( root_id, root_phash ) = self._CacheSimilarFilesPopBestRootNode( all_nodes ) #HydrusData.RandomPop( all_nodes )
-            
-            self._CacheSimilarFilesGenerateBranch( job_key, None, root_id, root_phash, all_nodes )
+            if len( all_nodes ) > 0:
+                
+                phash_ids = numpy.array( [ phash_id for ( phash_id, phash ) in all_nodes ], dtype = 'int64' )
+                phashes_array = ClientDuplicates.ConvertPHashesToNumPyArray( [ phash for ( phash_id, phash ) in all_nodes ] )
+                
+                del all_nodes
+                
+                self._CacheSimilarFilesGenerateBranch( job_key, None, phash_ids, phashes_array )
+                
             
         finally:
             
@@ -1836,7 +2277,7 @@ class DB( HydrusDB.HydrusDB ):
         self._c.executemany( 'INSERT OR IGNORE INTO shape_maintenance_phash_regen ( hash_id ) VALUES ( ? );', ( ( hash_id, ) for hash_id in hash_ids ) )
         
     
-    def _CacheSimilarFilesSearch( self, hash_id, max_hamming_distance ):
+    def _CacheSimilarFilesSearch( self, hash_id, max_hamming_distance, use_phash_search_index = True ):
         
         if max_hamming_distance == 0:
             
@@ -1846,6 +2287,28 @@ class DB( HydrusDB.HydrusDB ):
             
             search_radius = max_hamming_distance
             
+            if use_phash_search_index:
+                
+                phash_search_index = self._CacheSimilarFilesGetPHashSearchIndex()
+                
+            else:
+                
+                phash_search_index = None
+                
+            
+            if phash_search_index is not None:
+                
+                search_phashes = [ phash for ( phash, ) in self._c.execute( 'SELECT phash FROM shape_perceptual_hashes NATURAL JOIN shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) ]
+                
+                similar_phash_ids = phash_search_index.Search( search_phashes, search_radius )
+                
+                select_statement = 'SELECT hash_id FROM shape_perceptual_hash_map WHERE phash_id IN %s;'
+                
+                similar_hash_ids = self._STL( self._SelectFromList( select_statement, similar_phash_ids ) )
+                
+                return similar_hash_ids
+                
+            
             result = self._c.execute( 'SELECT phash_id FROM shape_vptree WHERE parent_id IS NULL;' ).fetchone()
             
             if result is None:
@@ -3014,6 +3477,27 @@ class DB( HydrusDB.HydrusDB ):
         self._CreateIndex( 'external_caches.integer_subtags', [ 'integer_subtag' ] )
         
     
+    def _CreateMediaResultSummaries( self ):
+        
+        self._c.execute( 'CREATE TABLE IF NOT EXISTS external_caches.media_result_summaries ( hash_id INTEGER PRIMARY KEY, summary TEXT );' )
+        
+        self._CreateMediaResultSummaryTriggers()
+        
+    
+    def _CreateMediaResultSummaryTriggers( self ):
+        
+        # temp triggers live on this connection only and are the only ones allowed to reach into another attached db
+        
+        for table_name in MEDIA_RESULT_SUMMARY_SOURCE_TABLES:
+            
+            trigger_name_prefix = 'media_result_summaries_' + table_name
+            
+            self._c.execute( 'CREATE TEMP TRIGGER IF NOT EXISTS ' + trigger_name_prefix + '_insert AFTER INSERT ON main.' + table_name + ' BEGIN DELETE FROM media_result_summaries WHERE hash_id = new.hash_id; END;' )
+            self._c.execute( 'CREATE TEMP TRIGGER IF NOT EXISTS ' + trigger_name_prefix + '_update AFTER UPDATE ON main.' + table_name + ' BEGIN DELETE FROM media_result_summaries WHERE hash_id IN ( old.hash_id, new.hash_id ); END;' )
+            self._c.execute( 'CREATE TEMP TRIGGER IF NOT EXISTS ' + trigger_name_prefix + '_delete AFTER DELETE ON main.' + table_name + ' BEGIN DELETE FROM media_result_summaries WHERE hash_id = old.hash_id; END;' )
+            
+        
+    
     def _DeleteFiles( self, service_id, hash_ids ):
         
         # the gui sometimes gets out of sync and sends a DELETE FROM TRASH call before the SEND TO TRASH call
@@ -3200,6 +3684,8 @@ class DB( HydrusDB.HydrusDB ):
             
             self._controller.CallToThread( client_files_manager.DelayedDeleteFiles, file_hashes )
             
+            self._c.executemany( 'DELETE FROM external_caches.file_keyframe_timestamps WHERE hash_id = ?;', ( ( hash_id, ) for hash_id in deletable_file_hash_ids ) )
+            
         
         useful_thumbnail_hash_ids = self._STS( self._c.execute( 'SELECT hash_id FROM current_files WHERE hash_id IN ' + HydrusData.SplayListForDB( hash_ids ) + ';' ) )
         
@@ -3338,6 +3824,21 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _DropMediaResultSummaries( self ):
+        
+        for table_name in MEDIA_RESULT_SUMMARY_SOURCE_TABLES:
+            
+            trigger_name_prefix = 'media_result_summaries_' + table_name
+            
+            for suffix in ( '_insert', '_update', '_delete' ):
+                
+                self._c.execute( 'DROP TRIGGER IF EXISTS temp.' + trigger_name_prefix + suffix + ';' )
+                
+            
+        
+        self._c.execute( 'DROP TABLE IF EXISTS external_caches.media_result_summaries;' )
+        
+    
     def _DisplayCatastrophicError( self, text ):
         
         message = 'The db encountered a serious error! This is going to be written to the log as well, but here it is for a screenshot:'
@@ -3592,11 +4093,98 @@ class DB( HydrusDB.HydrusDB ):
             
             if result is not None:
                 
-                hashes_result.append( hash )
+                hashes_result.append( hash )
+                
+            
+        
+        return hashes_result
+        
+    
+    def _GenerateMediaResults( self, hash_ids, table_threshold = None, use_summaries = None ):
+        
+        self._PopulateHashIdsToHashesCache( hash_ids )
+        
+        hash_ids_to_file_data = self._GetMediaResultsFileData( hash_ids, table_threshold = table_threshold, use_summaries = use_summaries )
+        
+        hash_ids_to_current_file_service_ids = { hash_id : [ file_service_id for ( file_service_id, timestamp ) in file_data[1] ] for ( hash_id, file_data ) in hash_ids_to_file_data.items() if len( file_data[1] ) > 0 }
+        
+        with HydrusDB.ListSelector( self, hash_ids, 'hash_id', table_threshold = table_threshold ) as selector:
+            
+            hash_ids_to_tags_managers = self._GetForceRefreshTagsManagers( hash_ids, hash_ids_to_current_file_service_ids = hash_ids_to_current_file_service_ids, selector = selector )
+            
+        
+        # build it
+        
+        service_ids_to_service_keys = { service_id : service_key for ( service_id, service_key ) in self._c.execute( 'SELECT service_id, service_key FROM services;' ) }
+        
+        media_results = []
+        
+        for hash_id in hash_ids:
+            
+            ( info_row, current_file_service_ids_and_timestamps, deleted_file_service_ids, pending_file_service_ids, petitioned_file_service_ids, urls, service_ids_and_filenames, service_ids_and_ratings, file_viewing_stats_row ) = hash_ids_to_file_data[ hash_id ]
+            
+            tags_manager = hash_ids_to_tags_managers[ hash_id ]
+            
+            #
+            
+            current_file_service_keys = { service_ids_to_service_keys[ service_id ] for ( service_id, timestamp ) in current_file_service_ids_and_timestamps }
+            
+            deleted_file_service_keys = { service_ids_to_service_keys[ service_id ] for service_id in deleted_file_service_ids }
+            
+            pending_file_service_keys = { service_ids_to_service_keys[ service_id ] for service_id in pending_file_service_ids }
+            
+            petitioned_file_service_keys = { service_ids_to_service_keys[ service_id ] for service_id in petitioned_file_service_ids }
+            
+            inbox = hash_id in self._inbox_hash_ids
+            
+            urls = set( urls )
+            
+            service_ids_to_filenames = HydrusData.BuildKeyToListDict( service_ids_and_filenames )
+            
+            service_keys_to_filenames = { service_ids_to_service_keys[ service_id ] : filenames for ( service_id, filenames ) in service_ids_to_filenames.items() }
+            
+            current_file_service_keys_to_timestamps = { service_ids_to_service_keys[ service_id ] : timestamp for ( service_id, timestamp ) in current_file_service_ids_and_timestamps }
+            
+            locations_manager = ClientMedia.LocationsManager( current_file_service_keys, deleted_file_service_keys, pending_file_service_keys, petitioned_file_service_keys, inbox, urls, service_keys_to_filenames, current_to_timestamps = current_file_service_keys_to_timestamps )
+            
+            #
+            
+            local_ratings = { service_ids_to_service_keys[ service_id ] : rating for ( service_id, rating ) in service_ids_and_ratings }
+            
+            ratings_manager = ClientRatings.RatingsManager( local_ratings )
+            
+            #
+            
+            if file_viewing_stats_row is None:
+                
+                file_viewing_stats_manager = ClientMedia.FileViewingStatsManager.STATICGenerateEmptyManager()
+                
+            else:
+                
+                ( preview_views, preview_viewtime, media_views, media_viewtime ) = file_viewing_stats_row
+                
+                file_viewing_stats_manager = ClientMedia.FileViewingStatsManager( preview_views, preview_viewtime, media_views, media_viewtime )
+                
+            
+            #
+            
+            hash = self._hash_ids_to_hashes_cache[ hash_id ]
+            
+            if info_row is None:
+                
+                file_info_manager = ClientMedia.FileInfoManager( hash_id, hash )
+                
+            else:
+                
+                ( size, mime, width, height, duration, num_frames, num_words ) = info_row
                 
+                file_info_manager = ClientMedia.FileInfoManager( hash_id, hash, size, mime, width, height, duration, num_frames, num_words )
+                
+            
+            media_results.append( ClientMedia.MediaResult( file_info_manager, tags_manager, locations_manager, ratings_manager, file_viewing_stats_manager ) )
             
         
-        return hashes_result
+        return media_results
         
     
     def _GenerateMappingsTables( self, service_id ):
@@ -4139,7 +4727,15 @@ class DB( HydrusDB.HydrusDB ):
         return predicates
         
     
-    def _GetForceRefreshTagsManagers( self, hash_ids, hash_ids_to_current_file_service_ids = None ):
+    def _GetForceRefreshTagsManagers( self, hash_ids, hash_ids_to_current_file_service_ids = None, selector = None ):
+        
+        if selector is None:
+            
+            with HydrusDB.ListSelector( self, hash_ids, 'hash_id' ) as selector:
+                
+                return self._GetForceRefreshTagsManagers( hash_ids, hash_ids_to_current_file_service_ids = hash_ids_to_current_file_service_ids, selector = selector )
+                
+            
         
         tag_censorship_manager = self._controller.GetManager( 'tag_censorship' )
         
@@ -4147,7 +4743,7 @@ class DB( HydrusDB.HydrusDB ):
         
         if hash_ids_to_current_file_service_ids is None:
             
-            hash_ids_to_current_file_service_ids = HydrusData.BuildKeyToListDict( self._SelectFromList( 'SELECT hash_id, service_id FROM current_files WHERE hash_id IN %s;', hash_ids ) )
+            hash_ids_to_current_file_service_ids = HydrusData.BuildKeyToListDict( selector.Select( 'SELECT hash_id, service_id FROM current_files WHERE hash_id IN %s;' ) )
             
         
         # Let's figure out if there is a common specific file service to this batch
@@ -4191,20 +4787,20 @@ class DB( HydrusDB.HydrusDB ):
             
             if common_file_service_id is None:
                 
-                tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_CURRENT, tag_id ) ) for ( hash_id, tag_id ) in self._SelectFromList( 'SELECT hash_id, tag_id FROM ' + current_mappings_table_name + ' WHERE hash_id IN %s;', hash_ids ) )
-                tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_DELETED, tag_id ) ) for ( hash_id, tag_id ) in self._SelectFromList( 'SELECT hash_id, tag_id FROM ' + deleted_mappings_table_name + ' WHERE hash_id IN %s;', hash_ids ) )
-                tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_PENDING, tag_id ) ) for ( hash_id, tag_id ) in self._SelectFromList( 'SELECT hash_id, tag_id FROM ' + pending_mappings_table_name + ' WHERE hash_id IN %s;', hash_ids ) )
+                tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_CURRENT, tag_id ) ) for ( hash_id, tag_id ) in selector.Select( 'SELECT hash_id, tag_id FROM ' + current_mappings_table_name + ' WHERE hash_id IN %s;' ) )
+                tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_DELETED, tag_id ) ) for ( hash_id, tag_id ) in selector.Select( 'SELECT hash_id, tag_id FROM ' + deleted_mappings_table_name + ' WHERE hash_id IN %s;' ) )
+                tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_PENDING, tag_id ) ) for ( hash_id, tag_id ) in selector.Select( 'SELECT hash_id, tag_id FROM ' + pending_mappings_table_name + ' WHERE hash_id IN %s;' ) )
                 
             else:
                 
                 ( cache_files_table_name, cache_current_mappings_table_name, cache_deleted_mappings_table_name, cache_pending_mappings_table_name, ac_cache_table_name ) = GenerateSpecificMappingsCacheTableNames( common_file_service_id, tag_service_id )
                 
-                tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_CURRENT, tag_id ) ) for ( hash_id, tag_id ) in self._SelectFromList( 'SELECT hash_id, tag_id FROM ' + cache_current_mappings_table_name + ' WHERE hash_id IN %s;', hash_ids ) )
-                tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_DELETED, tag_id ) ) for ( hash_id, tag_id ) in self._SelectFromList( 'SELECT hash_id, tag_id FROM ' + cache_deleted_mappings_table_name + ' WHERE hash_id IN %s;', hash_ids ) )
-                tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_PENDING, tag_id ) ) for ( hash_id, tag_id ) in self._SelectFromList( 'SELECT hash_id, tag_id FROM ' + cache_pending_mappings_table_name + ' WHERE hash_id IN %s;', hash_ids ) )
+                tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_CURRENT, tag_id ) ) for ( hash_id, tag_id ) in selector.Select( 'SELECT hash_id, tag_id FROM ' + cache_current_mappings_table_name + ' WHERE hash_id IN %s;' ) )
+                tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_DELETED, tag_id ) ) for ( hash_id, tag_id ) in selector.Select( 'SELECT hash_id, tag_id FROM ' + cache_deleted_mappings_table_name + ' WHERE hash_id IN %s;' ) )
+                tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_PENDING, tag_id ) ) for ( hash_id, tag_id ) in selector.Select( 'SELECT hash_id, tag_id FROM ' + cache_pending_mappings_table_name + ' WHERE hash_id IN %s;' ) )
                 
             
-            tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_PETITIONED, tag_id ) ) for ( hash_id, tag_id ) in self._SelectFromList( 'SELECT hash_id, tag_id FROM ' + petitioned_mappings_table_name + ' WHERE hash_id IN %s;', hash_ids ) )
+            tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_PETITIONED, tag_id ) ) for ( hash_id, tag_id ) in selector.Select( 'SELECT hash_id, tag_id FROM ' + petitioned_mappings_table_name + ' WHERE hash_id IN %s;' ) )
             
         
         seen_tag_ids = { tag_id for ( hash_id, ( tag_service_id, status, tag_id ) ) in tag_data }
@@ -5849,6 +6445,22 @@ class DB( HydrusDB.HydrusDB ):
         return value
         
     
+    def _GetKeyframeTimestamps( self, hash ):
+        
+        hash_id = self._GetHashId( hash )
+        
+        result = self._c.execute( 'SELECT timestamps FROM external_caches.file_keyframe_timestamps WHERE hash_id = ?;', ( hash_id, ) ).fetchone()
+        
+        if result is None:
+            
+            return None
+            
+        
+        ( timestamps, ) = result
+        
+        return json.loads( timestamps )
+        
+    
     def _GetLastShutdownWorkTime( self ):
         
         result = self._c.execute( 'SELECT last_shutdown_work_time FROM last_shutdown_work_time;' ).fetchone()
@@ -5863,115 +6475,140 @@ class DB( HydrusDB.HydrusDB ):
         return last_shutdown_work_time
         
     
+    def _GetMediaResultPlaceholderData( self, hash_ids ):
+        
+        # just enough to show a count, sort by the system sorts, and find the full media result later
+        
+        self._PopulateHashIdsToHashesCache( hash_ids )
+        
+        service_ids_to_service_keys = { service_id : service_key for ( service_id, service_key ) in self._c.execute( 'SELECT service_id, service_key FROM services;' ) }
+        
+        with HydrusDB.ListSelector( self, hash_ids, 'hash_id' ) as selector:
+            
+            hash_ids_to_info_rows = { hash_id : ( size, mime, width, height, duration, num_frames, num_words ) for ( hash_id, size, mime, width, height, duration, num_frames, num_words ) in selector.Select( 'SELECT * FROM files_info WHERE hash_id IN %s;' ) }
+            
+            hash_ids_to_current_file_service_ids_and_timestamps = HydrusData.BuildKeyToListDict( ( ( hash_id, ( service_id, timestamp ) ) for ( hash_id, service_id, timestamp ) in selector.Select( 'SELECT hash_id, service_id, timestamp FROM current_files WHERE hash_id IN %s;' ) ) )
+            
+        
+        placeholder_data = []
+        
+        for hash_id in hash_ids:
+            
+            hash = self._hash_ids_to_hashes_cache[ hash_id ]
+            
+            if hash_id in hash_ids_to_info_rows:
+                
+                ( size, mime, width, height, duration, num_frames, num_words ) = hash_ids_to_info_rows[ hash_id ]
+                
+                file_info_manager = ClientMedia.FileInfoManager( hash_id, hash, size, mime, width, height, duration, num_frames, num_words )
+                
+            else:
+                
+                file_info_manager = ClientMedia.FileInfoManager( hash_id, hash )
+                
+            
+            inbox = hash_id in self._inbox_hash_ids
+            
+            current_file_service_keys_to_timestamps = { service_ids_to_service_keys[ service_id ] : timestamp for ( service_id, timestamp ) in hash_ids_to_current_file_service_ids_and_timestamps[ hash_id ] }
+            
+            placeholder_data.append( ( file_info_manager, inbox, current_file_service_keys_to_timestamps ) )
+            
+        
+        return placeholder_data
+        
+    
     def _GetMediaResults( self, hash_ids ):
         
         ( cached_media_results, missing_hash_ids ) = self._weakref_media_result_cache.GetMediaResultsAndMissing( hash_ids )
         
         if len( missing_hash_ids ) > 0:
             
-            hash_ids = missing_hash_ids
+            missing_media_results = self._GenerateMediaResults( missing_hash_ids )
+            
+            self._weakref_media_result_cache.AddMediaResults( missing_media_results )
+            
+            cached_media_results.extend( missing_media_results )
+            
+        
+        # the cache hands back what it had first, so restore the caller's order, which may be a db sort
+        
+        hash_ids_to_media_results = { media_result.GetHashId() : media_result for media_result in cached_media_results }
+        
+        media_results = [ hash_ids_to_media_results[ hash_id ] for hash_id in hash_ids if hash_id in hash_ids_to_media_results ]
+        
+        return media_results
+        
+    
+    def _GetMediaResultsFileData( self, hash_ids, table_threshold = None, use_summaries = None ):
+        
+        # everything but tags and inbox, as json-friendly lists keyed by hash_id
+        
+        if use_summaries is None:
+            
+            use_summaries = self._media_result_summaries_ok
             
-            # get first detailed results
+        
+        hash_ids_to_file_data = {}
+        
+        if use_summaries:
             
-            self._PopulateHashIdsToHashesCache( hash_ids )
+            with HydrusDB.ListSelector( self, hash_ids, 'hash_id', table_threshold = table_threshold ) as selector:
+                
+                hash_ids_to_file_data = { hash_id : json.loads( summary ) for ( hash_id, summary ) in selector.Select( 'SELECT hash_id, summary FROM external_caches.media_result_summaries WHERE hash_id IN %s;' ) }
+                
             
-            hash_ids_to_info = { hash_id : ClientMedia.FileInfoManager( hash_id, self._hash_ids_to_hashes_cache[ hash_id ], size, mime, width, height, duration, num_frames, num_words ) for ( hash_id, size, mime, width, height, duration, num_frames, num_words ) in self._SelectFromList( 'SELECT * FROM files_info WHERE hash_id IN %s;', hash_ids ) }
+            hash_ids_to_load = [ hash_id for hash_id in hash_ids if hash_id not in hash_ids_to_file_data ]
             
-            hash_ids_to_current_file_service_ids_and_timestamps = HydrusData.BuildKeyToListDict( ( ( hash_id, ( service_id, timestamp ) ) for ( hash_id, service_id, timestamp ) in self._SelectFromList( 'SELECT hash_id, service_id, timestamp FROM current_files WHERE hash_id IN %s;', hash_ids ) ) )
+        else:
             
-            hash_ids_to_deleted_file_service_ids = HydrusData.BuildKeyToListDict( self._SelectFromList( 'SELECT hash_id, service_id FROM deleted_files WHERE hash_id IN %s;', hash_ids ) )
+            hash_ids_to_load = hash_ids
             
-            hash_ids_to_pending_file_service_ids = HydrusData.BuildKeyToListDict( self._SelectFromList( 'SELECT hash_id, service_id FROM file_transfers WHERE hash_id IN %s;', hash_ids ) )
+        
+        if len( hash_ids_to_load ) == 0:
             
-            hash_ids_to_petitioned_file_service_ids = HydrusData.BuildKeyToListDict( self._SelectFromList( 'SELECT hash_id, service_id FROM file_petitions WHERE hash_id IN %s;', hash_ids ) )
+            return hash_ids_to_file_data
             
-            hash_ids_to_urls = HydrusData.BuildKeyToSetDict( self._SelectFromList( 'SELECT hash_id, url FROM url_map NATURAL JOIN urls WHERE hash_id IN %s;', hash_ids ) )
+        
+        with HydrusDB.ListSelector( self, hash_ids_to_load, 'hash_id', table_threshold = table_threshold ) as selector:
             
-            hash_ids_to_service_ids_and_filenames = HydrusData.BuildKeyToListDict( ( ( hash_id, ( service_id, filename ) ) for ( hash_id, service_id, filename ) in self._SelectFromList( 'SELECT hash_id, service_id, filename FROM service_filenames WHERE hash_id IN %s;', hash_ids ) ) )
+            hash_ids_to_info_rows = { hash_id : ( size, mime, width, height, duration, num_frames, num_words ) for ( hash_id, size, mime, width, height, duration, num_frames, num_words ) in selector.Select( 'SELECT * FROM files_info WHERE hash_id IN %s;' ) }
             
-            hash_ids_to_local_ratings = HydrusData.BuildKeyToListDict( ( ( hash_id, ( service_id, rating ) ) for ( service_id, hash_id, rating ) in self._SelectFromList( 'SELECT service_id, hash_id, rating FROM local_ratings WHERE hash_id IN %s;', hash_ids ) ) )
+            hash_ids_to_current_file_service_ids_and_timestamps = HydrusData.BuildKeyToListDict( ( ( hash_id, ( service_id, timestamp ) ) for ( hash_id, service_id, timestamp ) in selector.Select( 'SELECT hash_id, service_id, timestamp FROM current_files WHERE hash_id IN %s;' ) ) )
             
-            hash_ids_to_file_viewing_stats_managers = { hash_id : ClientMedia.FileViewingStatsManager( preview_views, preview_viewtime, media_views, media_viewtime ) for ( hash_id, preview_views, preview_viewtime, media_views, media_viewtime ) in self._SelectFromList( 'SELECT hash_id, preview_views, preview_viewtime, media_views, media_viewtime FROM file_viewing_stats WHERE hash_id IN %s;', hash_ids ) }
+            hash_ids_to_deleted_file_service_ids = HydrusData.BuildKeyToListDict( selector.Select( 'SELECT hash_id, service_id FROM deleted_files WHERE hash_id IN %s;' ) )
             
-            #
+            hash_ids_to_pending_file_service_ids = HydrusData.BuildKeyToListDict( selector.Select( 'SELECT hash_id, service_id FROM file_transfers WHERE hash_id IN %s;' ) )
             
-            hash_ids_to_current_file_service_ids = { hash_id : [ file_service_id for ( file_service_id, timestamp ) in file_service_ids_and_timestamps ] for ( hash_id, file_service_ids_and_timestamps ) in hash_ids_to_current_file_service_ids_and_timestamps.items() }
+            hash_ids_to_petitioned_file_service_ids = HydrusData.BuildKeyToListDict( selector.Select( 'SELECT hash_id, service_id FROM file_petitions WHERE hash_id IN %s;' ) )
             
-            hash_ids_to_tags_managers = self._GetForceRefreshTagsManagers( hash_ids, hash_ids_to_current_file_service_ids = hash_ids_to_current_file_service_ids )
+            hash_ids_to_urls = HydrusData.BuildKeyToListDict( selector.Select( 'SELECT hash_id, url FROM url_map NATURAL JOIN urls WHERE hash_id IN %s;' ) )
             
-            # build it
+            hash_ids_to_service_ids_and_filenames = HydrusData.BuildKeyToListDict( ( ( hash_id, ( service_id, filename ) ) for ( hash_id, service_id, filename ) in selector.Select( 'SELECT hash_id, service_id, filename FROM service_filenames WHERE hash_id IN %s;' ) ) )
             
-            service_ids_to_service_keys = { service_id : service_key for ( service_id, service_key ) in self._c.execute( 'SELECT service_id, service_key FROM services;' ) }
+            hash_ids_to_local_ratings = HydrusData.BuildKeyToListDict( ( ( hash_id, ( service_id, rating ) ) for ( service_id, hash_id, rating ) in selector.Select( 'SELECT service_id, hash_id, rating FROM local_ratings WHERE hash_id IN %s;' ) ) )
             
-            missing_media_results = []
+            hash_ids_to_file_viewing_stats_rows = { hash_id : ( preview_views, preview_viewtime, media_views, media_viewtime ) for ( hash_id, preview_views, preview_viewtime, media_views, media_viewtime ) in selector.Select( 'SELECT hash_id, preview_views, preview_viewtime, media_views, media_viewtime FROM file_viewing_stats WHERE hash_id IN %s;' ) }
             
-            for hash_id in hash_ids:
-                
-                tags_manager = hash_ids_to_tags_managers[ hash_id ]
-                
-                #
-                
-                current_file_service_keys = { service_ids_to_service_keys[ service_id ] for ( service_id, timestamp ) in hash_ids_to_current_file_service_ids_and_timestamps[ hash_id ] }
-                
-                deleted_file_service_keys = { service_ids_to_service_keys[ service_id ] for service_id in hash_ids_to_deleted_file_service_ids[ hash_id ] }
-                
-                pending_file_service_keys = { service_ids_to_service_keys[ service_id ] for service_id in hash_ids_to_pending_file_service_ids[ hash_id ] }
-                
-                petitioned_file_service_keys = { service_ids_to_service_keys[ service_id ] for service_id in hash_ids_to_petitioned_file_service_ids[ hash_id ] }
-                
-                inbox = hash_id in self._inbox_hash_ids
-                
-                urls = hash_ids_to_urls[ hash_id ]
-                
-                service_ids_to_filenames = HydrusData.BuildKeyToListDict( hash_ids_to_service_ids_and_filenames[ hash_id ] )
-                
-                service_keys_to_filenames = { service_ids_to_service_keys[ service_id ] : filenames for ( service_id, filenames ) in service_ids_to_filenames.items() }
-                
-                current_file_service_keys_to_timestamps = { service_ids_to_service_keys[ service_id ] : timestamp for ( service_id, timestamp ) in hash_ids_to_current_file_service_ids_and_timestamps[ hash_id ] }
-                
-                locations_manager = ClientMedia.LocationsManager( current_file_service_keys, deleted_file_service_keys, pending_file_service_keys, petitioned_file_service_keys, inbox, urls, service_keys_to_filenames, current_to_timestamps = current_file_service_keys_to_timestamps )
-                
-                #
-                
-                local_ratings = { service_ids_to_service_keys[ service_id ] : rating for ( service_id, rating ) in hash_ids_to_local_ratings[ hash_id ] }
-                
-                ratings_manager = ClientRatings.RatingsManager( local_ratings )
-                
-                #
-                
-                if hash_id in hash_ids_to_file_viewing_stats_managers:
-                    
-                    file_viewing_stats_manager = hash_ids_to_file_viewing_stats_managers[ hash_id ]
-                    
-                else:
-                    
-                    file_viewing_stats_manager = ClientMedia.FileViewingStatsManager.STATICGenerateEmptyManager()
-                    
-                
-                #
-                
-                if hash_id in hash_ids_to_info:
-                    
-                    file_info_manager = hash_ids_to_info[ hash_id ]
-                    
-                else:
-                    
-                    hash = self._hash_ids_to_hashes_cache[ hash_id ]
-                    
-                    file_info_manager = ClientMedia.FileInfoManager( hash_id, hash )
-                    
-                
-                missing_media_results.append( ClientMedia.MediaResult( file_info_manager, tags_manager, locations_manager, ratings_manager, file_viewing_stats_manager ) )
-                
+        
+        hash_ids_to_loaded_file_data = {}
+        
+        for hash_id in hash_ids_to_load:
             
-            self._weakref_media_result_cache.AddMediaResults( missing_media_results )
+            file_data = ( hash_ids_to_info_rows.get( hash_id, None ), hash_ids_to_current_file_service_ids_and_timestamps[ hash_id ], hash_ids_to_deleted_file_service_ids[ hash_id ], hash_ids_to_pending_file_service_ids[ hash_id ], hash_ids_to_petitioned_file_service_ids[ hash_id ], hash_ids_to_urls[ hash_id ], hash_ids_to_service_ids_and_filenames[ hash_id ], hash_ids_to_local_ratings[ hash_id ], hash_ids_to_file_viewing_stats_rows.get( hash_id, None ) )
             
-            cached_media_results.extend( missing_media_results )
+            hash_ids_to_loaded_file_data[ hash_id ] = file_data
+            
+        
+        if use_summaries and not self._is_concurrent_reader:
+            
+            # the read connections leave writing to the main thread
+            
+            self._c.executemany( 'INSERT OR REPLACE INTO external_caches.media_result_summaries ( hash_id, summary ) VALUES ( ?, ? );', ( ( hash_id, json.dumps( file_data ) ) for ( hash_id, file_data ) in hash_ids_to_loaded_file_data.items() ) )
             
         
-        media_results = cached_media_results
+        hash_ids_to_file_data.update( hash_ids_to_loaded_file_data )
         
-        return media_results
+        return hash_ids_to_file_data
         
     
     def _GetMediaResultsFromHashes( self, hashes ):
@@ -6018,6 +6655,13 @@ class DB( HydrusDB.HydrusDB ):
         return namespace_id
         
     
+    def _GetNumReadConnections( self ):
+        
+        new_options = self._GetJSONDump( HydrusSerialisable.SERIALISABLE_TYPE_CLIENT_OPTIONS )
+        
+        return new_options.GetInteger( 'db_num_read_connections' )
+        
+    
     def _GetNumsPending( self ):
         
         services = self._GetServices( ( HC.TAG_REPOSITORY, HC.FILE_REPOSITORY, HC.IPFS ) )
@@ -6718,6 +7362,55 @@ class DB( HydrusDB.HydrusDB ):
         return site_id
         
     
+    def _GetSortedHashIds( self, file_service_key, hash_ids, media_sorts ):
+        
+        # these mirror the key functions in MediaSort.GetSortKeyAndReverse, missing values and all
+        
+        file_service_id = self._GetServiceId( file_service_key )
+        
+        service = self._GetService( file_service_id )
+        
+        if service.GetServiceType() == HC.LOCAL_FILE_DOMAIN:
+            
+            file_service_id = self._combined_local_file_service_id
+            
+        
+        sort_datas_to_order_bys = {}
+        
+        sort_datas_to_order_bys[ CC.SORT_FILES_BY_FILESIZE ] = 'IFNULL( size, 0 )'
+        sort_datas_to_order_bys[ CC.SORT_FILES_BY_DURATION ] = 'IFNULL( duration, -1 )'
+        sort_datas_to_order_bys[ CC.SORT_FILES_BY_IMPORT_TIME ] = 'IFNULL( timestamp, -1 )'
+        sort_datas_to_order_bys[ CC.SORT_FILES_BY_MIME ] = 'mime'
+        sort_datas_to_order_bys[ CC.SORT_FILES_BY_RANDOM ] = 'RANDOM()'
+        sort_datas_to_order_bys[ CC.SORT_FILES_BY_WIDTH ] = 'IFNULL( width, 0 )'
+        sort_datas_to_order_bys[ CC.SORT_FILES_BY_HEIGHT ] = 'CASE WHEN width IS NULL THEN 0 ELSE IFNULL( height, -1 ) END'
+        sort_datas_to_order_bys[ CC.SORT_FILES_BY_RATIO ] = 'CASE WHEN width IS NULL OR height IS NULL OR width = 0 OR height = 0 THEN -1 ELSE CAST( width AS REAL ) / height END'
+        sort_datas_to_order_bys[ CC.SORT_FILES_BY_NUM_PIXELS ] = 'CASE WHEN width IS NULL THEN 0 WHEN height IS NULL THEN -1 ELSE width * height END'
+        
+        order_bys = []
+        
+        for media_sort in media_sorts:
+            
+            ( sort_metadata, sort_data ) = media_sort.sort_type
+            
+            order_by = sort_datas_to_order_bys[ sort_data ]
+            
+            if media_sort.sort_asc == CC.SORT_DESC:
+                
+                order_by += ' DESC'
+                
+            
+            order_bys.append( order_by )
+            
+        
+        with HydrusDB.TemporaryIntegerTable( self._c, hash_ids, 'hash_id' ) as temp_table_name:
+            
+            sorted_hash_ids = self._STL( self._c.execute( 'SELECT ' + temp_table_name + '.hash_id FROM ' + temp_table_name + ' LEFT OUTER JOIN files_info USING ( hash_id ) LEFT OUTER JOIN current_files ON ( current_files.hash_id = ' + temp_table_name + '.hash_id AND current_files.service_id = ? ) ORDER BY ' + ', '.join( order_bys ) + ';', ( file_service_id, ) ) )
+            
+        
+        return sorted_hash_ids
+        
+    
     def _GetSubtagId( self, subtag ):
         
         result = self._c.execute( 'SELECT subtag_id FROM subtags WHERE subtag = ?;', ( subtag, ) ).fetchone()
@@ -7184,51 +7877,126 @@ class DB( HydrusDB.HydrusDB ):
     
     def _ImportFile( self, file_import_job ):
         
-        hash = file_import_job.GetHash()
+        return self._ImportFiles( [ file_import_job ] )[0]
         
-        hash_id = self._GetHashId( hash )
+    
+    def _ImportFiles( self, file_import_jobs ):
         
-        ( status, status_hash, note ) = self._GetHashIdStatus( hash_id, prefix = 'recognised during import' )
+        hashes_to_hash_ids = {}
+        hashes_to_statuses_and_notes = {}
         
-        if status != CC.STATUS_SUCCESSFUL_BUT_REDUNDANT:
+        for file_import_job in file_import_jobs:
+            
+            hash = file_import_job.GetHash()
             
-            ( size, mime, width, height, duration, num_frames, num_words ) = file_import_job.GetFileInfo()
+            if hash not in hashes_to_hash_ids:
+                
+                hash_id = self._GetHashId( hash )
+                
+                hashes_to_hash_ids[ hash ] = hash_id
+                
+                ( status, status_hash, note ) = self._GetHashIdStatus( hash_id, prefix = 'recognised during import' )
+                
+                hashes_to_statuses_and_notes[ hash ] = ( status, note )
+                
             
-            timestamp = HydrusData.GetNow()
+        
+        timestamp = HydrusData.GetNow()
+        
+        files_info_rows = []
+        local_hashes_rows = []
+        content_updates = []
+        archive_hash_ids = []
+        inbox_hash_ids = []
+        
+        new_hashes = set()
+        statuses_and_notes = []
+        
+        for file_import_job in file_import_jobs:
             
-            phashes = file_import_job.GetPHashes()
+            hash = file_import_job.GetHash()
+            hash_id = hashes_to_hash_ids[ hash ]
             
-            if phashes is not None:
+            if hash in new_hashes:
+                
+                # the same file twice in one batch, so this one is a dupe of the first
                 
-                self._CacheSimilarFilesAssociatePHashes( hash_id, phashes )
+                statuses_and_notes.append( None )
+                
+                continue
                 
             
-            self._AddFilesInfo( [ ( hash_id, size, mime, width, height, duration, num_frames, num_words ) ], overwrite = True )
+            ( status, note ) = hashes_to_statuses_and_notes[ hash ]
             
-            self._AddFiles( self._local_file_service_id, [ ( hash_id, timestamp ) ] )
+            if status != CC.STATUS_SUCCESSFUL_BUT_REDUNDANT:
+                
+                ( size, mime, width, height, duration, num_frames, num_words ) = file_import_job.GetFileInfo()
+                
+                phashes = file_import_job.GetPHashes()
+                
+                if phashes is not None:
+                    
+                    self._CacheSimilarFilesAssociatePHashes( hash_id, phashes )
+                    
+                
+                files_info_rows.append( ( hash_id, size, mime, width, height, duration, num_frames, num_words ) )
+                
+                file_info_manager = ClientMedia.FileInfoManager( hash_id, hash, size, mime, width, height, duration, num_frames, num_words )
+                
+                content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( file_info_manager, timestamp ) ) )
+                
+                ( md5, sha1, sha512 ) = file_import_job.GetExtraHashes()
+                
+                local_hashes_rows.append( ( hash_id, sqlite3.Binary( md5 ), sqlite3.Binary( sha1 ), sqlite3.Binary( sha512 ) ) )
+                
+                file_import_options = file_import_job.GetFileImportOptions()
+                
+                if file_import_options.AutomaticallyArchives():
+                    
+                    archive_hash_ids.append( hash_id )
+                    
+                else:
+                    
+                    inbox_hash_ids.append( hash_id )
+                    
+                
+                new_hashes.add( hash )
+                
+                status = CC.STATUS_SUCCESSFUL_AND_NEW
+                
             
-            file_info_manager = ClientMedia.FileInfoManager( hash_id, hash, size, mime, width, height, duration, num_frames, num_words )
+            statuses_and_notes.append( ( status, note ) )
             
-            content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( file_info_manager, timestamp ) )
+        
+        if len( files_info_rows ) > 0:
             
-            self.pub_content_updates_after_commit( { CC.LOCAL_FILE_SERVICE_KEY : [ content_update ] } )
+            self._AddFilesInfo( files_info_rows, overwrite = True )
             
-            ( md5, sha1, sha512 ) = file_import_job.GetExtraHashes()
+            self._AddFiles( self._local_file_service_id, [ ( hash_id, timestamp ) for ( hash_id, size, mime, width, height, duration, num_frames, num_words ) in files_info_rows ] )
             
-            self._c.execute( 'INSERT OR IGNORE INTO local_hashes ( hash_id, md5, sha1, sha512 ) VALUES ( ?, ?, ?, ? );', ( hash_id, sqlite3.Binary( md5 ), sqlite3.Binary( sha1 ), sqlite3.Binary( sha512 ) ) )
+            self.pub_content_updates_after_commit( { CC.LOCAL_FILE_SERVICE_KEY : content_updates } )
             
-            file_import_options = file_import_job.GetFileImportOptions()
+            self._c.executemany( 'INSERT OR IGNORE INTO local_hashes ( hash_id, md5, sha1, sha512 ) VALUES ( ?, ?, ?, ? );', local_hashes_rows )
             
-            if file_import_options.AutomaticallyArchives():
+            if len( archive_hash_ids ) > 0:
                 
-                self._ArchiveFiles( ( hash_id, ) )
+                self._ArchiveFiles( archive_hash_ids )
                 
-            else:
+            
+            if len( inbox_hash_ids ) > 0:
                 
-                self._InboxFiles( ( hash_id, ) )
+                self._InboxFiles( inbox_hash_ids )
                 
             
-            status = CC.STATUS_SUCCESSFUL_AND_NEW
+        
+        for ( i, file_import_job ) in enumerate( file_import_jobs ):
+            
+            if statuses_and_notes[ i ] is None:
+                
+                ( status, status_hash, note ) = self._GetHashIdStatus( hashes_to_hash_ids[ file_import_job.GetHash() ], prefix = 'recognised during import' )
+                
+                statuses_and_notes[ i ] = ( CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, note )
+                
             
         
         tag_services = self._GetServices( HC.TAG_SERVICES )
@@ -7247,7 +8015,7 @@ class DB( HydrusDB.HydrusDB ):
                 
                 try:
                     
-                    self._SyncHashesToTagArchive( [ hash ], hta_path, service_key, adding, namespaces )
+                    self._SyncHashesToTagArchive( hashes_to_hash_ids.keys(), hta_path, service_key, adding, namespaces )
                     
                 except:
                     
@@ -7256,7 +8024,7 @@ class DB( HydrusDB.HydrusDB ):
                 
             
         
-        return ( status, note )
+        return statuses_and_notes
         
     
     def _ImportUpdate( self, update_network_string, update_hash, mime ):
@@ -7331,6 +8099,7 @@ class DB( HydrusDB.HydrusDB ):
         
         self._weakref_media_result_cache = ClientCaches.MediaResultCache()
         self._hash_ids_to_hashes_cache = {}
+        self._phash_search_index = None
         self._tag_ids_to_tags_cache = {}
         
         ( self._null_namespace_id, ) = self._c.execute( 'SELECT namespace_id FROM namespaces WHERE namespace = ?;', ( '', ) ).fetchone()
@@ -7339,6 +8108,24 @@ class DB( HydrusDB.HydrusDB ):
         
         self._inbox_hash_ids = self._STS( self._c.execute( 'SELECT hash_id FROM file_inbox;' ) )
         
+        new_options = self._GetJSONDump( HydrusSerialisable.SERIALISABLE_TYPE_CLIENT_OPTIONS )
+        
+        # derived from the files themselves, so older dbs can just start it empty
+        
+        self._c.execute( 'CREATE TABLE IF NOT EXISTS external_caches.file_keyframe_timestamps ( hash_id INTEGER PRIMARY KEY, timestamps TEXT );' )
+        
+        self._SetMediaResultSummariesOK( new_options.GetBoolean( 'db_cache_media_result_summaries' ) )
+        
+    
+    def _InitDBCursor( self ):
+        
+        HydrusDB.HydrusDB._InitDBCursor( self )
+        
+        if self._MediaResultSummariesExist():
+            
+            self._CreateMediaResultSummaryTriggers()
+            
+        
     
     def _InitDiskCache( self ):
         
@@ -7509,6 +8296,13 @@ class DB( HydrusDB.HydrusDB ):
         return True
         
     
+    def _MediaResultSummariesExist( self ):
+        
+        result = self._c.execute( 'SELECT 1 FROM external_caches.sqlite_master WHERE type = ? AND name = ?;', ( 'table', 'media_result_summaries' ) ).fetchone()
+        
+        return result is not None
+        
+    
     def _MaintainReparseFiles( self, stop_time = None ):
         
         if stop_time is None:
@@ -7546,6 +8340,10 @@ class DB( HydrusDB.HydrusDB ):
     
     def _ManageDBError( self, job, e ):
         
+        # the job is about to be rolled back, so anything it did to the phash index may now be wrong. it'll reload on next search
+        
+        self._phash_search_index = None
+        
         if isinstance( e, MemoryError ):
             
             HydrusData.ShowText( 'The client is running out of memory! Restart it ASAP!' )
@@ -8382,7 +9180,7 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
-    def _ProcessRepositoryContentUpdate( self, job_key, service_id, content_update ):
+    def _ProcessRepositoryContentUpdate( self, job_key, service_id, content_update, row_names_to_speed_stats = None ):
         
         FILES_CHUNK_SIZE = 200
         MAPPINGS_CHUNK_SIZE = 50000
@@ -8423,7 +9221,7 @@ class DB( HydrusDB.HydrusDB ):
             
             rows_processed += num_rows
             
-            report_content_speed_to_job_key( job_key, rows_processed, total_rows, precise_timestamp, num_rows, 'new files' )
+            report_content_speed_to_job_key( job_key, rows_processed, total_rows, precise_timestamp, num_rows, 'new files', row_names_to_speed_stats )
             job_key.SetVariable( 'popup_gauge_2', ( rows_processed, total_rows ) )
             
         
@@ -8450,7 +9248,7 @@ class DB( HydrusDB.HydrusDB ):
             
             rows_processed += num_rows
             
-            report_content_speed_to_job_key( job_key, rows_processed, total_rows, precise_timestamp, num_rows, 'deleted files' )
+            report_content_speed_to_job_key( job_key, rows_processed, total_rows, precise_timestamp, num_rows, 'deleted files', row_names_to_speed_stats )
             job_key.SetVariable( 'popup_gauge_2', ( rows_processed, total_rows ) )
             
         
@@ -8485,7 +9283,7 @@ class DB( HydrusDB.HydrusDB ):
             
             rows_processed += num_rows
             
-            report_content_speed_to_job_key( job_key, rows_processed, total_rows, precise_timestamp, num_rows, 'new mappings' )
+            report_content_speed_to_job_key( job_key, rows_processed, total_rows, precise_timestamp, num_rows, 'new mappings', row_names_to_speed_stats )
             job_key.SetVariable( 'popup_gauge_2', ( rows_processed, total_rows ) )
             
         
@@ -8520,7 +9318,7 @@ class DB( HydrusDB.HydrusDB ):
             
             rows_processed += num_rows
             
-            report_content_speed_to_job_key( job_key, rows_processed, total_rows, precise_timestamp, num_rows, 'deleted mappings' )
+            report_content_speed_to_job_key( job_key, rows_processed, total_rows, precise_timestamp, num_rows, 'deleted mappings', row_names_to_speed_stats )
             job_key.SetVariable( 'popup_gauge_2', ( rows_processed, total_rows ) )
             
         
@@ -8553,7 +9351,7 @@ class DB( HydrusDB.HydrusDB ):
             
             rows_processed += num_rows
             
-            report_content_speed_to_job_key( job_key, rows_processed, total_rows, precise_timestamp, num_rows, 'new tag parents' )
+            report_content_speed_to_job_key( job_key, rows_processed, total_rows, precise_timestamp, num_rows, 'new tag parents', row_names_to_speed_stats )
             job_key.SetVariable( 'popup_gauge_2', ( rows_processed, total_rows ) )
             
         
@@ -8588,7 +9386,7 @@ class DB( HydrusDB.HydrusDB ):
             
             rows_processed += num_rows
             
-            report_content_speed_to_job_key( job_key, rows_processed, total_rows, precise_timestamp, num_rows, 'deleted tag parents' )
+            report_content_speed_to_job_key( job_key, rows_processed, total_rows, precise_timestamp, num_rows, 'deleted tag parents', row_names_to_speed_stats )
             job_key.SetVariable( 'popup_gauge_2', ( rows_processed, total_rows ) )
             
         
@@ -8623,7 +9421,7 @@ class DB( HydrusDB.HydrusDB ):
             
             rows_processed += num_rows
             
-            report_content_speed_to_job_key( job_key, rows_processed, total_rows, precise_timestamp, num_rows, 'new tag siblings' )
+            report_content_speed_to_job_key( job_key, rows_processed, total_rows, precise_timestamp, num_rows, 'new tag siblings', row_names_to_speed_stats )
             job_key.SetVariable( 'popup_gauge_2', ( rows_processed, total_rows ) )
             
         
@@ -8658,7 +9456,7 @@ class DB( HydrusDB.HydrusDB ):
             
             rows_processed += num_rows
             
-            report_content_speed_to_job_key( job_key, rows_processed, total_rows, precise_timestamp, num_rows, 'deleted tag siblings' )
+            report_content_speed_to_job_key( job_key, rows_processed, total_rows, precise_timestamp, num_rows, 'deleted tag siblings', row_names_to_speed_stats )
             job_key.SetVariable( 'popup_gauge_2', ( rows_processed, total_rows ) )
             
         
@@ -8785,9 +9583,13 @@ class DB( HydrusDB.HydrusDB ):
                     
                     total_definitions_rows = 0
                     
+                    hash_ids_and_hashes = [ ( hash_id, self._GetHash( hash_id ) ) for hash_id in definition_hash_ids ]
+                    
+                    update_loader = RepositoryUpdateLoader( client_files_manager, hash_ids_and_hashes, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS )
+                    
                     try:
                         
-                        for hash_id in definition_hash_ids:
+                        for ( hash_id, definition_update ) in update_loader.IterateUpdates():
                             
                             ( i_paused, should_quit ) = job_key.WaitIfNeeded()
                             
@@ -8801,17 +9603,6 @@ class DB( HydrusDB.HydrusDB ):
                             job_key.SetVariable( 'popup_text_1', status )
                             job_key.SetVariable( 'popup_gauge_1', ( num_updates_done, num_updates_to_do ) )
                             
-                            update_hash = self._GetHash( hash_id )
-                            
-                            update_path = client_files_manager.LocklessGetFilePath( update_hash, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS )
-                            
-                            with open( update_path, 'rb' ) as f:
-                                
-                                update_network_string = f.read()
-                                
-                            
-                            definition_update = HydrusSerialisable.CreateFromNetworkString( update_network_string )
-                            
                             precise_timestamp = HydrusData.GetNowPrecise()
                             
                             self._ProcessRepositoryDefinitionUpdate( service_id, definition_update )
@@ -8840,6 +9631,8 @@ class DB( HydrusDB.HydrusDB ):
                         
                     finally:
                         
+                        update_loader.Stop()
+                        
                         report_speed_to_log( larger_precise_timestamp, total_definitions_rows, 'definitions' )
                         
                     
@@ -8854,9 +9647,15 @@ class DB( HydrusDB.HydrusDB ):
                     
                     total_content_rows = 0
                     
+                    row_names_to_speed_stats = {}
+                    
+                    hash_ids_and_hashes = [ ( hash_id, self._GetHash( hash_id ) ) for hash_id in content_hash_ids ]
+                    
+                    update_loader = RepositoryUpdateLoader( client_files_manager, hash_ids_and_hashes, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS )
+                    
                     try:
                         
-                        for hash_id in content_hash_ids:
+                        for ( hash_id, content_update ) in update_loader.IterateUpdates():
                             
                             ( i_paused, should_quit ) = job_key.WaitIfNeeded()
                             
@@ -8867,21 +9666,15 @@ class DB( HydrusDB.HydrusDB ):
                             
                             status = 'processing ' + HydrusData.ConvertValueRangeToPrettyString( num_updates_done + 1, num_updates_to_do )
                             
-                            job_key.SetVariable( 'popup_text_1', status )
-                            job_key.SetVariable( 'popup_gauge_1', ( num_updates_done, num_updates_to_do ) )
-                            
-                            update_hash = self._GetHash( hash_id )
-                            
-                            update_path = client_files_manager.LocklessGetFilePath( update_hash, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS )
-                            
-                            with open( update_path, 'rb' ) as f:
+                            if len( row_names_to_speed_stats ) > 0:
                                 
-                                update_network_string = f.read()
+                                status += os.linesep + ConvertSpeedStatsToPrettyString( row_names_to_speed_stats )
                                 
                             
-                            content_update = HydrusSerialisable.CreateFromNetworkString( update_network_string )
+                            job_key.SetVariable( 'popup_text_1', status )
+                            job_key.SetVariable( 'popup_gauge_1', ( num_updates_done, num_updates_to_do ) )
                             
-                            did_whole_update = self._ProcessRepositoryContentUpdate( job_key, service_id, content_update )
+                            did_whole_update = self._ProcessRepositoryContentUpdate( job_key, service_id, content_update, row_names_to_speed_stats )
                             
                             ( i_paused, should_quit ) = job_key.WaitIfNeeded()
                             
@@ -8901,8 +9694,12 @@ class DB( HydrusDB.HydrusDB ):
                         
                     finally:
                         
+                        update_loader.Stop()
+                        
                         report_speed_to_log( precise_timestamp, total_content_rows, 'content rows' )
                         
+                        report_speed_stats_to_log( row_names_to_speed_stats )
+                        
                     
                 
             finally:
@@ -8965,6 +9762,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'imageboards': result = self._GetYAMLDump( YAML_DUMP_ID_IMAGEBOARD, *args, **kwargs )
         elif action == 'in_inbox': result = self._InInbox( *args, **kwargs )
         elif action == 'is_an_orphan': result = self._IsAnOrphan( *args, **kwargs )
+        elif action == 'keyframe_timestamps': result = self._GetKeyframeTimestamps( *args, **kwargs )
         elif action == 'last_shutdown_work_time': result = self._GetLastShutdownWorkTime( *args, **kwargs )
         elif action == 'load_into_disk_cache': result = self._LoadIntoDiskCache( *args, **kwargs )
         elif action == 'local_booru_share_keys': result = self._GetYAMLDumpNames( YAML_DUMP_ID_LOCAL_BOORU )
@@ -8972,7 +9770,9 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'local_booru_shares': result = self._GetYAMLDump( YAML_DUMP_ID_LOCAL_BOORU )
         elif action == 'maintenance_due': result = self._GetMaintenanceDue( *args, **kwargs )
         elif action == 'media_results': result = self._GetMediaResultsFromHashes( *args, **kwargs )
+        elif action == 'media_result_placeholder_data': result = self._GetMediaResultPlaceholderData( *args, **kwargs )
         elif action == 'media_results_from_ids': result = self._GetMediaResults( *args, **kwargs )
+        elif action == 'media_results_benchmark': result = self._BenchmarkMediaResults( *args, **kwargs )
         elif action == 'missing_repository_update_hashes': result = self._GetRepositoryUpdateHashesIDoNotHave( *args, **kwargs )
         elif action == 'missing_thumbnail_hashes': result = self._GetRepositoryThumbnailHashesIDoNotHave( *args, **kwargs )
         elif action == 'nums_pending': result = self._GetNumsPending( *args, **kwargs )
@@ -8991,6 +9791,9 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'service_filenames': result = self._GetServiceFilenames( *args, **kwargs )
         elif action == 'service_info': result = self._GetServiceInfo( *args, **kwargs )
         elif action == 'services': result = self._GetServices( *args, **kwargs )
+        elif action == 'sorted_hash_ids': result = self._GetSortedHashIds( *args, **kwargs )
+        elif action == 'similar_files_discovery_benchmark': result = self._CacheSimilarFilesDiscoveryBenchmark( *args, **kwargs )
+        elif action == 'similar_files_phash_generation_benchmark': result = self._CacheSimilarFilesPHashGenerationBenchmark( *args, **kwargs )
         elif action == 'similar_files_maintenance_status': result = self._CacheSimilarFilesGetMaintenanceStatus( *args, **kwargs )
         elif action == 'related_tags': result = self._GetRelatedTags( *args, **kwargs )
         elif action == 'tag_censorship': result = self._GetTagCensorship( *args, **kwargs )
@@ -9497,6 +10300,16 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.execute( 'INSERT INTO json_dumps ( dump_type, version, dump ) VALUES ( ?, ?, ? );', ( dump_type, version, sqlite3.Binary( dump ) ) )
             
+            if dump_type == HydrusSerialisable.SERIALISABLE_TYPE_CLIENT_OPTIONS:
+                
+                media_result_summaries_ok = obj.GetBoolean( 'db_cache_media_result_summaries' )
+                
+                if media_result_summaries_ok != self._media_result_summaries_ok:
+                    
+                    self._SetMediaResultSummariesOK( media_result_summaries_ok )
+                    
+                
+            
         
     
     def _SetJSONSimple( self, name, value ):
@@ -9513,6 +10326,13 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _SetKeyframeTimestamps( self, hash, timestamps ):
+        
+        hash_id = self._GetHashId( hash )
+        
+        self._c.execute( 'REPLACE INTO external_caches.file_keyframe_timestamps ( hash_id, timestamps ) VALUES ( ?, ? );', ( hash_id, json.dumps( timestamps ) ) )
+        
+    
     def _SetLastShutdownWorkTime( self, timestamp ):
         
         self._c.execute( 'DELETE from last_shutdown_work_time;' )
@@ -9520,6 +10340,22 @@ class DB( HydrusDB.HydrusDB ):
         self._c.execute( 'INSERT INTO last_shutdown_work_time ( last_shutdown_work_time ) VALUES ( ? );', ( timestamp, ) )
         
     
+    def _SetMediaResultSummariesOK( self, media_result_summaries_ok ):
+        
+        self._media_result_summaries_ok = media_result_summaries_ok
+        
+        if self._media_result_summaries_ok:
+            
+            self._CreateMediaResultSummaries()
+            
+        else:
+            
+            # without the triggers running, an old table would go stale
+            
+            self._DropMediaResultSummaries()
+            
+        
+    
     def _SetPassword( self, password ):
         
         if password is not None:
@@ -9741,6 +10577,10 @@ class DB( HydrusDB.HydrusDB ):
         
         self._controller.pub( 'splash_set_status_text', 'updating db to v' + str( version + 1 ) )
         
+        # updates can shuffle the tables these summarise without the triggers watching, so start them again afterwards
+        
+        self._DropMediaResultSummaries()
+        
         if version == 281:
             
             try:
@@ -12089,7 +12929,9 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'file_integrity': result = self._CheckFileIntegrity( *args, **kwargs )
         elif action == 'imageboard': result = self._SetYAMLDump( YAML_DUMP_ID_IMAGEBOARD, *args, **kwargs )
         elif action == 'import_file': result = self._ImportFile( *args, **kwargs )
+        elif action == 'import_files': result = self._ImportFiles( *args, **kwargs )
         elif action == 'import_update': result = self._ImportUpdate( *args, **kwargs )
+        elif action == 'keyframe_timestamps': result = self._SetKeyframeTimestamps( *args, **kwargs )
         elif action == 'last_shutdown_work_time': result = self._SetLastShutdownWorkTime( *args, **kwargs )
         elif action == 'local_booru_share': result = self._SetYAMLDump( YAML_DUMP_ID_LOCAL_BOORU, *args, **kwargs )
         elif action == 'maintain_file_reparsing': result = self._MaintainReparseFiles( *args, **kwargs )
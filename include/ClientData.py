@@ -1,6 +1,7 @@
 import ClientConstants as CC
 import ClientDefaults
 import ClientDownloading
+import ClientMedia
 import ClientThreading
 import collections
 import HydrusConstants as HC
@@ -253,6 +254,15 @@ def GetMediasTagCount( pool, tag_service_key = CC.COMBINED_TAG_SERVICE_KEY, coll
             
         else:
             
+            media_result = media.GetMediaResult()
+            
+            if isinstance( media_result, ClientMedia.MediaResultPlaceholder ) and not media_result.IsLoaded():
+                
+                # lazily loaded pages only count what they have loaded
+                
+                continue
+                
+            
             tags_managers.append( media.GetTagsManager() )
             
         
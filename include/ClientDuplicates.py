@@ -5,7 +5,340 @@ import HydrusData
 import HydrusExceptions
 import HydrusGlobals as HG
 import HydrusSerialisable
+import numpy
+import random
+import struct
+import threading
 
+PHASH_POPCOUNT_LOOKUP = numpy.array( [ bin( i ).count( '1' ) for i in range( 256 ) ], dtype = 'uint8' )
+
+def CombinePHashPairs( list_of_pairs ):
+    
+    if len( list_of_pairs ) == 0:
+        
+        return numpy.empty( ( 0, 2 ), dtype = 'int64' )
+        
+    
+    pairs = numpy.concatenate( list_of_pairs )
+    
+    pairs.sort( axis = 1 )
+    
+    return pairs
+    
+def ConvertPHashesToNumPyArray( phashes ):
+    
+    # phashes come out of sqlite as buffers, so str them before joining
+    
+    phashes_string = ''.join( ( str( phash ) for phash in phashes ) )
+    
+    return numpy.frombuffer( phashes_string, dtype = '>u8' ).astype( 'uint64' )
+    
+def GenerateVPTreeRows( parent_id, phash_ids, phashes_array, job_key = None ):
+    
+    # builds a whole vp-tree branch in memory, returning the branch's root phash_id and its shape_vptree rows
+    
+    num_to_do = len( phash_ids )
+    
+    root_index = GetBestVPTreeRootIndex( phashes_array )
+    
+    process_queue = collections.deque()
+    
+    process_queue.append( ( parent_id, ) + PopVPTreeNode( phash_ids, phashes_array, root_index ) )
+    
+    root_phash_id = int( phash_ids[ root_index ] )
+    
+    insert_rows = []
+    
+    while len( process_queue ) > 0:
+        
+        if job_key is not None and len( insert_rows ) % 1000 == 0:
+            
+            job_key.SetVariable( 'popup_text_2', 'generating new branch -- ' + HydrusData.ConvertValueRangeToPrettyString( len( insert_rows ), num_to_do ) )
+            
+        
+        ( parent_id, phash_id, phash, children_ids, children_phashes ) = process_queue.popleft()
+        
+        if len( children_ids ) == 0:
+            
+            insert_rows.append( ( phash_id, parent_id, None, None, 0, None, 0 ) )
+            
+            continue
+            
+        
+        distances = GetUInt64HammingDistances( children_phashes, phash )
+        
+        median_index = len( distances ) // 2
+        
+        median_radius = int( numpy.partition( distances, median_index )[ median_index ] )
+        
+        inner_mask = distances < median_radius
+        radius_mask = distances == median_radius
+        outer_mask = distances > median_radius
+        
+        if inner_mask.sum() <= outer_mask.sum():
+            
+            radius = median_radius
+            
+            inner_mask = numpy.logical_or( inner_mask, radius_mask )
+            
+        else:
+            
+            radius = median_radius - 1
+            
+            outer_mask = numpy.logical_or( outer_mask, radius_mask )
+            
+        
+        inner_ids = children_ids[ inner_mask ]
+        inner_phashes = children_phashes[ inner_mask ]
+        
+        outer_ids = children_ids[ outer_mask ]
+        outer_phashes = children_phashes[ outer_mask ]
+        
+        inner_population = len( inner_ids )
+        outer_population = len( outer_ids )
+        
+        inner_node = PopVPTreeNode( inner_ids, inner_phashes, GetBestVPTreeRootIndex( inner_phashes ) )
+        
+        inner_id = inner_node[0]
+        
+        process_queue.append( ( phash_id, ) + inner_node )
+        
+        if outer_population == 0:
+            
+            outer_id = None
+            
+        else:
+            
+            outer_node = PopVPTreeNode( outer_ids, outer_phashes, GetBestVPTreeRootIndex( outer_phashes ) )
+            
+            outer_id = outer_node[0]
+            
+            process_queue.append( ( phash_id, ) + outer_node )
+            
+        
+        insert_rows.append( ( phash_id, parent_id, radius, inner_id, inner_population, outer_id, outer_population ) )
+        
+    
+    return ( root_phash_id, insert_rows )
+    
+def GetBestVPTreeRootIndex( phashes_array ):
+    
+    # we want a viewpoint that splits a sample into two equal halves, preferring a wider spread of distances when that ties
+    
+    num_nodes = len( phashes_array )
+    
+    if num_nodes <= 2:
+        
+        # any root splits these perfectly
+        
+        return 0
+        
+    
+    MAX_VIEWPOINTS = 256
+    MAX_SAMPLE = 64
+    
+    if num_nodes > MAX_VIEWPOINTS:
+        
+        viewpoint_indices = numpy.array( random.sample( xrange( num_nodes ), MAX_VIEWPOINTS ), dtype = 'int64' )
+        
+    else:
+        
+        viewpoint_indices = numpy.arange( num_nodes )
+        
+    
+    if num_nodes > MAX_SAMPLE:
+        
+        sample_indices = numpy.array( random.sample( xrange( num_nodes ), MAX_SAMPLE ), dtype = 'int64' )
+        
+    else:
+        
+        sample_indices = numpy.arange( num_nodes )
+        
+    
+    xored = numpy.bitwise_xor( phashes_array[ viewpoint_indices ][ :, None ], phashes_array[ sample_indices ][ None, : ] )
+    
+    views = PHASH_POPCOUNT_LOOKUP[ xored.view( 'uint8' ) ].reshape( xored.shape + ( 8, ) ).sum( axis = 2 )
+    
+    # a viewpoint does not view itself. we push those cells to the end of the sort and mask them out of the counts
+    
+    not_self = viewpoint_indices[ :, None ] != sample_indices[ None, : ]
+    
+    views = numpy.where( not_self, views, 255 )
+    
+    num_views = not_self.sum( axis = 1 )
+    
+    radii = numpy.sort( views, axis = 1 )[ numpy.arange( len( viewpoint_indices ) ), num_views // 2 ]
+    
+    num_left = numpy.logical_and( not_self, views < radii[ :, None ] ).sum( axis = 1 ).astype( 'float64' )
+    num_radius = ( views == radii[ :, None ] ).sum( axis = 1 ).astype( 'float64' )
+    num_right = numpy.logical_and( not_self, views > radii[ :, None ] ).sum( axis = 1 ).astype( 'float64' )
+    
+    left_gets_radius = num_left <= num_right
+    
+    num_left = numpy.where( left_gets_radius, num_left + num_radius, num_left )
+    num_right = numpy.where( left_gets_radius, num_right, num_right + num_radius )
+    
+    ratios = numpy.minimum( num_left, num_right ) / numpy.maximum( num_left, num_right )
+    
+    ratio_scores = ( ratios * ( MAX_SAMPLE / 2 ) ).astype( 'int64' )
+    
+    # larger sd tends to mean less sphere overlap when searching
+    
+    means = numpy.where( not_self, views, 0 ).sum( axis = 1 ) / num_views.astype( 'float64' )
+    
+    squared_diffs = numpy.where( not_self, ( views - means[ :, None ] ) ** 2, 0 )
+    
+    sds = ( squared_diffs.sum( axis = 1 ) / num_views ) ** 0.5
+    
+    best_index = numpy.lexsort( ( viewpoint_indices, sds, ratio_scores ) )[ -1 ]
+    
+    return int( viewpoint_indices[ best_index ] )
+    
+def GetPHashBands( max_hamming_distance ):
+    
+    # pigeonhole: if two phashes differ in at most d bits, then cutting them into d + 1 bands means at least one band must match exactly
+    
+    num_bands = min( max_hamming_distance + 1, 64 )
+    
+    bands = []
+    
+    shift = 0
+    
+    for i in range( num_bands ):
+        
+        band_width = ( 64 - shift ) // ( num_bands - i )
+        
+        bands.append( ( shift, ( 1 << band_width ) - 1 ) )
+        
+        shift += band_width
+        
+    
+    return bands
+    
+def GetPHashHammingDistances( phashes_array, phash ):
+    
+    phash_int = numpy.uint64( struct.unpack( '!Q', phash )[0] )
+    
+    return GetUInt64HammingDistances( phashes_array, phash_int )
+    
+def GetSortedPHashBands( phashes_array, max_hamming_distance ):
+    
+    # sorting each band is the slow part of a bulk search and does not depend on which phashes are pending, so it can be shared between chunks
+    
+    sorted_bands = []
+    
+    for ( shift, mask ) in GetPHashBands( max_hamming_distance ):
+        
+        keys = numpy.bitwise_and( numpy.right_shift( phashes_array, numpy.uint64( shift ) ), numpy.uint64( mask ) )
+        
+        order = numpy.argsort( keys, kind = 'mergesort' )
+        
+        sorted_keys = keys[ order ]
+        
+        group_starts = numpy.concatenate( ( [ 0 ], numpy.flatnonzero( sorted_keys[1:] != sorted_keys[:-1] ) + 1 ) ).astype( 'int64' )
+        
+        sorted_bands.append( ( order, group_starts ) )
+        
+    
+    return sorted_bands
+    
+def GetUInt64HammingDistances( phashes_array, phash_int ):
+    
+    # this is the numpy version of HydrusData.Get64BitHammingDistance, doing the xor and popcount for every row at once
+    
+    xored = numpy.bitwise_xor( phashes_array, phash_int )
+    
+    return PHASH_POPCOUNT_LOOKUP[ xored.view( 'uint8' ) ].reshape( ( -1, 8 ) ).sum( axis = 1 )
+    
+def IteratePHashPairsWithinDistance( phash_ids, phashes_array, pending_mask, max_hamming_distance, sorted_bands = None ):
+    
+    # yields ( band_index, num_bands, num_groups_done, num_groups, pairs ), where pairs is an ( n, 2 ) array of phash_ids
+    # only pairs that include at least one pending phash are compared. the same pair can come up in more than one band, so the caller should be ok with dupes
+    
+    MAX_BLOCK_CELLS = 1048576
+    
+    if len( phash_ids ) == 0:
+        
+        return
+        
+    
+    if sorted_bands is None:
+        
+        sorted_bands = GetSortedPHashBands( phashes_array, max_hamming_distance )
+        
+    
+    num_bands = len( sorted_bands )
+    
+    pending_ints = pending_mask.astype( 'int64' )
+    
+    for ( band_index, ( order, group_starts ) ) in enumerate( sorted_bands ):
+        
+        group_ends = numpy.concatenate( ( group_starts[1:], [ len( order ) ] ) )
+        
+        group_sizes = group_ends - group_starts
+        group_pending_counts = numpy.add.reduceat( pending_ints[ order ], group_starts )
+        
+        interesting = numpy.flatnonzero( ( group_sizes > 1 ) & ( group_pending_counts > 0 ) )
+        
+        num_groups = len( interesting )
+        
+        pairs_found = []
+        num_pairs_found = 0
+        
+        for ( num_groups_done, group_index ) in enumerate( interesting ):
+            
+            members = order[ group_starts[ group_index ] : group_ends[ group_index ] ]
+            
+            pending_members = members[ pending_mask[ members ] ]
+            
+            member_phashes = phashes_array[ members ]
+            
+            block_size = max( 1, MAX_BLOCK_CELLS // len( members ) )
+            
+            for block_start in range( 0, len( pending_members ), block_size ):
+                
+                block = pending_members[ block_start : block_start + block_size ]
+                
+                xored = numpy.bitwise_xor( phashes_array[ block ][ :, None ], member_phashes[ None, : ] )
+                
+                distances = PHASH_POPCOUNT_LOOKUP[ xored.view( 'uint8' ) ].reshape( xored.shape + ( 8, ) ).sum( axis = 2 )
+                
+                ( block_indices, member_indices ) = numpy.nonzero( distances <= max_hamming_distance )
+                
+                a = block[ block_indices ]
+                b = members[ member_indices ]
+                
+                not_self = a != b
+                
+                if not_self.any():
+                    
+                    pairs = numpy.column_stack( ( phash_ids[ a[ not_self ] ], phash_ids[ b[ not_self ] ] ) )
+                    
+                    pairs_found.append( pairs )
+                    num_pairs_found += len( pairs )
+                    
+                
+            
+            if num_pairs_found > MAX_BLOCK_CELLS or num_groups_done % 256 == 0:
+                
+                yield ( band_index, num_bands, num_groups_done, num_groups, CombinePHashPairs( pairs_found ) )
+                
+                pairs_found = []
+                num_pairs_found = 0
+                
+            
+        
+        yield ( band_index, num_bands, num_groups, num_groups, CombinePHashPairs( pairs_found ) )
+        
+    
+def PopVPTreeNode( phash_ids, phashes_array, index ):
+    
+    remaining = numpy.ones( len( phash_ids ), dtype = 'bool' )
+    
+    remaining[ index ] = False
+    
+    return ( int( phash_ids[ index ] ), phashes_array[ index ], phash_ids[ remaining ], phashes_array[ remaining ] )
+    
 class DuplicateActionOptions( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_DUPLICATE_ACTION_OPTIONS
@@ -374,3 +707,124 @@ class DuplicateActionOptions( HydrusSerialisable.SerialisableBase ):
         
     
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_DUPLICATE_ACTION_OPTIONS ] = DuplicateActionOptions
+
+class PHashSearchIndex( object ):
+    
+    def __init__( self ):
+        
+        self._lock = threading.Lock()
+        
+        self._phash_ids = numpy.empty( 0, dtype = 'int64' )
+        self._phashes = numpy.empty( 0, dtype = 'uint64' )
+        
+        # adding to a numpy array is a full copy, so we batch up changes and only consolidate when someone wants to search
+        
+        self._pending_additions = {}
+        self._pending_removals = set()
+        
+    
+    def _Consolidate( self ):
+        
+        if len( self._pending_additions ) == 0 and len( self._pending_removals ) == 0:
+            
+            return
+            
+        
+        dirty_phash_ids = list( self._pending_removals )
+        dirty_phash_ids.extend( self._pending_additions.keys() )
+        
+        if len( self._phash_ids ) > 0:
+            
+            keep = numpy.logical_not( numpy.in1d( self._phash_ids, numpy.array( dirty_phash_ids, dtype = 'int64' ) ) )
+            
+            self._phash_ids = self._phash_ids[ keep ]
+            self._phashes = self._phashes[ keep ]
+            
+        
+        if len( self._pending_additions ) > 0:
+            
+            ( new_phash_ids, new_phashes ) = zip( *self._pending_additions.items() )
+            
+            self._phash_ids = numpy.concatenate( ( self._phash_ids, numpy.array( new_phash_ids, dtype = 'int64' ) ) )
+            self._phashes = numpy.concatenate( ( self._phashes, ConvertPHashesToNumPyArray( new_phashes ) ) )
+            
+        
+        self._pending_additions = {}
+        self._pending_removals = set()
+        
+    
+    def AddPHashes( self, rows ):
+        
+        with self._lock:
+            
+            for ( phash_id, phash ) in rows:
+                
+                self._pending_removals.discard( phash_id )
+                
+                self._pending_additions[ phash_id ] = str( phash )
+                
+            
+        
+    
+    def GetArrays( self ):
+        
+        # consolidation always makes new arrays, so these are safe to hand out
+        
+        with self._lock:
+            
+            self._Consolidate()
+            
+            return ( self._phash_ids, self._phashes )
+            
+        
+    
+    def GetNumPHashes( self ):
+        
+        with self._lock:
+            
+            self._Consolidate()
+            
+            return len( self._phash_ids )
+            
+        
+    
+    def RemovePHashIds( self, phash_ids ):
+        
+        with self._lock:
+            
+            for phash_id in phash_ids:
+                
+                if phash_id in self._pending_additions:
+                    
+                    del self._pending_additions[ phash_id ]
+                    
+                
+                self._pending_removals.add( phash_id )
+                
+            
+        
+    
+    def Search( self, search_phashes, max_hamming_distance ):
+        
+        with self._lock:
+            
+            self._Consolidate()
+            
+            similar_phash_ids = set()
+            
+            if len( self._phash_ids ) == 0:
+                
+                return similar_phash_ids
+                
+            
+            for search_phash in search_phashes:
+                
+                distances = GetPHashHammingDistances( self._phashes, search_phash )
+                
+                similar_phash_ids.update( self._phash_ids[ distances <= max_hamming_distance ].tolist() )
+                
+            
+            return similar_phash_ids
+            
+        
+    
@@ -2,6 +2,7 @@ import HydrusConstants as HC
 import ClientConstants as CC
 import ClientCaches
 import ClientData
+import ClientDefaults
 import ClientDragDrop
 import ClientExporting
 import ClientGUICommon
@@ -50,6 +51,7 @@ import HydrusTagArchive
 import HydrusVideoHandling
 import os
 import PIL
+import random
 import re
 import shlex
 import sqlite3
@@ -536,6 +538,192 @@ class FrameGUI( ClientGUITopLevelWindows.FrameThatResizes ):
             
         
     
+    def _BenchmarkBandwidthChecks( self ):
+        
+        def do_it():
+            
+            num_trackers = 300
+            
+            now = HydrusData.GetNow()
+            
+            # a busy recent history at every granularity, in the serialised format
+            
+            def generate_flat_dict( num_brackets, granularity ):
+                
+                latest_timestamp = now - ( now % granularity )
+                
+                return [ ( latest_timestamp - i * granularity, random.randint( 1, 1048576 ) ) for i in range( num_brackets ) ]
+                
+            
+            serialisable_info = []
+            
+            for i in range( 2 ):
+                
+                serialisable_info.append( [] )
+                serialisable_info.append( generate_flat_dict( 31, 86400 ) )
+                serialisable_info.append( generate_flat_dict( 72, 3600 ) )
+                serialisable_info.append( generate_flat_dict( 180, 60 ) )
+                serialisable_info.append( generate_flat_dict( 240, 1 ) )
+                
+            
+            bandwidth_trackers = []
+            
+            for i in range( num_trackers ):
+                
+                bandwidth_tracker = HydrusNetworking.BandwidthTracker()
+                
+                bandwidth_tracker.InitialiseFromSerialisableInfo( 1, serialisable_info )
+                
+                bandwidth_trackers.append( bandwidth_tracker )
+                
+            
+            bandwidth_rules = HydrusNetworking.BandwidthRules()
+            
+            bandwidth_rules.AddRule( HC.BANDWIDTH_TYPE_REQUESTS, 1, 5 )
+            bandwidth_rules.AddRule( HC.BANDWIDTH_TYPE_REQUESTS, 60, 600 )
+            bandwidth_rules.AddRule( HC.BANDWIDTH_TYPE_DATA, 3600, 1024 * 1048576 )
+            bandwidth_rules.AddRule( HC.BANDWIDTH_TYPE_DATA, 86400, 8192 * 1048576 )
+            
+            num_checks = 0
+            
+            time_started_precise = HydrusData.GetNowPrecise()
+            
+            while HydrusData.GetNowPrecise() - time_started_precise < 2:
+                
+                for bandwidth_tracker in bandwidth_trackers:
+                    
+                    bandwidth_rules.CanStartRequest( bandwidth_tracker )
+                    bandwidth_rules.CanContinueDownload( bandwidth_tracker )
+                    bandwidth_rules.GetWaitingEstimate( bandwidth_tracker )
+                    
+                
+                num_checks += num_trackers * 3
+                
+            
+            time_took = HydrusData.GetNowPrecise() - time_started_precise
+            
+            HydrusData.ShowText( 'bandwidth checks against ' + HydrusData.ToHumanInt( num_trackers ) + ' network contexts: ' + HydrusData.ToHumanInt( int( num_checks / time_took ) ) + ' checks/s' )
+            
+        
+        self._controller.CallToThread( do_it )
+        
+    
+    def _BenchmarkHTMLParsing( self ):
+        
+        def do_it():
+            
+            html_formulae = ClientParsing.GetHTMLFormulaeFromPageParsers( ClientDefaults.GetDefaultParsers() )
+            
+            fast_html_formulae = [ html_formula for html_formula in html_formulae if html_formula.CanParseWithLXML() ]
+            
+            dir_path = os.path.join( HC.STATIC_DIR, 'testing' )
+            
+            htmls = []
+            
+            for filename in os.listdir( dir_path ):
+                
+                if filename.endswith( '.html' ):
+                    
+                    with open( os.path.join( dir_path, filename ), 'rb' ) as f:
+                        
+                        htmls.append( HydrusData.ToUnicode( f.read() ) )
+                        
+                    
+                
+            
+            if len( htmls ) == 0:
+                
+                HydrusData.ShowText( 'Could not find any sample html pages to benchmark!' )
+                
+                return
+                
+            
+            num_mismatches = 0
+            
+            for html in htmls:
+                
+                soup = ClientParsing.GetSoup( html )
+                lxml_tree = ClientParsing.GetLXMLTree( html )
+                
+                for html_formula in fast_html_formulae:
+                    
+                    if html_formula.ParseSoup( soup ) != html_formula.ParseLXMLTree( lxml_tree ):
+                        
+                        num_mismatches += 1
+                        
+                    
+                
+            
+            num_pages = 0
+            
+            time_started_precise = HydrusData.GetNowPrecise()
+            
+            while HydrusData.GetNowPrecise() - time_started_precise < 5:
+                
+                for html in htmls:
+                    
+                    soup = ClientParsing.GetSoup( html )
+                    
+                    for html_formula in fast_html_formulae:
+                        
+                        html_formula.ParseSoup( soup )
+                        
+                    
+                
+                num_pages += len( htmls )
+                
+            
+            soup_time_per_page = ( HydrusData.GetNowPrecise() - time_started_precise ) / num_pages
+            
+            num_pages = 0
+            
+            time_started_precise = HydrusData.GetNowPrecise()
+            
+            while HydrusData.GetNowPrecise() - time_started_precise < 5:
+                
+                for html in htmls:
+                    
+                    lxml_tree = ClientParsing.GetLXMLTree( html )
+                    
+                    for html_formula in fast_html_formulae:
+                        
+                        html_formula.ParseLXMLTree( lxml_tree )
+                        
+                    
+                
+                num_pages += len( htmls )
+                
+            
+            lxml_time_per_page = ( HydrusData.GetNowPrecise() - time_started_precise ) / num_pages
+            
+            text = HydrusData.ToHumanInt( len( fast_html_formulae ) ) + ' of the ' + HydrusData.ToHumanInt( len( html_formulae ) ) + ' default parser html formulae can use lxml.'
+            text += os.linesep
+            text += 'Building the tree and running them on ' + HydrusData.ToHumanInt( len( htmls ) ) + ' sample pages took ' + HydrusData.TimeDeltaToPrettyTimeDelta( soup_time_per_page ) + ' per page with bs4 and ' + HydrusData.TimeDeltaToPrettyTimeDelta( lxml_time_per_page ) + ' per page with lxml.'
+            
+            if num_mismatches > 0:
+                
+                text += os.linesep
+                text += HydrusData.ToHumanInt( num_mismatches ) + ' formula results were different between the two!'
+                
+            
+            HydrusData.ShowText( text )
+            
+        
+        self._controller.CallToThread( do_it )
+        
+    
+    def _BenchmarkSimilarFilesDiscovery( self ):
+        
+        search_distance = self._controller.new_options.GetInteger( 'similar_files_duplicate_pairs_search_distance' )
+        
+        self._controller.CallToThread( self._controller.Read, 'similar_files_discovery_benchmark', search_distance )
+        
+    
+    def _BenchmarkSimilarFilesPHashGeneration( self ):
+        
+        self._controller.CallToThread( self._controller.Read, 'similar_files_phash_generation_benchmark', 200 )
+        
+    
     def _BackupDatabase( self ):
         
         path = self._new_options.GetNoneableString( 'backup_path' )
@@ -864,6 +1052,30 @@ class FrameGUI( ClientGUITopLevelWindows.FrameThatResizes ):
             
         
     
+    def _DebugBenchmarkMediaResults( self ):
+        
+        def do_it():
+            
+            results = self._controller.Read( 'media_results_benchmark', 10000 )
+            
+            for ( name, num_media_results, time_took ) in results:
+                
+                if time_took > 0:
+                    
+                    rate = HydrusData.ToHumanInt( int( num_media_results / time_took ) ) + ' media results/s'
+                    
+                else:
+                    
+                    rate = 'instant'
+                    
+                
+                HydrusData.ShowText( name + ': ' + HydrusData.ToHumanInt( num_media_results ) + ' media results in ' + HydrusData.TimeDeltaToPrettyTimeDelta( time_took ) + ', ' + rate )
+                
+            
+        
+        self._controller.CallToThread( do_it )
+        
+    
     def _DebugFetchAURL( self ):
         
         def wx_code( network_job ):
@@ -1101,6 +1313,41 @@ class FrameGUI( ClientGUITopLevelWindows.FrameThatResizes ):
         HydrusData.DebugPrint( 'garbage printing finished' )
         
     
+    def _DebugShowCacheStats( self ):
+        
+        for ( name, cache_name ) in ( ( 'thumbnail cache', 'thumbnail' ), ( 'image cache', 'images' ) ):
+            
+            ( num_items, total_footprint, cache_size, num_hits, num_misses, num_evictions, num_timeouts ) = self._controller.GetCache( cache_name ).GetStats()
+            
+            num_requests = num_hits + num_misses
+            
+            if num_requests == 0:
+                
+                hit_rate = 'no requests yet'
+                
+            else:
+                
+                hit_rate = HydrusData.ConvertFloatToPercentage( float( num_hits ) / num_requests ) + ' hit rate'
+                
+            
+            text = name + ': ' + HydrusData.ToHumanInt( num_items ) + ' items, ' + HydrusData.ConvertValueRangeToBytes( total_footprint, cache_size ) + ', ' + HydrusData.ToHumanInt( num_hits ) + ' hits, ' + HydrusData.ToHumanInt( num_misses ) + ' misses (' + hit_rate + '), ' + HydrusData.ToHumanInt( num_evictions ) + ' evictions, ' + HydrusData.ToHumanInt( num_timeouts ) + ' timeouts'
+            
+            HydrusData.ShowText( text )
+            
+        
+    
+    def _DebugShowPubSubStats( self ):
+        
+        rows = self._controller.GetPubSubTopicStats()
+        
+        for ( topic, num_pubs, num_coalesced, num_calls, total_time, max_time ) in rows[:20]:
+            
+            text = topic + ': ' + HydrusData.ToHumanInt( num_pubs ) + ' pubs (' + HydrusData.ToHumanInt( num_coalesced ) + ' coalesced), ' + HydrusData.ToHumanInt( num_calls ) + ' calls, ' + '%.1fms total, %.1fms worst' % ( total_time * 1000, max_time * 1000 )
+            
+            HydrusData.ShowText( text )
+            
+        
+    
     def _DebugShowScheduledJobs( self ):
         
         self._controller.DebugShowScheduledJobs()
@@ -2098,7 +2345,11 @@ class FrameGUI( ClientGUITopLevelWindows.FrameThatResizes ):
             
             ClientGUIMenus.AppendMenuItem( self, data_actions, 'run fast memory maintenance', 'Tell all the fast caches to maintain themselves.', self._controller.MaintainMemoryFast )
             ClientGUIMenus.AppendMenuItem( self, data_actions, 'run slow memory maintenance', 'Tell all the slow caches to maintain themselves.', self._controller.MaintainMemorySlow )
+            ClientGUIMenus.AppendMenuItem( self, data_actions, 'benchmark media result loading', 'Load up to 10,000 of your files\' media results the old chunked way and the new bulk ways and print how fast each was.', self._DebugBenchmarkMediaResults )
+            ClientGUIMenus.AppendMenuItem( self, data_actions, 'review db job metrics', 'Show how long db jobs have been queueing and running.', self._ReviewDBJobMetrics )
             ClientGUIMenus.AppendMenuItem( self, data_actions, 'review threads', 'Show current threads and what they are doing.', self._ReviewThreads )
+            ClientGUIMenus.AppendMenuItem( self, data_actions, 'show cache stats', 'Print some information about how well the thumbnail and image caches are doing.', self._DebugShowCacheStats )
+            ClientGUIMenus.AppendMenuItem( self, data_actions, 'show pubsub stats', 'Print which pubsub topics have been taking the most time to process.', self._DebugShowPubSubStats )
             ClientGUIMenus.AppendMenuItem( self, data_actions, 'show scheduled jobs', 'Print some information about the currently scheduled jobs log.', self._DebugShowScheduledJobs )
             ClientGUIMenus.AppendMenuItem( self, data_actions, 'flush log', 'Command the log to write any buffered contents to hard drive.', HydrusData.DebugPrint, 'Flushing log' )
             ClientGUIMenus.AppendMenuItem( self, data_actions, 'print garbage', 'Print some information about the python garbage to the log.', self._DebugPrintGarbage )
@@ -2114,6 +2365,15 @@ class FrameGUI( ClientGUITopLevelWindows.FrameThatResizes ):
             
             ClientGUIMenus.AppendMenu( debug, network_actions, 'network actions' )
             
+            benchmarks = wx.Menu()
+            
+            ClientGUIMenus.AppendMenuItem( self, benchmarks, 'bandwidth checks', 'Time checking some busy bandwidth histories against some typical bandwidth rules, as the network engine does for every waiting job.', self._BenchmarkBandwidthChecks )
+            ClientGUIMenus.AppendMenuItem( self, benchmarks, 'html parsing', 'Time parsing the sample html pages with the default parsers\' html formulae, first with bs4 and then with lxml.', self._BenchmarkHTMLParsing )
+            ClientGUIMenus.AppendMenuItem( self, benchmarks, 'similar files duplicate discovery', 'Time searching some files one at a time against the similar files tree, and then all files at once in bulk, at the current duplicate search distance.', self._BenchmarkSimilarFilesDiscovery )
+            ClientGUIMenus.AppendMenuItem( self, benchmarks, 'similar files phash generation', 'Time generating the similar files phashes of some of your files one at a time, and then all together in a batch.', self._BenchmarkSimilarFilesPHashGeneration )
+            
+            ClientGUIMenus.AppendMenu( debug, benchmarks, 'benchmarks' )
+            
             ClientGUIMenus.AppendMenuItem( self, debug, 'run and initialise server for testing', 'This will try to boot the server in your install folder and initialise it. This is mostly here for testing purposes.', self._AutoServerSetup )
             
             ClientGUIMenus.AppendMenu( menu, debug, 'debug' )
@@ -3273,6 +3533,15 @@ class FrameGUI( ClientGUITopLevelWindows.FrameThatResizes ):
         frame.SetPanel( panel )
         
     
+    def _ReviewDBJobMetrics( self ):
+        
+        frame = ClientGUITopLevelWindows.FrameThatTakesScrollablePanel( self, 'review db job metrics' )
+        
+        panel = ClientGUIScrolledPanelsReview.ReviewDBJobMetrics( frame, self._controller )
+        
+        frame.SetPanel( panel )
+        
+    
     def _ReviewNetworkJobs( self ):
         
         frame = ClientGUITopLevelWindows.FrameThatTakesScrollablePanel( self, 'review network jobs' )
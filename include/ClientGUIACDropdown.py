@@ -740,6 +740,9 @@ class AutoCompleteDropdownTags( AutoCompleteDropdown ):
         self._tag_repo_button = ClientGUICommon.BetterButton( self._dropdown_window, tag_service.GetName(), self.TagButtonHit )
         self._tag_repo_button.SetMinSize( ( 20, -1 ) )
         
+        HG.client_controller.sub( self, 'NewSiblingsOrParents', 'notify_new_siblings_gui' )
+        HG.client_controller.sub( self, 'NewSiblingsOrParents', 'notify_new_parents_gui' )
+        
     
     def _ChangeFileService( self, file_service_key ):
         
@@ -824,6 +827,16 @@ class AutoCompleteDropdownTags( AutoCompleteDropdown ):
         HG.client_controller.PopupMenu( self._file_repo_button, menu )
         
     
+    def NewSiblingsOrParents( self, changed_tags ):
+        
+        predicates = itertools.chain( self._cached_results, self._current_matches )
+        
+        if True in ( predicate.GetType() in ( HC.PREDICATE_TYPE_TAG, HC.PREDICATE_TYPE_PARENT ) and predicate.GetValue() in changed_tags for predicate in predicates ):
+            
+            self._SetListDirty()
+            
+        
+    
     def SetFileService( self, file_service_key ):
         
         self._ChangeFileService( file_service_key )
@@ -310,6 +310,8 @@ class Animation( wx.Window ):
     
     def _DrawFrame( self, dc ):
         
+        started = HydrusData.GetNowPrecise()
+        
         current_frame = self._video_container.GetFrame( self._current_frame_index )
         
         ( my_width, my_height ) = self._canvas_bmp.GetSize()
@@ -368,6 +370,8 @@ class Animation( wx.Window ):
             dc.StretchBlit( 0, 0, my_width, my_height, mdc, 0, 0, frame_width, frame_height )
             
         
+        self._video_container.AddFrameTiming( 'paint', HydrusData.GetNowPrecise() - started )
+        
         self._current_frame_drawn = True
         
         next_frame_time_s = self._video_container.GetDuration( self._current_frame_index ) / 1000.0
@@ -2342,6 +2346,26 @@ class Canvas( wx.Window ):
     
     def SetMedia( self, media ):
         
+        def wx_code( media ):
+            
+            if not self:
+                
+                return
+                
+            
+            if media == self._current_media:
+                
+                HG.client_controller.pub( 'canvas_new_display_media', self._canvas_key, self._current_media )
+                
+            
+        
+        def thread_load( media ):
+            
+            ClientMedia.LoadMediaResultPlaceholders( ( media, ) )
+            
+            wx.CallAfter( wx_code, media )
+            
+        
         if media is not None:
             
             media = media.GetDisplayMedia()
@@ -2404,6 +2428,13 @@ class Canvas( wx.Window ):
             
             HG.client_controller.pub( 'canvas_new_display_media', self._canvas_key, self._current_media )
             
+            if self._current_media is not None and ClientMedia.HasUnloadedMediaResultPlaceholders( ( self._current_media, ) ):
+                
+                # a lazily loaded page's file shows straight away, and its tags and ratings catch up once they are loaded
+                
+                HG.client_controller.CallToThread( thread_load, self._current_media )
+                
+            
             HG.client_controller.pub( 'canvas_new_index_string', self._canvas_key, self._GetIndexString() )
             
             self._SetDirty()
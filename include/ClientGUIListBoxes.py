@@ -1471,7 +1471,7 @@ class ListBoxTags( ListBox ):
         self.Bind( wx.EVT_RIGHT_DOWN, self.EventMouseRightClick )
         self.Bind( wx.EVT_MIDDLE_DOWN, self.EventMouseMiddleClick )
         
-        HG.client_controller.sub( self, 'ForceTagRecalc', 'notify_new_siblings_gui' )
+        HG.client_controller.sub( self, 'NewSiblings', 'notify_new_siblings_gui' )
         HG.client_controller.sub( self, 'ForceTagRecalc', 'notify_new_force_refresh_tags_gui' )
         HG.client_controller.sub( self, '_UpdateBackgroundColour', 'notify_new_colourset' )
         
@@ -1829,6 +1829,14 @@ class ListBoxTags( ListBox ):
         pass
         
     
+    def NewSiblings( self, changed_tags ):
+        
+        if not changed_tags.isdisjoint( self._terms ):
+            
+            self.ForceTagRecalc()
+            
+        
+    
 class ListBoxTagsPredicates( ListBoxTags ):
     
     has_counts = True
@@ -930,6 +930,10 @@ class ManagementPanelDuplicateFilter( ManagementPanel ):
         
         menu_items.append( ( 'check', 'search for duplicate pairs at the current distance during normal db maintenance', 'Tell the client to find duplicate pairs in its normal db maintenance cycles, whether you have that set to idle or shutdown time.', check_manager ) )
         
+        check_manager = ClientGUICommon.CheckboxManagerOptions( 'similar_files_use_in_memory_search' )
+        
+        menu_items.append( ( 'check', 'search for similar files using a fast in-memory index', 'Tell the client to keep all its similar files data in memory and search it all at once, rather than walking the on-disk search tree. This is much faster but costs about 16 bytes of memory per phash.', check_manager ) )
+        
         self._cog_button = ClientGUICommon.MenuBitmapButton( self, CC.GlobalBMPs.cog, menu_items )
         
         menu_items = []
@@ -4192,7 +4196,23 @@ class ManagementPanelQuery( ManagementPanel ):
                     
                     self._query_job_key = ClientThreading.JobKey()
                     
-                    self._controller.CallToThread( self.THREADDoQuery, self._controller, self._page_key, self._query_job_key, file_search_context )
+                    media_sort = self._sort_by.GetSort()
+                    media_sort_fallback = self._controller.new_options.GetFallbackSort()
+                    
+                    sortable_without_media_results = len( self._collect_by.GetChoice() ) == 0 and media_sort.CanSortInDB() and media_sort_fallback.CanSortInDB()
+                    
+                    sort_in_db = self._controller.new_options.GetBoolean( 'sort_file_queries_in_db' ) and sortable_without_media_results
+                    
+                    if sort_in_db:
+                        
+                        db_media_sorts = ( media_sort, media_sort_fallback )
+                        
+                    else:
+                        
+                        db_media_sorts = None
+                        
+                    
+                    self._controller.CallToThread( self.THREADDoQuery, self._controller, self._page_key, self._query_job_key, file_search_context, db_media_sorts, sortable_without_media_results )
                     
                     panel = ClientGUIMedia.MediaPanelLoading( self._page, self._page_key, file_service_key )
                     
@@ -4311,7 +4331,7 @@ class ManagementPanelQuery( ManagementPanel ):
             
         
     
-    def ShowFinishedQuery( self, query_job_key, media_results ):
+    def ShowFinishedQuery( self, query_job_key, media_results, db_media_sorts = None ):
         
         if query_job_key == self._query_job_key:
             
@@ -4319,6 +4339,13 @@ class ManagementPanelQuery( ManagementPanel ):
             
             panel = ClientGUIMedia.MediaPanelThumbnails( self._page, self._page_key, file_service_key, media_results )
             
+            if db_media_sorts is not None:
+                
+                ( media_sort, media_sort_fallback ) = db_media_sorts
+                
+                panel.SetPresorted( media_sort )
+                
+            
             panel.Collect( self._page_key, self._collect_by.GetChoice() )
             
             panel.Sort( self._page_key, self._sort_by.GetSort() )
@@ -4339,7 +4366,7 @@ class ManagementPanelQuery( ManagementPanel ):
             
         
     
-    def THREADDoQuery( self, controller, page_key, query_job_key, search_context ):
+    def THREADDoQuery( self, controller, page_key, query_job_key, search_context, db_media_sorts = None, placeholders_ok = True ):
         
         def wx_code():
             
@@ -4350,7 +4377,7 @@ class ManagementPanelQuery( ManagementPanel ):
                 return
                 
             
-            self.ShowFinishedQuery( query_job_key, media_results )
+            self.ShowFinishedQuery( query_job_key, media_results, db_media_sorts )
             
         
         QUERY_CHUNK_SIZE = 256
@@ -4364,8 +4391,26 @@ class ManagementPanelQuery( ManagementPanel ):
             return
             
         
+        if db_media_sorts is not None:
+            
+            query_hash_ids = controller.Read( 'sorted_hash_ids', search_context.GetFileServiceKey(), query_hash_ids, db_media_sorts )
+            
+        
         media_results = []
         
+        placeholder_threshold = controller.new_options.GetNoneableInteger( 'media_result_placeholder_threshold' )
+        
+        if placeholders_ok and placeholder_threshold is not None and len( query_hash_ids ) > placeholder_threshold:
+            
+            # the full media results will be fetched a page at a time as the thumbnails are scrolled to
+            
+            media_result_pager = ClientMedia.MediaResultPager( page_size = QUERY_CHUNK_SIZE )
+            
+        else:
+            
+            media_result_pager = None
+            
+        
         for sub_query_hash_ids in HydrusData.SplitListIntoChunks( query_hash_ids, QUERY_CHUNK_SIZE ):
             
             if query_job_key.IsCancelled():
@@ -4373,7 +4418,14 @@ class ManagementPanelQuery( ManagementPanel ):
                 return
                 
             
-            more_media_results = controller.Read( 'media_results_from_ids', sub_query_hash_ids )
+            if media_result_pager is None:
+                
+                more_media_results = controller.Read( 'media_results_from_ids', sub_query_hash_ids )
+                
+            else:
+                
+                more_media_results = media_result_pager.AddPlaceholderData( controller.Read( 'media_result_placeholder_data', sub_query_hash_ids ) )
+                
             
             media_results.extend( more_media_results )
             
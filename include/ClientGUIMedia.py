@@ -372,6 +372,8 @@ class MediaPanel( ClientMedia.ListeningMediaList, wx.ScrolledCanvas ):
         
         self._selected_media = set()
         
+        self._lazily_loaded = True in ( isinstance( media_result, ClientMedia.MediaResultPlaceholder ) for media_result in media_results )
+        
         HG.client_controller.sub( self, 'AddMediaResults', 'add_media_results' )
         HG.client_controller.sub( self, 'SetFocussedMedia', 'set_focus' )
         HG.client_controller.sub( self, 'Collect', 'collect_media' )
@@ -1182,6 +1184,28 @@ class MediaPanel( ClientMedia.ListeningMediaList, wx.ScrolledCanvas ):
             
         
     
+    def _LoadMediaResultPlaceholdersThen( self, medias, func, *args ):
+        
+        def wx_code():
+            
+            if not self:
+                
+                return
+                
+            
+            func( *args )
+            
+        
+        def thread_load( medias ):
+            
+            ClientMedia.LoadMediaResultPlaceholders( medias )
+            
+            wx.CallAfter( wx_code )
+            
+        
+        HG.client_controller.CallToThread( thread_load, list( medias ) )
+        
+    
     def _ManageNotes( self ):
         
         def wx_do_it( media, notes ):
@@ -1252,6 +1276,13 @@ class MediaPanel( ClientMedia.ListeningMediaList, wx.ScrolledCanvas ):
             
             if len( HG.client_controller.services_manager.GetServices( HC.RATINGS_SERVICES ) ) > 0:
                 
+                if ClientMedia.HasUnloadedMediaResultPlaceholders( self._selected_media ):
+                    
+                    self._LoadMediaResultPlaceholdersThen( self._selected_media, self._ManageRatings )
+                    
+                    return
+                    
+                
                 flat_media = self._GetSelectedFlatMedia()
                 
                 with ClientGUIDialogsManage.DialogManageRatings( self, flat_media ) as dlg:
@@ -1268,6 +1299,13 @@ class MediaPanel( ClientMedia.ListeningMediaList, wx.ScrolledCanvas ):
         
         if len( self._selected_media ) > 0:
             
+            if ClientMedia.HasUnloadedMediaResultPlaceholders( self._selected_media ):
+                
+                self._LoadMediaResultPlaceholdersThen( self._selected_media, self._ManageTags )
+                
+                return
+                
+            
             num_files = self._GetNumSelected()
             
             title = 'manage tags for ' + HydrusData.ToHumanInt( num_files ) + ' files'
@@ -1293,6 +1331,13 @@ class MediaPanel( ClientMedia.ListeningMediaList, wx.ScrolledCanvas ):
             return
             
         
+        if ClientMedia.HasUnloadedMediaResultPlaceholders( ( self._focussed_media, ) ):
+            
+            self._LoadMediaResultPlaceholdersThen( ( self._focussed_media, ), self._ManageURLs )
+            
+            return
+            
+        
         title = 'manage known urls'
         
         with ClientGUITopLevelWindows.DialogManage( self, title ) as dlg:
@@ -1452,7 +1497,9 @@ class MediaPanel( ClientMedia.ListeningMediaList, wx.ScrolledCanvas ):
                 tags_media = self._selected_media
                 
             
-            force_reload = force_reload or self._due_a_forced_selection_pub
+            # lazily loaded pages load and release results as they scroll, so incremental counts would drift
+            
+            force_reload = force_reload or self._due_a_forced_selection_pub or self._lazily_loaded
             
             HG.client_controller.pub( 'new_tags_selection', self._page_key, tags_media, force_reload = force_reload )
             HG.client_controller.pub( 'new_page_status', self._page_key, self._GetPrettyStatus() )
@@ -1984,6 +2031,22 @@ class MediaPanel( ClientMedia.ListeningMediaList, wx.ScrolledCanvas ):
         
         if page_key == self._page_key:
             
+            if collect_by is not None and len( collect_by ) > 0 and ClientMedia.HasUnloadedMediaResultPlaceholders( self._sorted_media ):
+                
+                # collecting needs everyone's tags and ratings, and the sort that came after this has to be redone once it is in
+                
+                def do_it():
+                    
+                    self.Collect( page_key, collect_by )
+                    
+                    self.Sort( page_key )
+                    
+                
+                self._LoadMediaResultPlaceholdersThen( self._sorted_media, do_it )
+                
+                return
+                
+            
             self._Select( 'none' )
             
             ClientMedia.ListeningMediaList.Collect( self, collect_by )
@@ -2254,6 +2317,17 @@ class MediaPanel( ClientMedia.ListeningMediaList, wx.ScrolledCanvas ):
         
         if page_key == self._page_key:
             
+            media_sorts = ( self._media_sort if media_sort is None else media_sort, HG.client_controller.new_options.GetFallbackSort() )
+            
+            # the sorts the db can do only need what placeholders know, the rest need everyone's full results
+            
+            if False in ( ms.CanSortInDB() for ms in media_sorts ) and ClientMedia.HasUnloadedMediaResultPlaceholders( self._sorted_media ):
+                
+                self._LoadMediaResultPlaceholdersThen( self._sorted_media, self.Sort, page_key, media_sort )
+                
+                return
+                
+            
             ClientMedia.ListeningMediaList.Sort( self, media_sort )
             
         
@@ -2419,6 +2493,13 @@ class MediaPanelThumbnails( MediaPanel ):
     
     def _DrawCanvasPage( self, page_index, bmp ):
         
+        def thread_load( page_key, thumbnails, visible ):
+            
+            ClientMedia.LoadMediaResultPlaceholders( thumbnails )
+            
+            HG.client_controller.GetCache( 'thumbnail' ).Waterfall( page_key, thumbnails, visible = visible )
+            
+        
         ( bmp_width, bmp_height ) = bmp.GetSize()
         
         dc = wx.MemoryDC( bmp )
@@ -2442,6 +2523,7 @@ class MediaPanelThumbnails( MediaPanel ):
         
         ( thumbnail_span_width, thumbnail_span_height ) = self._GetThumbnailSpanDimensions()
         
+        thumbnails_to_load_later = []
         thumbnails_to_render_later = []
         
         thumbnail_cache = HG.client_controller.GetCache( 'thumbnail' )
@@ -2452,7 +2534,13 @@ class MediaPanelThumbnails( MediaPanel ):
             
             hash = thumbnail.GetDisplayMedia().GetHash()
             
-            if hash in self._hashes_faded and thumbnail_cache.HasThumbnailCached( thumbnail ):
+            if ClientMedia.HasUnloadedMediaResultPlaceholders( [ thumbnail ] ):
+                
+                # lazily loaded results are fetched off the gui thread and then fade in through the waterfall like any other thumbnail
+                
+                thumbnails_to_load_later.append( thumbnail )
+                
+            elif hash in self._hashes_faded and thumbnail_cache.HasThumbnailCached( thumbnail ):
                 
                 self._StopFading( hash )
                 
@@ -2472,7 +2560,14 @@ class MediaPanelThumbnails( MediaPanel ):
                 
             
         
-        HG.client_controller.GetCache( 'thumbnail' ).Waterfall( self._page_key, thumbnails_to_render_later )
+        visible = page_index in self._CalculateVisiblePageIndices()
+        
+        HG.client_controller.GetCache( 'thumbnail' ).Waterfall( self._page_key, thumbnails_to_render_later, visible = visible )
+        
+        if len( thumbnails_to_load_later ) > 0:
+            
+            HG.client_controller.CallToThread( thread_load, self._page_key, thumbnails_to_load_later, visible )
+            
         
     
     def _FadeThumbnails( self, thumbnails ):
@@ -2774,7 +2869,7 @@ class MediaPanelThumbnails( MediaPanel ):
         
         if len( thumbnails_to_render_later ) > 0:
             
-            HG.client_controller.GetCache( 'thumbnail' ).Waterfall( self._page_key, thumbnails_to_render_later )
+            HG.client_controller.GetCache( 'thumbnail' ).Waterfall( self._page_key, thumbnails_to_render_later, visible = True )
             
         
     
@@ -2813,6 +2908,32 @@ class MediaPanelThumbnails( MediaPanel ):
             
         
     
+    def _ReleaseDistantMediaResults( self ):
+        
+        # lazily loaded pages drop the full media results of thumbnails far from the view, and will fetch them again if they come back
+        
+        if HG.client_controller.GetGUI().IsCurrentPage( self._page_key ):
+            
+            page_indices = self._CalculateVisiblePageIndices()
+            
+            num_thumbnails_per_page = self._num_columns * self._num_rows_per_canvas_page
+            
+            num_thumbnails_margin = 1024
+            
+            first_index_to_keep = min( page_indices ) * num_thumbnails_per_page - num_thumbnails_margin
+            last_index_to_keep = ( max( page_indices ) + 1 ) * num_thumbnails_per_page + num_thumbnails_margin
+            
+        else:
+            
+            first_index_to_keep = 0
+            last_index_to_keep = -1
+            
+        
+        distant_media = [ media for ( index, media ) in enumerate( self._sorted_media ) if index < first_index_to_keep or index > last_index_to_keep ]
+        
+        ClientMedia.ReleaseMediaResultPlaceholders( distant_media )
+        
+    
     def _RemoveMediaDirectly( self, singleton_media, collected_media ):
         
         if self._focussed_media is not None:
@@ -4031,6 +4152,8 @@ class MediaPanelThumbnails( MediaPanel ):
         
         self._DeleteAllDirtyPages()
         
+        self._ReleaseDistantMediaResults()
+        
     
     def NewFileInfo( self, hashes ):
         
@@ -1499,6 +1499,10 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._max_network_jobs = wx.SpinCtrl( self, min = 1, max = 30 )
             self._max_network_jobs_per_domain = wx.SpinCtrl( self, min = 1, max = 5 )
+            self._max_network_jobs_per_domain.SetToolTip( 'Each domain also keeps this many connections alive for reuse, so parallel downloads do not have to set up new connections.' )
+            
+            self._network_dns_cache_period = wx.SpinCtrl( self, min = 0, max = 86400 )
+            self._network_dns_cache_period.SetToolTip( 'Remember the address of each host for this long, so new connections do not have to wait on a DNS lookup. Set 0 to look up every time.' )
             
             proxy_panel = ClientGUICommon.StaticBox( self, 'proxy settings' )
             
@@ -1519,6 +1523,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._max_network_jobs.SetValue( self._new_options.GetInteger( 'max_network_jobs' ) )
             self._max_network_jobs_per_domain.SetValue( self._new_options.GetInteger( 'max_network_jobs_per_domain' ) )
             
+            self._network_dns_cache_period.SetValue( self._new_options.GetInteger( 'network_dns_cache_period' ) )
+            
             if HC.options[ 'external_host' ] is not None:
                 
                 self._external_host.SetValue( HC.options[ 'external_host' ] )
@@ -1564,6 +1570,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'network timeout (seconds): ', self._network_timeout ) )
             rows.append( ( 'max number of simultaneous active network jobs: ', self._max_network_jobs ) )
             rows.append( ( 'max number of simultaneous active network jobs per domain: ', self._max_network_jobs_per_domain ) )
+            rows.append( ( 'remember DNS results for (seconds): ', self._network_dns_cache_period ) )
             rows.append( ( 'external ip/host override: ', self._external_host ) )
             
             gridbox = ClientGUICommon.WrapInGrid( self, rows )
@@ -1596,6 +1603,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetInteger( 'network_timeout', self._network_timeout.GetValue() )
             self._new_options.SetInteger( 'max_network_jobs', self._max_network_jobs.GetValue() )
             self._new_options.SetInteger( 'max_network_jobs_per_domain', self._max_network_jobs_per_domain.GetValue() )
+            self._new_options.SetInteger( 'network_dns_cache_period', self._network_dns_cache_period.GetValue() )
         
     
     class _DownloadingPanel( wx.Panel ):
@@ -1653,6 +1661,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._show_new_on_file_seed_short_summary = wx.CheckBox( misc )
             self._show_deleted_on_file_seed_short_summary = wx.CheckBox( misc )
             
+            self._fast_html_parsing = wx.CheckBox( misc )
+            self._fast_html_parsing.SetToolTip( 'EXPERIMENTAL: Parsing formulae that lxml can do exactly will skip building the slower html5lib/BeautifulSoup tree. lxml does not fix up badly broken html the same way, so on some pages (misnested tags, nested forms, entities without a semicolon) it can find different results. If a parser starts giving odd results, turn this off.' )
+            
             self._subscription_network_error_delay = ClientGUITime.TimeDeltaButton( misc, min = 600, days = True, hours = True, minutes = True )
             self._subscription_other_error_delay = ClientGUITime.TimeDeltaButton( misc, min = 600, days = True, hours = True, minutes = True )
             self._downloader_network_error_delay = ClientGUITime.TimeDeltaButton( misc, min = 600, days = True, hours = True, minutes = True )
@@ -1686,6 +1697,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._stop_character.SetValue( self._new_options.GetString( 'stop_character' ) )
             self._show_new_on_file_seed_short_summary.SetValue( self._new_options.GetBoolean( 'show_new_on_file_seed_short_summary' ) )
             self._show_deleted_on_file_seed_short_summary.SetValue( self._new_options.GetBoolean( 'show_deleted_on_file_seed_short_summary' ) )
+            self._fast_html_parsing.SetValue( self._new_options.GetBoolean( 'fast_html_parsing' ) )
             
             self._watcher_page_wait_period.SetValue( self._new_options.GetInteger( 'watcher_page_wait_period' ) )
             self._watcher_page_wait_period.SetToolTip( gallery_page_tt )
@@ -1741,6 +1753,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'Stop character:', self._stop_character ) )
             rows.append( ( 'Show a \'N\' (for \'new\') count on short file import summaries:', self._show_new_on_file_seed_short_summary ) )
             rows.append( ( 'Show a \'D\' (for \'deleted\') count on short file import summaries:', self._show_deleted_on_file_seed_short_summary ) )
+            rows.append( ( 'EXPERIMENTAL: Parse html with the faster lxml parser where possible:', self._fast_html_parsing ) )
             rows.append( ( 'Delay time on a gallery/watcher network error:', self._downloader_network_error_delay ) )
             rows.append( ( 'Delay time on a subscription network error:', self._subscription_network_error_delay ) )
             rows.append( ( 'Delay time on a subscription other error:', self._subscription_other_error_delay ) )
@@ -1783,6 +1796,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetString( 'stop_character', self._stop_character.GetValue() )
             self._new_options.SetBoolean( 'show_new_on_file_seed_short_summary', self._show_new_on_file_seed_short_summary.GetValue() )
             self._new_options.SetBoolean( 'show_deleted_on_file_seed_short_summary', self._show_deleted_on_file_seed_short_summary.GetValue() )
+            self._new_options.SetBoolean( 'fast_html_parsing', self._fast_html_parsing.GetValue() )
             
             self._new_options.SetInteger( 'subscription_network_error_delay', self._subscription_network_error_delay.GetValue() )
             self._new_options.SetInteger( 'subscription_other_error_delay', self._subscription_other_error_delay.GetValue() )
@@ -3156,6 +3170,21 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._thumbnail_cache_timeout = ClientGUITime.TimeDeltaButton( media_panel, min = 300, days = True, hours = True, minutes = True )
             self._thumbnail_cache_timeout.SetToolTip( 'The amount of time after which a thumbnail in the cache will naturally be removed, if it is not shunted out due to a new member exceeding the size limit. Requires restart to kick in.' )
             
+            self._thumbnail_cache_policy = ClientGUICommon.BetterChoice( media_panel )
+            
+            for cache_policy in ( CC.DATA_CACHE_POLICY_LRU, CC.DATA_CACHE_POLICY_SIZE_WEIGHTED_LRU, CC.DATA_CACHE_POLICY_2Q ):
+                
+                self._thumbnail_cache_policy.Append( CC.data_cache_policy_string_lookup[ cache_policy ], cache_policy )
+                
+            
+            self._thumbnail_cache_policy.SetToolTip( 'How the thumbnail cache decides what to drop when it is full. The scan resistant policy keeps the thumbnails you keep coming back to even if you scroll through a huge page. Requires restart to kick in.' )
+            
+            self._thumbnail_waterfall_num_workers = wx.SpinCtrl( media_panel, min = 1, max = 32 )
+            self._thumbnail_waterfall_num_workers.SetToolTip( 'How many threads may load and resize thumbnails at once when a page is filling in. More threads fill big pages faster on machines with many cores. Requires restart to kick in.' )
+            
+            self._use_packed_thumbnail_store = wx.CheckBox( media_panel )
+            self._use_packed_thumbnail_store.SetToolTip( 'Keep a copy of every thumbnail the client draws, already resized and ready to go, in a few big files in the db directory. Pages of thumbnails load with far fewer disk seeks and no image decoding, at the cost of some extra disk space. Requires restart to kick in, and turning it off deletes the store.' )
+            
             self._image_cache_timeout = ClientGUITime.TimeDeltaButton( media_panel, min = 300, days = True, hours = True, minutes = True )
             self._image_cache_timeout.SetToolTip( 'The amount of time after which a rendered image in the cache will naturally be removed, if it is not shunted out due to a new member exceeding the size limit. Requires restart to kick in.' )
             
@@ -3193,6 +3222,21 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._forced_search_limit = ClientGUICommon.NoneableSpinCtrl( misc_panel, '', min = 1, max = 100000 )
             
+            self._media_result_placeholder_threshold = ClientGUICommon.NoneableSpinCtrl( misc_panel, '', none_phrase = 'always load everything', min = 1, max = 10000000 )
+            self._media_result_placeholder_threshold.SetToolTip( 'When a search returns more files than this, the page starts with just enough information about each file to count and sort them, and only loads the tags, locations and ratings of the thumbnails you actually scroll to. Searches that are collected, or sorted by tags, ratings or views, load everything up front, and switching a page to one of those loads everything in the background first.' )
+            
+            self._db_num_read_connections = wx.SpinCtrl( misc_panel, min = 0, max = 8 )
+            self._db_num_read_connections.SetToolTip( 'The client can open extra read-only connections to its database so thumbnail media and autocomplete lookups do not have to wait behind long searches. They are only used when nothing is waiting to be written. Set 0 to do everything on the single main connection. Requires restart to kick in.' )
+            
+            self._db_cache_media_result_summaries = wx.CheckBox( misc_panel )
+            self._db_cache_media_result_summaries.SetToolTip( 'Keep a ready-made summary of each file\'s size, locations, urls, ratings and viewing stats in client.caches.db, so big searches load their results with fewer lookups. It costs some disk space and makes writes to that information a little slower. Turning it off deletes the summaries.' )
+            
+            self._sort_file_queries_in_db = wx.CheckBox( misc_panel )
+            self._sort_file_queries_in_db.SetToolTip( 'When a search finishes and neither the page\'s sort nor the fallback sort needs tags or ratings, have the database return the files already in order, so big pages do not have to be sorted in the client. Has no effect when collecting.' )
+            
+            self._file_import_num_workers = wx.SpinCtrl( misc_panel, min = 1, max = 32 )
+            self._file_import_num_workers.SetToolTip( 'How many threads may hash, inspect and thumbnail files at once when importing from your hard drive, and decode images at once when regenerating similar files data. The database writes still happen one batch at a time. More threads get through big jobs faster on machines with many cores.' )
+            
             #
             
             self._disk_cache_init_period.SetValue( self._new_options.GetNoneableInteger( 'disk_cache_init_period' ) )
@@ -3215,6 +3259,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._fullscreen_cache_size.SetValue( int( HC.options[ 'fullscreen_cache_size' ] / 1048576 ) )
             
             self._thumbnail_cache_timeout.SetValue( self._new_options.GetInteger( 'thumbnail_cache_timeout' ) )
+            self._thumbnail_cache_policy.SelectClientData( self._new_options.GetInteger( 'thumbnail_cache_policy' ) )
+            self._thumbnail_waterfall_num_workers.SetValue( self._new_options.GetInteger( 'thumbnail_waterfall_num_workers' ) )
+            self._use_packed_thumbnail_store.SetValue( self._new_options.GetBoolean( 'use_packed_thumbnail_store' ) )
             self._image_cache_timeout.SetValue( self._new_options.GetInteger( 'image_cache_timeout' ) )
             
             self._video_buffer_size_mb.SetValue( self._new_options.GetInteger( 'video_buffer_size_mb' ) )
@@ -3232,6 +3279,12 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._autocomplete_short_wait.SetValue( short_wait )
             
             self._forced_search_limit.SetValue( self._new_options.GetNoneableInteger( 'forced_search_limit' ) )
+            self._media_result_placeholder_threshold.SetValue( self._new_options.GetNoneableInteger( 'media_result_placeholder_threshold' ) )
+            
+            self._db_num_read_connections.SetValue( self._new_options.GetInteger( 'db_num_read_connections' ) )
+            self._db_cache_media_result_summaries.SetValue( self._new_options.GetBoolean( 'db_cache_media_result_summaries' ) )
+            self._sort_file_queries_in_db.SetValue( self._new_options.GetBoolean( 'sort_file_queries_in_db' ) )
+            self._file_import_num_workers.SetValue( self._new_options.GetInteger( 'file_import_num_workers' ) )
             
             #
             
@@ -3271,6 +3324,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'MB memory reserved for thumbnail cache: ', thumbnails_sizer ) )
             rows.append( ( 'MB memory reserved for image cache: ', fullscreens_sizer ) )
             rows.append( ( 'Thumbnail cache timeout: ', self._thumbnail_cache_timeout ) )
+            rows.append( ( 'Thumbnail cache policy: ', self._thumbnail_cache_policy ) )
+            rows.append( ( 'Thumbnail loading threads: ', self._thumbnail_waterfall_num_workers ) )
+            rows.append( ( 'Keep a packed store of ready-to-draw thumbnails: ', self._use_packed_thumbnail_store ) )
             rows.append( ( 'Image cache timeout: ', self._image_cache_timeout ) )
             
             gridbox = ClientGUICommon.WrapInGrid( media_panel, rows )
@@ -3287,6 +3343,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             text += os.linesep
             text += 'If the video buffer can hold an entire video, it only needs to be rendered once and will play and loop very smoothly.'
             text += os.linesep
+            text += 'For longer videos, whatever the buffer does not need is used to keep recently decoded frames, so scrubbing back is quick.'
+            text += os.linesep
             text += 'PROTIP: Do not go crazy here.'
             
             buffer_panel.Add( wx.StaticText( buffer_panel, label = text ), CC.FLAGS_VCENTER )
@@ -3326,6 +3384,11 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows = []
             
             rows.append( ( 'Forced system:limit for all searches: ', self._forced_search_limit ) )
+            rows.append( ( 'Load big search results lazily above this many files: ', self._media_result_placeholder_threshold ) )
+            rows.append( ( 'Extra read-only database connections: ', self._db_num_read_connections ) )
+            rows.append( ( 'Cache file summaries for faster result loading: ', self._db_cache_media_result_summaries ) )
+            rows.append( ( 'Sort search results in the database where possible: ', self._sort_file_queries_in_db ) )
+            rows.append( ( 'File import threads: ', self._file_import_num_workers ) )
             
             gridbox = ClientGUICommon.WrapInGrid( misc_panel, rows )
             
@@ -3430,11 +3493,20 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             HC.options[ 'fullscreen_cache_size' ] = self._fullscreen_cache_size.GetValue() * 1048576
             
             self._new_options.SetInteger( 'thumbnail_cache_timeout', self._thumbnail_cache_timeout.GetValue() )
+            self._new_options.SetInteger( 'thumbnail_cache_policy', self._thumbnail_cache_policy.GetChoice() )
+            self._new_options.SetInteger( 'thumbnail_waterfall_num_workers', self._thumbnail_waterfall_num_workers.GetValue() )
+            self._new_options.SetBoolean( 'use_packed_thumbnail_store', self._use_packed_thumbnail_store.GetValue() )
             self._new_options.SetInteger( 'image_cache_timeout', self._image_cache_timeout.GetValue() )
             
             self._new_options.SetInteger( 'video_buffer_size_mb', self._video_buffer_size_mb.GetValue() )
             
             self._new_options.SetNoneableInteger( 'forced_search_limit', self._forced_search_limit.GetValue() )
+            self._new_options.SetNoneableInteger( 'media_result_placeholder_threshold', self._media_result_placeholder_threshold.GetValue() )
+            
+            self._new_options.SetInteger( 'db_num_read_connections', self._db_num_read_connections.GetValue() )
+            self._new_options.SetBoolean( 'db_cache_media_result_summaries', self._db_cache_media_result_summaries.GetValue() )
+            self._new_options.SetBoolean( 'sort_file_queries_in_db', self._sort_file_queries_in_db.GetValue() )
+            self._new_options.SetInteger( 'file_import_num_workers', self._file_import_num_workers.GetValue() )
             
             HC.options[ 'num_autocomplete_chars' ] = self._num_autocomplete_chars.GetValue()
             
@@ -31,6 +31,7 @@ import collections
 import cookielib
 import HydrusConstants as HC
 import HydrusData
+import HydrusDB
 import HydrusExceptions
 import HydrusGlobals as HG
 import HydrusNATPunch
@@ -1502,6 +1503,88 @@ class ReviewAllBandwidthPanel( ClientGUIScrolledPanels.ReviewPanel ):
             
         
     
+class ReviewDBJobMetrics( ClientGUIScrolledPanels.ReviewPanel ):
+    
+    def __init__( self, parent, controller ):
+        
+        self._controller = controller
+        
+        ClientGUIScrolledPanels.ReviewPanel.__init__( self, parent )
+        
+        self._all_time = wx.CheckBox( self, label = 'show the whole session, not just the last hour' )
+        self._all_time.Bind( wx.EVT_CHECKBOX, self.EventAllTime )
+        
+        self._queue_depths = ClientGUICommon.BetterStaticText( self )
+        
+        self._list_ctrl_panel = ClientGUIListCtrl.BetterListCtrlPanel( self )
+        
+        columns = [ ( 'action', -1 ), ( 'jobs', 8 ), ( 'on read connections', 8 ), ( 'queued p50/p95/p99', 26 ), ( 'running p50/p95/p99', 26 ), ( 'avg rows', 10 ) ]
+        
+        self._list_ctrl = ClientGUIListCtrl.BetterListCtrl( self._list_ctrl_panel, 'db job metrics review', 20, 30, columns, self._ConvertDataToListCtrlTuples )
+        
+        self._list_ctrl_panel.SetListCtrl( self._list_ctrl )
+        
+        self._list_ctrl_panel.AddButton( 'refresh snapshot', self._RefreshSnapshot )
+        
+        #
+        
+        self._list_ctrl.Sort( 4 )
+        
+        self._RefreshSnapshot()
+        
+        #
+        
+        vbox = wx.BoxSizer( wx.VERTICAL )
+        
+        vbox.Add( self._all_time, CC.FLAGS_EXPAND_PERPENDICULAR )
+        vbox.Add( self._queue_depths, CC.FLAGS_EXPAND_PERPENDICULAR )
+        vbox.Add( self._list_ctrl_panel, CC.FLAGS_EXPAND_BOTH_WAYS )
+        
+        self.SetSizer( vbox )
+        
+    
+    def _ConvertDataToListCtrlTuples( self, row ):
+        
+        ( action, num_jobs, num_concurrent, queue_times, execution_times, num_rows ) = row
+        
+        avg_rows = num_rows / num_jobs
+        
+        pretty_action = action
+        pretty_num_jobs = HydrusData.ToHumanInt( num_jobs )
+        pretty_num_concurrent = HydrusData.ToHumanInt( num_concurrent )
+        pretty_queue_times = HydrusDB.ConvertJobTimesToPrettyString( queue_times )
+        pretty_execution_times = HydrusDB.ConvertJobTimesToPrettyString( execution_times )
+        pretty_avg_rows = HydrusData.ToHumanInt( avg_rows )
+        
+        display_tuple = ( pretty_action, pretty_num_jobs, pretty_num_concurrent, pretty_queue_times, pretty_execution_times, pretty_avg_rows )
+        sort_tuple = ( action, num_jobs, num_concurrent, queue_times[1], execution_times[1], avg_rows )
+        
+        return ( display_tuple, sort_tuple )
+        
+    
+    def _RefreshSnapshot( self ):
+        
+        ( snapshot, queue_depths ) = self._controller.GetDBJobMetrics( all_time = self._all_time.GetValue() )
+        
+        if len( queue_depths ) == 0:
+            
+            text = 'No jobs are waiting.'
+            
+        else:
+            
+            text = 'Waiting: ' + ', '.join( ( HydrusData.ToHumanInt( count ) + ' at ' + queue_name + ' priority ' + str( priority ) for ( ( queue_name, priority ), count ) in sorted( queue_depths.items() ) ) )
+            
+        
+        self._queue_depths.SetLabelText( text )
+        
+        self._list_ctrl.SetData( snapshot )
+        
+    
+    def EventAllTime( self, event ):
+        
+        self._RefreshSnapshot()
+        
+    
 class ReviewDownloaderImport( ClientGUIScrolledPanels.ReviewPanel ):
     
     def __init__( self, parent, network_engine ):
@@ -2110,6 +2193,13 @@ class ReviewNetworkContextBandwidthPanel( ClientGUIScrolledPanels.ReviewPanel ):
         
         pretty_current_usage = 'current usage: ' + HydrusData.ConvertIntToBytes( current_usage ) + '/s'
         
+        data_saved_by_resuming = self._controller.network_engine.bandwidth_manager.GetDataSavedByResuming( self._network_context )
+        
+        if data_saved_by_resuming > 0:
+            
+            pretty_current_usage += ' - saved by resuming broken downloads this session: ' + HydrusData.ConvertIntToBytes( data_saved_by_resuming )
+            
+        
         self._current_usage_st.SetLabelText( pretty_current_usage )
         
         #
@@ -2242,9 +2332,14 @@ class ReviewNetworkJobs( ClientGUIScrolledPanels.ReviewPanel ):
         
         self._list_ctrl_panel.AddButton( 'refresh snapshot', self._RefreshSnapshot )
         
+        columns = [ ( 'domain', -1 ), ( 'waiting', 10 ), ( 'running', 10 ), ( 'average wait to start', 24 ), ( 'longest wait to start', 24 ), ( 'connections reused', 20 ), ( 'average connection setup', 24 ) ]
+        
+        self._domains_list_ctrl = ClientGUIListCtrl.BetterListCtrl( self, 'network domains scheduling review', 6, 30, columns, self._ConvertDomainDataToListCtrlTuples )
+        
         #
         
         self._list_ctrl.Sort( 0 )
+        self._domains_list_ctrl.Sort( 1, asc = False )
         
         self._RefreshSnapshot()
         
@@ -2253,6 +2348,7 @@ class ReviewNetworkJobs( ClientGUIScrolledPanels.ReviewPanel ):
         vbox = wx.BoxSizer( wx.VERTICAL )
         
         vbox.Add( self._list_ctrl_panel, CC.FLAGS_EXPAND_BOTH_WAYS )
+        vbox.Add( self._domains_list_ctrl, CC.FLAGS_EXPAND_PERPENDICULAR )
         
         self.SetSizer( vbox )
         
@@ -2278,12 +2374,75 @@ class ReviewNetworkJobs( ClientGUIScrolledPanels.ReviewPanel ):
         return ( display_tuple, sort_tuple )
         
     
+    def _ConvertDomainDataToListCtrlTuples( self, domain_row ):
+        
+        ( domain, num_waiting, num_running, average_latency, max_latency, num_requests, num_reused, average_setup_time ) = domain_row
+        
+        pretty_num_waiting = HydrusData.ToHumanInt( num_waiting )
+        pretty_num_running = HydrusData.ToHumanInt( num_running )
+        
+        pretty_num_reused = HydrusData.ConvertValueRangeToPrettyString( num_reused, num_requests )
+        
+        if average_setup_time is None:
+            
+            pretty_average_setup_time = 'no new connections yet'
+            
+            average_setup_time = -1
+            
+        else:
+            
+            pretty_average_setup_time = HydrusData.TimeDeltaToPrettyTimeDelta( average_setup_time )
+            
+        
+        if average_latency is None:
+            
+            pretty_average_latency = 'no jobs started yet'
+            pretty_max_latency = 'no jobs started yet'
+            
+            average_latency = -1
+            max_latency = -1
+            
+        else:
+            
+            pretty_average_latency = HydrusData.TimeDeltaToPrettyTimeDelta( average_latency )
+            pretty_max_latency = HydrusData.TimeDeltaToPrettyTimeDelta( max_latency )
+            
+        
+        display_tuple = ( domain, pretty_num_waiting, pretty_num_running, pretty_average_latency, pretty_max_latency, pretty_num_reused, pretty_average_setup_time )
+        sort_tuple = ( domain, num_waiting, num_running, average_latency, max_latency, num_reused, average_setup_time )
+        
+        return ( display_tuple, sort_tuple )
+        
+    
     def _RefreshSnapshot( self ):
         
         job_rows = self._controller.network_engine.GetJobsSnapshot()
         
         self._list_ctrl.SetData( job_rows )
         
+        domains_to_connection_stats = {}
+        
+        for ( network_context, num_requests, num_reused, average_setup_time ) in self._controller.network_engine.session_manager.GetConnectionStats():
+            
+            if network_context.context_type == CC.NETWORK_CONTEXT_DOMAIN:
+                
+                domains_to_connection_stats[ network_context.context_data ] = ( num_requests, num_reused, average_setup_time )
+                
+            
+        
+        domain_rows = []
+        
+        for scheduling_row in self._controller.network_engine.GetSchedulingStats():
+            
+            domain = scheduling_row[0]
+            
+            connection_stats = domains_to_connection_stats.get( domain, ( 0, 0, None ) )
+            
+            domain_rows.append( tuple( scheduling_row ) + connection_stats )
+            
+        
+        self._domains_list_ctrl.SetData( domain_rows )
+        
     
 class ReviewNetworkSessionsPanel( ClientGUIScrolledPanels.ReviewPanel ):
     
@@ -1,10 +1,12 @@
 import numpy.core.multiarray # important this comes before cv!
 import ClientConstants as CC
+import collections
 import cv2
 import HydrusConstants as HC
 import HydrusData
 import HydrusImageHandling
 import HydrusGlobals as HG
+import threading
 
 if cv2.__version__.startswith( '2' ):
     
@@ -159,114 +161,173 @@ def GenerateNumPyImageFromPILImage( pil_image ):
     
 def GenerateShapePerceptualHashes( path, mime ):
     
-    numpy_image = GenerateNumpyImage( path, mime )
+    tile = GenerateShapePerceptualHashTile( path, mime )
     
-    ( y, x, depth ) = numpy_image.shape
+    ( phashes, ) = GenerateShapePerceptualHashesFromTiles( [ tile ] )
     
-    if depth == 4:
-        
-        # doing this on 10000x10000 pngs eats ram like mad
-        numpy_image = EfficientlyThumbnailNumpyImage( numpy_image, ( 1024, 1024 ) )
-        
-        ( y, x, depth ) = numpy_image.shape
-        
-        # create weight and transform numpy_image to greyscale
+    return phashes
+    
+def GenerateShapePerceptualHashesForPaths( paths_and_mimes, num_workers = 1 ):
+    
+    # decoding is the slow part, and cv and pil let go of the GIL while they do it, so it is spread over some threads
+    # a file that cannot be read gets an empty set of phashes, as if it had no shape
+    
+    tiles = [ None ] * len( paths_and_mimes )
+    
+    indices = collections.deque( range( len( paths_and_mimes ) ) )
+    
+    def work():
         
-        numpy_alpha = numpy_image[ :, :, 3 ]
+        while True:
+            
+            try:
+                
+                i = indices.popleft()
+                
+            except IndexError:
+                
+                return
+                
+            
+            ( path, mime ) = paths_and_mimes[ i ]
+            
+            try:
+                
+                tiles[ i ] = GenerateShapePerceptualHashTile( path, mime )
+                
+            except Exception as e:
+                
+                HydrusData.Print( 'Could not generate phashes for ' + path )
+                
+                HydrusData.PrintException( e )
+                
+            
         
-        numpy_alpha_float = numpy_alpha / 255.0
+    
+    def work_and_signal( event ):
         
-        numpy_image_bgr = numpy_image[ :, :, :3 ]
+        try:
+            
+            work()
+            
+        finally:
+            
+            event.set()
+            
         
-        numpy_image_gray_bare = cv2.cvtColor( numpy_image_bgr, cv2.COLOR_RGB2GRAY )
+    
+    num_helpers = min( num_workers, len( paths_and_mimes ) ) - 1
+    
+    events = [ threading.Event() for i in range( max( num_helpers, 0 ) ) ]
+    
+    for event in events:
         
-        # create a white greyscale canvas
+        HG.client_controller.CallToThread( work_and_signal, event )
         
-        white = numpy.ones( ( y, x ) ) * 255.0
+    
+    work()
+    
+    for event in events:
         
-        # paste the grayscale image onto the white canvas using: pixel * alpha + white * ( 1 - alpha )
+        event.wait()
         
-        numpy_image_gray = numpy.uint8( ( numpy_image_gray_bare * numpy_alpha_float ) + ( white * ( numpy.ones( ( y, x ) ) - numpy_alpha_float ) ) )
+    
+    good_indices = [ i for ( i, tile ) in enumerate( tiles ) if tile is not None ]
+    
+    all_phashes = [ set() for tile in tiles ]
+    
+    if len( good_indices ) > 0:
         
-    else:
+        good_phashes = GenerateShapePerceptualHashesFromTiles( [ tiles[ i ] for i in good_indices ] )
         
-        numpy_image_gray = cv2.cvtColor( numpy_image, cv2.COLOR_RGB2GRAY )
+        for ( i, phashes ) in zip( good_indices, good_phashes ):
+            
+            all_phashes[ i ] = phashes
+            
         
     
-    numpy_image_tiny = cv2.resize( numpy_image_gray, ( 32, 32 ), interpolation = cv2.INTER_AREA )
+    return all_phashes
     
-    # convert to float and calc dct
+def GenerateShapePerceptualHashesFromTiles( tiles ):
     
-    numpy_image_tiny_float = numpy.float32( numpy_image_tiny )
+    # convert to float and calc dct, taking the top left 8x8
+    # a 32x32 dct is cheap, and doing it just as we always have keeps the phashes identical to those already in the db
     
-    dct = cv2.dct( numpy_image_tiny_float )
+    dct_88s = numpy.array( [ cv2.dct( numpy.float32( tile ) )[:8,:8] for tile in tiles ] )
     
-    # take top left 8x8 of dct
-    
-    dct_88 = dct[:8,:8]
+    dct_88s = dct_88s.reshape( ( len( tiles ), 64 ) )
     
     # get median of dct
     # exclude [0,0], which represents flat colour
     # this [0,0] exclusion is apparently important for mean, but maybe it ain't so important for median--w/e
     
-    # old mean code
-    # mask = numpy.ones( ( 8, 8 ) )
-    # mask[0,0] = 0
-    # average = numpy.average( dct_88, weights = mask )
-    
-    median = numpy.median( dct_88.reshape( 64 )[1:] )
+    medians = numpy.median( dct_88s[ :, 1: ], axis = 1 )
     
     # make a monochromatic, 64-bit hash of whether the entry is above or below the median
+    # packbits goes most significant bit first, so TTTFTFTF becomes 11101010, same as shifting them in one at a time
     
-    dct_88_boolean = dct_88 > median
+    dct_88s_boolean = dct_88s > medians.reshape( ( len( tiles ), 1 ) )
     
-    # convert TTTFTFTF to 11101010 by repeatedly shifting answer and adding 0 or 1
-    # you can even go ( a << 1 ) + b and leave out the initial param on the reduce call as bools act like ints for this
-    # but let's not go crazy for another two nanoseconds
-    def collapse_bools_to_binary_uint( a, b ):
-        
-        return ( a << 1 ) + int( b )
-        
+    phash_rows = numpy.packbits( dct_88s_boolean, axis = 1 )
     
-    bytes = []
+    all_phashes = []
     
-    for i in range( 8 ):
+    for phash_row in phash_rows:
         
-        '''
-        # old way of doing it, which compared value to median every time
-        byte = 0
+        phashes = set()
         
-        for j in range( 8 ):
-            
-            byte <<= 1 # shift byte one left
-            
-            value = dct_88[i,j]
-            
-            if value > median:
-                
-                byte |= 1
-                
-            
-        '''
+        phashes.add( phash_row.tostring() )
+        
+        # now discard the blank hash, which is 1000000... and not useful
         
-        byte = reduce( collapse_bools_to_binary_uint, dct_88_boolean[i], 0 )
+        phashes.discard( CC.BLANK_PHASH )
         
-        bytes.append( byte )
+        all_phashes.append( phashes )
         
     
-    phash = str( bytearray( bytes ) )
+    # we good
     
-    # now discard the blank hash, which is 1000000... and not useful
+    return all_phashes
     
-    phashes = set()
+def GenerateShapePerceptualHashTile( path, mime ):
     
-    phashes.add( phash )
+    numpy_image = GenerateNumpyImage( path, mime )
     
-    phashes.discard( CC.BLANK_PHASH )
+    ( y, x, depth ) = numpy_image.shape
     
-    # we good
+    if depth == 4:
+        
+        # doing this on 10000x10000 pngs eats ram like mad
+        numpy_image = EfficientlyThumbnailNumpyImage( numpy_image, ( 1024, 1024 ) )
+        
+        ( y, x, depth ) = numpy_image.shape
+        
+        # create weight and transform numpy_image to greyscale
+        
+        numpy_alpha = numpy_image[ :, :, 3 ]
+        
+        numpy_alpha_float = numpy_alpha / 255.0
+        
+        numpy_image_bgr = numpy_image[ :, :, :3 ]
+        
+        numpy_image_gray_bare = cv2.cvtColor( numpy_image_bgr, cv2.COLOR_RGB2GRAY )
+        
+        # create a white greyscale canvas
+        
+        white = numpy.ones( ( y, x ) ) * 255.0
+        
+        # paste the grayscale image onto the white canvas using: pixel * alpha + white * ( 1 - alpha )
+        
+        numpy_image_gray = numpy.uint8( ( numpy_image_gray_bare * numpy_alpha_float ) + ( white * ( numpy.ones( ( y, x ) ) - numpy_alpha_float ) ) )
+        
+    else:
+        
+        numpy_image_gray = cv2.cvtColor( numpy_image, cv2.COLOR_RGB2GRAY )
+        
     
-    return phashes
+    numpy_image_tiny = cv2.resize( numpy_image_gray, ( 32, 32 ), interpolation = cv2.INTER_AREA )
+    
+    return numpy_image_tiny
     
 def GenerateThumbnailFromStaticImageCV( path, dimensions = HC.UNSCALED_THUMBNAIL_DIMENSIONS, mime = None ):
     
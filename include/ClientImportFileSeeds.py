@@ -14,12 +14,17 @@ import HydrusGlobals as HG
 import HydrusPaths
 import HydrusSerialisable
 import HydrusTags
+import HydrusThreading
 import os
+import Queue
 import threading
 import time
 import traceback
 import urlparse
 
+FILE_IMPORT_BATCH_SIZE = 32
+FILE_IMPORT_BATCH_PERIOD = 1.0
+
 def GenerateFileSeedCacheStatus( file_seed_cache ):
     
     statuses_to_counts = file_seed_cache.GetStatusesToCounts()
@@ -297,6 +302,151 @@ class FileImportJob( object ):
         self._extra_hashes = HydrusFileHandling.GetExtraHashesFromPath( self._temp_path )
         
     
+def ImportPaths( file_seeds, file_seed_cache, file_import_options, limited_mimes = None ):
+    
+    # the cpu-heavy work on each file is spread over several threads, which feed files that are new to the db to this thread to be written in batches
+    
+    if len( file_seeds ) == 0:
+        
+        return
+        
+    
+    client_files_manager = HG.client_controller.client_files_manager
+    
+    num_workers = max( 1, min( len( file_seeds ), HG.client_controller.new_options.GetInteger( 'file_import_num_workers' ) ) )
+    
+    file_seeds_to_prepare = collections.deque( file_seeds )
+    
+    prepared_queue = Queue.Queue( maxsize = num_workers * 2 )
+    
+    def THREADPrepare():
+        
+        try:
+            
+            while not HydrusThreading.IsThreadShuttingDown():
+                
+                try:
+                    
+                    file_seed = file_seeds_to_prepare.popleft()
+                    
+                except IndexError:
+                    
+                    break
+                    
+                
+                prepared = file_seed.PrepareImportPath( file_seed_cache, file_import_options, limited_mimes = limited_mimes )
+                
+                if prepared is not None:
+                    
+                    prepared_queue.put( ( file_seed, ) + prepared )
+                    
+                
+            
+        finally:
+            
+            prepared_queue.put( None )
+            
+        
+    
+    def WriteBatch( batch ):
+        
+        file_import_jobs = [ file_import_job for ( file_seed, os_file_handle, temp_path, file_import_job ) in batch ]
+        
+        try:
+            
+            results_and_exceptions = client_files_manager.ImportFiles( file_import_jobs )
+            
+            for ( ( file_seed, os_file_handle, temp_path, file_import_job ), ( result, exception ) ) in zip( batch, results_and_exceptions ):
+                
+                try:
+                    
+                    if exception is not None:
+                        
+                        raise exception
+                        
+                    
+                    ( status, note ) = result
+                    
+                    file_seed.SetStatus( status, note = note )
+                    file_seed.SetHash( file_import_job.GetHash() )
+                    
+                except Exception as e:
+                    
+                    file_seed.SetStatus( CC.STATUS_ERROR, exception = e )
+                    
+                
+            
+        finally:
+            
+            for ( file_seed, os_file_handle, temp_path, file_import_job ) in batch:
+                
+                HydrusPaths.CleanUpTempPath( os_file_handle, temp_path )
+                
+            
+        
+        file_seed_cache.NotifyFileSeedsUpdated( [ file_seed for ( file_seed, os_file_handle, temp_path, file_import_job ) in batch ] )
+        
+    
+    if num_workers == 1 and len( file_seeds ) == 1:
+        
+        THREADPrepare()
+        
+    else:
+        
+        for i in range( num_workers ):
+            
+            HG.client_controller.CallToThread( THREADPrepare )
+            
+        
+    
+    num_workers_running = num_workers
+    
+    batch = []
+    batch_started = None
+    
+    while num_workers_running > 0:
+        
+        try:
+            
+            if len( batch ) == 0:
+                
+                prepared = prepared_queue.get()
+                
+            else:
+                
+                prepared = prepared_queue.get( timeout = max( 0.0, batch_started + FILE_IMPORT_BATCH_PERIOD - HydrusData.GetNowPrecise() ) )
+                
+            
+            if prepared is None:
+                
+                num_workers_running -= 1
+                
+            else:
+                
+                if len( batch ) == 0:
+                    
+                    batch_started = HydrusData.GetNowPrecise()
+                    
+                
+                batch.append( prepared )
+                
+            
+        except Queue.Empty:
+            
+            pass
+            
+        
+        if len( batch ) > 0:
+            
+            if len( batch ) >= FILE_IMPORT_BATCH_SIZE or num_workers_running == 0 or HydrusData.GetNowPrecise() >= batch_started + FILE_IMPORT_BATCH_PERIOD:
+                
+                WriteBatch( batch )
+                
+                batch = []
+                
+            
+        
+    
 FILE_SEED_TYPE_HDD = 0
 FILE_SEED_TYPE_URL = 1
 
@@ -768,62 +918,7 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
     
     def ImportPath( self, file_seed_cache, file_import_options, limited_mimes = None ):
         
-        try:
-            
-            if self.file_seed_type != FILE_SEED_TYPE_HDD:
-                
-                raise HydrusExceptions.VetoException( 'Attempted to import as a path, but I do not think I am a path!' )
-                
-            
-            path = self.file_seed_data
-            
-            if not os.path.exists( path ):
-                
-                raise HydrusExceptions.VetoException( 'Source file does not exist!' )
-                
-            
-            if limited_mimes is not None:
-                
-                mime = HydrusFileHandling.GetMime( path )
-                
-                if mime not in limited_mimes:
-                    
-                    raise HydrusExceptions.VetoException( 'Not in allowed mimes!' )
-                    
-                
-            
-            ( os_file_handle, temp_path ) = ClientPaths.GetTempPath()
-            
-            try:
-                
-                copied = HydrusPaths.MirrorFile( path, temp_path )
-                
-                if not copied:
-                    
-                    raise Exception( 'File failed to copy to temp path--see log for error.' )
-                    
-                
-                self.Import( temp_path, file_import_options )
-                
-            finally:
-                
-                HydrusPaths.CleanUpTempPath( os_file_handle, temp_path )
-                
-            
-        except HydrusExceptions.MimeException as e:
-            
-            self.SetStatus( CC.STATUS_ERROR, exception = e )
-            
-        except HydrusExceptions.VetoException as e:
-            
-            self.SetStatus( CC.STATUS_VETOED, note = HydrusData.ToUnicode( e ) )
-            
-        except Exception as e:
-            
-            self.SetStatus( CC.STATUS_ERROR, exception = e )
-            
-        
-        file_seed_cache.NotifyFileSeedsUpdated( ( self, ) )
+        ImportPaths( [ self ], file_seed_cache, file_import_options, limited_mimes = limited_mimes )
         
     
     def IsAPostURL( self ):
@@ -908,6 +1003,98 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         return ( should_download_metadata, should_download_file )
         
     
+    def PrepareImportPath( self, file_seed_cache, file_import_options, limited_mimes = None ):
+        
+        # does all the file work short of the db write. a file that is new to the db comes back ready to be written, anything else is finished here
+        
+        try:
+            
+            if self.file_seed_type != FILE_SEED_TYPE_HDD:
+                
+                raise HydrusExceptions.VetoException( 'Attempted to import as a path, but I do not think I am a path!' )
+                
+            
+            path = self.file_seed_data
+            
+            if not os.path.exists( path ):
+                
+                raise HydrusExceptions.VetoException( 'Source file does not exist!' )
+                
+            
+            if limited_mimes is not None:
+                
+                mime = HydrusFileHandling.GetMime( path )
+                
+                if mime not in limited_mimes:
+                    
+                    raise HydrusExceptions.VetoException( 'Not in allowed mimes!' )
+                    
+                
+            
+            ( os_file_handle, temp_path ) = ClientPaths.GetTempPath()
+            
+            prepared = False
+            
+            try:
+                
+                copied = HydrusPaths.MirrorFile( path, temp_path )
+                
+                if not copied:
+                    
+                    raise Exception( 'File failed to copy to temp path--see log for error.' )
+                    
+                
+                if HG.file_report_mode:
+                    
+                    HydrusData.ShowText( 'New file import job!' )
+                    
+                
+                file_import_job = FileImportJob( temp_path, file_import_options )
+                
+                ( status, hash, note ) = file_import_job.GenerateHashAndStatus()
+                
+                if file_import_job.IsNewToDB():
+                    
+                    file_import_job.GenerateInfo()
+                    
+                    file_import_job.CheckIsGoodToImport()
+                    
+                    prepared = True
+                    
+                    return ( os_file_handle, temp_path, file_import_job )
+                    
+                
+                file_import_job.PubsubContentUpdates()
+                
+                self.SetStatus( status, note = note )
+                self.SetHash( hash )
+                
+            finally:
+                
+                if not prepared:
+                    
+                    HydrusPaths.CleanUpTempPath( os_file_handle, temp_path )
+                    
+                
+            
+        except HydrusExceptions.MimeException as e:
+            
+            self.SetStatus( CC.STATUS_ERROR, exception = e )
+            
+        except HydrusExceptions.VetoException as e:
+            
+            self.SetStatus( CC.STATUS_VETOED, note = HydrusData.ToUnicode( e ) )
+            
+        except Exception as e:
+            
+            self.SetStatus( CC.STATUS_ERROR, exception = e )
+            
+        
+        file_seed_cache.NotifyFileSeedsUpdated( ( self, ) )
+        
+        return None
+        
+    
     def PresentToPage( self, page_key ):
         
         hash = self.GetHash()
@@ -1901,6 +2088,29 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         return None
         
     
+    def GetNextFileSeeds( self, status, num_to_get ):
+        
+        next_file_seeds = []
+        
+        with self._lock:
+            
+            for file_seed in self._file_seeds:
+                
+                if file_seed.status == status:
+                    
+                    next_file_seeds.append( file_seed )
+                    
+                    if len( next_file_seeds ) >= num_to_get:
+                        
+                        break
+                        
+                    
+                
+            
+        
+        return next_file_seeds
+        
+    
     def GetNumNewFilesSince( self, since ):
         
         num_files = 0
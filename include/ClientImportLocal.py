@@ -17,6 +17,8 @@ import os
 import threading
 import time
 
+FILE_SEEDS_PER_WORKER = 16
+
 class HDDImport( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_HDD_IMPORT
@@ -65,6 +67,8 @@ class HDDImport( HydrusSerialisable.SerialisableBase ):
         self._current_action = ''
         self._paused = False
         
+        self._files_per_second = None
+        
         self._lock = threading.Lock()
         
         self._files_repeating_job = None
@@ -92,87 +96,105 @@ class HDDImport( HydrusSerialisable.SerialisableBase ):
     
     def _WorkOnFiles( self, page_key ):
         
-        file_seed = self._file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN )
+        num_workers = HG.client_controller.new_options.GetInteger( 'file_import_num_workers' )
         
-        if file_seed is None:
+        file_seeds = self._file_seed_cache.GetNextFileSeeds( CC.STATUS_UNKNOWN, num_workers * FILE_SEEDS_PER_WORKER )
+        
+        if len( file_seeds ) == 0:
             
             return
             
         
-        did_substantial_work = False
-        
-        path = file_seed.file_seed_data
-        
         with self._lock:
             
-            if path in self._paths_to_tags:
+            if self._files_per_second is None:
                 
-                service_keys_to_tags = self._paths_to_tags[ path ]
+                self._current_action = 'importing'
                 
             else:
                 
-                service_keys_to_tags = {}
+                self._current_action = 'importing at ' + HydrusData.ToHumanInt( int( self._files_per_second ) ) + ' files/s'
                 
             
         
+        started = HydrusData.GetNowPrecise()
+        
+        ClientImportFileSeeds.ImportPaths( file_seeds, self._file_seed_cache, self._file_import_options )
+        
+        time_took = HydrusData.GetNowPrecise() - started
+        
         with self._lock:
             
-            self._current_action = 'importing'
+            self._files_per_second = len( file_seeds ) / max( time_took, 0.001 )
             
         
-        file_seed.ImportPath( self._file_seed_cache, self._file_import_options )
-        
-        did_substantial_work = True
+        if HG.file_report_mode:
+            
+            HydrusData.ShowText( 'Imported ' + HydrusData.ToHumanInt( len( file_seeds ) ) + ' files in ' + HydrusData.TimeDeltaToPrettyTimeDelta( time_took ) + ', ' + HydrusData.ToHumanInt( int( self._files_per_second ) ) + ' files/s' )
+            
         
-        if file_seed.status in CC.SUCCESSFUL_IMPORT_STATES:
+        for file_seed in file_seeds:
             
-            if file_seed.HasHash():
-                
-                hash = file_seed.GetHash()
-                
-                service_keys_to_content_updates = ClientData.ConvertServiceKeysToTagsToServiceKeysToContentUpdates( { hash }, service_keys_to_tags )
+            path = file_seed.file_seed_data
+            
+            with self._lock:
                 
-                if len( service_keys_to_content_updates ) > 0:
+                if path in self._paths_to_tags:
                     
-                    HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
+                    service_keys_to_tags = self._paths_to_tags[ path ]
                     
-                    did_substantial_work = True
+                else:
+                    
+                    service_keys_to_tags = {}
                     
                 
             
-            if file_seed.ShouldPresent( self._file_import_options ):
-                
-                file_seed.PresentToPage( page_key )
-                
-                did_substantial_work = True
-                
-            
-            if self._delete_after_success:
+            if file_seed.status in CC.SUCCESSFUL_IMPORT_STATES:
                 
-                try:
+                if file_seed.HasHash():
                     
-                    ClientPaths.DeletePath( path )
+                    hash = file_seed.GetHash()
                     
-                except Exception as e:
+                    service_keys_to_content_updates = ClientData.ConvertServiceKeysToTagsToServiceKeysToContentUpdates( { hash }, service_keys_to_tags )
                     
-                    HydrusData.ShowText( 'While attempting to delete ' + path + ', the following error occurred:' )
-                    HydrusData.ShowException( e )
+                    if len( service_keys_to_content_updates ) > 0:
+                        
+                        HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
+                        
                     
                 
-                txt_path = path + '.txt'
+                if file_seed.ShouldPresent( self._file_import_options ):
+                    
+                    file_seed.PresentToPage( page_key )
+                    
                 
-                if os.path.exists( txt_path ):
+                if self._delete_after_success:
                     
                     try:
                         
-                        ClientPaths.DeletePath( txt_path )
+                        ClientPaths.DeletePath( path )
                         
                     except Exception as e:
                         
-                        HydrusData.ShowText( 'While attempting to delete ' + txt_path + ', the following error occurred:' )
+                        HydrusData.ShowText( 'While attempting to delete ' + path + ', the following error occurred:' )
                         HydrusData.ShowException( e )
                         
                     
+                    txt_path = path + '.txt'
+                    
+                    if os.path.exists( txt_path ):
+                        
+                        try:
+                            
+                            ClientPaths.DeletePath( txt_path )
+                            
+                        except Exception as e:
+                            
+                            HydrusData.ShowText( 'While attempting to delete ' + txt_path + ', the following error occurred:' )
+                            HydrusData.ShowException( e )
+                            
+                        
+                    
                 
             
         
@@ -181,10 +203,7 @@ class HDDImport( HydrusSerialisable.SerialisableBase ):
             self._current_action = ''
             
         
-        if did_substantial_work:
-            
-            time.sleep( ClientImporting.DID_SUBSTANTIAL_FILE_WORK_MINIMUM_SLEEP_TIME )
-            
+        time.sleep( ClientImporting.DID_SUBSTANTIAL_FILE_WORK_MINIMUM_SLEEP_TIME )
         
     
     def CurrentlyWorking( self ):
@@ -557,15 +576,19 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         num_total_unknown = self._file_seed_cache.GetFileSeedCount( CC.STATUS_UNKNOWN )
         num_total_done = num_total - num_total_unknown
         
+        num_workers = HG.client_controller.new_options.GetInteger( 'file_import_num_workers' )
+        
+        files_per_second = None
+        
         while True:
             
-            file_seed = self._file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN )
+            file_seeds = self._file_seed_cache.GetNextFileSeeds( CC.STATUS_UNKNOWN, num_workers * FILE_SEEDS_PER_WORKER )
             
             p1 = HC.options[ 'pause_import_folders_sync' ] or self._paused
             p2 = HydrusThreading.IsThreadShuttingDown()
             p3 = job_key.IsCancelled()
             
-            if file_seed is None or p1 or p2 or p3:
+            if len( file_seeds ) == 0 or p1 or p2 or p3:
                 
                 break
                 
@@ -579,91 +602,105 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
                 time_to_save = HydrusData.GetNow() + 600
                 
             
-            gauge_num_done = num_total_done + num_files_imported + 1
+            gauge_num_done = num_total_done + i + 1
+            
+            text = 'importing file ' + HydrusData.ConvertValueRangeToPrettyString( gauge_num_done, num_total )
             
-            job_key.SetVariable( 'popup_text_1', 'importing file ' + HydrusData.ConvertValueRangeToPrettyString( gauge_num_done, num_total ) )
+            if files_per_second is not None:
+                
+                text += ' at ' + HydrusData.ToHumanInt( int( files_per_second ) ) + ' files/s'
+                
+            
+            job_key.SetVariable( 'popup_text_1', text )
             job_key.SetVariable( 'popup_gauge_1', ( gauge_num_done, num_total ) )
             
-            path = file_seed.file_seed_data
+            started = HydrusData.GetNowPrecise()
             
-            file_seed.ImportPath( self._file_seed_cache, self._file_import_options, limited_mimes = self._mimes )
+            ClientImportFileSeeds.ImportPaths( file_seeds, self._file_seed_cache, self._file_import_options, limited_mimes = self._mimes )
             
-            if file_seed.status in CC.SUCCESSFUL_IMPORT_STATES:
+            files_per_second = len( file_seeds ) / max( HydrusData.GetNowPrecise() - started, 0.001 )
+            
+            for file_seed in file_seeds:
                 
-                if file_seed.HasHash():
-                    
-                    hash = file_seed.GetHash()
+                path = file_seed.file_seed_data
+                
+                if file_seed.status in CC.SUCCESSFUL_IMPORT_STATES:
                     
-                    if self._tag_import_options.HasAdditionalTags():
-                        
-                        in_inbox = HG.client_controller.Read( 'in_inbox', hash )
+                    if file_seed.HasHash():
                         
-                        downloaded_tags = []
+                        hash = file_seed.GetHash()
                         
-                        service_keys_to_content_updates = self._tag_import_options.GetServiceKeysToContentUpdates( file_seed.status, in_inbox, hash, downloaded_tags ) # additional tags
-                        
-                        if len( service_keys_to_content_updates ) > 0:
+                        if self._tag_import_options.HasAdditionalTags():
                             
-                            HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
+                            in_inbox = HG.client_controller.Read( 'in_inbox', hash )
                             
-                        
-                    
-                    service_keys_to_tags = {}
-                    
-                    for ( tag_service_key, filename_tagging_options ) in self._tag_service_keys_to_filename_tagging_options.items():
-                        
-                        if not HG.client_controller.services_manager.ServiceExists( tag_service_key ):
+                            downloaded_tags = []
+                            
+                            service_keys_to_content_updates = self._tag_import_options.GetServiceKeysToContentUpdates( file_seed.status, in_inbox, hash, downloaded_tags ) # additional tags
                             
-                            continue
+                            if len( service_keys_to_content_updates ) > 0:
+                                
+                                HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
+                                
                             
                         
-                        try:
+                        service_keys_to_tags = {}
+                        
+                        for ( tag_service_key, filename_tagging_options ) in self._tag_service_keys_to_filename_tagging_options.items():
                             
-                            tags = filename_tagging_options.GetTags( tag_service_key, path )
+                            if not HG.client_controller.services_manager.ServiceExists( tag_service_key ):
+                                
+                                continue
+                                
                             
-                            if len( tags ) > 0:
+                            try:
+                                
+                                tags = filename_tagging_options.GetTags( tag_service_key, path )
                                 
-                                service_keys_to_tags[ tag_service_key ] = tags
+                                if len( tags ) > 0:
+                                    
+                                    service_keys_to_tags[ tag_service_key ] = tags
+                                    
+                                
+                            except Exception as e:
+                                
+                                HydrusData.ShowText( 'Trying to parse filename tags in the import folder "' + self._name + '" threw an error!' )
+                                
+                                HydrusData.ShowException( e )
                                 
                             
-                        except Exception as e:
+                        
+                        if len( service_keys_to_tags ) > 0:
                             
-                            HydrusData.ShowText( 'Trying to parse filename tags in the import folder "' + self._name + '" threw an error!' )
+                            service_keys_to_content_updates = ClientData.ConvertServiceKeysToTagsToServiceKeysToContentUpdates( { hash }, service_keys_to_tags )
                             
-                            HydrusData.ShowException( e )
+                            HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
                             
                         
                     
-                    if len( service_keys_to_tags ) > 0:
-                        
-                        service_keys_to_content_updates = ClientData.ConvertServiceKeysToTagsToServiceKeysToContentUpdates( { hash }, service_keys_to_tags )
+                    num_files_imported += 1
+                    
+                    if hash not in presentation_hashes_fast:
                         
-                        HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
+                        if file_seed.ShouldPresent( self._file_import_options ):
+                            
+                            presentation_hashes.append( hash )
+                            
+                            presentation_hashes_fast.add( hash )
+                            
                         
                     
-                
-                num_files_imported += 1
-                
-                if hash not in presentation_hashes_fast:
+                elif file_seed.status == CC.STATUS_ERROR:
                     
-                    if file_seed.ShouldPresent( self._file_import_options ):
-                        
-                        presentation_hashes.append( hash )
-                        
-                        presentation_hashes_fast.add( hash )
-                        
+                    HydrusData.Print( 'A file failed to import from import folder ' + self._name + ':' + path )
                     
                 
-            elif file_seed.status == CC.STATUS_ERROR:
+                i += 1
                 
-                HydrusData.Print( 'A file failed to import from import folder ' + self._name + ':' + path )
-                
-            
-            i += 1
-            
-            if i % 10 == 0:
-                
-                self._ActionPaths()
+                if i % 10 == 0:
+                    
+                    self._ActionPaths()
+                    
                 
             
         
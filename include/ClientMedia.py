@@ -9,6 +9,7 @@ import HydrusConstants as HC
 import HydrusTags
 import os
 import random
+import threading
 import time
 import traceback
 import wx
@@ -19,6 +20,8 @@ import HydrusGlobals as HG
 import HydrusSerialisable
 import itertools
 
+DB_SORTABLE_SYSTEM_SORTS = { CC.SORT_FILES_BY_FILESIZE, CC.SORT_FILES_BY_DURATION, CC.SORT_FILES_BY_IMPORT_TIME, CC.SORT_FILES_BY_MIME, CC.SORT_FILES_BY_RANDOM, CC.SORT_FILES_BY_WIDTH, CC.SORT_FILES_BY_HEIGHT, CC.SORT_FILES_BY_RATIO, CC.SORT_FILES_BY_NUM_PIXELS }
+
 def FlattenMedia( media_list ):
     
     flat_media = []
@@ -192,6 +195,51 @@ def GetDuplicateComparisonStatements( shown_media, comparison_media ):
     
     return ( statements, score )
     
+def GetPagersToMediaResultPlaceholders( medias ):
+    
+    pagers_to_placeholders = collections.defaultdict( list )
+    
+    for media in medias:
+        
+        if media.IsCollection():
+            
+            for ( pager, placeholders ) in GetPagersToMediaResultPlaceholders( media.GetFlatMedia() ).items():
+                
+                pagers_to_placeholders[ pager ].extend( placeholders )
+                
+            
+            continue
+            
+        
+        media_result = media.GetMediaResult()
+        
+        if isinstance( media_result, MediaResultPlaceholder ):
+            
+            pagers_to_placeholders[ media_result.GetPager() ].append( media_result )
+            
+        
+    
+    return pagers_to_placeholders
+    
+def HasUnloadedMediaResultPlaceholders( medias ):
+    
+    for placeholders in GetPagersToMediaResultPlaceholders( medias ).values():
+        
+        if False in ( placeholder.IsLoaded() for placeholder in placeholders ):
+            
+            return True
+            
+        
+    
+    return False
+    
+def LoadMediaResultPlaceholders( medias ):
+    
+    for ( pager, placeholders ) in GetPagersToMediaResultPlaceholders( medias ).items():
+        
+        pager.LoadMediaResults( placeholders )
+        
+    
 def MergeTagsManagers( tags_managers ):
     
     def CurrentAndPendingFilter( items ):
@@ -234,6 +282,13 @@ def MergeTagsManagers( tags_managers ):
     
     return TagsManager( merged_service_keys_to_statuses_to_tags )
     
+def ReleaseMediaResultPlaceholders( medias ):
+    
+    for ( pager, placeholders ) in GetPagersToMediaResultPlaceholders( medias ).items():
+        
+        pager.ReleaseMediaResults( placeholders )
+        
+    
 class DuplicatesManager( object ):
     
     def __init__( self, service_keys_to_dupe_statuses_to_counts ):
@@ -649,6 +704,9 @@ class MediaList( object ):
         self._media_sort = MediaSort( ( 'system', CC.SORT_FILES_BY_FILESIZE ), CC.SORT_ASC )
         self._collect_by = []
         
+        self._presorted_media_sort = None
+        self._sort_types_to_media_to_sort_keys = collections.defaultdict( dict )
+        
         self._collect_map_singletons = {}
         self._collect_map_collected = {}
         
@@ -700,6 +758,24 @@ class MediaList( object ):
         return keys_to_medias
         
     
+    def _ClearSortKeys( self, medias = None ):
+        
+        if medias is None:
+            
+            self._sort_types_to_media_to_sort_keys = collections.defaultdict( dict )
+            
+        else:
+            
+            for media_to_sort_keys in self._sort_types_to_media_to_sort_keys.values():
+                
+                for media in medias:
+                    
+                    media_to_sort_keys.pop( media, None )
+                    
+                
+            
+        
+    
     def _GenerateMediaCollection( self, media_results ):
         
         return MediaCollection( self._file_service_key, media_results )
@@ -771,6 +847,32 @@ class MediaList( object ):
             
         
     
+    def _GetSortKeyAndReverse( self, media_sort ):
+        
+        ( sort_key, reverse ) = media_sort.GetSortKeyAndReverse( self._file_service_key )
+        
+        if media_sort.sort_type == ( 'system', CC.SORT_FILES_BY_RANDOM ):
+            
+            return ( sort_key, reverse )
+            
+        
+        # keys are kept until a content update touches the media, so re-sorting a big page does not rebuild them all
+        
+        media_to_sort_keys = self._sort_types_to_media_to_sort_keys[ media_sort.sort_type ]
+        
+        def cached_sort_key( media ):
+            
+            if media not in media_to_sort_keys:
+                
+                media_to_sort_keys[ media ] = sort_key( media )
+                
+            
+            return media_to_sort_keys[ media ]
+            
+        
+        return ( cached_sort_key, reverse )
+        
+    
     def _HasHashes( self, hashes ):
         
         for hash in hashes:
@@ -863,11 +965,15 @@ class MediaList( object ):
         
         self._sorted_media.remove_items( singleton_media.union( collected_media ) )
         
+        self._ClearSortKeys( singleton_media.union( collected_media ) )
+        
         self._RecalcHashes()
         
     
     def AddMedia( self, new_media, append = True ):
         
+        self._presorted_media_sort = None
+        
         if append:
             
             for media in new_media:
@@ -961,6 +1067,18 @@ class MediaList( object ):
         
         self._collect_by = collect_by
         
+        if len( collect_by ) == 0 and len( self._collected_media ) == 0:
+            
+            # nothing to collect or uncollect, so the current order can stand
+            
+            self._collect_map_singletons = {}
+            self._collect_map_collected = {}
+            
+            return
+            
+        
+        self._presorted_media_sort = None
+        
         for media in self._collected_media:
             
             self._singleton_media.update( [ self._GenerateMediaSingleton( media_result ) for media_result in media.GenerateMediaResults() ] )
@@ -984,11 +1102,20 @@ class MediaList( object ):
         
         self._sorted_media = SortedList( list( self._singleton_media ) + list( self._collected_media ) )
         
+        self._ClearSortKeys()
+        
         self._RecalcHashes()
         
     
+    def ClearSortKeys( self ):
+        
+        self._ClearSortKeys()
+        
+    
     def DeletePending( self, service_key ):
         
+        self._ClearSortKeys()
+        
         for media in self._collected_media: media.DeletePending( service_key )
         
     
@@ -1213,6 +1340,18 @@ class MediaList( object ):
             m.ProcessContentUpdates( service_keys_to_content_updates )
             
         
+        affected_hashes = set()
+        
+        for content_updates in service_keys_to_content_updates.values():
+            
+            for content_update in content_updates:
+                
+                affected_hashes.update( content_update.GetHashes() )
+                
+            
+        
+        self._ClearSortKeys( self._GetMedia( affected_hashes ) )
+        
         for ( service_key, content_updates ) in service_keys_to_content_updates.items():
             
             for content_update in content_updates:
@@ -1269,6 +1408,8 @@ class MediaList( object ):
     
     def ResetService( self, service_key ):
         
+        self._ClearSortKeys()
+        
         if service_key == self._file_service_key:
             
             self._RemoveMediaDirectly( self._singleton_media, self._collected_media )
@@ -1279,6 +1420,13 @@ class MediaList( object ):
             
         
     
+    def SetPresorted( self, media_sort ):
+        
+        # the db has already put the media in this order, so the next sort by it can be skipped
+        
+        self._presorted_media_sort = media_sort
+        
+    
     def Sort( self, media_sort = None ):
         
         for media in self._collected_media:
@@ -1293,15 +1441,24 @@ class MediaList( object ):
         
         self._media_sort = media_sort
         
+        presorted_media_sort = self._presorted_media_sort
+        
+        self._presorted_media_sort = None
+        
+        if presorted_media_sort is not None and presorted_media_sort.sort_type == media_sort.sort_type and presorted_media_sort.sort_asc == media_sort.sort_asc:
+            
+            return
+            
+        
         media_sort_fallback = HG.client_controller.new_options.GetFallbackSort()
         
-        ( sort_key, reverse ) = media_sort_fallback.GetSortKeyAndReverse( self._file_service_key )
+        ( sort_key, reverse ) = self._GetSortKeyAndReverse( media_sort_fallback )
         
         self._sorted_media.sort( sort_key, reverse = reverse )
         
         # this is a stable sort, so the fallback order above will remain for equal items
         
-        ( sort_key, reverse ) = self._media_sort.GetSortKeyAndReverse( self._file_service_key )
+        ( sort_key, reverse ) = self._GetSortKeyAndReverse( self._media_sort )
         
         self._sorted_media.sort( sort_key = sort_key, reverse = reverse )
         
@@ -1314,6 +1471,8 @@ class ListeningMediaList( MediaList ):
         
         HG.client_controller.sub( self, 'ProcessContentUpdates', 'content_updates_gui' )
         HG.client_controller.sub( self, 'ProcessServiceUpdates', 'service_updates_gui' )
+        HG.client_controller.sub( self, 'NewSiblings', 'notify_new_siblings_gui' )
+        HG.client_controller.sub( self, 'ClearSortKeys', 'notify_new_force_refresh_tags_gui' )
         
     
     def AddMediaResults( self, media_results, append = True ):
@@ -1337,6 +1496,11 @@ class ListeningMediaList( MediaList ):
         return new_media
         
     
+    def NewSiblings( self, changed_tags ):
+        
+        self._ClearSortKeys()
+        
+    
 class MediaCollection( MediaList, Media ):
     
     def __init__( self, file_service_key, media_results ):
@@ -1585,7 +1749,7 @@ class MediaSingleton( Media ):
     
     def GetTimestamp( self, service_key ):
         
-        return self._media_result.GetLocationsManager().GetTimestamp( service_key )
+        return self._media_result.GetTimestamp( service_key )
         
     
     def GetPrettyInfoLines( self ):
@@ -1896,6 +2060,11 @@ class MediaResult( object ):
         return self._tags_manager
         
     
+    def GetTimestamp( self, service_key ):
+        
+        return self._locations_manager.GetTimestamp( service_key )
+        
+    
     def ProcessContentUpdate( self, service_key, content_update ):
         
         try:
@@ -1958,6 +2127,377 @@ class MediaResult( object ):
         return ( self._file_info_manager, self._tags_manager, self._locations_manager, self._ratings_manager )
         
     
+class MediaResultPager( object ):
+    
+    def __init__( self, page_size = 256 ):
+        
+        self._lock = threading.Lock()
+        
+        self._page_size = page_size
+        
+        self._placeholders = []
+        self._hashes_to_placeholders = {}
+        
+        HG.client_controller.sub( self, 'ProcessContentUpdates', 'content_updates_data' )
+        
+    
+    def AddPlaceholderData( self, placeholder_data ):
+        
+        with self._lock:
+            
+            placeholders = []
+            
+            for ( file_info_manager, inbox, current_to_timestamps ) in placeholder_data:
+                
+                placeholder = MediaResultPlaceholder( self, len( self._placeholders ), file_info_manager, inbox, current_to_timestamps )
+                
+                self._placeholders.append( placeholder )
+                self._hashes_to_placeholders[ placeholder.GetHash() ] = placeholder
+                
+                placeholders.append( placeholder )
+                
+            
+            return placeholders
+            
+        
+    
+    def GetNumLoaded( self ):
+        
+        with self._lock:
+            
+            return len( [ placeholder for placeholder in self._placeholders if placeholder.IsLoaded() ] )
+            
+        
+    
+    def LoadMediaResults( self, placeholders ):
+        
+        with self._lock:
+            
+            hash_ids_to_media_results = { placeholder.GetHashId() : placeholder.GetLoadedMediaResult() for placeholder in placeholders if placeholder.IsLoaded() }
+            
+            placeholders_to_load = [ placeholder for placeholder in placeholders if not placeholder.IsLoaded() ]
+            
+        
+        if len( placeholders_to_load ) > 0:
+            
+            # the read happens outside the lock, so content updates and other loads are not held up behind it
+            
+            hash_ids = [ placeholder.GetHashId() for placeholder in placeholders_to_load ]
+            
+            media_results = HG.client_controller.Read( 'media_results_from_ids', hash_ids )
+            
+            with self._lock:
+                
+                hash_ids_to_media_results.update( { media_result.GetHashId() : media_result for media_result in media_results } )
+                
+                for placeholder in placeholders_to_load:
+                    
+                    if placeholder.IsLoaded():
+                        
+                        hash_ids_to_media_results[ placeholder.GetHashId() ] = placeholder.GetLoadedMediaResult()
+                        
+                    else:
+                        
+                        placeholder.SetMediaResult( hash_ids_to_media_results[ placeholder.GetHashId() ] )
+                        
+                    
+                
+            
+        
+        return hash_ids_to_media_results
+        
+    
+    def LoadPage( self, placeholder ):
+        
+        # one db hit fetches the placeholder's neighbours in the original query order, which are likely to be wanted next
+        
+        start_index = placeholder.GetPagerIndex() - ( placeholder.GetPagerIndex() % self._page_size )
+        
+        with self._lock:
+            
+            placeholders = self._placeholders[ start_index : start_index + self._page_size ]
+            
+        
+        hash_ids_to_media_results = self.LoadMediaResults( placeholders )
+        
+        return hash_ids_to_media_results[ placeholder.GetHashId() ]
+        
+    
+    def ProcessContentUpdates( self, service_keys_to_content_updates ):
+        
+        # loaded placeholders are kept up to date by the media result cache, so only the unloaded ones need to hear this
+        
+        with self._lock:
+            
+            for ( service_key, content_updates ) in service_keys_to_content_updates.items():
+                
+                for content_update in content_updates:
+                    
+                    for hash in content_update.GetHashes():
+                        
+                        if hash in self._hashes_to_placeholders:
+                            
+                            placeholder = self._hashes_to_placeholders[ hash ]
+                            
+                            if not placeholder.IsLoaded():
+                                
+                                placeholder.ProcessContentUpdate( service_key, content_update )
+                                
+                            
+                        
+                    
+                
+            
+        
+    
+    def ReleaseMediaResults( self, placeholders ):
+        
+        with self._lock:
+            
+            for placeholder in placeholders:
+                
+                placeholder.ReleaseMediaResult()
+                
+            
+        
+    
+class MediaResultPlaceholder( object ):
+    
+    def __init__( self, pager, pager_index, file_info_manager, inbox, current_to_timestamps ):
+        
+        self._pager = pager
+        self._pager_index = pager_index
+        
+        self._file_info_manager = file_info_manager
+        
+        # only inbox and timestamps are reliable here, but that covers the system sorts
+        self._partial_locations_manager = LocationsManager( set( current_to_timestamps.keys() ), set(), set(), set(), inbox = inbox, current_to_timestamps = current_to_timestamps )
+        
+        self._media_result = None
+        
+    
+    def _GetMediaResult( self ):
+        
+        media_result = self._media_result
+        
+        if media_result is None:
+            
+            if wx.IsMainThread():
+                
+                # the gui never waits on the db here. it loads pages off its thread first, and until then it gets what the placeholder knows
+                
+                tags_manager = TagsManager( collections.defaultdict( HydrusData.default_dict_set ) )
+                ratings_manager = ClientRatings.RatingsManager( {} )
+                file_viewing_stats_manager = FileViewingStatsManager.STATICGenerateEmptyManager()
+                
+                media_result = MediaResult( self._file_info_manager, tags_manager, self._partial_locations_manager, ratings_manager, file_viewing_stats_manager )
+                
+            else:
+                
+                media_result = self._pager.LoadPage( self )
+                
+            
+        
+        return media_result
+        
+    
+    def DeletePending( self, service_key ):
+        
+        media_result = self._media_result
+        
+        if media_result is not None:
+            
+            media_result.DeletePending( service_key )
+            
+        
+    
+    def Duplicate( self ):
+        
+        return self._GetMediaResult().Duplicate()
+        
+    
+    def GetDuration( self ):
+        
+        return self._file_info_manager.duration
+        
+    
+    def GetFileInfoManager( self ):
+        
+        return self._file_info_manager
+        
+    
+    def GetFileViewingStatsManager( self ):
+        
+        return self._GetMediaResult().GetFileViewingStatsManager()
+        
+    
+    def GetHash( self ):
+        
+        return self._file_info_manager.hash
+        
+    
+    def GetHashId( self ):
+        
+        return self._file_info_manager.hash_id
+        
+    
+    def GetInbox( self ):
+        
+        media_result = self._media_result
+        
+        if media_result is None:
+            
+            return self._partial_locations_manager.GetInbox()
+            
+        else:
+            
+            return media_result.GetInbox()
+            
+        
+    
+    def GetLoadedMediaResult( self ):
+        
+        return self._media_result
+        
+    
+    def GetLocationsManager( self ):
+        
+        return self._GetMediaResult().GetLocationsManager()
+        
+    
+    def GetMime( self ):
+        
+        return self._file_info_manager.mime
+        
+    
+    def GetNumFrames( self ):
+        
+        return self._file_info_manager.num_frames
+        
+    
+    def GetNumWords( self ):
+        
+        return self._file_info_manager.num_words
+        
+    
+    def GetPager( self ):
+        
+        return self._pager
+        
+    
+    def GetPagerIndex( self ):
+        
+        return self._pager_index
+        
+    
+    def GetRatingsManager( self ):
+        
+        return self._GetMediaResult().GetRatingsManager()
+        
+    
+    def GetResolution( self ):
+        
+        return ( self._file_info_manager.width, self._file_info_manager.height )
+        
+    
+    def GetSize( self ):
+        
+        return self._file_info_manager.size
+        
+    
+    def GetTagsManager( self ):
+        
+        return self._GetMediaResult().GetTagsManager()
+        
+    
+    def GetTimestamp( self, service_key ):
+        
+        media_result = self._media_result
+        
+        if media_result is None:
+            
+            return self._partial_locations_manager.GetTimestamp( service_key )
+            
+        else:
+            
+            return media_result.GetTimestamp( service_key )
+            
+        
+    
+    def IsLoaded( self ):
+        
+        return self._media_result is not None
+        
+    
+    def ProcessContentUpdate( self, service_key, content_update ):
+        
+        media_result = self._media_result
+        
+        if media_result is None:
+            
+            if content_update.GetDataType() == HC.CONTENT_TYPE_FILES:
+                
+                self._partial_locations_manager.ProcessContentUpdate( service_key, content_update )
+                
+            
+        else:
+            
+            media_result.ProcessContentUpdate( service_key, content_update )
+            
+        
+    
+    def RefreshFileInfo( self ):
+        
+        media_result = self._GetMediaResult()
+        
+        media_result.RefreshFileInfo()
+        
+        self._file_info_manager = media_result.GetFileInfoManager()
+        
+    
+    def ReleaseMediaResult( self ):
+        
+        media_result = self._media_result
+        
+        if media_result is not None:
+            
+            locations_manager = media_result.GetLocationsManager()
+            
+            current_to_timestamps = { service_key : locations_manager.GetTimestamp( service_key ) for service_key in locations_manager.GetCurrent() }
+            
+            self._partial_locations_manager = LocationsManager( set( current_to_timestamps.keys() ), set(), set(), set(), inbox = locations_manager.GetInbox(), current_to_timestamps = current_to_timestamps )
+            
+            self._media_result = None
+            
+        
+    
+    def ResetService( self, service_key ):
+        
+        media_result = self._media_result
+        
+        if media_result is not None:
+            
+            media_result.ResetService( service_key )
+            
+        
+    
+    def SetMediaResult( self, media_result ):
+        
+        self._media_result = media_result
+        
+        self._file_info_manager = media_result.GetFileInfoManager()
+        
+    
+    def SetTagsManager( self, tags_manager ):
+        
+        self._GetMediaResult().SetTagsManager( tags_manager )
+        
+    
+    def ToTuple( self ):
+        
+        return self._GetMediaResult().ToTuple()
+        
+    
 class MediaSort( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_MEDIA_SORT
@@ -2041,6 +2581,13 @@ class MediaSort( HydrusSerialisable.SerialisableBase ):
         return True
         
     
+    def CanSortInDB( self ):
+        
+        ( sort_metatype, sort_data ) = self.sort_type
+        
+        return sort_metatype == 'system' and sort_data in DB_SORTABLE_SYSTEM_SORTS
+        
+    
     def GetSortKeyAndReverse( self, file_service_key ):
         
         reverse = False
@@ -2667,7 +3214,32 @@ class TagsManager( TagsManagerSimple ):
         return tag in combined_statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ] or tag in combined_statuses_to_tags[ HC.CONTENT_STATUS_PENDING ]
         
     
-    def NewSiblings( self ):
+    def NewSiblings( self, changed_tags = None ):
+        
+        if changed_tags is not None:
+            
+            has_changed_tag = False
+            
+            for ( service_key, statuses_to_tags ) in self._service_keys_to_statuses_to_tags.items():
+                
+                if service_key == CC.COMBINED_TAG_SERVICE_KEY:
+                    
+                    continue
+                    
+                
+                if True in ( not changed_tags.isdisjoint( tags ) for tags in statuses_to_tags.values() ):
+                    
+                    has_changed_tag = True
+                    
+                    break
+                    
+                
+            
+            if not has_changed_tag:
+                
+                return
+                
+            
         
         self._combined_is_calculated = False
         
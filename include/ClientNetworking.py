@@ -52,6 +52,8 @@ def GenerateMultipartFormDataCTAndBodyFromDict( fields ):
     
 class NetworkEngine( object ):
     
+    FULL_REVIEW_PERIOD = 5
+    
     def __init__( self, controller, bandwidth_manager, session_manager, domain_manager, login_manager ):
         
         self.controller = controller
@@ -78,12 +80,19 @@ class NetworkEngine( object ):
         
         self._jobs_awaiting_validity = []
         self._current_validation_process = None
-        self._jobs_awaiting_bandwidth = []
+        self._network_contexts_to_jobs_awaiting_bandwidth = {}
+        self._network_contexts_to_bandwidth_check_times = {}
         self._jobs_awaiting_login = []
         self._current_login_process = None
         self._jobs_awaiting_slot = []
         self._jobs_running = []
         
+        self._jobs_to_add_times = {}
+        self._domains_to_start_latencies = collections.defaultdict( lambda: collections.deque( maxlen = 100 ) )
+        
+        self._review_all_jobs = True
+        self._next_full_review_time = 0
+        
         self._pause_all_new_network_traffic = self.controller.new_options.GetBoolean( 'pause_all_new_network_traffic' )
         
         self._is_running = False
@@ -106,6 +115,8 @@ class NetworkEngine( object ):
             
             self._jobs_awaiting_validity.append( job )
             
+            self._jobs_to_add_times[ job ] = time.time()
+            
         
         self._new_work_to_do.set()
         
@@ -127,7 +138,7 @@ class NetworkEngine( object ):
             jobs = []
             
             jobs.extend( ( ( JOB_STATUS_AWAITING_VALIDITY, j ) for j in self._jobs_awaiting_validity ) )
-            jobs.extend( ( ( JOB_STATUS_AWAITING_BANDWIDTH, j ) for j in self._jobs_awaiting_bandwidth ) )
+            jobs.extend( ( ( JOB_STATUS_AWAITING_BANDWIDTH, j ) for j in itertools.chain.from_iterable( self._network_contexts_to_jobs_awaiting_bandwidth.values() ) ) )
             jobs.extend( ( ( JOB_STATUS_AWAITING_LOGIN, j ) for j in self._jobs_awaiting_login ) )
             jobs.extend( ( ( JOB_STATUS_AWAITING_SLOT, j ) for j in self._jobs_awaiting_slot ) )
             jobs.extend( ( ( JOB_STATUS_RUNNING, j ) for j in self._jobs_running ) )
@@ -136,11 +147,54 @@ class NetworkEngine( object ):
             
         
     
+    def GetSchedulingStats( self ):
+        
+        with self._lock:
+            
+            domains_to_num_waiting = collections.Counter()
+            
+            waiting_jobs = itertools.chain( self._jobs_awaiting_validity, itertools.chain.from_iterable( self._network_contexts_to_jobs_awaiting_bandwidth.values() ), self._jobs_awaiting_login, self._jobs_awaiting_slot )
+            
+            for job in waiting_jobs:
+                
+                domains_to_num_waiting[ job.GetSecondLevelDomain() ] += 1
+                
+            
+            domains = set( domains_to_num_waiting.keys() )
+            domains.update( self._active_domains_counter.keys() )
+            domains.update( self._domains_to_start_latencies.keys() )
+            
+            rows = []
+            
+            for domain in domains:
+                
+                latencies = self._domains_to_start_latencies.get( domain, [] )
+                
+                if len( latencies ) == 0:
+                    
+                    average_latency = None
+                    max_latency = None
+                    
+                else:
+                    
+                    average_latency = sum( latencies ) / len( latencies )
+                    max_latency = max( latencies )
+                    
+                
+                rows.append( ( domain, domains_to_num_waiting[ domain ], self._active_domains_counter[ domain ], average_latency, max_latency ) )
+                
+            
+            return rows
+            
+        
+    
     def IsBusy( self ):
         
         with self._lock:
             
-            return len( self._jobs_awaiting_validity ) + len( self._jobs_awaiting_bandwidth ) + len( self._jobs_awaiting_login ) + len( self._jobs_awaiting_slot ) + len( self._jobs_running ) > 50
+            num_awaiting_bandwidth = sum( ( len( jobs ) for jobs in self._network_contexts_to_jobs_awaiting_bandwidth.values() ) )
+            
+            return len( self._jobs_awaiting_validity ) + num_awaiting_bandwidth + len( self._jobs_awaiting_login ) + len( self._jobs_awaiting_slot ) + len( self._jobs_running ) > 50
             
         
     
@@ -206,7 +260,14 @@ class NetworkEngine( object ):
                 
             else:
                 
-                self._jobs_awaiting_bandwidth.append( job )
+                network_contexts_key = tuple( job.GetNetworkContexts() )
+                
+                if network_contexts_key not in self._network_contexts_to_jobs_awaiting_bandwidth:
+                    
+                    self._network_contexts_to_jobs_awaiting_bandwidth[ network_contexts_key ] = collections.deque()
+                    
+                
+                self._network_contexts_to_jobs_awaiting_bandwidth[ network_contexts_key ].append( job )
                 
                 return False
                 
@@ -245,6 +306,69 @@ class NetworkEngine( object ):
                 
             
         
+        def ProcessBlockedBandwidthJob( job ):
+            
+            if job.IsDone():
+                
+                return False
+                
+            elif job.ObeysBandwidth():
+                
+                return True
+                
+            else:
+                
+                return ProcessBandwidthJob( job )
+                
+            
+        
+        def ProcessBandwidthQueues( review_all_jobs ):
+            
+            # jobs with the same network contexts share the same bandwidth, so if the first in a queue cannot start, nor can the rest
+            
+            now = time.time()
+            
+            for ( network_contexts_key, jobs ) in self._network_contexts_to_jobs_awaiting_bandwidth.items():
+                
+                if not review_all_jobs and now < self._network_contexts_to_bandwidth_check_times.get( network_contexts_key, 0 ):
+                    
+                    continue
+                    
+                
+                while len( jobs ) > 0 and not ProcessBandwidthJob( jobs[0] ):
+                    
+                    jobs.popleft()
+                    
+                
+                if review_all_jobs and len( jobs ) > 1:
+                    
+                    first_job = jobs.popleft()
+                    
+                    jobs = collections.deque( filter( ProcessBlockedBandwidthJob, jobs ) )
+                    
+                    jobs.appendleft( first_job )
+                    
+                    self._network_contexts_to_jobs_awaiting_bandwidth[ network_contexts_key ] = jobs
+                    
+                
+                if len( jobs ) == 0:
+                    
+                    del self._network_contexts_to_jobs_awaiting_bandwidth[ network_contexts_key ]
+                    
+                    if network_contexts_key in self._network_contexts_to_bandwidth_check_times:
+                        
+                        del self._network_contexts_to_bandwidth_check_times[ network_contexts_key ]
+                        
+                    
+                else:
+                    
+                    waiting_estimate = self.bandwidth_manager.GetWaitingEstimate( network_contexts_key )
+                    
+                    self._network_contexts_to_bandwidth_check_times[ network_contexts_key ] = int( now ) + max( 1, waiting_estimate )
+                    
+                
+            
+        
         def ProcessForceLogins():
             
             if len( self._domains_to_login ) > 0 and self._current_login_process is None:
@@ -409,7 +533,16 @@ class NetworkEngine( object ):
                         HydrusData.ShowText( 'Network Job Starting: ' + job._method + ' ' + job._url )
                         
                     
-                    self._active_domains_counter[ job.GetSecondLevelDomain() ] += 1
+                    second_level_domain = job.GetSecondLevelDomain()
+                    
+                    self._active_domains_counter[ second_level_domain ] += 1
+                    
+                    if job in self._jobs_to_add_times:
+                        
+                        self._domains_to_start_latencies[ second_level_domain ].append( time.time() - self._jobs_to_add_times[ job ] )
+                        
+                        del self._jobs_to_add_times[ job ]
+                        
                     
                     self.controller.CallToThread( job.Start )
                     
@@ -452,17 +585,56 @@ class NetworkEngine( object ):
                 
             
         
+        def GetNextWakeTime():
+            
+            # we want to catch the rollover of the second for bandwidth jobs
+            
+            next_second = int( time.time() ) + 1
+            
+            wake_times = [ self._next_full_review_time ]
+            
+            if len( self._jobs_awaiting_validity ) + len( self._jobs_awaiting_login ) + len( self._domains_to_login ) > 0:
+                
+                wake_times.append( next_second )
+                
+            
+            if self._current_validation_process is not None or self._current_login_process is not None:
+                
+                wake_times.append( next_second )
+                
+            
+            if len( self._jobs_awaiting_slot ) > 0 and len( self._jobs_running ) < self.MAX_JOBS:
+                
+                wake_times.append( next_second )
+                
+            
+            wake_times.extend( self._network_contexts_to_bandwidth_check_times.values() )
+            
+            return min( wake_times )
+            
+        
         self._is_running = True
         
         while not ( self._local_shutdown or self.controller.ModelIsShutdown() ):
             
+            self._new_work_to_do.clear()
+            
             with self._lock:
                 
+                review_all_jobs = self._review_all_jobs or time.time() >= self._next_full_review_time
+                
+                if review_all_jobs:
+                    
+                    self._review_all_jobs = False
+                    
+                    self._next_full_review_time = time.time() + self.FULL_REVIEW_PERIOD
+                    
+                
                 self._jobs_awaiting_validity = filter( ProcessValidationJob, self._jobs_awaiting_validity )
                 
                 ProcessCurrentValidationJob()
                 
-                self._jobs_awaiting_bandwidth = filter( ProcessBandwidthJob, self._jobs_awaiting_bandwidth )
+                ProcessBandwidthQueues( review_all_jobs )
                 
                 ProcessForceLogins()
                 
@@ -470,21 +642,25 @@ class NetworkEngine( object ):
                 
                 ProcessCurrentLoginJob()
                 
-                self._jobs_awaiting_slot = filter( ProcessReadyJob, self._jobs_awaiting_slot )
-                
                 self._jobs_running = filter( ProcessRunningJob, self._jobs_running )
                 
+                if review_all_jobs or len( self._jobs_running ) < self.MAX_JOBS:
+                    
+                    self._jobs_awaiting_slot = filter( ProcessReadyJob, self._jobs_awaiting_slot )
+                    
+                
+                if review_all_jobs:
+                    
+                    for job in [ job for job in self._jobs_to_add_times if job.IsDone() ]:
+                        
+                        del self._jobs_to_add_times[ job ]
+                        
+                    
+                
+                next_wake_time = GetNextWakeTime()
+                
             
-            # we want to catch the rollover of the second for bandwidth jobs
-            
-            now_with_subsecond = time.time()
-            subsecond_part = now_with_subsecond % 1
-            
-            time_until_next_second = 1.0 - subsecond_part
-            
-            self._new_work_to_do.wait( time_until_next_second )
-            
-            self._new_work_to_do.clear()
+            self._new_work_to_do.wait( max( 0.0, next_wake_time - time.time() ) )
             
         
         self._is_running = False
@@ -515,3 +691,13 @@ class NetworkEngine( object ):
         self._new_work_to_do.set()
         
     
+    def Wake( self, review_all_jobs = False ):
+        
+        if review_all_jobs:
+            
+            self._review_all_jobs = True
+            
+        
+        self._new_work_to_do.set()
+        
+    
@@ -32,6 +32,9 @@ class NetworkBandwidthManager( HydrusSerialisable.SerialisableBase ):
         self._network_contexts_to_bandwidth_trackers = collections.defaultdict( HydrusNetworking.BandwidthTracker )
         self._network_contexts_to_bandwidth_rules = collections.defaultdict( HydrusNetworking.BandwidthRules )
         
+        # not saved, just a running total for this session
+        self._network_contexts_to_data_saved_by_resuming = collections.Counter()
+        
         for context_type in [ CC.NETWORK_CONTEXT_GLOBAL, CC.NETWORK_CONTEXT_HYDRUS, CC.NETWORK_CONTEXT_DOMAIN, CC.NETWORK_CONTEXT_DOWNLOADER_PAGE, CC.NETWORK_CONTEXT_SUBSCRIPTION, CC.NETWORK_CONTEXT_WATCHER_PAGE ]:
             
             self._network_contexts_to_bandwidth_rules[ ClientNetworkingContexts.NetworkContext( context_type ) ] = HydrusNetworking.BandwidthRules()
@@ -115,6 +118,14 @@ class NetworkBandwidthManager( HydrusSerialisable.SerialisableBase ):
         self._dirty = True
         
     
+    def _WakeEngine( self ):
+        
+        if self.engine is not None:
+            
+            self.engine.Wake( review_all_jobs = True )
+            
+        
+    
     def AlreadyHaveExactlyTheseBandwidthRules( self, network_context, bandwidth_rules ):
         
         with self._lock:
@@ -219,6 +230,8 @@ class NetworkBandwidthManager( HydrusSerialisable.SerialisableBase ):
             
             self._SetDirty()
             
+            self._WakeEngine()
+            
         
     
     def DeleteHistory( self, network_contexts ):
@@ -241,6 +254,8 @@ class NetworkBandwidthManager( HydrusSerialisable.SerialisableBase ):
             
             self._SetDirty()
             
+            self._WakeEngine()
+            
         
     
     def GetDefaultRules( self ):
@@ -271,6 +286,14 @@ class NetworkBandwidthManager( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def GetDataSavedByResuming( self, network_context ):
+        
+        with self._lock:
+            
+            return self._network_contexts_to_data_saved_by_resuming[ network_context ]
+            
+        
+    
     def GetBandwidthStringsAndGaugeTuples( self, network_context ):
         
         with self._lock:
@@ -376,6 +399,17 @@ class NetworkBandwidthManager( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def ReportDataSavedByResuming( self, network_contexts, num_bytes ):
+        
+        with self._lock:
+            
+            for network_context in network_contexts:
+                
+                self._network_contexts_to_data_saved_by_resuming[ network_context ] += num_bytes
+                
+            
+        
+    
     def ReportDataUsed( self, network_contexts, num_bytes ):
         
         with self._lock:
@@ -423,6 +457,8 @@ class NetworkBandwidthManager( HydrusSerialisable.SerialisableBase ):
             
             self._SetDirty()
             
+            self._WakeEngine()
+            
         
     
     def TryToConsumeAGalleryToken( self, second_level_domain, query_type ):
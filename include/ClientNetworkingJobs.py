@@ -133,6 +133,13 @@ class NetworkJob( object ):
         
         self._last_time_ongoing_bandwidth_failed = 0
         
+        self._connection_reused = None
+        self._connection_setup_time = None
+        
+        self._resume_validator = None
+        self._resume_offset = 0
+        self._num_bytes_saved_by_resuming = 0
+        
         self._status_text = u'initialising\u2026'
         self._num_bytes_read = 0
         self._num_bytes_to_read = 1
@@ -191,6 +198,38 @@ class NetworkJob( object ):
         return ( session_network_context, login_network_context )
         
     
+    def _GetResumeOffset( self, response ):
+        
+        # a 206 is only any good if it picks up exactly where our partial file stops
+        
+        if self._resume_offset == 0 or response.status_code != 206:
+            
+            return 0
+            
+        
+        content_range = response.headers.get( 'Content-Range', '' )
+        
+        try:
+            
+            ( unit, byte_range ) = content_range.split( ' ', 1 )
+            
+            start = int( byte_range.split( '-', 1 )[0] )
+            
+        except ValueError:
+            
+            start = None
+            
+        
+        if start != self._resume_offset or not self._IsIdentityEncoded( response ):
+            
+            self._resume_validator = None
+            
+            raise HydrusExceptions.ShouldReattemptNetworkException( 'Server sent the wrong part of the file when asked to resume!' )
+            
+        
+        return start
+        
+    
     def _SendRequestAndGetResponse( self ):
         
         with self._lock:
@@ -222,6 +261,20 @@ class NetworkJob( object ):
                 headers[ key ] = HydrusData.ToByteString( value )
                 
             
+            self._resume_offset = 0
+            
+            if self._resume_validator is not None and os.path.exists( self._temp_path ):
+                
+                self._resume_offset = os.path.getsize( self._temp_path )
+                
+                if self._resume_offset > 0:
+                    
+                    headers[ 'Range' ] = 'bytes=' + str( self._resume_offset ) + '-'
+                    headers[ 'If-Range' ] = self._resume_validator
+                    headers[ 'Accept-Encoding' ] = 'identity'
+                    
+                
+            
             self._status_text = u'sending request\u2026'
             
             snc = self._session_network_context
@@ -235,6 +288,32 @@ class NetworkJob( object ):
         
         response = session.request( method, url, data = data, files = files, headers = headers, stream = True, timeout = ( connect_timeout, read_timeout ) )
         
+        connection_reused = getattr( response, 'connection_reused', None )
+        connection_setup_time = getattr( response, 'connection_setup_time', None )
+        
+        if connection_reused is not None:
+            
+            with self._lock:
+                
+                self._connection_reused = connection_reused
+                self._connection_setup_time = connection_setup_time
+                
+            
+            self.engine.session_manager.ReportConnectionUsed( snc, connection_reused, connection_setup_time )
+            
+            if HG.network_report_mode:
+                
+                if connection_reused:
+                    
+                    HydrusData.ShowText( 'Network Job reused a connection: ' + method + ' ' + url )
+                    
+                else:
+                    
+                    HydrusData.ShowText( 'Network Job set up a new connection in ' + HydrusData.TimeDeltaToPrettyTimeDelta( connection_setup_time ) + ': ' + method + ' ' + url )
+                    
+                
+            
+        
         return response
         
     
@@ -268,6 +347,13 @@ class NetworkJob( object ):
         return False
         
     
+    def _IsIdentityEncoded( self, response ):
+        
+        content_encoding = response.headers.get( 'Content-Encoding', 'identity' ).strip().lower()
+        
+        return content_encoding in ( '', 'identity' )
+        
+    
     def _ObeysBandwidth( self ):
         
         if self._bandwidth_manual_override:
@@ -314,10 +400,12 @@ class NetworkJob( object ):
             
         
     
-    def _ReadResponse( self, response, stream_dest, max_allowed = None ):
+    def _ReadResponse( self, response, stream_dest, max_allowed = None, resume_offset = 0 ):
         
         with self._lock:
             
+            self._num_bytes_read = resume_offset
+            
             if self._content_type is not None and self._content_type in HC.mime_enum_lookup:
                 
                 mime = HC.mime_enum_lookup[ self._content_type ]
@@ -329,7 +417,7 @@ class NetworkJob( object ):
             
             if 'content-length' in response.headers:
             
-                self._num_bytes_to_read = int( response.headers[ 'content-length' ] )
+                self._num_bytes_to_read = resume_offset + int( response.headers[ 'content-length' ] )
                 
                 if max_allowed is not None and self._num_bytes_to_read > max_allowed:
                     
@@ -392,6 +480,51 @@ class NetworkJob( object ):
             
         
     
+    def _ReadResponseToTempPath( self, response ):
+        
+        with self._lock:
+            
+            resume_offset = self._GetResumeOffset( response )
+            
+            if resume_offset == 0:
+                
+                self._SetResumeValidator( response )
+                
+            else:
+                
+                self._num_bytes_saved_by_resuming += resume_offset
+                
+                self._status_text = u'resuming download\u2026'
+                
+            
+        
+        if resume_offset == 0:
+            
+            with open( self._temp_path, 'wb' ) as f:
+                
+                self._ReadResponse( response, f )
+                
+            
+        else:
+            
+            self.engine.bandwidth_manager.ReportDataSavedByResuming( self._network_contexts, resume_offset )
+            
+            if HG.network_report_mode:
+                
+                HydrusData.ShowText( 'Network Job resumed a download after ' + HydrusData.ConvertIntToBytes( resume_offset ) + ': ' + self._url )
+                
+            
+            with open( self._temp_path, 'r+b' ) as f:
+                
+                f.seek( resume_offset )
+                
+                f.truncate()
+                
+                self._ReadResponse( response, f, resume_offset = resume_offset )
+                
+            
+        
+    
     def _ReportDataUsed( self, num_bytes ):
         
         self._bandwidth_tracker.ReportDataUsed( num_bytes )
@@ -405,6 +538,11 @@ class NetworkJob( object ):
         
         self._SetDone()
         
+        if self.engine is not None:
+            
+            self.engine.Wake( review_all_jobs = True )
+            
+        
     
     def _SetError( self, e, error ):
         
@@ -427,6 +565,44 @@ class NetworkJob( object ):
         
         self._is_done_event.set()
         
+        if self.engine is not None:
+            
+            self.engine.Wake()
+            
+        
+    
+    def _SetResumeValidator( self, response ):
+        
+        self._resume_validator = None
+        
+        if self._method != 'GET' or response.status_code != 200:
+            
+            return
+            
+        
+        if response.headers.get( 'Accept-Ranges', '' ).lower() != 'bytes' or 'content-length' not in response.headers:
+            
+            return
+            
+        
+        # requests decodes gzip and friends as it reads, so our temp file would not line up with byte ranges of the encoded body
+        
+        if not self._IsIdentityEncoded( response ):
+            
+            return
+            
+        
+        etag = response.headers.get( 'ETag', '' )
+        
+        if etag != '' and not etag.startswith( 'W/' ): # If-Range needs a strong validator
+            
+            self._resume_validator = etag
+            
+        elif 'Last-Modified' in response.headers:
+            
+            self._resume_validator = response.headers[ 'Last-Modified' ]
+            
+        
     
     def _Sleep( self, seconds ):
         
@@ -583,6 +759,22 @@ class NetworkJob( object ):
             
         
     
+    def GetBytesSavedByResuming( self ):
+        
+        with self._lock:
+            
+            return self._num_bytes_saved_by_resuming
+            
+        
+    
+    def GetConnectionStats( self ):
+        
+        with self._lock:
+            
+            return ( self._connection_reused, self._connection_setup_time )
+            
+        
+    
     def GetContent( self ):
         
         with self._lock:
@@ -783,6 +975,11 @@ class NetworkJob( object ):
                 self._wake_time = min( self._wake_time, self._bandwidth_manual_override_delayed_timestamp + 1 )
                 
             
+            if self.engine is not None:
+                
+                self.engine.Wake( review_all_jobs = True )
+                
+            
         
     
     def OverrideToken( self ):
@@ -793,6 +990,11 @@ class NetworkJob( object ):
             
             self._wake_time = 0
             
+            if self.engine is not None:
+                
+                self.engine.Wake( review_all_jobs = True )
+                
+            
         
     
     def SetDeathTime( self, death_time ):
@@ -896,14 +1098,13 @@ class NetworkJob( object ):
                         
                         if self._temp_path is None:
                             
+                            self._stream_io = cStringIO.StringIO()
+                            
                             self._ReadResponse( response, self._stream_io, 104857600 )
                             
                         else:
                             
-                            with open( self._temp_path, 'wb' ) as f:
-                                
-                                self._ReadResponse( response, f )
-                                
+                            self._ReadResponseToTempPath( response )
                             
                         
                         with self._lock:
@@ -911,6 +1112,15 @@ class NetworkJob( object ):
                             self._status_text = 'done!'
                             
                         
+                    elif response.status_code == 416 and self._resume_offset > 0:
+                        
+                        with self._lock:
+                            
+                            self._resume_validator = None
+                            
+                        
+                        raise HydrusExceptions.ShouldReattemptNetworkException( 'Server would not resume the download from where it broke!' )
+                        
                     else:
                         
                         with self._lock:
@@ -918,6 +1128,8 @@ class NetworkJob( object ):
                             self._status_text = str( response.status_code ) + ' - ' + str( response.reason )
                             
                         
+                        self._stream_io = cStringIO.StringIO()
+                        
                         self._ReadResponse( response, self._stream_io, 104857600 )
                         
                         with self._lock:
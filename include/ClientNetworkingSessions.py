@@ -6,7 +6,9 @@ import HydrusData
 import HydrusSerialisable
 import HydrusGlobals as HG
 import requests
+import socket
 import threading
+import urllib3
 
 try:
     
@@ -20,6 +22,213 @@ except:
     SOCKS_PROXY_OK = False
     
 
+class DNSCache( object ):
+    
+    def __init__( self ):
+        
+        self._lock = threading.Lock()
+        
+        self._cache_period = 300
+        
+        self._hosts_to_addresses_and_timeouts = {}
+        
+    
+    def ClearAddress( self, host ):
+        
+        with self._lock:
+            
+            if host in self._hosts_to_addresses_and_timeouts:
+                
+                del self._hosts_to_addresses_and_timeouts[ host ]
+                
+            
+        
+    
+    def GetAddress( self, host, port ):
+        
+        with self._lock:
+            
+            if self._cache_period == 0:
+                
+                return host
+                
+            
+            if host in self._hosts_to_addresses_and_timeouts:
+                
+                ( address, timeout ) = self._hosts_to_addresses_and_timeouts[ host ]
+                
+                if not HydrusData.TimeHasPassed( timeout ):
+                    
+                    return address
+                    
+                
+            
+            cache_period = self._cache_period
+            
+        
+        try:
+            
+            results = socket.getaddrinfo( host, port, urllib3.util.connection.allowed_gai_family(), socket.SOCK_STREAM )
+            
+        except:
+            
+            # let the connection do the lookup itself and raise a proper error
+            
+            return host
+            
+        
+        if len( results ) == 0:
+            
+            return host
+            
+        
+        address = results[0][4][0]
+        
+        with self._lock:
+            
+            self._hosts_to_addresses_and_timeouts[ host ] = ( address, HydrusData.GetNow() + cache_period )
+            
+        
+        return address
+        
+    
+    def SetCachePeriod( self, cache_period ):
+        
+        with self._lock:
+            
+            self._cache_period = cache_period
+            
+            if self._cache_period == 0:
+                
+                self._hosts_to_addresses_and_timeouts = {}
+                
+            
+        
+    
+DNS_CACHE = DNSCache()
+
+class NetworkConnectionMixin( object ):
+    
+    # remembers how long the connection took to set up, tcp and tls together, and how many responses it has carried
+    
+    connection_setup_time = None
+    num_responses = 0
+    
+    def _new_conn( self ):
+        
+        host = self._dns_host
+        
+        self._dns_host = DNS_CACHE.GetAddress( host, self.port )
+        
+        try:
+            
+            return super( NetworkConnectionMixin, self )._new_conn()
+            
+        except urllib3.exceptions.NewConnectionError:
+            
+            if self._dns_host == host:
+                
+                raise
+                
+            
+            # the cached address may have gone stale, so try again the normal way
+            
+            DNS_CACHE.ClearAddress( host )
+            
+            self._dns_host = host
+            
+            return super( NetworkConnectionMixin, self )._new_conn()
+            
+        finally:
+            
+            self._dns_host = host
+            
+        
+    
+    def connect( self ):
+        
+        time_started_precise = HydrusData.GetNowPrecise()
+        
+        super( NetworkConnectionMixin, self ).connect()
+        
+        self.connection_setup_time = HydrusData.GetNowPrecise() - time_started_precise
+        self.num_responses = 0
+        
+    
+class NetworkHTTPConnection( NetworkConnectionMixin, urllib3.connection.HTTPConnection ):
+    
+    pass
+    
+class NetworkHTTPSConnection( NetworkConnectionMixin, urllib3.connection.HTTPSConnection ):
+    
+    pass
+    
+class NetworkHTTPConnectionPool( urllib3.connectionpool.HTTPConnectionPool ):
+    
+    ConnectionCls = NetworkHTTPConnection
+    
+class NetworkHTTPSConnectionPool( urllib3.connectionpool.HTTPSConnectionPool ):
+    
+    ConnectionCls = NetworkHTTPSConnection
+    
+class NetworkHTTPAdapter( requests.adapters.HTTPAdapter ):
+    
+    def __reduce_ex__( self, protocol ):
+        
+        # sessions are pickled with their adapters, so save as a vanilla adapter. the session manager puts us back on load
+        
+        return ( requests.adapters.HTTPAdapter, (), self.__getstate__() )
+        
+    
+    def _SetPoolClasses( self, pool_manager ):
+        
+        pool_manager.pool_classes_by_scheme = { 'http' : NetworkHTTPConnectionPool, 'https' : NetworkHTTPSConnectionPool }
+        
+    
+    def init_poolmanager( self, *args, **kwargs ):
+        
+        requests.adapters.HTTPAdapter.init_poolmanager( self, *args, **kwargs )
+        
+        self._SetPoolClasses( self.poolmanager )
+        
+    
+    def proxy_manager_for( self, proxy, **proxy_kwargs ):
+        
+        manager = requests.adapters.HTTPAdapter.proxy_manager_for( self, proxy, **proxy_kwargs )
+        
+        if not proxy.lower().startswith( 'socks' ):
+            
+            self._SetPoolClasses( manager )
+            
+        
+        return manager
+        
+    
+    def send( self, request, *args, **kwargs ):
+        
+        response = requests.adapters.HTTPAdapter.send( self, request, *args, **kwargs )
+        
+        connection = getattr( response.raw, '_connection', None )
+        
+        if isinstance( connection, NetworkConnectionMixin ):
+            
+            connection.num_responses += 1
+            
+            response.connection_reused = connection.num_responses > 1
+            
+            if response.connection_reused:
+                
+                response.connection_setup_time = 0.0
+                
+            else:
+                
+                response.connection_setup_time = connection.connection_setup_time
+                
+            
+        
+        return response
+        
+    
 class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_NETWORK_SESSION_MANAGER
@@ -28,6 +237,9 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
     
     SESSION_TIMEOUT = 60 * 60
     
+    # a session covers a whole second-level domain, which for a cdn can be many hosts
+    MAX_NUM_HOST_POOLS = 32
+    
     def __init__( self ):
         
         HydrusSerialisable.SerialisableBase.__init__( self )
@@ -42,8 +254,12 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
         
         self._network_contexts_to_session_timeouts = {}
         
+        self._network_contexts_to_connection_stats = {}
+        
         self._proxies_dict = {}
         
+        self._max_pool_size = 3
+        
         self._Reinitialise()
         
         HG.client_controller.sub( self, 'Reinitialise', 'notify_new_options' )
@@ -123,6 +339,25 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def _MountAdapters( self, session ):
+        
+        adapter = session.get_adapter( 'https://' )
+        
+        if isinstance( adapter, NetworkHTTPAdapter ) and adapter._pool_maxsize == self._max_pool_size:
+            
+            return
+            
+        
+        for prefix in ( 'https://', 'http://' ):
+            
+            old_adapter = session.get_adapter( prefix )
+            
+            session.mount( prefix, NetworkHTTPAdapter( pool_connections = self.MAX_NUM_HOST_POOLS, pool_maxsize = self._max_pool_size, max_retries = old_adapter.max_retries ) )
+            
+            old_adapter.close()
+            
+        
+    
     def _Reinitialise( self ):
         
         self._proxies_dict = {}
@@ -140,6 +375,12 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
             self._proxies_dict[ 'https' ] = https_proxy
             
         
+        # each session covers a second-level domain, so let it keep a connection alive for every job the engine will run against it
+        
+        self._max_pool_size = HG.client_controller.new_options.GetInteger( 'max_network_jobs_per_domain' )
+        
+        DNS_CACHE.SetCachePeriod( HG.client_controller.new_options.GetInteger( 'network_dns_cache_period' ) )
+        
     
     def _SetDirty( self ):
         
@@ -161,6 +402,32 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def GetConnectionStats( self ):
+        
+        with self._lock:
+            
+            rows = []
+            
+            for ( network_context, ( num_requests, num_reused, total_setup_time ) ) in self._network_contexts_to_connection_stats.items():
+                
+                num_new = num_requests - num_reused
+                
+                if num_new == 0:
+                    
+                    average_setup_time = None
+                    
+                else:
+                    
+                    average_setup_time = total_setup_time / num_new
+                    
+                
+                rows.append( ( network_context, num_requests, num_reused, average_setup_time ) )
+                
+            
+            return rows
+            
+        
+    
     def GetNetworkContexts( self ):
         
         with self._lock:
@@ -187,6 +454,8 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
                 session.proxies = dict( self._proxies_dict )
                 
             
+            self._MountAdapters( session )
+            
             #
             
             self._CleanSessionCookies( network_context, session )
@@ -232,6 +501,29 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def ReportConnectionUsed( self, network_context, connection_reused, connection_setup_time ):
+        
+        with self._lock:
+            
+            network_context = self._GetSessionNetworkContext( network_context )
+            
+            ( num_requests, num_reused, total_setup_time ) = self._network_contexts_to_connection_stats.get( network_context, ( 0, 0, 0.0 ) )
+            
+            num_requests += 1
+            
+            if connection_reused:
+                
+                num_reused += 1
+                
+            else:
+                
+                total_setup_time += connection_setup_time
+                
+            
+            self._network_contexts_to_connection_stats[ network_context ] = ( num_requests, num_reused, total_setup_time )
+            
+        
+    
     def SetClean( self ):
         
         with self._lock:
@@ -75,6 +75,12 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         self._dictionary[ 'booleans' ][ 'use_system_ffmpeg' ] = False
         
         self._dictionary[ 'booleans' ][ 'maintain_similar_files_duplicate_pairs_during_idle' ] = False
+        self._dictionary[ 'booleans' ][ 'similar_files_use_in_memory_search' ] = False
+        
+        self._dictionary[ 'booleans' ][ 'use_packed_thumbnail_store' ] = False
+        
+        self._dictionary[ 'booleans' ][ 'db_cache_media_result_summaries' ] = False
+        self._dictionary[ 'booleans' ][ 'sort_file_queries_in_db' ] = True
         
         self._dictionary[ 'booleans' ][ 'show_namespaces' ] = True
         
@@ -119,6 +125,8 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         
         self._dictionary[ 'booleans' ][ 'file_viewing_statistics_active' ] = True
         
+        self._dictionary[ 'booleans' ][ 'fast_html_parsing' ] = False
+        
         #
         
         self._dictionary[ 'colours' ] = HydrusSerialisable.SerialisableDictionary()
@@ -186,6 +194,7 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         self._dictionary[ 'integers' ][ 'page_file_count_display' ] = CC.PAGE_FILE_COUNT_DISPLAY_ALL
         
         self._dictionary[ 'integers' ][ 'network_timeout' ] = 10
+        self._dictionary[ 'integers' ][ 'network_dns_cache_period' ] = 300
         
         self._dictionary[ 'integers' ][ 'thumbnail_visibility_scroll_percent' ] = 75
         
@@ -195,6 +204,8 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         
         self._dictionary[ 'integers' ][ 'shutdown_work_period' ] = 86400
         
+        self._dictionary[ 'integers' ][ 'db_num_read_connections' ] = 0
+        
         self._dictionary[ 'integers' ][ 'max_network_jobs' ] = 15
         self._dictionary[ 'integers' ][ 'max_network_jobs_per_domain' ] = 3
         
@@ -208,6 +219,8 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         
         self._dictionary[ 'integers' ][ 'video_thumbnail_percentage_in' ] = 35
         
+        self._dictionary[ 'integers' ][ 'file_import_num_workers' ] = 4
+        
         self._dictionary[ 'integers' ][ 'duplicate_comparison_score_higher_filesize' ] = 20
         self._dictionary[ 'integers' ][ 'duplicate_comparison_score_much_higher_filesize' ] = 10
         self._dictionary[ 'integers' ][ 'duplicate_comparison_score_higher_resolution' ] = 20
@@ -216,6 +229,8 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         self._dictionary[ 'integers' ][ 'duplicate_comparison_score_older' ] = 5
         
         self._dictionary[ 'integers' ][ 'thumbnail_cache_timeout' ] = 86400
+        self._dictionary[ 'integers' ][ 'thumbnail_cache_policy' ] = CC.DATA_CACHE_POLICY_LRU
+        self._dictionary[ 'integers' ][ 'thumbnail_waterfall_num_workers' ] = 4
         self._dictionary[ 'integers' ][ 'image_cache_timeout' ] = 600
         
         self._dictionary[ 'integers' ][ 'thumbnail_border' ] = 1
@@ -246,6 +261,8 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         
         self._dictionary[ 'noneable_integers' ][ 'forced_search_limit' ] = None
         
+        self._dictionary[ 'noneable_integers' ][ 'media_result_placeholder_threshold' ] = 10000
+        
         self._dictionary[ 'noneable_integers' ][ 'disk_cache_maintenance_mb' ] = 256
         self._dictionary[ 'noneable_integers' ][ 'disk_cache_init_period' ] = 4
         
@@ -2,6 +2,7 @@ import bs4
 import calendar
 import ClientNetworkingDomain
 import ClientNetworkingJobs
+import codecs
 import collections
 import cStringIO
 import HydrusConstants as HC
@@ -31,6 +32,8 @@ except ImportError:
 try:
     
     import lxml
+    import lxml.etree
+    import lxml.html
     
     LXML_IS_OK = True
     
@@ -38,6 +41,12 @@ except ImportError:
     
     LXML_IS_OK = False
     
+def CanParseHTMLWithLXML( html ):
+    
+    # without an explicit body, libxml2 wraps any leading text in a <p> that html5lib would not make
+    
+    return LXML_IS_OK and LXML_BODY_TAG_RE.search( html ) is not None
+    
 def ConvertParseResultToPrettyString( result ):
     
     ( ( name, content_type, additional_info ), parsed_text ) = result
@@ -250,6 +259,52 @@ def GetHashesFromParseResults( results ):
     
     return hash_results
     
+def GetHTMLFormulaeFromPageParsers( page_parsers ):
+    
+    formulae = []
+    
+    page_parsers = list( page_parsers )
+    
+    while len( page_parsers ) > 0:
+        
+        page_parser = page_parsers.pop()
+        
+        ( sub_page_parsers, content_parsers ) = page_parser.GetContentParsers()
+        
+        for ( formula, sub_page_parser ) in sub_page_parsers:
+            
+            formulae.append( formula )
+            page_parsers.append( sub_page_parser )
+            
+        
+        for content_parser in content_parsers:
+            
+            ( name, content_type, formula, sort_type, sort_asc, additional_info ) = content_parser.ToTuple()
+            
+            formulae.append( formula )
+            
+        
+    
+    html_formulae = []
+    
+    while len( formulae ) > 0:
+        
+        formula = formulae.pop()
+        
+        if isinstance( formula, ParseFormulaCompound ):
+            
+            ( sub_formulae, sub_phrase, string_match, string_converter ) = formula.ToTuple()
+            
+            formulae.extend( sub_formulae )
+            
+        elif isinstance( formula, ParseFormulaHTML ):
+            
+            html_formulae.append( formula )
+            
+        
+    
+    return html_formulae
+    
 def GetHTMLTagString( tag ):
     
     all_strings = [ s for s in tag.strings if len( s ) > 0 ]
@@ -265,6 +320,81 @@ def GetHTMLTagString( tag ):
     
     return result
     
+def GetLXMLTagString( tag ):
+    
+    # this matches GetHTMLTagString on an html5lib soup--comment text is skipped, script and style text is not
+    
+    for s in tag.itertext():
+        
+        if len( s ) > 0:
+            
+            return unicode( s )
+            
+        
+    
+    return ''
+    
+def GetLXMLTree( html ):
+    
+    if not LXML_IS_OK:
+        
+        raise HydrusExceptions.ParseException( 'This client does not have access to lxml, so it cannot use the fast html parser.' )
+        
+    
+    if not isinstance( html, unicode ):
+        
+        # libxml2 guesses encodings differently to bs4, so we decode the bytes ourselves, the way the soup would
+        
+        dammit = bs4.UnicodeDammit( html, is_html = True )
+        
+        if dammit.unicode_markup is not None:
+            
+            encoding = dammit.original_encoding
+            
+            # html5lib, like browsers, reads latin-1 as its superset windows-1252
+            
+            if encoding is not None and codecs.lookup( encoding ).name in ( 'ascii', 'iso8859-1' ):
+                
+                try:
+                    
+                    html = html.decode( 'windows-1252' )
+                    
+                except UnicodeDecodeError:
+                    
+                    html = dammit.unicode_markup
+                    
+                
+            else:
+                
+                html = dammit.unicode_markup
+                
+            
+        
+    
+    if isinstance( html, unicode ):
+        
+        # lxml will not take unicode that has an encoding declaration, so we hand it bytes and tell it what they are
+        
+        html = html.encode( 'utf-8' )
+        
+        parser = lxml.html.HTMLParser( encoding = 'utf-8' )
+        
+    else:
+        
+        parser = None
+        
+    
+    try:
+        
+        return lxml.html.document_fromstring( html, parser = parser )
+        
+    except lxml.etree.ParserError:
+        
+        # an empty document, which bs4 would happily turn into an empty soup
+        
+        return lxml.html.document_fromstring( '<html></html>' )
+        
+    
 def GetNamespacesFromParsableContent( parsable_content ):
     
     content_type_to_additional_infos = HydrusData.BuildKeyToSetDict( ( ( content_type, additional_infos ) for ( name, content_type, additional_infos ) in parsable_content ) )
@@ -818,6 +948,18 @@ class ParseFormulaHTML( ParseFormula ):
         return tags
         
     
+    def _FindLXMLTags( self, root ):
+        
+        tags = ( root, )
+        
+        for tag_rule in self._tag_rules:
+            
+            tags = tag_rule.GetLXMLNodes( tags )
+            
+        
+        return tags
+        
+    
     def _GetParsePrettySeparator( self ):
         
         if self._content_to_fetch == HTML_CONTENT_HTML:
@@ -877,6 +1019,58 @@ class ParseFormulaHTML( ParseFormula ):
         return result
         
     
+    def _GetRawContentFromLXMLTag( self, tag ):
+        
+        if self._content_to_fetch == HTML_CONTENT_ATTRIBUTE:
+            
+            result = tag.get( self._attribute_to_fetch )
+            
+            if result is None:
+                
+                raise HydrusExceptions.ParseException( 'Attribute ' + self._attribute_to_fetch + ' not found!' )
+                
+            
+            result = unicode( result )
+            
+            if IsMultiValuedHTMLAttribute( tag.tag, self._attribute_to_fetch ):
+                
+                result = ' '.join( result.split() )
+                
+            
+        elif self._content_to_fetch == HTML_CONTENT_STRING:
+            
+            result = GetLXMLTagString( tag )
+            
+        
+        if result is None or result == '':
+            
+            raise HydrusExceptions.ParseException( 'Empty/No results found!' )
+            
+        
+        return result
+        
+    
+    def _GetRawContentsFromLXMLTags( self, tags ):
+        
+        raw_contents = []
+        
+        for tag in tags:
+            
+            try:
+                
+                raw_content = self._GetRawContentFromLXMLTag( tag )
+                
+                raw_contents.append( raw_content )
+                
+            except HydrusExceptions.ParseException:
+                
+                continue
+                
+            
+        
+        return raw_contents
+        
+    
     def _GetRawContentsFromTags( self, tags ):
         
         raw_contents = []
@@ -920,6 +1114,20 @@ class ParseFormulaHTML( ParseFormula ):
     
     def _ParseRawContents( self, parsing_context, data ):
         
+        if HG.client_controller.new_options.GetBoolean( 'fast_html_parsing' ) and self.CanParseWithLXML() and CanParseHTMLWithLXML( data ):
+            
+            try:
+                
+                root = HG.client_controller.parsing_cache.GetLXMLTree( data )
+                
+            except Exception as e:
+                
+                raise HydrusExceptions.ParseException( 'Unable to parse that HTML: ' + HydrusData.ToUnicode( e ) )
+                
+            
+            return self.ParseLXMLTree( root )
+            
+        
         try:
             
             root = HG.client_controller.parsing_cache.GetSoup( data )
@@ -929,11 +1137,7 @@ class ParseFormulaHTML( ParseFormula ):
             raise HydrusExceptions.ParseException( 'Unable to parse that HTML: ' + HydrusData.ToUnicode( e ) )
             
         
-        tags = self._FindHTMLTags( root )
-        
-        raw_contents = self._GetRawContentsFromTags( tags )
-        
-        return raw_contents
+        return self.ParseSoup( root )
         
     
     def _UpdateSerialisableInfo( self, version, old_serialisable_info ):
@@ -1047,6 +1251,40 @@ class ParseFormulaHTML( ParseFormula ):
             
         
     
+    def CanParseWithLXML( self ):
+        
+        if not LXML_IS_OK:
+            
+            return False
+            
+        
+        # lxml would serialise the html differently, so we leave that to bs4
+        if self._content_to_fetch == HTML_CONTENT_HTML:
+            
+            return False
+            
+        
+        return False not in ( tag_rule.CanParseWithLXML() for tag_rule in self._tag_rules )
+        
+    
+    def ParseLXMLTree( self, root ):
+        
+        tags = self._FindLXMLTags( root )
+        
+        raw_contents = self._GetRawContentsFromLXMLTags( tags )
+        
+        return raw_contents
+        
+    
+    def ParseSoup( self, root ):
+        
+        tags = self._FindHTMLTags( root )
+        
+        raw_contents = self._GetRawContentsFromTags( tags )
+        
+        return raw_contents
+        
+    
     def ParsesSeparatedContent( self ):
         
         return self._content_to_fetch == HTML_CONTENT_HTML
@@ -1093,6 +1331,21 @@ HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIAL
 HTML_RULE_TYPE_DESCENDING = 0
 HTML_RULE_TYPE_ASCENDING = 1
 
+# bs4 splits these attributes into lists, which changes how it matches and returns them
+MULTI_VALUED_HTML_ATTRIBUTES = bs4.builder.HTMLTreeBuilder.DEFAULT_CDATA_LIST_ATTRIBUTES
+
+# html5lib adds tbody to tables that do not have one, but lxml does not, so rules that could land on it have to use bs4
+LXML_UNSAFE_TAG_NAMES = { 'tbody' }
+
+LXML_BODY_TAG_RE = re.compile( r'<body[\s>]', re.IGNORECASE )
+
+XML_NAME_RE = re.compile( r'^[A-Za-z_][A-Za-z0-9_\-\.]*$' )
+
+def IsMultiValuedHTMLAttribute( tag_name, attribute ):
+    
+    return attribute in MULTI_VALUED_HTML_ATTRIBUTES[ '*' ] or attribute in MULTI_VALUED_HTML_ATTRIBUTES.get( tag_name, [] )
+    
+
 class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_PARSE_RULE_HTML
@@ -1141,6 +1394,114 @@ class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
         self._should_test_tag_string = should_test_tag_string
         self._tag_string_string_match = tag_string_string_match
         
+        self._lxml_xpath_and_variables = None
+        
+    
+    def _GenerateLXMLXPathAndVariables( self ):
+        
+        # a descending rule as an xpath, or None if we cannot say it exactly how bs4 would match it
+        
+        tag_name = self._tag_name
+        
+        if tag_name is None:
+            
+            if len( self._tag_attributes ) == 0:
+                
+                return None
+                
+            
+            tag_name = '*'
+            
+        elif tag_name in LXML_UNSAFE_TAG_NAMES or XML_NAME_RE.match( tag_name ) is None:
+            
+            return None
+            
+        
+        predicates = []
+        variables = {}
+        
+        for ( key, value ) in self._tag_attributes.items():
+            
+            if XML_NAME_RE.match( key ) is None or not isinstance( value, basestring ) or value == '':
+                
+                return None
+                
+            
+            variable_name = 'v' + str( len( variables ) )
+            
+            variables[ variable_name ] = value
+            
+            single_predicate = '@' + key + ' = $' + variable_name
+            
+            if len( value.split() ) == 1:
+                
+                # bs4 matches a multi-valued attribute if any of its values match
+                
+                spaced_variable_name = variable_name + 's'
+                
+                variables[ spaced_variable_name ] = ' ' + value + ' '
+                
+                multi_predicate = 'contains( concat( \' \', normalize-space( @' + key + ' ), \' \' ), $' + spaced_variable_name + ' )'
+                
+            else:
+                
+                multi_predicate = 'normalize-space( @' + key + ' ) = $' + variable_name
+                
+            
+            if key in MULTI_VALUED_HTML_ATTRIBUTES[ '*' ]:
+                
+                predicate = multi_predicate
+                
+            elif self._tag_name is not None:
+                
+                if IsMultiValuedHTMLAttribute( self._tag_name, key ):
+                    
+                    predicate = multi_predicate
+                    
+                else:
+                    
+                    predicate = single_predicate
+                    
+                
+            else:
+                
+                multi_tag_names = [ multi_tag_name for ( multi_tag_name, attributes ) in MULTI_VALUED_HTML_ATTRIBUTES.items() if multi_tag_name != '*' and key in attributes ]
+                
+                if len( multi_tag_names ) == 0:
+                    
+                    predicate = single_predicate
+                    
+                else:
+                    
+                    is_multi_tag = ' or '.join( 'self::' + multi_tag_name for multi_tag_name in multi_tag_names )
+                    
+                    predicate = '( ( ' + is_multi_tag + ' ) and ' + multi_predicate + ' ) or ( not( ' + is_multi_tag + ' ) and ' + single_predicate + ' )'
+                    
+                
+            
+            predicates.append( '[' + predicate + ']' )
+            
+        
+        xpath = './/' + tag_name + ''.join( predicates )
+        
+        if self._tag_index is not None:
+            
+            xpath = '(' + xpath + ')[' + str( self._tag_index + 1 ) + ']'
+            
+        
+        return ( xpath, variables )
+        
+    
+    def _GetLXMLXPathAndVariables( self ):
+        
+        if self._lxml_xpath_and_variables is None:
+            
+            # wrapped in a tuple so we also remember when the rule cannot be done with lxml
+            
+            self._lxml_xpath_and_variables = ( self._GenerateLXMLXPathAndVariables(), )
+            
+        
+        return self._lxml_xpath_and_variables[0]
         
     
     def _GetSerialisableInfo( self ):
@@ -1156,6 +1517,8 @@ class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
         
         self._tag_string_string_match = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_tag_string_string_match )
         
+        self._lxml_xpath_and_variables = None
+        
     
     def _UpdateSerialisableInfo( self, version, old_serialisable_info ):
         
@@ -1175,6 +1538,66 @@ class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def CanParseWithLXML( self ):
+        
+        if self._rule_type == HTML_RULE_TYPE_DESCENDING:
+            
+            return self._GetLXMLXPathAndVariables() is not None
+            
+        elif self._rule_type == HTML_RULE_TYPE_ASCENDING:
+            
+            return self._tag_name is not None and self._tag_name not in LXML_UNSAFE_TAG_NAMES
+            
+        
+    
+    def GetLXMLNodes( self, nodes ):
+        
+        new_nodes = []
+        
+        if self._rule_type == HTML_RULE_TYPE_DESCENDING:
+            
+            ( xpath, variables ) = self._GetLXMLXPathAndVariables()
+            
+            for node in nodes:
+                
+                new_nodes.extend( node.xpath( xpath, **variables ) )
+                
+            
+        elif self._rule_type == HTML_RULE_TYPE_ASCENDING:
+            
+            for node in nodes:
+                
+                num_found = 0
+                
+                potential_parent = node.getparent()
+                
+                while potential_parent is not None:
+                    
+                    if potential_parent.tag == self._tag_name:
+                        
+                        num_found += 1
+                        
+                    
+                    if num_found == self._tag_depth:
+                        
+                        new_nodes.append( potential_parent )
+                        
+                        break
+                        
+                    
+                    potential_parent = potential_parent.getparent()
+                    
+                
+            
+        
+        if self._should_test_tag_string:
+            
+            new_nodes = [ node for node in new_nodes if self._tag_string_string_match.Matches( GetLXMLTagString( node ) ) ]
+            
+        
+        return new_nodes
+        
+    
     def GetNodes( self, nodes ):
         
         new_nodes = []
@@ -8,6 +8,8 @@ import HydrusImageHandling
 import HydrusGlobals as HG
 import HydrusThreading
 import HydrusVideoHandling
+import bisect
+import collections
 import os
 import threading
 import time
@@ -60,6 +62,12 @@ def GenerateHydrusBitmapFromNumPyImage( numpy_image, compressed = True ):
     
     return HydrusBitmap( numpy_image.data, ( x, y ), depth, compressed = compressed )
     
+def GenerateHydrusBitmapFromPackedData( packed_data ):
+    
+    ( data, size, depth, compressed ) = packed_data
+    
+    return HydrusBitmap( data, size, depth, compressed = compressed, data_is_compressed = compressed )
+    
 def GenerateHydrusBitmapFromPILImage( pil_image, compressed = True ):
     
     pil_image = HydrusImageHandling.Dequantize( pil_image )
@@ -206,6 +214,18 @@ class RasterContainerVideo( RasterContainer ):
         self._initialised = False
         
         self._frames = {}
+        self._numpy_images = {}
+        
+        self._last_numpy_image_given = None
+        
+        self._frame_timings_lock = threading.Lock()
+        
+        self._frame_timings = collections.OrderedDict()
+        
+        for name in ( 'decode', 'copy', 'paint' ):
+            
+            self._frame_timings[ name ] = [ 0, 0.0, 0.0 ] # num, total, max
+            
         
         self._buffer_start_index = -1
         self._buffer_end_index = -1
@@ -268,9 +288,82 @@ class RasterContainerVideo( RasterContainer ):
         self._rendered_first_frame = False
         self._ideal_next_frame = 0
         
+        self._renderer_index = 0
+        
+        self._keyframe_indices = []
+        
+        # frames that have fallen out of the buffer, grouped by gop, so scrubbing back to them does not mean decoding them again
+        # it gets whatever the buffer does not use, so the two together stay within the video buffer option
+        
+        self._gop_cache = collections.OrderedDict()
+        self._gop_cache_size = 0
+        self._gop_cache_max_size = max( 0, video_buffer_size_mb * 1024 * 1024 - frame_buffer_length * x * y * 3 )
+        
         HG.client_controller.CallToThread( self.THREADRender )
         
     
+    def _AddToGOPCache( self, index, numpy_image ):
+        
+        gop_start = self._GetGOPStart( index )
+        
+        if gop_start in self._gop_cache:
+            
+            gop = self._gop_cache.pop( gop_start )
+            
+        else:
+            
+            gop = {}
+            
+        
+        gop[ index ] = numpy_image
+        
+        self._gop_cache[ gop_start ] = gop # most recently used at the end
+        
+        self._gop_cache_size += numpy_image.nbytes
+        
+        while self._gop_cache_size > self._gop_cache_max_size and len( self._gop_cache ) > 0:
+            
+            ( gop_start, gop ) = self._gop_cache.popitem( last = False )
+            
+            for numpy_image in gop.values():
+                
+                self._gop_cache_size -= numpy_image.nbytes
+                
+                self._ReleaseFrame( numpy_image )
+                
+            
+        
+    
+    def _ClearGOPCache( self ):
+        
+        for gop in self._gop_cache.values():
+            
+            for numpy_image in gop.values():
+                
+                self._ReleaseFrame( numpy_image )
+                
+            
+        
+        self._gop_cache = collections.OrderedDict()
+        self._gop_cache_size = 0
+        
+    
+    def _GetGOPStart( self, index ):
+        
+        if len( self._keyframe_indices ) > 0:
+            
+            i = bisect.bisect_right( self._keyframe_indices, index ) - 1
+            
+            return self._keyframe_indices[ max( i, 0 ) ]
+            
+        else:
+            
+            # no keyframe index, so just group in fixed chunks
+            
+            return index - index % 32
+            
+        
+    
     def _HasFrame( self, index ):
         
         return index in self._frames
@@ -287,7 +380,96 @@ class RasterContainerVideo( RasterContainer ):
         
         for i in deletees:
             
+            numpy_image = self._numpy_images[ i ]
+            
             del self._frames[ i ]
+            del self._numpy_images[ i ]
+            
+            self._AddToGOPCache( i, numpy_image )
+            
+        
+    
+    def _PopFromGOPCache( self, index ):
+        
+        gop_start = self._GetGOPStart( index )
+        
+        if gop_start in self._gop_cache and index in self._gop_cache[ gop_start ]:
+            
+            gop = self._gop_cache.pop( gop_start )
+            
+            numpy_image = gop.pop( index )
+            
+            self._gop_cache_size -= numpy_image.nbytes
+            
+            if len( gop ) > 0:
+                
+                self._gop_cache[ gop_start ] = gop
+                
+            
+            return numpy_image
+            
+        
+        return None
+        
+    
+    def _ReleaseFrame( self, numpy_image ):
+        
+        # the gui may be drawing the frame it last got, so that one has to be left to the garbage collector
+        
+        if numpy_image is not self._last_numpy_image_given:
+            
+            self._renderer.release_frame( numpy_image )
+            
+        
+    
+    def _ReportFrameTimings( self ):
+        
+        texts = []
+        
+        for ( name, ( num, total, max_time ) ) in self._frame_timings.items():
+            
+            if num > 0:
+                
+                texts.append( name + ' ' + '%.2f' % ( total * 1000 / num ) + 'ms avg, ' + '%.2f' % ( max_time * 1000 ) + 'ms max' )
+                
+            
+            self._frame_timings[ name ] = [ 0, 0.0, 0.0 ]
+            
+        
+        HydrusData.ShowText( 'Video frame timings for ' + self._media.GetHash().encode( 'hex' ) + ': ' + ', '.join( texts ) )
+        
+    
+    def _SetRendererPosition( self, index ):
+        
+        self._renderer.set_position( index )
+        
+        self._renderer_index = index
+        
+    
+    def THREADLoadKeyframeIndices( self ):
+        
+        hash = self._media.GetHash()
+        
+        keyframe_timestamps = HG.client_controller.Read( 'keyframe_timestamps', hash )
+        
+        if keyframe_timestamps is None:
+            
+            keyframe_timestamps = HydrusVideoHandling.GetFFMPEGKeyframeTimestamps( self._path )
+            
+            HG.client_controller.Write( 'keyframe_timestamps', hash, keyframe_timestamps )
+            
+        
+        keyframe_indices = sorted( { int( round( timestamp / self._average_frame_duration ) ) for timestamp in keyframe_timestamps } )
+        
+        with self._lock:
+            
+            self._keyframe_indices = keyframe_indices
+            
+            self._renderer.set_keyframe_indices( keyframe_indices )
+            
+            # the chunks these were grouped in no longer line up
+            
+            self._ClearGOPCache()
             
         
     
@@ -310,6 +492,11 @@ class RasterContainerVideo( RasterContainer ):
             
             self._renderer = HydrusVideoHandling.VideoRendererFFMPEG( self._path, mime, duration, num_frames_in_video, self._target_resolution )
             
+            if mime != HC.IMAGE_APNG:
+                
+                HG.client_controller.CallToThread( self.THREADLoadKeyframeIndices )
+                
+            
         
         self.GetReadyForFrame( self._init_position )
         
@@ -346,7 +533,7 @@ class RasterContainerVideo( RasterContainer ):
                     
                     # we cannot get to the ideal next frame, so we need to rewind/reposition
                     
-                    self._renderer.set_position( self._buffer_start_index )
+                    self._SetRendererPosition( self._buffer_start_index )
                     
                     self._last_index_rendered = -1
                     
@@ -368,7 +555,23 @@ class RasterContainerVideo( RasterContainer ):
                     
                     try:
                         
-                        numpy_image = self._renderer.read_frame()
+                        numpy_image = self._PopFromGOPCache( frame_index )
+                        
+                        if numpy_image is None:
+                            
+                            if self._renderer_index != frame_index:
+                                
+                                self._SetRendererPosition( frame_index )
+                                
+                            
+                            started = HydrusData.GetNowPrecise()
+                            
+                            numpy_image = self._renderer.read_frame()
+                            
+                            self.AddFrameTiming( 'decode', HydrusData.GetNowPrecise() - started )
+                            
+                            self._renderer_index = ( frame_index + 1 ) % num_frames_in_video
+                            
                         
                     except Exception as e:
                         
@@ -390,7 +593,7 @@ class RasterContainerVideo( RasterContainer ):
                         
                         # we need to rewind renderer
                         
-                        self._renderer.set_position( 0 )
+                        self._SetRendererPosition( 0 )
                         
                         self._last_index_rendered = -1
                         
@@ -400,15 +603,28 @@ class RasterContainerVideo( RasterContainer ):
                 
                 if should_save_frame:
                     
+                    started = HydrusData.GetNowPrecise()
+                    
+                    # uncompressed, this wraps the numpy buffer without copying it
                     frame = GenerateHydrusBitmapFromNumPyImage( numpy_image, compressed = False )
                     
+                    self.AddFrameTiming( 'copy', HydrusData.GetNowPrecise() - started )
+                    
                     with self._lock:
                         
                         self._frames[ frame_index ] = frame
+                        self._numpy_images[ frame_index ] = numpy_image
                         
                         self._MaintainBuffer()
                         
                     
+                else:
+                    
+                    with self._lock:
+                        
+                        self._ReleaseFrame( numpy_image )
+                        
+                    
                 
                 with self._lock:
                     
@@ -437,6 +653,23 @@ class RasterContainerVideo( RasterContainer ):
             
         
     
+    def AddFrameTiming( self, name, duration ):
+        
+        with self._frame_timings_lock:
+            
+            timing = self._frame_timings[ name ]
+            
+            timing[0] += 1
+            timing[1] += duration
+            timing[2] = max( timing[2], duration )
+            
+            if HG.media_load_report_mode and name == 'decode' and timing[0] >= 250:
+                
+                self._ReportFrameTimings()
+                
+            
+        
+    
     def GetBufferIndices( self ):
         
         if self._last_index_rendered == -1:
@@ -467,6 +700,8 @@ class RasterContainerVideo( RasterContainer ):
             
             frame = self._frames[ index ]
             
+            self._last_numpy_image_given = self._numpy_images[ index ]
+            
         
         num_frames_in_video = self.GetNumFrames()
         
@@ -615,7 +850,7 @@ class RasterContainerVideo( RasterContainer ):
     
 class HydrusBitmap( object ):
     
-    def __init__( self, data, size, depth, compressed = True ):
+    def __init__( self, data, size, depth, compressed = True, data_is_compressed = False ):
         
         if not LZ4_OK:
             
@@ -624,7 +859,7 @@ class HydrusBitmap( object ):
         
         self._compressed = compressed
         
-        if self._compressed:
+        if self._compressed and not data_is_compressed:
             
             self._data = lz4.block.compress( data )
             
@@ -712,6 +947,11 @@ class HydrusBitmap( object ):
         return len( self._data )
         
     
+    def GetPackedData( self ):
+        
+        return ( self._data, self._size, self._depth, self._compressed )
+        
+    
     def GetSize( self ):
         
         return self._size
@@ -252,6 +252,13 @@ class GIFRenderer( object ):
         return self._RenderCurrentFrame()
         
     
+    def release_frame( self, numpy_image ):
+        
+        # cv and pil make a fresh array for every frame, so there is nothing to reuse
+        
+        pass
+        
+    
     def set_position( self, index ):
         
         if index == self._next_render_index: return
@@ -360,6 +360,11 @@ class HydrusController( object ):
         return self.db_dir
         
     
+    def GetDBJobMetrics( self, all_time = False ):
+        
+        return self.db.GetJobMetrics( all_time = all_time )
+        
+    
     def GetDBStatus( self ):
         
         return self.db.GetStatus()
@@ -375,6 +380,11 @@ class HydrusController( object ):
         return self._managers[ name ]
         
     
+    def GetPubSubTopicStats( self ):
+        
+        return self._pubsub.GetTopicStats()
+        
+    
     def GetThreadPoolBusyStatus( self ):
         
         if HydrusData.TimeHasPassed( self._thread_pool_busy_status_text_new_check_time ):
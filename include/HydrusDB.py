@@ -1,3 +1,6 @@
+import bisect
+import collections
+import copy
 import distutils.version
 import HydrusConstants as HC
 import HydrusData
@@ -7,11 +10,21 @@ import HydrusPaths
 import os
 import Queue
 import sqlite3
+import threading
 import traceback
 import time
 
 CONNECTION_REFRESH_TIME = 60 * 30
 
+# above this many ids, filling a temp table and doing one statement per select beats many 256-strong IN ( ?, ?, ... ) chunks
+LIST_SELECTOR_TABLE_THRESHOLD = 2048
+
+# each bucket is sqrt( 2 ) wider than the last, from 0.1ms to about twenty minutes
+JOB_METRICS_BUCKET_BOUNDARIES = [ 0.0001 * 2 ** ( i / 2.0 ) for i in range( 48 ) ]
+JOB_METRICS_PERCENTILES = ( 0.5, 0.95, 0.99 )
+
+READ_CONNECTION_WRITE_ACTIONS = { sqlite3.SQLITE_ALTER_TABLE, sqlite3.SQLITE_CREATE_INDEX, sqlite3.SQLITE_CREATE_TABLE, sqlite3.SQLITE_CREATE_TRIGGER, sqlite3.SQLITE_CREATE_VIEW, sqlite3.SQLITE_DELETE, sqlite3.SQLITE_DROP_INDEX, sqlite3.SQLITE_DROP_TABLE, sqlite3.SQLITE_DROP_TRIGGER, sqlite3.SQLITE_DROP_VIEW, sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE }
+
 def CanVacuum( db_path, stop_time = None ):
     
     try:
@@ -55,6 +68,36 @@ def CanVacuum( db_path, stop_time = None ):
         return False
         
     
+def ConvertJobTimesToPrettyString( times ):
+    
+    return '/'.join( ( '%.1fms' % ( t * 1000 ) for t in times ) )
+    
+def GetResultNumRows( result ):
+    
+    if result is None:
+        
+        return 0
+        
+    elif isinstance( result, ( list, tuple, set, frozenset, dict ) ):
+        
+        return len( result )
+        
+    else:
+        
+        return 1
+        
+    
+def ReadConnectionAuthoriser( action, arg1, arg2, db_name, trigger_name ):
+    
+    # read connections may fill their own in-memory scratch tables, but never the db files
+    
+    if action in READ_CONNECTION_WRITE_ACTIONS and db_name not in ( 'mem', 'temp' ):
+        
+        return sqlite3.SQLITE_DENY
+        
+    
+    return sqlite3.SQLITE_OK
+    
 def ReadLargeIdQueryInSeparateChunks( cursor, select_statement, chunk_size ):
     
     table_name = 'mem.tempbigread' + os.urandom( 32 ).encode( 'hex' )
@@ -126,6 +169,7 @@ def VacuumDB( db_path ):
     
 class HydrusDB( object ):
     
+    CONCURRENT_READ_ACTIONS = []
     READ_WRITE_ACTIONS = []
     UPDATE_WAIT = 2
     
@@ -146,6 +190,7 @@ class HydrusDB( object ):
         self._transaction_started = 0
         self._in_transaction = False
         self._transaction_contains_writes = False
+        self._is_concurrent_reader = False
         
         self._connection_timestamp = 0
         
@@ -179,8 +224,15 @@ class HydrusDB( object ):
         self._could_not_initialise = False
         
         self._jobs = Queue.PriorityQueue()
+        self._read_jobs = Queue.PriorityQueue()
         self._pubsubs = []
         
+        self._job_counts_lock = threading.Lock()
+        self._num_read_loops_running = 0
+        self._num_writes_pending = 0
+        
+        self._job_metrics = JobMetrics()
+        
         self._currently_doing_job = False
         self._current_status = ''
         self._current_job_name = ''
@@ -269,7 +321,7 @@ class HydrusDB( object ):
             
         
     
-    def _AttachExternalDatabases( self ):
+    def _AttachExternalDatabases( self, c ):
         
         for ( name, filename ) in self._db_filenames.items():
             
@@ -280,7 +332,7 @@ class HydrusDB( object ):
             
             db_path = os.path.join( self._db_dir, self._db_filenames[ name ] )
             
-            self._c.execute( 'ATTACH ? AS ' + name + ';', ( db_path, ) )
+            c.execute( 'ATTACH ? AS ' + name + ';', ( db_path, ) )
             
         
     
@@ -379,6 +431,28 @@ class HydrusDB( object ):
         HydrusData.DebugPrint( message )
         
     
+    def _DumpJobMetrics( self ):
+        
+        snapshot = self._job_metrics.GetSnapshot( all_time = True )
+        
+        if len( snapshot ) == 0:
+            
+            return
+            
+        
+        HydrusData.Print( 'Job metrics for this session of the ' + self._db_name + ' db, version ' + str( HC.SOFTWARE_VERSION ) + ' (queue and running times are p50/p95/p99):' )
+        
+        for ( action, num_jobs, num_concurrent, queue_times, execution_times, num_rows ) in sorted( snapshot ):
+            
+            HydrusData.Print( action + ': ' + HydrusData.ToHumanInt( num_jobs ) + ' jobs (' + HydrusData.ToHumanInt( num_concurrent ) + ' on read connections), queued ' + ConvertJobTimesToPrettyString( queue_times ) + ', running ' + ConvertJobTimesToPrettyString( execution_times ) + ', ' + HydrusData.ToHumanInt( num_rows ) + ' rows' )
+            
+        
+    
+    def _GetNumReadConnections( self ):
+        
+        return 0
+        
+    
     def _GetRowCount( self ):
         
         row_count = self._c.rowcount
@@ -444,7 +518,7 @@ class HydrusDB( object ):
         
         self._c.execute( 'ATTACH ":memory:" AS mem;' )
         
-        self._AttachExternalDatabases()
+        self._AttachExternalDatabases( self._c )
         
         db_names = [ name for ( index, name, path ) in self._c.execute( 'PRAGMA database_list;' ) if name not in ( 'mem', 'temp' ) ]
         
@@ -529,6 +603,32 @@ class HydrusDB( object ):
         pass
         
     
+    def _InitReadCursor( self ):
+        
+        db_path = os.path.join( self._db_dir, self._db_filenames[ 'main' ] )
+        
+        db = sqlite3.connect( db_path, isolation_level = None, detect_types = sqlite3.PARSE_DECLTYPES )
+        
+        c = db.cursor()
+        
+        c.execute( 'PRAGMA temp_store = 2;' )
+        
+        c.execute( 'ATTACH ":memory:" AS mem;' )
+        
+        self._AttachExternalDatabases( c )
+        
+        db_names = [ name for ( index, name, path ) in c.execute( 'PRAGMA database_list;' ) if name not in ( 'mem', 'temp' ) ]
+        
+        for db_name in db_names:
+            
+            c.execute( 'PRAGMA ' + db_name + '.cache_size = -10000;' )
+            
+        
+        db.set_authorizer( ReadConnectionAuthoriser )
+        
+        return ( db, c )
+        
+    
     def _ManageDBError( self, job, e ):
         
         raise NotImplementedError()
@@ -540,6 +640,8 @@ class HydrusDB( object ):
         
         ( action, args, kwargs ) = job.GetCallableTuple()
         
+        result = None
+        
         try:
             
             if job_type in ( 'read_write', 'write' ):
@@ -619,6 +721,49 @@ class HydrusDB( object ):
             self.publish_status_update()
             
         
+        return result
+        
+    
+    def _ProcessConcurrentReadJob( self, c, job ):
+        
+        ( action, args, kwargs ) = job.GetCallableTuple()
+        
+        result = None
+        
+        # a shallow copy shares all our caches but gets its own cursor, and anything the main thread rebinds mid-job will not pull the rug
+        reader = copy.copy( self )
+        
+        reader._c = c
+        reader._pubsubs = []
+        reader._is_concurrent_reader = True
+        
+        try:
+            
+            c.execute( 'BEGIN DEFERRED;' )
+            
+            try:
+                
+                result = reader._Read( action, *args, **kwargs )
+                
+            finally:
+                
+                c.execute( 'COMMIT;' )
+                
+            
+            for ( topic, args, kwargs ) in reader._pubsubs:
+                
+                self._controller.pub( topic, *args, **kwargs )
+                
+            
+            job.PutResult( result )
+            
+        except Exception as e:
+            
+            reader._ManageDBError( job, e )
+            
+        
+        return result
+        
     
     def _Read( self, action, *args, **kwargs ):
         
@@ -635,6 +780,21 @@ class HydrusDB( object ):
         pass
         
     
+    def _ReportJobLatency( self, job, time_started, concurrent, result = None ):
+        
+        ( action, args, kwargs ) = job.GetCallableTuple()
+        
+        queue_time = time_started - job.GetCreationTime()
+        execution_time = HydrusData.GetNowPrecise() - time_started
+        
+        self._job_metrics.ReportJob( action, queue_time, execution_time, GetResultNumRows( result ), concurrent )
+        
+        if HG.db_report_mode:
+            
+            HydrusData.ShowText( 'Finished ' + job.ToString() + ' after ' + HydrusData.TimeDeltaToPrettyTimeDelta( queue_time ) + ' queued and ' + HydrusData.TimeDeltaToPrettyTimeDelta( execution_time ) + ' running' + ( ' on a read connection' if concurrent else '' ) + '.' )
+            
+        
+    
     def _ReportStatus( self, text ):
         
         HydrusData.Print( text )
@@ -748,6 +908,13 @@ class HydrusDB( object ):
         return self._currently_doing_job
         
     
+    def CanServeConcurrentReads( self ):
+        
+        # the read connections cannot see uncommitted work, so only use them when nothing is waiting to be written
+        
+        return self._num_read_loops_running > 0 and self._num_writes_pending == 0 and not self._transaction_contains_writes
+        
+    
     def GetApproxTotalFileSize( self ):
         
         total = 0
@@ -762,6 +929,26 @@ class HydrusDB( object ):
         return total
         
     
+    def GetJobMetrics( self, all_time = False ):
+        
+        snapshot = self._job_metrics.GetSnapshot( all_time = all_time )
+        
+        queue_depths = collections.Counter()
+        
+        for ( queue_name, jobs ) in ( ( 'main', self._jobs ), ( 'read connections', self._read_jobs ) ):
+            
+            with jobs.mutex:
+                
+                for ( priority, job ) in jobs.queue:
+                    
+                    queue_depths[ ( queue_name, priority ) ] += 1
+                    
+                
+            
+        
+        return ( snapshot, dict( queue_depths ) )
+        
+    
     def GetStatus( self ):
         
         return ( self._current_status, self._current_job_name )
@@ -806,6 +993,21 @@ class HydrusDB( object ):
             return
             
         
+        if not self._no_wal:
+            
+            num_read_connections = self._GetNumReadConnections()
+            
+            for i in range( num_read_connections ):
+                
+                with self._job_counts_lock:
+                    
+                    self._num_read_loops_running += 1
+                    
+                
+                self._controller.CallToThreadLongRunning( self.ReadLoop )
+                
+            
+        
         self._ready_to_serve_requests = True
         
         error_count = 0
@@ -816,6 +1018,8 @@ class HydrusDB( object ):
                 
                 ( priority, job ) = self._jobs.get( timeout = 1 )
                 
+                time_started = HydrusData.GetNowPrecise()
+                
                 self._currently_doing_job = True
                 self._current_job_name = job.ToString()
                 
@@ -838,11 +1042,23 @@ class HydrusDB( object ):
                         
                         HydrusData.Profile( summary, 'self._ProcessJob( job )', globals(), locals() )
                         
+                        result = None
+                        
                     else:
                         
-                        self._ProcessJob( job )
+                        result = self._ProcessJob( job )
+                        
+                    
+                    if job.GetType() == 'write':
+                        
+                        with self._job_counts_lock:
+                            
+                            self._num_writes_pending -= 1
+                            
                         
                     
+                    self._ReportJobLatency( job, time_started, False, result = result )
+                    
                     error_count = 0
                     
                 except:
@@ -884,6 +1100,8 @@ class HydrusDB( object ):
         
         self._CloseDBCursor()
         
+        self._DumpJobMetrics()
+        
         self._loop_finished = True
         
     
@@ -901,11 +1119,65 @@ class HydrusDB( object ):
             raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
             
         
-        self._jobs.put( ( priority + 1, job ) ) # +1 so all writes of equal priority can clear out first
+        if action in self.CONCURRENT_READ_ACTIONS and self.CanServeConcurrentReads():
+            
+            self._read_jobs.put( ( priority, job ) )
+            
+        else:
+            
+            self._jobs.put( ( priority + 1, job ) ) # +1 so all writes of equal priority can clear out first
+            
         
         return job.GetResult()
         
     
+    def ReadLoop( self ):
+        
+        try:
+            
+            ( db, c ) = self._InitReadCursor()
+            
+        except Exception as e:
+            
+            HydrusData.Print( 'Could not open a read connection to the ' + self._db_name + ' db:' )
+            
+            HydrusData.PrintException( e )
+            
+            with self._job_counts_lock:
+                
+                self._num_read_loops_running -= 1
+                
+            
+            return
+            
+        
+        while not ( ( self._local_shutdown or self._controller.ModelIsShutdown() ) and self._read_jobs.empty() ):
+            
+            try:
+                
+                ( priority, job ) = self._read_jobs.get( timeout = 1 )
+                
+            except Queue.Empty:
+                
+                continue
+                
+            
+            time_started = HydrusData.GetNowPrecise()
+            
+            result = self._ProcessConcurrentReadJob( c, job )
+            
+            self._ReportJobLatency( job, time_started, True, result = result )
+            
+        
+        c.close()
+        db.close()
+        
+        with self._job_counts_lock:
+            
+            self._num_read_loops_running -= 1
+            
+        
+    
     def ReadyToServeRequests( self ):
         
         return self._ready_to_serve_requests
@@ -942,11 +1214,207 @@ class HydrusDB( object ):
             raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
             
         
+        with self._job_counts_lock:
+            
+            self._num_writes_pending += 1
+            
+        
         self._jobs.put( ( priority, job ) )
         
         if synchronous: return job.GetResult()
         
     
+class JobMetrics( object ):
+    
+    def __init__( self, window = 3600, slot_period = 60 ):
+        
+        self._lock = threading.Lock()
+        
+        self._window = window
+        self._slot_period = slot_period
+        
+        self._slots = collections.OrderedDict()
+        self._all_time_records = {}
+        
+    
+    def _AddToRecords( self, records, action, queue_time, execution_time, num_rows, concurrent ):
+        
+        if action not in records:
+            
+            records[ action ] = [ 0, 0, [ 0 ] * ( len( JOB_METRICS_BUCKET_BOUNDARIES ) + 1 ), [ 0 ] * ( len( JOB_METRICS_BUCKET_BOUNDARIES ) + 1 ), 0 ]
+            
+        
+        record = records[ action ]
+        
+        record[0] += 1
+        
+        if concurrent:
+            
+            record[1] += 1
+            
+        
+        record[2][ bisect.bisect_left( JOB_METRICS_BUCKET_BOUNDARIES, queue_time ) ] += 1
+        record[3][ bisect.bisect_left( JOB_METRICS_BUCKET_BOUNDARIES, execution_time ) ] += 1
+        
+        record[4] += num_rows
+        
+    
+    def _CullSlots( self ):
+        
+        oldest_slot = ( HydrusData.GetNow() - self._window ) // self._slot_period
+        
+        while len( self._slots ) > 0 and next( iter( self._slots ) ) < oldest_slot:
+            
+            self._slots.popitem( last = False )
+            
+        
+    
+    def _GetPercentiles( self, histogram, num_jobs ):
+        
+        percentiles = []
+        
+        for percentile in JOB_METRICS_PERCENTILES:
+            
+            target = percentile * num_jobs
+            
+            cumulative = 0
+            
+            for ( i, count ) in enumerate( histogram ):
+                
+                cumulative += count
+                
+                if cumulative >= target:
+                    
+                    break
+                    
+                
+            
+            # we report the top of the bucket. anything in the overflow bucket just reports the biggest boundary
+            
+            percentiles.append( JOB_METRICS_BUCKET_BOUNDARIES[ min( i, len( JOB_METRICS_BUCKET_BOUNDARIES ) - 1 ) ] )
+            
+        
+        return tuple( percentiles )
+        
+    
+    def GetSnapshot( self, all_time = False ):
+        
+        with self._lock:
+            
+            if all_time:
+                
+                records_list = [ self._all_time_records ]
+                
+            else:
+                
+                self._CullSlots()
+                
+                records_list = self._slots.values()
+                
+            
+            merged_records = {}
+            
+            for records in records_list:
+                
+                for ( action, ( num_jobs, num_concurrent, queue_histogram, execution_histogram, num_rows ) ) in records.items():
+                    
+                    if action not in merged_records:
+                        
+                        merged_records[ action ] = [ 0, 0, [ 0 ] * len( queue_histogram ), [ 0 ] * len( execution_histogram ), 0 ]
+                        
+                    
+                    merged_record = merged_records[ action ]
+                    
+                    merged_record[0] += num_jobs
+                    merged_record[1] += num_concurrent
+                    merged_record[2] = [ a + b for ( a, b ) in zip( merged_record[2], queue_histogram ) ]
+                    merged_record[3] = [ a + b for ( a, b ) in zip( merged_record[3], execution_histogram ) ]
+                    merged_record[4] += num_rows
+                    
+                
+            
+            snapshot = [ ( action, num_jobs, num_concurrent, self._GetPercentiles( queue_histogram, num_jobs ), self._GetPercentiles( execution_histogram, num_jobs ), num_rows ) for ( action, ( num_jobs, num_concurrent, queue_histogram, execution_histogram, num_rows ) ) in merged_records.items() ]
+            
+            return snapshot
+            
+        
+    
+    def ReportJob( self, action, queue_time, execution_time, num_rows, concurrent ):
+        
+        with self._lock:
+            
+            slot = HydrusData.GetNow() // self._slot_period
+            
+            if slot not in self._slots:
+                
+                self._slots[ slot ] = {}
+                
+                self._CullSlots()
+                
+            
+            self._AddToRecords( self._slots[ slot ], action, queue_time, execution_time, num_rows, concurrent )
+            self._AddToRecords( self._all_time_records, action, queue_time, execution_time, num_rows, concurrent )
+            
+        
+    
+class ListSelector( object ):
+    
+    # select statements take a %s like _SelectFromList, e.g. SELECT blah_id, blah FROM blahs WHERE blah_id IN %s;
+    
+    def __init__( self, db, xs, column_name, table_threshold = None ):
+        
+        if table_threshold is None:
+            
+            table_threshold = LIST_SELECTOR_TABLE_THRESHOLD
+            
+        
+        self._db = db
+        self._xs = xs
+        
+        if len( xs ) > table_threshold:
+            
+            self._temporary_integer_table = TemporaryIntegerTable( db._c, xs, column_name )
+            
+        else:
+            
+            self._temporary_integer_table = None
+            
+        
+        self._table_name = None
+        
+    
+    def __enter__( self ):
+        
+        if self._temporary_integer_table is not None:
+            
+            self._table_name = self._temporary_integer_table.__enter__()
+            
+        
+        return self
+        
+    
+    def __exit__( self, exc_type, exc_val, exc_tb ):
+        
+        if self._temporary_integer_table is not None:
+            
+            self._temporary_integer_table.__exit__( exc_type, exc_val, exc_tb )
+            
+        
+        return False
+        
+    
+    def Select( self, select_statement ):
+        
+        if self._table_name is None:
+            
+            return self._db._SelectFromList( select_statement, self._xs )
+            
+        else:
+            
+            return self._db._c.execute( select_statement % self._table_name )
+            
+        
+    
 class TemporaryIntegerTable( object ):
     
     def __init__( self, cursor, integer_iterable, column_name ):
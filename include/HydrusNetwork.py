@@ -2350,10 +2350,11 @@ class ServerServiceAdmin( ServerServiceRestricted ):
     
 class UpdateBuilder( object ):
     
-    def __init__( self, update_class, max_rows ):
+    def __init__( self, update_class, max_rows, update_callable = None ):
         
         self._update_class = update_class
         self._max_rows = max_rows
+        self._update_callable = update_callable
         
         self._updates = []
         
@@ -2361,6 +2362,20 @@ class UpdateBuilder( object ):
         self._current_num_rows = 0
         
     
+    def _FinishUpdate( self, update ):
+        
+        if self._update_callable is None:
+            
+            self._updates.append( update )
+            
+        else:
+            
+            # hand it off as soon as it is full so we never hold more than one update in memory
+            
+            self._update_callable( update )
+            
+        
+    
     def AddRow( self, row, row_weight = 1 ):
         
         self._current_update.AddRow( row )
@@ -2368,7 +2383,7 @@ class UpdateBuilder( object ):
         
         if self._current_num_rows > self._max_rows:
             
-            self._updates.append( self._current_update )
+            self._FinishUpdate( self._current_update )
             
             self._current_update = self._update_class()
             self._current_num_rows = 0
@@ -2379,7 +2394,7 @@ class UpdateBuilder( object ):
         
         if self._current_update.GetNumRows() > 0:
             
-            self._updates.append( self._current_update )
+            self._FinishUpdate( self._current_update )
             
         
         self._current_update = None
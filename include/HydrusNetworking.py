@@ -294,8 +294,6 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
     MAX_HOURS_TIME_DELTA = 72 * 3600
     MAX_DAYS_TIME_DELTA = 31 * 86400
     
-    CACHE_MAINTENANCE_TIME_DELTA = 120
-    
     MIN_TIME_DELTA_FOR_USER = 10
     
     def __init__( self ):
@@ -304,28 +302,25 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
         
         self._lock = threading.Lock()
         
-        self._next_cache_maintenance_timestamp = HydrusData.GetNow() + self.CACHE_MAINTENANCE_TIME_DELTA
-        
-        self._months_bytes = collections.Counter()
-        self._days_bytes = collections.Counter()
-        self._hours_bytes = collections.Counter()
-        self._minutes_bytes = collections.Counter()
-        self._seconds_bytes = collections.Counter()
-        
-        self._months_requests = collections.Counter()
-        self._days_requests = collections.Counter()
-        self._hours_requests = collections.Counter()
-        self._minutes_requests = collections.Counter()
-        self._seconds_requests = collections.Counter()
+        self._InitialiseUsage()
         
     
     def _GetSerialisableInfo( self ):
         
         dicts_flat = []
         
-        for d in ( self._months_bytes, self._days_bytes, self._hours_bytes, self._minutes_bytes, self._seconds_bytes, self._months_requests, self._days_requests, self._hours_requests, self._minutes_requests, self._seconds_requests ):
+        dicts_flat.append( self._months_bytes.items() )
+        
+        for ring in ( self._days_bytes, self._hours_bytes, self._minutes_bytes, self._seconds_bytes ):
             
-            dicts_flat.append( d.items() )
+            dicts_flat.append( ring.GetItems() )
+            
+        
+        dicts_flat.append( self._months_requests.items() )
+        
+        for ring in ( self._days_requests, self._hours_requests, self._minutes_requests, self._seconds_requests ):
+            
+            dicts_flat.append( ring.GetItems() )
             
         
         return dicts_flat
@@ -333,25 +328,38 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
     
     def _InitialiseFromSerialisableInfo( self, serialisable_info ):
         
-        counters = [ collections.Counter( dict( flat_dict ) ) for flat_dict in serialisable_info ]
-        
         # unusual error someone reported by email--it came back an empty list, fugg
-        if len( counters ) != 10:
+        if len( serialisable_info ) != 10:
             
             return
             
         
-        self._months_bytes = counters[ 0 ]
-        self._days_bytes = counters[ 1 ]
-        self._hours_bytes = counters[ 2 ]
-        self._minutes_bytes = counters[ 3 ]
-        self._seconds_bytes = counters[ 4 ]
+        self._InitialiseUsage()
+        
+        self._months_bytes = collections.Counter( dict( serialisable_info[ 0 ] ) )
+        self._months_requests = collections.Counter( dict( serialisable_info[ 5 ] ) )
         
-        self._months_requests = counters[ 5 ]
-        self._days_requests = counters[ 6 ]
-        self._hours_requests = counters[ 7 ]
-        self._minutes_requests = counters[ 8 ]
-        self._seconds_requests = counters[ 9 ]
+        rings_and_flat_dicts = []
+        
+        rings_and_flat_dicts.append( ( self._days_bytes, serialisable_info[ 1 ] ) )
+        rings_and_flat_dicts.append( ( self._hours_bytes, serialisable_info[ 2 ] ) )
+        rings_and_flat_dicts.append( ( self._minutes_bytes, serialisable_info[ 3 ] ) )
+        rings_and_flat_dicts.append( ( self._seconds_bytes, serialisable_info[ 4 ] ) )
+        
+        rings_and_flat_dicts.append( ( self._days_requests, serialisable_info[ 6 ] ) )
+        rings_and_flat_dicts.append( ( self._hours_requests, serialisable_info[ 7 ] ) )
+        rings_and_flat_dicts.append( ( self._minutes_requests, serialisable_info[ 8 ] ) )
+        rings_and_flat_dicts.append( ( self._seconds_requests, serialisable_info[ 9 ] ) )
+        
+        for ( ring, flat_dict ) in rings_and_flat_dicts:
+            
+            # adding in time order keeps every add at the head of the ring
+            
+            for ( timestamp, value ) in sorted( flat_dict ):
+                
+                ring.Add( timestamp, value )
+                
+            
         
     
     def _GetCurrentDateTime( self ):
@@ -452,14 +460,7 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             
             now = HydrusData.GetNow()
             
-            if now in counter:
-                
-                return counter[ now ]
-                
-            else:
-                
-                return 0
-                
+            return counter.GetValue( now )
             
         else:
             
@@ -470,31 +471,10 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             
             since = HydrusData.GetNow() - search_time_delta
             
-            return sum( ( value for ( timestamp, value ) in counter.items() if timestamp >= since ) )
+            return counter.GetTotalSince( since )
             
         
     
-    def _GetTimes( self, dt ):
-        
-        # collapse each time portion to the latest timestamp it covers
-        
-        ( year, month, day, hour, minute ) = ( dt.year, dt.month, dt.day, dt.hour, dt.minute )
-        
-        month_dt = datetime.datetime( year, month, 1 )
-        day_dt = datetime.datetime( year, month, day )
-        hour_dt = datetime.datetime( year, month, day, hour )
-        minute_dt = datetime.datetime( year, month, day, hour, minute )
-        
-        month_time = int( calendar.timegm( month_dt.timetuple() ) )
-        day_time = int( calendar.timegm( day_dt.timetuple() ) )
-        hour_time = int( calendar.timegm( hour_dt.timetuple() ) )
-        minute_time = int( calendar.timegm( minute_dt.timetuple() ) )
-        
-        second_time = int( calendar.timegm( dt.timetuple() ) )
-        
-        return ( month_time, day_time, hour_time, minute_time, second_time )
-        
-    
     def _GetUsage( self, bandwidth_type, time_delta, for_user ):
         
         if for_user and time_delta is not None and bandwidth_type == HC.BANDWIDTH_TYPE_DATA and time_delta <= self.MIN_TIME_DELTA_FOR_USER:
@@ -506,8 +486,6 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             usage = self._GetRawUsage( bandwidth_type, time_delta )
             
         
-        self._MaintainCache()
-        
         return usage
         
     
@@ -521,9 +499,9 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
         
         since = now - SEARCH_DELTA
         
-        valid_keys = [ key for key in counter.keys() if key >= since ]
+        earliest_timestamp = counter.GetEarliestTimestampSince( since )
         
-        if len( valid_keys ) == 0:
+        if earliest_timestamp is None:
             
             return 0
             
@@ -531,49 +509,30 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
         # If we want the average speed over past five secs but nothing has happened in sec 4 and 5, we don't want to count them
         # otherwise your 1MB/s counts as 200KB/s
         
-        earliest_timestamp = min( valid_keys )
-        
         SAMPLE_DELTA = max( now - earliest_timestamp, 1 )
         
-        total_bytes = sum( ( counter[ key ] for key in valid_keys ) )
+        total_bytes = counter.GetTotalSince( since )
         
         time_delta_average_per_sec = total_bytes / SAMPLE_DELTA
         
         return time_delta_average_per_sec * time_delta
         
     
-    def _MaintainCache( self ):
+    def _InitialiseUsage( self ):
         
-        if HydrusData.TimeHasPassed( self._next_cache_maintenance_timestamp ):
-            
-            now = HydrusData.GetNow()
-            
-            oldest_second = now - self.MAX_SECONDS_TIME_DELTA
-            oldest_minute = now - self.MAX_MINUTES_TIME_DELTA
-            oldest_hour = now - self.MAX_HOURS_TIME_DELTA
-            oldest_day = now - self.MAX_DAYS_TIME_DELTA
-            
-            def clear_counter( counter, timestamp ):
-                
-                bad_keys = [ key for key in counter.keys() if key < timestamp ]
-                
-                for bad_key in bad_keys:
-                    
-                    del counter[ bad_key ]
-                    
-                
-            
-            clear_counter( self._days_bytes, oldest_day )
-            clear_counter( self._days_requests, oldest_day )
-            clear_counter( self._hours_bytes, oldest_hour )
-            clear_counter( self._hours_requests, oldest_hour )
-            clear_counter( self._minutes_bytes, oldest_minute )
-            clear_counter( self._minutes_requests, oldest_minute )
-            clear_counter( self._seconds_bytes, oldest_second )
-            clear_counter( self._seconds_requests, oldest_second )
-            
-            self._next_cache_maintenance_timestamp = HydrusData.GetNow() + self.CACHE_MAINTENANCE_TIME_DELTA
-            
+        # each ring holds a little more than the longest time delta it answers for, plus the window
+        
+        self._months_bytes = collections.Counter()
+        self._days_bytes = UsageRingBuffer( 86400, self.MAX_DAYS_TIME_DELTA // 86400 + 2 )
+        self._hours_bytes = UsageRingBuffer( 3600, self.MAX_HOURS_TIME_DELTA // 3600 + 2 )
+        self._minutes_bytes = UsageRingBuffer( 60, self.MAX_MINUTES_TIME_DELTA // 60 + 2 )
+        self._seconds_bytes = UsageRingBuffer( 1, self.MAX_SECONDS_TIME_DELTA + 2 )
+        
+        self._months_requests = collections.Counter()
+        self._days_requests = UsageRingBuffer( 86400, self.MAX_DAYS_TIME_DELTA // 86400 + 2 )
+        self._hours_requests = UsageRingBuffer( 3600, self.MAX_HOURS_TIME_DELTA // 3600 + 2 )
+        self._minutes_requests = UsageRingBuffer( 60, self.MAX_MINUTES_TIME_DELTA // 60 + 2 )
+        self._seconds_requests = UsageRingBuffer( 1, self.MAX_SECONDS_TIME_DELTA + 2 )
         
     
     def GetCurrentMonthSummary( self ):
@@ -657,31 +616,16 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
                 
                 time_delta_in_which_bandwidth_counts = time_delta + window
                 
-                time_and_values = counter.items()
-                
-                time_and_values.sort( reverse = True )
-                
                 now = HydrusData.GetNow()
-                usage = 0
                 
-                for ( timestamp, value ) in time_and_values:
-                    
-                    current_search_time_delta = now - timestamp
-                    
-                    if current_search_time_delta > time_delta_in_which_bandwidth_counts: # we are searching beyond our time delta. no need to wait
-                        
-                        break
-                        
-                    
-                    usage += value
+                timestamp = counter.GetLatestTimestampWithTotalSince( now - time_delta_in_which_bandwidth_counts, max_allowed )
+                
+                if timestamp is None:
                     
-                    if usage >= max_allowed:
-                        
-                        return time_delta_in_which_bandwidth_counts - current_search_time_delta
-                        
+                    return 0
                     
                 
-                return 0
+                return time_delta_in_which_bandwidth_counts - ( now - timestamp )
                 
             
         
@@ -692,19 +636,19 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             
             dt = self._GetCurrentDateTime()
             
-            ( month_time, day_time, hour_time, minute_time, second_time ) = self._GetTimes( dt )
+            month_time = self._GetMonthTime( dt )
             
-            self._months_bytes[ month_time ] += num_bytes
+            now = HydrusData.GetNow()
             
-            self._days_bytes[ day_time ] += num_bytes
+            self._months_bytes[ month_time ] += num_bytes
             
-            self._hours_bytes[ hour_time ] += num_bytes
+            self._days_bytes.Add( now, num_bytes )
             
-            self._minutes_bytes[ minute_time ] += num_bytes
+            self._hours_bytes.Add( now, num_bytes )
             
-            self._seconds_bytes[ second_time ] += num_bytes
+            self._minutes_bytes.Add( now, num_bytes )
             
-            self._MaintainCache()
+            self._seconds_bytes.Add( now, num_bytes )
             
         
     
@@ -714,20 +658,206 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             
             dt = self._GetCurrentDateTime()
             
-            ( month_time, day_time, hour_time, minute_time, second_time ) = self._GetTimes( dt )
+            month_time = self._GetMonthTime( dt )
             
-            self._months_requests[ month_time ] += 1
+            now = HydrusData.GetNow()
             
-            self._days_requests[ day_time ] += 1
+            self._months_requests[ month_time ] += 1
             
-            self._hours_requests[ hour_time ] += 1
+            self._days_requests.Add( now, 1 )
             
-            self._minutes_requests[ minute_time ] += 1
+            self._hours_requests.Add( now, 1 )
             
-            self._seconds_requests[ second_time ] += 1
+            self._minutes_requests.Add( now, 1 )
             
-            self._MaintainCache()
+            self._seconds_requests.Add( now, 1 )
             
         
     
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_BANDWIDTH_TRACKER ] = BandwidthTracker
+
+class UsageRingBuffer( object ):
+    
+    # fixed-size ring of usage brackets, each 'granularity' seconds wide and keyed by the timestamp they start at
+    # alongside each bracket's value, we keep the running total of everything added up to and including it, so any 'since x' sum is one subtraction
+    
+    def __init__( self, granularity, num_brackets ):
+        
+        self._granularity = granularity
+        self._num_brackets = num_brackets
+        
+        self._values = [ 0 ] * num_brackets
+        self._running_totals = [ 0 ] * num_brackets
+        
+        self._total = 0
+        self._latest_bracket = None
+        
+    
+    def _GetEarliestBracket( self ):
+        
+        return self._latest_bracket - self._num_brackets + 1
+        
+    
+    def _GetFirstBracketSince( self, since ):
+        
+        # first bracket whose start timestamp is >= since
+        
+        return - ( - since // self._granularity )
+        
+    
+    def _GetTotalFromBracket( self, bracket ):
+        
+        i = bracket % self._num_brackets
+        
+        return self._total - ( self._running_totals[ i ] - self._values[ i ] )
+        
+    
+    def Add( self, timestamp, value ):
+        
+        bracket = timestamp // self._granularity
+        
+        if self._latest_bracket is None:
+            
+            self._latest_bracket = bracket
+            
+        
+        if bracket > self._latest_bracket:
+            
+            # clear out the brackets we are moving over. no need to go round more than once
+            
+            first_new_bracket = max( self._latest_bracket + 1, bracket - self._num_brackets + 1 )
+            
+            for new_bracket in range( first_new_bracket, bracket + 1 ):
+                
+                i = new_bracket % self._num_brackets
+                
+                self._values[ i ] = 0
+                self._running_totals[ i ] = self._total
+                
+            
+            self._latest_bracket = bracket
+            
+        elif bracket < self._GetEarliestBracket():
+            
+            return
+            
+        
+        self._total += value
+        
+        # the clock may have gone backwards, in which case everything newer needs its running total bumped too
+        
+        for later_bracket in range( bracket, self._latest_bracket + 1 ):
+            
+            self._running_totals[ later_bracket % self._num_brackets ] += value
+            
+        
+        self._values[ bracket % self._num_brackets ] += value
+        
+    
+    def GetEarliestTimestampSince( self, since ):
+        
+        if self._latest_bracket is None:
+            
+            return None
+            
+        
+        first_bracket = max( self._GetFirstBracketSince( since ), self._GetEarliestBracket() )
+        
+        for bracket in range( first_bracket, self._latest_bracket + 1 ):
+            
+            if self._values[ bracket % self._num_brackets ] > 0:
+                
+                return bracket * self._granularity
+                
+            
+        
+        return None
+        
+    
+    def GetItems( self ):
+        
+        if self._latest_bracket is None:
+            
+            return []
+            
+        
+        items = []
+        
+        for bracket in range( self._GetEarliestBracket(), self._latest_bracket + 1 ):
+            
+            value = self._values[ bracket % self._num_brackets ]
+            
+            if value > 0:
+                
+                items.append( ( bracket * self._granularity, value ) )
+                
+            
+        
+        return items
+        
+    
+    def GetLatestTimestampWithTotalSince( self, since, total ):
+        
+        # the latest bracket at which the total of it and everything after it reaches the given total
+        
+        if self._latest_bracket is None:
+            
+            return None
+            
+        
+        low = max( self._GetFirstBracketSince( since ), self._GetEarliestBracket() )
+        high = self._latest_bracket
+        
+        if low > high or self._GetTotalFromBracket( low ) < total:
+            
+            return None
+            
+        
+        # totals from a bracket onwards only go down as the bracket gets later, so we can bisect
+        
+        while low < high:
+            
+            middle = ( low + high + 1 ) // 2
+            
+            if self._GetTotalFromBracket( middle ) >= total:
+                
+                low = middle
+                
+            else:
+                
+                high = middle - 1
+                
+            
+        
+        return low * self._granularity
+        
+    
+    def GetTotalSince( self, since ):
+        
+        if self._latest_bracket is None:
+            
+            return 0
+            
+        
+        first_bracket = max( self._GetFirstBracketSince( since ), self._GetEarliestBracket() )
+        
+        if first_bracket > self._latest_bracket:
+            
+            return 0
+            
+        
+        return self._GetTotalFromBracket( first_bracket )
+        
+    
+    def GetValue( self, timestamp ):
+        
+        bracket = timestamp // self._granularity
+        
+        if self._latest_bracket is None or bracket > self._latest_bracket or bracket < self._GetEarliestBracket():
+            
+            return 0
+            
+        
+        return self._values[ bracket % self._num_brackets ]
+        
+    
@@ -1,3 +1,4 @@
+import collections
 import HydrusConstants as HC
 import HydrusData
 import HydrusExceptions
@@ -7,6 +8,54 @@ import traceback
 import weakref
 import HydrusGlobals as HG
 
+# these only say 'something changed, go look', so if the same one comes in several times in one go, we only need to deliver it once
+
+COALESCABLE_TOPICS = set()
+
+COALESCABLE_TOPICS.update( ( 'canvas_new_index_string', 'canvas_new_zoom', 'file_seed_cache_file_seeds_updated', 'gallery_seed_log_gallery_seeds_updated', 'important_dirt_to_clean', 'main_gui_title', 'memory_maintenance_pulse', 'message', 'new_page_status', 'new_siblings_gui' ) )
+COALESCABLE_TOPICS.update( ( 'notify_new_colourset', 'notify_new_downloads', 'notify_new_export_folders', 'notify_new_favourite_tags', 'notify_new_force_refresh_tags_data', 'notify_new_force_refresh_tags_gui', 'notify_new_import_folders', 'notify_new_options', 'notify_new_pages', 'notify_new_pending', 'notify_new_permissions', 'notify_new_sessions', 'notify_new_subscriptions', 'notify_new_undo' ) )
+COALESCABLE_TOPICS.update( ( 'notify_restart_export_folders_daemon', 'notify_restart_import_folders_daemon', 'notify_restart_repo_sync_daemon', 'notify_restart_subs_sync_daemon' ) )
+COALESCABLE_TOPICS.update( ( 'refresh_dupe_numbers', 'refresh_local_booru_shares', 'refresh_page_name', 'refresh_query', 'service_updated', 'set_num_query_results', 'set_status_bar_dirty', 'splash_set_status_subtext', 'splash_set_status_text', 'splash_set_title_text', 'wake_daemons' ) )
+
+def CoalescePubSubs( pubsubs ):
+    
+    # keep the last of each identical message, so whatever is listening sees the latest nudge
+    
+    coalesced_pubsubs = []
+    topics_to_num_coalesced = collections.Counter()
+    
+    seen_keys = set()
+    
+    for ( topic, args, kwargs ) in reversed( pubsubs ):
+        
+        if topic in COALESCABLE_TOPICS:
+            
+            try:
+                
+                key = ( topic, args, tuple( sorted( kwargs.items() ) ) )
+                
+                if key in seen_keys:
+                    
+                    topics_to_num_coalesced[ topic ] += 1
+                    
+                    continue
+                    
+                
+                seen_keys.add( key )
+                
+            except TypeError: # unhashable
+                
+                pass
+                
+            
+        
+        coalesced_pubsubs.append( ( topic, args, kwargs ) )
+        
+    
+    coalesced_pubsubs.reverse()
+    
+    return ( coalesced_pubsubs, topics_to_num_coalesced )
+    
 class HydrusPubSub( object ):
     
     def __init__( self, controller ):
@@ -21,54 +70,107 @@ class HydrusPubSub( object ):
         
         self._lock = threading.Lock()
         
-        self._topics_to_objects = {}
-        self._topics_to_method_names = {}
+        self._topics_to_subscribers = {}
+        
+        self._topics_to_stats = {}
         
     
     def _GetCallables( self, topic ):
         
         callables = []
         
-        if topic in self._topics_to_objects:
+        if topic in self._topics_to_subscribers:
             
-            try:
+            subscribers = self._topics_to_subscribers[ topic ]
+            
+            dead_keys = []
+            
+            for ( key, ( object_weakref, method_name ) ) in subscribers.items():
+                
+                object = object_weakref()
                 
-                objects = self._topics_to_objects[ topic ]
+                if object is None:
+                    
+                    dead_keys.append( key )
+                    
+                    continue
+                    
                 
-                for object in objects:
+                try:
                     
-                    if not object:
+                    if not object: # a dead wx window, or a list that is empty for now
                         
                         continue
                         
                     
-                    method_names = self._topics_to_method_names[ topic ]
+                    callable = getattr( object, method_name, None )
                     
-                    for method_name in method_names:
-                        
-                        if hasattr( object, method_name ):
-                            
-                            callable = getattr( object, method_name )
-                            
-                            callables.append( callable )
-                            
-                        
+                except:
+                    
+                    continue
                     
                 
-            except:
+                if callable is not None:
+                    
+                    callables.append( callable )
+                    
                 
-                pass
+            
+            for key in dead_keys:
+                
+                del subscribers[ key ]
+                
+            
+            if len( subscribers ) == 0:
+                
+                del self._topics_to_subscribers[ topic ]
                 
             
         
         return callables
         
     
+    def _GetTopicStats( self, topic ):
+        
+        if topic not in self._topics_to_stats:
+            
+            # num_pubs, num_coalesced, num_calls, total_time, max_time
+            
+            self._topics_to_stats[ topic ] = [ 0, 0, 0, 0.0, 0.0 ]
+            
+        
+        return self._topics_to_stats[ topic ]
+        
+    
+    def _ReportTopicTime( self, topic, num_calls, time_took ):
+        
+        with self._lock:
+            
+            stats = self._GetTopicStats( topic )
+            
+            stats[2] += num_calls
+            stats[3] += time_took
+            stats[4] = max( stats[4], time_took )
+            
+        
+    
     def DoingWork( self ):
         
         return self._doing_work
         
     
+    def GetTopicStats( self ):
+        
+        with self._lock:
+            
+            rows = [ ( topic, num_pubs, num_coalesced, num_calls, total_time, max_time ) for ( topic, ( num_pubs, num_coalesced, num_calls, total_time, max_time ) ) in self._topics_to_stats.items() ]
+            
+        
+        rows.sort( key = lambda row: row[4], reverse = True )
+        
+        return rows
+        
+    
     def Process( self ):
         
         # only do one list of callables at a time
@@ -95,15 +197,27 @@ class HydrusPubSub( object ):
                 
                 self._pubsubs = []
                 
+                ( pubsubs, topics_to_num_coalesced ) = CoalescePubSubs( pubsubs )
+                
+                for ( topic, num_coalesced ) in topics_to_num_coalesced.items():
+                    
+                    self._GetTopicStats( topic )[1] += num_coalesced
+                    
+                
             
             for ( topic, args, kwargs ) in pubsubs:
                 
                 try:
                     
-                    callables = self._GetCallables( topic )
+                    with self._lock:
+                        
+                        callables = self._GetCallables( topic )
+                        
                     
                     # do this _outside_ the lock, lol
                     
+                    start_time = HydrusData.GetNowPrecise()
+                    
                     pubsub_profilable = topic != 'message'
                     
                     if HG.pubsub_profile_mode and pubsub_profilable:
@@ -141,6 +255,8 @@ class HydrusPubSub( object ):
                             
                         
                     
+                    self._ReportTopicTime( topic, len( callables ), HydrusData.GetNowPrecise() - start_time )
+                    
                 except Exception as e:
                     
                     HydrusData.ShowException( e )
@@ -159,6 +275,10 @@ class HydrusPubSub( object ):
             
             self._pubsubs.append( ( topic, args, kwargs ) )
             
+            stats = self._GetTopicStats( topic )
+            
+            stats[0] += 1
+            
         
         self._pub_event.set()
         
@@ -180,11 +300,23 @@ class HydrusPubSub( object ):
         
         with self._lock:
             
-            if topic not in self._topics_to_objects: self._topics_to_objects[ topic ] = weakref.WeakSet()
-            if topic not in self._topics_to_method_names: self._topics_to_method_names[ topic ] = set()
+            if topic not in self._topics_to_subscribers: self._topics_to_subscribers[ topic ] = {}
+            
+            subscribers = self._topics_to_subscribers[ topic ]
+            
+            key = ( id( object ), method_name )
+            
+            if key in subscribers:
+                
+                ( object_weakref, existing_method_name ) = subscribers[ key ]
+                
+                if object_weakref() is object:
+                    
+                    return
+                    
+                
             
-            self._topics_to_objects[ topic ].add( object )
-            self._topics_to_method_names[ topic ].add( method_name )
+            subscribers[ key ] = ( weakref.ref( object ), method_name )
             
         
     
@@ -1,3 +1,5 @@
+import bisect
+import collections
 import HydrusConstants as HC
 import HydrusData
 import HydrusExceptions
@@ -188,6 +190,55 @@ def GetFFMPEGInfoLines( path, count_frames_manually = False ):
     
     return lines
     
+def GetFFMPEGKeyframeTimestamps( path ):
+    
+    # decoding only the keyframes is quick, and showinfo reports the timestamp of each one
+    
+    cmd = [ FFMPEG_PATH, '-skip_frame', 'nokey', '-i', path, '-map', '0:v:0', '-vf', 'showinfo', '-f', 'null', '-' ]
+    
+    try:
+        
+        proc = subprocess.Popen( cmd, bufsize = 10**5, stdout = subprocess.PIPE, stderr = subprocess.PIPE, startupinfo = HydrusData.GetHideTerminalSubprocessStartupInfo() )
+        
+    except:
+        
+        if not os.path.exists( FFMPEG_PATH ):
+            
+            raise Exception( 'FFMPEG was not found!' )
+            
+        else:
+            
+            raise
+            
+        
+    
+    ( stdout, stderr ) = proc.communicate()
+    
+    timestamps = []
+    
+    for pts_time in re.findall( r'\bpts_time:(\S+)', stderr ):
+        
+        try:
+            
+            timestamps.append( float( pts_time ) )
+            
+        except ValueError:
+            
+            continue
+            
+        
+    
+    if len( timestamps ) == 0:
+        
+        return []
+        
+    
+    # -ss counts from the start of the file, not from zero
+    
+    start = min( timestamps )
+    
+    return sorted( { int( ( timestamp - start ) * 1000 ) for timestamp in timestamps } )
+    
 def GetFFMPEGVideoProperties( path, count_frames_manually = False ):
     
     lines = GetFFMPEGInfoLines( path, count_frames_manually )
@@ -651,6 +702,12 @@ class VideoRendererFFMPEG( object ):
         
         self.bufsize = bufsize
         
+        # frames the caller is done with, which we read the next frames straight into
+        self._free_frames = collections.deque( maxlen = 16 )
+        self._skip_frame = None
+        
+        self._keyframe_indices = []
+        
         self.initialize()
         
     
@@ -659,6 +716,27 @@ class VideoRendererFFMPEG( object ):
         self.close()
         
     
+    def _get_frame_buffer( self ):
+        
+        if len( self._free_frames ) > 0:
+            
+            return self._free_frames.popleft()
+            
+        
+        ( w, h ) = self._target_resolution
+        
+        return numpy.empty( ( h, w, self.depth ), dtype = 'uint8' )
+        
+    
+    def _get_keyframe_index( self, index ):
+        
+        # the last keyframe at or before index
+        
+        i = bisect.bisect_right( self._keyframe_indices, index ) - 1
+        
+        return self._keyframe_indices[ max( i, 0 ) ]
+        
+    
     def close(self):
         
         if self.process is not None:
@@ -743,15 +821,16 @@ class VideoRendererFFMPEG( object ):
         
         n = int( n )
         
-        ( w, h ) = self._target_resolution
+        if n > 0 and self._skip_frame is None:
+            
+            self._skip_frame = self._get_frame_buffer()
+            
         
         for i in range( n ):
             
             if self.process is not None:
                 
-                self.process.stdout.read( self.depth * w * h )
-                
-                self.process.stdout.flush()
+                self.process.stdout.readinto( self._skip_frame )
                 
             
             self.pos += 1
@@ -767,30 +846,31 @@ class VideoRendererFFMPEG( object ):
         
         if self.process is None:
             
-            result = self.lastread
+            result = self.lastread.copy()
             
         else:
             
-            ( w, h ) = self._target_resolution
-            
-            nbytes = self.depth * w * h
+            frame = self._get_frame_buffer()
             
-            s = self.process.stdout.read(nbytes)
+            num_read = self.process.stdout.readinto( frame )
             
-            if len(s) != nbytes:
+            if num_read != self.bufsize:
+                
+                self._free_frames.append( frame )
                 
                 if self.lastread is None:
                     
                     raise Exception( 'Unable to render that video! Please send it to hydrus dev so he can look at it!' )
                     
                 
-                result = self.lastread
+                # a copy, so every frame we hand out is its own array and can be released independently
+                result = self.lastread.copy()
                 
                 self.close()
                 
             else:
                 
-                result = numpy.fromstring( s, dtype = 'uint8' ).reshape( ( h, w, len( s ) // ( w * h ) ) )
+                result = frame
                 
                 self.lastread = result
                 
@@ -801,10 +881,37 @@ class VideoRendererFFMPEG( object ):
         return result
         
     
+    def release_frame( self, frame ):
+        
+        # the caller promises it holds no more references to this frame, so we can overwrite it
+        
+        if frame is self.lastread:
+            
+            return
+            
+        
+        self._free_frames.append( frame )
+        
+    
+    def set_keyframe_indices( self, keyframe_indices ):
+        
+        self._keyframe_indices = keyframe_indices
+        
+    
     def set_position( self, pos ):
         
         rewind = pos < self.pos
-        jump_a_long_way_ahead = pos > self.pos + 60
+        
+        if len( self._keyframe_indices ) > 0 and self._mime not in ( HC.IMAGE_APNG, HC.IMAGE_GIF ):
+            
+            # a new process with -ss decodes from the keyframe before pos, so it only beats reading on if that keyframe is ahead of us
+            
+            jump_a_long_way_ahead = self._get_keyframe_index( pos ) > self.pos
+            
+        else:
+            
+            jump_a_long_way_ahead = pos > self.pos + 60
+            
         
         if rewind or jump_a_long_way_ahead:
             
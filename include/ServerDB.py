@@ -85,6 +85,32 @@ def GenerateRepositoryUpdateTableName( service_id ):
     
     return 'updates_' + str( service_id )
     
+def IterateGroupedMappingChunks( cursor, chunk_size ):
+    
+    # cursor must give ( service_tag_id, service_hash_id ) ordered by service_tag_id
+    
+    for ( service_tag_id, group ) in itertools.groupby( cursor, lambda row: row[0] ):
+        
+        block_of_service_hash_ids = []
+        
+        for ( service_tag_id, service_hash_id ) in group:
+            
+            block_of_service_hash_ids.append( service_hash_id )
+            
+            if len( block_of_service_hash_ids ) == chunk_size:
+                
+                yield ( service_tag_id, block_of_service_hash_ids )
+                
+                block_of_service_hash_ids = []
+                
+            
+        
+        if len( block_of_service_hash_ids ) > 0:
+            
+            yield ( service_tag_id, block_of_service_hash_ids )
+            
+        
+    
 class DB( HydrusDB.HydrusDB ):
     
     READ_WRITE_ACTIONS = [ 'access_key', 'immediate_content_update', 'registration_keys' ]
@@ -1538,42 +1564,51 @@ class DB( HydrusDB.HydrusDB ):
         
         HydrusData.Print( 'Creating update for ' + repr( name ) + ' from ' + HydrusData.ConvertTimestampToPrettyTime( begin, in_gmt = True ) + ' to ' + HydrusData.ConvertTimestampToPrettyTime( end, in_gmt = True ) )
         
-        updates = self._RepositoryGenerateUpdates( service_id, begin, end )
-        
         update_hashes = []
         
-        total_definition_rows = 0
-        total_content_rows = 0
+        # num_definition_rows, num_content_rows, num_bytes
+        
+        totals = [ 0, 0, 0 ]
         
-        if len( updates ) > 0:
+        def write_update( update ):
             
-            for update in updates:
-                
-                num_rows = update.GetNumRows()
-                
-                if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
-                    
-                    total_definition_rows += num_rows
-                    
-                elif isinstance( update, HydrusNetwork.ContentUpdate ):
-                    
-                    total_content_rows += num_rows
-                    
+            num_rows = update.GetNumRows()
+            
+            if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
                 
-                update_bytes = update.DumpToNetworkString()
+                totals[0] += num_rows
                 
-                update_hash = hashlib.sha256( update_bytes ).digest()
+            elif isinstance( update, HydrusNetwork.ContentUpdate ):
                 
-                dest_path = ServerFiles.GetExpectedFilePath( update_hash )
+                totals[1] += num_rows
                 
-                with open( dest_path, 'wb' ) as f:
-                    
-                    f.write( update_bytes )
-                    
+            
+            update_bytes = update.DumpToNetworkString()
+            
+            totals[2] += len( update_bytes )
+            
+            update_hash = hashlib.sha256( update_bytes ).digest()
+            
+            dest_path = ServerFiles.GetExpectedFilePath( update_hash )
+            
+            with open( dest_path, 'wb' ) as f:
                 
-                update_hashes.append( update_hash )
+                f.write( update_bytes )
                 
             
+            update_hashes.append( update_hash )
+            
+        
+        start_time = HydrusData.GetNowPrecise()
+        
+        self._RepositoryGenerateUpdates( service_id, begin, end, update_callable = write_update )
+        
+        time_took = max( HydrusData.GetNowPrecise() - start_time, 0.001 )
+        
+        ( total_definition_rows, total_content_rows, total_bytes ) = totals
+        
+        if len( update_hashes ) > 0:
+            
             ( update_table_name ) = GenerateRepositoryUpdateTableName( service_id )
             
             master_hash_ids = self._GetMasterHashIds( update_hashes )
@@ -1581,7 +1616,10 @@ class DB( HydrusDB.HydrusDB ):
             self._c.executemany( 'INSERT OR IGNORE INTO ' + update_table_name + ' ( master_hash_id ) VALUES ( ? );', ( ( master_hash_id, ) for master_hash_id in master_hash_ids ) )
             
         
-        HydrusData.Print( 'Update OK. ' + HydrusData.ToHumanInt( total_definition_rows ) + ' definition rows and ' + HydrusData.ToHumanInt( total_content_rows ) + ' content rows in ' + HydrusData.ToHumanInt( len( updates ) ) + ' update files.' )
+        rows_per_second = int( ( total_definition_rows + total_content_rows ) / time_took )
+        bytes_per_second = int( total_bytes / time_took )
+        
+        HydrusData.Print( 'Update OK. ' + HydrusData.ToHumanInt( total_definition_rows ) + ' definition rows and ' + HydrusData.ToHumanInt( total_content_rows ) + ' content rows in ' + HydrusData.ToHumanInt( len( update_hashes ) ) + ' update files totalling ' + HydrusData.ConvertIntToBytes( total_bytes ) + '. Took ' + HydrusData.TimeDeltaToPrettyTimeDelta( time_took ) + ', at ' + HydrusData.ToHumanInt( rows_per_second ) + ' rows/s and ' + HydrusData.ConvertIntToBytes( bytes_per_second ) + '/s.' )
         
         return update_hashes
         
@@ -1740,7 +1778,10 @@ class DB( HydrusDB.HydrusDB ):
         return updates
         
     
-    def _RepositoryGenerateUpdates( self, service_id, begin, end ):
+    def _RepositoryGenerateUpdates( self, service_id, begin, end, update_callable = None ):
+        
+        # if update_callable is given, each update is handed to it as soon as it is full and is not kept
+        # rows are streamed straight off the cursor, so nothing in here should hit the db while it is being called
         
         MAX_DEFINITIONS_ROWS = 50000
         MAX_CONTENT_ROWS = 250000
@@ -1749,8 +1790,8 @@ class DB( HydrusDB.HydrusDB ):
         
         updates = []
         
-        definitions_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.DefinitionsUpdate, MAX_DEFINITIONS_ROWS )
-        content_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.ContentUpdate, MAX_CONTENT_ROWS )
+        definitions_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.DefinitionsUpdate, MAX_DEFINITIONS_ROWS, update_callable = update_callable )
+        content_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.ContentUpdate, MAX_CONTENT_ROWS, update_callable = update_callable )
         
         ( service_hash_ids_table_name, service_tag_ids_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
         
@@ -1785,9 +1826,7 @@ class DB( HydrusDB.HydrusDB ):
             content_update_builder.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, file_row ) )
             
         
-        service_hash_ids = [ service_hash_id for ( service_hash_id, ) in self._c.execute( 'SELECT service_hash_id FROM ' + deleted_files_table_name + ' WHERE file_timestamp BETWEEN ? AND ?;', ( begin, end ) ) ]
-        
-        for service_hash_id in service_hash_ids:
+        for ( service_hash_id, ) in self._c.execute( 'SELECT service_hash_id FROM ' + deleted_files_table_name + ' WHERE file_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
             
             content_update_builder.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, service_hash_id ) )
             
@@ -1796,42 +1835,36 @@ class DB( HydrusDB.HydrusDB ):
         
         ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
         
-        service_tag_ids_to_service_hash_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + current_mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ?;', ( begin, end ) ) )
+        cursor = self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + current_mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ? ORDER BY service_tag_id;', ( begin, end ) )
         
-        for ( service_tag_id, service_hash_ids ) in service_tag_ids_to_service_hash_ids.items():
+        for ( service_tag_id, block_of_service_hash_ids ) in IterateGroupedMappingChunks( cursor, MAX_CONTENT_CHUNK ):
             
-            for block_of_service_hash_ids in HydrusData.SplitListIntoChunks( service_hash_ids, MAX_CONTENT_CHUNK ):
-                
-                row_weight = len( block_of_service_hash_ids )
-                
-                content_update_builder.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( service_tag_id, block_of_service_hash_ids ) ), row_weight )
-                
+            row_weight = len( block_of_service_hash_ids )
+            
+            content_update_builder.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( service_tag_id, block_of_service_hash_ids ) ), row_weight )
             
         
-        service_tag_ids_to_service_hash_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + deleted_mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ?;', ( begin, end ) ) )
+        cursor = self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + deleted_mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ? ORDER BY service_tag_id;', ( begin, end ) )
         
-        for ( service_tag_id, service_hash_ids ) in service_tag_ids_to_service_hash_ids.items():
+        for ( service_tag_id, block_of_service_hash_ids ) in IterateGroupedMappingChunks( cursor, MAX_CONTENT_CHUNK ):
             
-            for block_of_service_hash_ids in HydrusData.SplitListIntoChunks( service_hash_ids, MAX_CONTENT_CHUNK ):
-                
-                row_weight = len( block_of_service_hash_ids )
-                
-                content_update_builder.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( service_tag_id, block_of_service_hash_ids ) ), row_weight )
-                
+            row_weight = len( block_of_service_hash_ids )
+            
+            content_update_builder.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( service_tag_id, block_of_service_hash_ids ) ), row_weight )
             
         
         #
         
         ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = GenerateRepositoryTagParentsTableNames( service_id )
         
-        pairs = self._c.execute( 'SELECT child_service_tag_id, parent_service_tag_id FROM ' + current_tag_parents_table_name + ' WHERE parent_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall()
+        pairs = self._c.execute( 'SELECT child_service_tag_id, parent_service_tag_id FROM ' + current_tag_parents_table_name + ' WHERE parent_timestamp BETWEEN ? AND ?;', ( begin, end ) )
         
         for pair in pairs:
             
             content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_ADD, pair ) )
             
         
-        pairs = self._c.execute( 'SELECT child_service_tag_id, parent_service_tag_id FROM ' + deleted_tag_parents_table_name + ' WHERE parent_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall()
+        pairs = self._c.execute( 'SELECT child_service_tag_id, parent_service_tag_id FROM ' + deleted_tag_parents_table_name + ' WHERE parent_timestamp BETWEEN ? AND ?;', ( begin, end ) )
         
         for pair in pairs:
             
@@ -1842,14 +1875,14 @@ class DB( HydrusDB.HydrusDB ):
         
         ( current_tag_siblings_table_name, deleted_tag_siblings_table_name, pending_tag_siblings_table_name, petitioned_tag_siblings_table_name ) = GenerateRepositoryTagSiblingsTableNames( service_id )
         
-        pairs = self._c.execute( 'SELECT bad_service_tag_id, good_service_tag_id FROM ' + current_tag_siblings_table_name + ' WHERE sibling_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall()
+        pairs = self._c.execute( 'SELECT bad_service_tag_id, good_service_tag_id FROM ' + current_tag_siblings_table_name + ' WHERE sibling_timestamp BETWEEN ? AND ?;', ( begin, end ) )
         
         for pair in pairs:
             
             content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_ADD, pair ) )
             
         
-        pairs = self._c.execute( 'SELECT bad_service_tag_id, good_service_tag_id FROM ' + deleted_tag_siblings_table_name + ' WHERE sibling_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall()
+        pairs = self._c.execute( 'SELECT bad_service_tag_id, good_service_tag_id FROM ' + deleted_tag_siblings_table_name + ' WHERE sibling_timestamp BETWEEN ? AND ?;', ( begin, end ) )
         
         for pair in pairs:
             
@@ -55,9 +55,9 @@ class TestDaemons( unittest.TestCase ):
             
             ClientDaemons.DAEMONCheckImportFolders( HG.test_controller )
             
-            import_file = HG.test_controller.GetWrite( 'import_file' )
+            import_files = HG.test_controller.GetWrite( 'import_files' )
             
-            self.assertEqual( len( import_file ), 3 )
+            self.assertEqual( sum( ( len( file_import_jobs ) for ( ( file_import_jobs, ), kwargs ) in import_files ) ), 3 )
             
             # I need to expand tests here with the new file system
             
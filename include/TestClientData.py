@@ -1,7 +1,263 @@
+import ClientCaches
 import ClientConstants as CC
+import ClientDuplicates
 import ClientImportOptions
 import ClientImportFileSeeds
 import HydrusConstants as HC
+import HydrusData
 import HydrusExceptions
+import HydrusGlobals as HG
+import numpy
 import os
+import shutil
+import tempfile
 import unittest
+from mock import patch
+
+class TestDataCache( unittest.TestCase ):
+    
+    class _Data( object ):
+        
+        def __init__( self, footprint ):
+            
+            self._footprint = footprint
+            
+        
+        def GetEstimatedMemoryFootprint( self ):
+            
+            return self._footprint
+            
+        
+    
+    def test_lru( self ):
+        
+        data_cache = ClientCaches.DataCache( HG.test_controller, 100 )
+        
+        for i in range( 11 ):
+            
+            data_cache.AddData( i, self._Data( 10 ) )
+            
+        
+        data_cache.GetIfHasData( 0 )
+        
+        data_cache.AddData( 11, self._Data( 10 ) )
+        
+        self.assertTrue( data_cache.HasData( 0 ) )
+        self.assertFalse( data_cache.HasData( 1 ) )
+        self.assertTrue( data_cache.HasData( 2 ) )
+        
+        data_cache.DeleteData( 5 )
+        
+        self.assertEqual( data_cache.GetIfHasData( 5 ), None )
+        
+        ( num_items, total_footprint, cache_size, num_hits, num_misses, num_evictions, num_timeouts ) = data_cache.GetStats()
+        
+        self.assertEqual( ( num_items, total_footprint, num_hits, num_misses, num_evictions ), ( 10, 100, 1, 1, 1 ) )
+        
+    
+    def test_size_weighted_lru( self ):
+        
+        data_cache = ClientCaches.DataCache( HG.test_controller, 100, policy = CC.DATA_CACHE_POLICY_SIZE_WEIGHTED_LRU )
+        
+        data_cache.AddData( 'small', self._Data( 10 ) )
+        data_cache.AddData( 'big', self._Data( 95 ) )
+        data_cache.AddData( 'new', self._Data( 10 ) )
+        
+        self.assertTrue( data_cache.HasData( 'small' ) )
+        self.assertFalse( data_cache.HasData( 'big' ) )
+        
+    
+    def test_2q( self ):
+        
+        data_cache = ClientCaches.DataCache( HG.test_controller, 1000, policy = CC.DATA_CACHE_POLICY_2Q )
+        
+        for i in range( 50 ):
+            
+            data_cache.AddData( ( 'favourite', i ), self._Data( 10 ) )
+            
+        
+        # the favourites are looked at again a while after they were added
+        
+        with patch.object( HydrusData, 'GetNow', return_value = HydrusData.GetNow() + 60 ):
+            
+            for i in range( 50 ):
+                
+                data_cache.GetIfHasData( ( 'favourite', i ) )
+                
+            
+        
+        for i in range( 1000 ):
+            
+            data_cache.AddData( ( 'scroll', i ), self._Data( 10 ) )
+            
+        
+        self.assertTrue( all( ( data_cache.HasData( ( 'favourite', i ) ) for i in range( 50 ) ) ) )
+        
+        ( num_items, total_footprint, cache_size, num_hits, num_misses, num_evictions, num_timeouts ) = data_cache.GetStats()
+        
+        self.assertEqual( total_footprint, 10 * num_items )
+        self.assertTrue( total_footprint <= 1010 )
+        
+    
+class TestThumbnailPackStore( unittest.TestCase ):
+    
+    def test_store( self ):
+        
+        path = tempfile.mkdtemp()
+        
+        try:
+            
+            hashes = [ os.urandom( 32 ) for i in range( 50 ) ]
+            
+            hashes_to_packed_data = { hash : ( os.urandom( 100 + i ), ( 10 + i, 20 ), 3, i % 2 == 0 ) for ( i, hash ) in enumerate( hashes ) }
+            
+            store = ClientCaches.ThumbnailPackStore( path, ( 150, 125 ) )
+            
+            for hash in hashes:
+                
+                store.AddThumbnail( hash, hashes_to_packed_data[ hash ] )
+                
+            
+            self.assertEqual( store.GetThumbnail( hashes[0] ), hashes_to_packed_data[ hashes[0] ] )
+            
+            store.ClearThumbnails( hashes[ : 40 ] )
+            
+            self.assertEqual( store.GetThumbnail( hashes[0] ), None )
+            
+            store.AddThumbnail( hashes[1], hashes_to_packed_data[ hashes[1] ] )
+            
+            store.Close()
+            
+            # reopening replays the index, and the dead space should get compacted away
+            
+            store = ClientCaches.ThumbnailPackStore( path, ( 150, 125 ) )
+            
+            for hash in hashes:
+                
+                if hash in hashes[ 0 : 1 ] + hashes[ 2 : 40 ]:
+                    
+                    self.assertEqual( store.GetThumbnail( hash ), None )
+                    
+                else:
+                    
+                    self.assertEqual( store.GetThumbnail( hash ), hashes_to_packed_data[ hash ] )
+                    
+                
+            
+            total_pack_size = sum( ( os.path.getsize( os.path.join( path, filename ) ) for filename in os.listdir( path ) if filename.endswith( '.pack' ) ) )
+            
+            self.assertEqual( total_pack_size, sum( ( len( hashes_to_packed_data[ hash ][0] ) for hash in hashes[ 40 : ] + hashes[ 1 : 2 ] ) ) )
+            
+            store.SetThumbnailDimensions( ( 200, 200 ) )
+            
+            self.assertEqual( store.GetThumbnail( hashes[45] ), None )
+            
+            store.Close()
+            
+            # only a few packs stay open, and the stale ones are closed as others are opened
+            
+            store = ClientCaches.ThumbnailPackStore( path, ( 200, 200 ), max_open_packs = 4 )
+            
+            for hash in hashes:
+                
+                store.AddThumbnail( hash, hashes_to_packed_data[ hash ] )
+                
+                self.assertLessEqual( len( store._prefixes_to_packs ), 4 )
+                
+            
+            for hash in hashes:
+                
+                self.assertEqual( store.GetThumbnail( hash ), hashes_to_packed_data[ hash ] )
+                
+            
+            store.Close()
+            
+        finally:
+            
+            shutil.rmtree( path )
+            
+        
+    
+class TestPHashSearchIndex( unittest.TestCase ):
+    
+    def test_search( self ):
+        
+        rows = [ ( phash_id, os.urandom( 8 ) ) for phash_id in range( 1000 ) ]
+        
+        phash_search_index = ClientDuplicates.PHashSearchIndex()
+        
+        phash_search_index.AddPHashes( rows )
+        
+        self.assertEqual( phash_search_index.GetNumPHashes(), 1000 )
+        
+        ( search_phash_id, search_phash ) = rows[0]
+        
+        for max_hamming_distance in ( 0, 8, 30 ):
+            
+            expected_phash_ids = { phash_id for ( phash_id, phash ) in rows if HydrusData.Get64BitHammingDistance( search_phash, phash ) <= max_hamming_distance }
+            
+            self.assertEqual( phash_search_index.Search( [ search_phash ], max_hamming_distance ), expected_phash_ids )
+            
+        
+        phash_search_index.RemovePHashIds( [ search_phash_id ] )
+        
+        self.assertEqual( phash_search_index.GetNumPHashes(), 999 )
+        self.assertNotIn( search_phash_id, phash_search_index.Search( [ search_phash ], 0 ) )
+        
+        phash_search_index.AddPHashes( [ ( search_phash_id, search_phash ) ] )
+        phash_search_index.AddPHashes( [ ( search_phash_id, search_phash ) ] )
+        
+        self.assertEqual( phash_search_index.GetNumPHashes(), 1000 )
+        self.assertIn( search_phash_id, phash_search_index.Search( [ search_phash ], 0 ) )
+        
+    
+    def test_pairs_within_distance( self ):
+        
+        rows = [ ( phash_id, os.urandom( 8 ) ) for phash_id in range( 500 ) ]
+        
+        # some near neighbours, so there is something to find
+        
+        for ( phash_id, bit ) in zip( range( 500, 600 ), range( 100 ) ):
+            
+            ( original_phash_id, phash ) = rows[ phash_id - 500 ]
+            
+            phash_int = int( phash.encode( 'hex' ), 16 ) ^ ( 1 << ( bit % 64 ) )
+            
+            rows.append( ( phash_id, ( '%016x' % phash_int ).decode( 'hex' ) ) )
+            
+        
+        phash_search_index = ClientDuplicates.PHashSearchIndex()
+        
+        phash_search_index.AddPHashes( rows )
+        
+        ( phash_ids, phashes_array ) = phash_search_index.GetArrays()
+        
+        phash_ids_to_phashes = dict( rows )
+        
+        max_hamming_distance = 4
+        
+        sorted_bands = ClientDuplicates.GetSortedPHashBands( phashes_array, max_hamming_distance )
+        
+        for pending_phash_ids in ( set( range( 600 ) ), set( range( 0, 600, 7 ) ) ):
+            
+            expected_pairs = { frozenset( ( a, b ) ) for a in pending_phash_ids for b in range( 600 ) if a != b and HydrusData.Get64BitHammingDistance( phash_ids_to_phashes[ a ], phash_ids_to_phashes[ b ] ) <= max_hamming_distance }
+            
+            pending_mask = numpy.array( [ phash_id in pending_phash_ids for phash_id in phash_ids ], dtype = 'bool' )
+            
+            pairs = set()
+            
+            for ( band_index, num_bands, num_groups_done, num_groups, phash_pairs ) in ClientDuplicates.IteratePHashPairsWithinDistance( phash_ids, phashes_array, pending_mask, max_hamming_distance, sorted_bands = sorted_bands ):
+                
+                pairs.update( ( frozenset( pair ) for pair in phash_pairs.tolist() ) )
+                
+            
+            self.assertTrue( len( expected_pairs ) > 0 )
+            self.assertEqual( pairs, expected_pairs )
+            
+        
+        empty_phash_ids = numpy.array( [], dtype = 'int64' )
+        empty_phashes_array = numpy.array( [], dtype = 'uint64' )
+        
+        self.assertEqual( list( ClientDuplicates.IteratePHashPairsWithinDistance( empty_phash_ids, empty_phashes_array, numpy.array( [], dtype = 'bool' ), max_hamming_distance ) ), [] )
+        
+    
@@ -13,3 +13,18 @@ class TestImageHandling( unittest.TestCase ):
         
         self.assertEqual( phashes, set( [ '\xb4M\xc7\xb2M\xcb8\x1c' ] ) )
         
+    
+    def test_phash_batch( self ):
+        
+        hydrus_png_path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        muh_jpg_path = os.path.join( HC.STATIC_DIR, 'testing', 'muh_jpg.jpg' )
+        
+        paths_and_mimes = [ ( hydrus_png_path, HC.IMAGE_PNG ), ( os.path.join( HC.STATIC_DIR, 'not_a_file.png' ), HC.IMAGE_PNG ), ( muh_jpg_path, HC.IMAGE_JPEG ) ]
+        
+        all_phashes = ClientImageHandling.GenerateShapePerceptualHashesForPaths( paths_and_mimes, num_workers = 2 )
+        
+        self.assertEqual( all_phashes[0], set( [ '\xb4M\xc7\xb2M\xcb8\x1c' ] ) )
+        self.assertEqual( all_phashes[1], set() )
+        self.assertEqual( all_phashes[2], set( [ '\x90\xc1\xda_<,=\xf0' ] ) )
+        self.assertEqual( all_phashes[2], ClientImageHandling.GenerateShapePerceptualHashes( muh_jpg_path, HC.IMAGE_JPEG ) )
+        
@@ -8,15 +8,21 @@ import ClientNetworkingLogin
 import ClientNetworkingSessions
 import ClientServices
 import collections
+import cPickle
 import HydrusConstants as HC
 import HydrusData
 import HydrusExceptions
 import HydrusNetworking
+import HydrusPaths
+import HydrusSerialisable
 import os
+import requests
+import socket
 import TestConstants
 import threading
 import time
 import unittest
+import urllib3
 import HydrusGlobals as HG
 from httmock import all_requests, urlmatch, HTTMock, response
 from mock import patch
@@ -315,7 +321,7 @@ class TestNetworkingEngine( unittest.TestCase ):
                 time.sleep( 0.1 )
                 
                 self.assertEqual( len( engine._jobs_awaiting_validity ), 0 )
-                self.assertEqual( len( engine._jobs_awaiting_bandwidth ), 0 )
+                self.assertEqual( len( engine._network_contexts_to_jobs_awaiting_bandwidth ), 0 )
                 self.assertEqual( len( engine._jobs_awaiting_login ), 0 )
                 self.assertEqual( len( engine._jobs_awaiting_slot ), 0 )
                 self.assertEqual( len( engine._jobs_running ), 0 )
@@ -327,11 +333,80 @@ class TestNetworkingEngine( unittest.TestCase ):
         engine.Shutdown()
         
     
+    def test_engine_bandwidth_queue( self ):
+        
+        mock_controller = TestConstants.MockController()
+        bandwidth_manager = ClientNetworkingBandwidth.NetworkBandwidthManager()
+        session_manager = ClientNetworkingSessions.NetworkSessionManager()
+        domain_manager = ClientNetworkingDomain.NetworkDomainManager()
+        login_manager = ClientNetworkingLogin.NetworkLoginManager()
+        
+        engine = ClientNetworking.NetworkEngine( mock_controller, bandwidth_manager, session_manager, domain_manager, login_manager )
+        
+        RESTRICTIVE_REQUEST_RULES = HydrusNetworking.BandwidthRules()
+        
+        RESTRICTIVE_REQUEST_RULES.AddRule( HC.BANDWIDTH_TYPE_REQUESTS, 86400, 1 )
+        
+        DOMAIN_NETWORK_CONTEXT = ClientNetworkingContexts.NetworkContext( CC.NETWORK_CONTEXT_DOMAIN, MOCK_DOMAIN )
+        
+        bandwidth_manager.SetRules( DOMAIN_NETWORK_CONTEXT, RESTRICTIVE_REQUEST_RULES )
+        
+        mock_controller.CallToThread( engine.MainLoop )
+        
+        #
+        
+        with HTTMock( catch_all ):
+            
+            with HTTMock( catch_wew_ok ):
+                
+                jobs = [ ClientNetworkingJobs.NetworkJob( 'GET', MOCK_URL ) for i in range( 3 ) ]
+                
+                for job in jobs:
+                    
+                    engine.AddJob( job )
+                    
+                
+                time.sleep( 0.2 )
+                
+                self.assertTrue( jobs[0].IsDone() )
+                self.assertFalse( jobs[1].IsDone() )
+                self.assertFalse( jobs[2].IsDone() )
+                
+                self.assertEqual( [ len( queue ) for queue in engine._network_contexts_to_jobs_awaiting_bandwidth.values() ], [ 2 ] )
+                self.assertTrue( min( engine._network_contexts_to_bandwidth_check_times.values() ) > time.time() )
+                
+                ( domain, num_waiting, num_running, average_latency, max_latency ) = engine.GetSchedulingStats()[0]
+                
+                self.assertEqual( domain, MOCK_DOMAIN )
+                self.assertEqual( num_waiting, 2 )
+                self.assertEqual( num_running, 0 )
+                self.assertTrue( max_latency < 0.2 )
+                
+                jobs[1].OverrideBandwidth()
+                
+                time.sleep( 0.2 )
+                
+                self.assertTrue( jobs[1].IsDone() )
+                self.assertFalse( jobs[2].IsDone() )
+                
+                jobs[2].Cancel()
+                
+                time.sleep( 0.2 )
+                
+                self.assertEqual( len( engine._network_contexts_to_jobs_awaiting_bandwidth ), 0 )
+                
+            
+        
+        #
+        
+        engine.Shutdown()
+        
+    
 class TestNetworkingJob( unittest.TestCase ):
     
-    def _GetJob( self, for_login = False ):
+    def _GetJob( self, for_login = False, temp_path = None ):
         
-        job = ClientNetworkingJobs.NetworkJob( 'GET', MOCK_URL )
+        job = ClientNetworkingJobs.NetworkJob( 'GET', MOCK_URL, temp_path = temp_path )
         
         job.SetForLogin( for_login )
         
@@ -536,6 +611,117 @@ class TestNetworkingJob( unittest.TestCase ):
         pass
         
     
+    def test_resume_download( self ):
+        
+        requests_headers = []
+        
+        @urlmatch( netloc = 'wew.lad' )
+        def catch_wew_broken_then_resume( url, request ):
+            
+            requests_headers.append( dict( request.headers ) )
+            
+            if len( requests_headers ) == 1:
+                
+                # says 256KB but breaks after the first 64KB
+                return response( 200, LONG_GOOD_RESPONSE[ : 65536 ], { 'Accept-Ranges' : 'bytes', 'ETag' : '"muh_etag"', 'content-length' : str( len( LONG_GOOD_RESPONSE ) ) }, 'OK' )
+                
+            else:
+                
+                remainder = LONG_GOOD_RESPONSE[ 65536 : ]
+                
+                return response( 206, remainder, { 'Content-Range' : 'bytes 65536-' + str( len( LONG_GOOD_RESPONSE ) - 1 ) + '/' + str( len( LONG_GOOD_RESPONSE ) ), 'content-length' : str( len( remainder ) ) }, 'Partial Content' )
+                
+            
+        
+        ( os_file_handle, temp_path ) = HydrusPaths.GetTempPath()
+        
+        try:
+            
+            with HTTMock( catch_all ):
+                
+                with HTTMock( catch_wew_broken_then_resume ):
+                    
+                    job = self._GetJob( temp_path = temp_path )
+                    
+                    job.Start()
+                    
+                    self.assertFalse( job.HasError() )
+                    
+                
+            
+            self.assertEqual( len( requests_headers ), 2 )
+            
+            self.assertNotIn( 'Range', requests_headers[0] )
+            self.assertEqual( requests_headers[1][ 'Range' ], 'bytes=65536-' )
+            self.assertEqual( requests_headers[1][ 'If-Range' ], '"muh_etag"' )
+            
+            with open( temp_path, 'rb' ) as f:
+                
+                self.assertEqual( f.read(), LONG_GOOD_RESPONSE )
+                
+            
+            self.assertEqual( job.GetBytesSavedByResuming(), 65536 )
+            self.assertEqual( job.engine.bandwidth_manager.GetDataSavedByResuming( ClientNetworkingContexts.GLOBAL_NETWORK_CONTEXT ), 65536 )
+            
+        finally:
+            
+            HydrusPaths.CleanUpTempPath( os_file_handle, temp_path )
+            
+        
+    
+    def test_resume_download_not_when_encoded( self ):
+        
+        requests_headers = []
+        
+        @urlmatch( netloc = 'wew.lad' )
+        def catch_wew_broken_then_whole( url, request ):
+            
+            requests_headers.append( dict( request.headers ) )
+            
+            if len( requests_headers ) == 1:
+                
+                # our partial file would be decoded bytes, which do not line up with ranges of the gzipped body
+                return response( 200, LONG_GOOD_RESPONSE[ : 65536 ], { 'Accept-Ranges' : 'bytes', 'ETag' : '"muh_etag"', 'Content-Encoding' : 'gzip', 'content-length' : str( len( LONG_GOOD_RESPONSE ) ) }, 'OK' )
+                
+            else:
+                
+                return response( 200, LONG_GOOD_RESPONSE, { 'content-length' : str( len( LONG_GOOD_RESPONSE ) ) }, 'OK' )
+                
+            
+        
+        ( os_file_handle, temp_path ) = HydrusPaths.GetTempPath()
+        
+        try:
+            
+            with HTTMock( catch_all ):
+                
+                with HTTMock( catch_wew_broken_then_whole ):
+                    
+                    job = self._GetJob( temp_path = temp_path )
+                    
+                    job.Start()
+                    
+                    self.assertFalse( job.HasError() )
+                    
+                
+            
+            self.assertEqual( len( requests_headers ), 2 )
+            
+            self.assertNotIn( 'Range', requests_headers[1] )
+            
+            with open( temp_path, 'rb' ) as f:
+                
+                self.assertEqual( f.read(), LONG_GOOD_RESPONSE )
+                
+            
+            self.assertEqual( job.GetBytesSavedByResuming(), 0 )
+            
+        finally:
+            
+            HydrusPaths.CleanUpTempPath( os_file_handle, temp_path )
+            
+        
+    
 class TestNetworkingJobHydrus( unittest.TestCase ):
     
     def _GetJob( self, for_login = False ):
@@ -691,3 +877,186 @@ class TestNetworkingJobHydrus( unittest.TestCase ):
         pass
         
     
+class TestNetworkSessionManager( unittest.TestCase ):
+    
+    def test_connection_stats( self ):
+        
+        session_manager = ClientNetworkingSessions.NetworkSessionManager()
+        
+        subdomain_network_context = ClientNetworkingContexts.NetworkContext( CC.NETWORK_CONTEXT_DOMAIN, MOCK_SUBDOMAIN )
+        
+        session_manager.ReportConnectionUsed( subdomain_network_context, False, 0.5 )
+        session_manager.ReportConnectionUsed( subdomain_network_context, True, 0.0 )
+        session_manager.ReportConnectionUsed( subdomain_network_context, False, 0.3 )
+        
+        ( ( network_context, num_requests, num_reused, average_setup_time ), ) = session_manager.GetConnectionStats()
+        
+        self.assertEqual( network_context, ClientNetworkingContexts.NetworkContext( CC.NETWORK_CONTEXT_DOMAIN, MOCK_DOMAIN ) )
+        self.assertEqual( ( num_requests, num_reused ), ( 3, 1 ) )
+        self.assertAlmostEqual( average_setup_time, 0.4 )
+        
+        session_manager.ReportConnectionUsed( ClientNetworkingContexts.GLOBAL_NETWORK_CONTEXT, True, 0.0 )
+        
+        self.assertIn( ( ClientNetworkingContexts.GLOBAL_NETWORK_CONTEXT, 1, 1, None ), session_manager.GetConnectionStats() )
+        
+    
+    def test_dns_cache( self ):
+        
+        dns_cache = ClientNetworkingSessions.DNSCache()
+        
+        now = HydrusData.GetNow()
+        
+        first_results = [ ( socket.AF_INET, socket.SOCK_STREAM, 6, '', ( '10.0.0.1', 80 ) ) ]
+        second_results = [ ( socket.AF_INET, socket.SOCK_STREAM, 6, '', ( '10.0.0.2', 80 ) ) ]
+        
+        with patch.object( socket, 'getaddrinfo', return_value = first_results ) as getaddrinfo:
+            
+            with patch.object( HydrusData, 'GetNow', return_value = now ):
+                
+                self.assertEqual( dns_cache.GetAddress( MOCK_DOMAIN, 80 ), '10.0.0.1' )
+                self.assertEqual( dns_cache.GetAddress( MOCK_DOMAIN, 80 ), '10.0.0.1' )
+                
+                self.assertEqual( getaddrinfo.call_count, 1 )
+                
+            
+            getaddrinfo.return_value = second_results
+            
+            with patch.object( HydrusData, 'GetNow', return_value = now + 299 ):
+                
+                self.assertEqual( dns_cache.GetAddress( MOCK_DOMAIN, 80 ), '10.0.0.1' )
+                
+            
+            with patch.object( HydrusData, 'GetNow', return_value = now + 301 ):
+                
+                self.assertEqual( dns_cache.GetAddress( MOCK_DOMAIN, 80 ), '10.0.0.2' )
+                
+                self.assertEqual( getaddrinfo.call_count, 2 )
+                
+            
+            dns_cache.SetCachePeriod( 0 )
+            
+            self.assertEqual( dns_cache.GetAddress( MOCK_DOMAIN, 80 ), MOCK_DOMAIN )
+            
+            self.assertEqual( getaddrinfo.call_count, 2 )
+            
+        
+        dns_cache.SetCachePeriod( 300 )
+        
+        with patch.object( socket, 'getaddrinfo', side_effect = socket.gaierror( 'no such host' ) ):
+            
+            self.assertEqual( dns_cache.GetAddress( MOCK_DOMAIN, 80 ), MOCK_DOMAIN )
+            
+        
+    
+    def test_dns_cache_stale_fallback( self ):
+        
+        dns_cache = ClientNetworkingSessions.DNSCache()
+        
+        hosts_tried = []
+        
+        def new_conn( connection ):
+            
+            hosts_tried.append( connection._dns_host )
+            
+            if connection._dns_host == '10.0.0.1':
+                
+                raise urllib3.exceptions.NewConnectionError( connection, 'connection refused' )
+                
+            
+            return 'socket'
+            
+        
+        results = [ ( socket.AF_INET, socket.SOCK_STREAM, 6, '', ( '10.0.0.1', 80 ) ) ]
+        
+        with patch.object( ClientNetworkingSessions, 'DNS_CACHE', dns_cache ):
+            
+            with patch.object( socket, 'getaddrinfo', return_value = results ):
+                
+                self.assertEqual( dns_cache.GetAddress( MOCK_DOMAIN, 80 ), '10.0.0.1' )
+                
+            
+            with patch.object( urllib3.connection.HTTPConnection, '_new_conn', new_conn ):
+                
+                connection = ClientNetworkingSessions.NetworkHTTPConnection( MOCK_DOMAIN, 80 )
+                
+                self.assertEqual( connection._new_conn(), 'socket' )
+                
+            
+            self.assertEqual( hosts_tried, [ '10.0.0.1', MOCK_DOMAIN ] )
+            self.assertEqual( connection._dns_host, MOCK_DOMAIN )
+            
+            # the stale address was dropped, so the next connection looks it up again
+            
+            with patch.object( socket, 'getaddrinfo', return_value = [] ) as getaddrinfo:
+                
+                self.assertEqual( dns_cache.GetAddress( MOCK_DOMAIN, 80 ), MOCK_DOMAIN )
+                
+                self.assertEqual( getaddrinfo.call_count, 1 )
+                
+            
+        
+    
+    def test_pickle_compatibility( self ):
+        
+        session_manager = ClientNetworkingSessions.NetworkSessionManager()
+        
+        session = session_manager.GetSessionForDomain( MOCK_DOMAIN )
+        
+        self.assertIsInstance( session.get_adapter( 'https://' ), ClientNetworkingSessions.NetworkHTTPAdapter )
+        
+        # a session saved with our adapter has to load in a client that does not have it
+        
+        loaded_session = cPickle.loads( cPickle.dumps( session ) )
+        
+        for prefix in ( 'https://', 'http://' ):
+            
+            adapter = loaded_session.get_adapter( prefix )
+            
+            self.assertIs( type( adapter ), requests.adapters.HTTPAdapter )
+            self.assertEqual( adapter._pool_maxsize, session.get_adapter( prefix )._pool_maxsize )
+            
+        
+        loaded_session_manager = HydrusSerialisable.CreateFromSerialisableTuple( session_manager.GetSerialisableTuple() )
+        
+        loaded_session = loaded_session_manager.GetSessionForDomain( MOCK_DOMAIN )
+        
+        self.assertIsInstance( loaded_session.get_adapter( 'https://' ), ClientNetworkingSessions.NetworkHTTPAdapter )
+        self.assertIsInstance( loaded_session.get_adapter( 'http://' ), ClientNetworkingSessions.NetworkHTTPAdapter )
+        
+    
+    def test_pool_size( self ):
+        
+        new_options = HG.client_controller.new_options
+        
+        old_max_network_jobs_per_domain = new_options.GetInteger( 'max_network_jobs_per_domain' )
+        
+        try:
+            
+            new_options.SetInteger( 'max_network_jobs_per_domain', 5 )
+            
+            session_manager = ClientNetworkingSessions.NetworkSessionManager()
+            
+            session = session_manager.GetSessionForDomain( MOCK_DOMAIN )
+            
+            self.assertEqual( session.get_adapter( 'https://' )._pool_maxsize, 5 )
+            self.assertEqual( session.get_adapter( 'http://' )._pool_maxsize, 5 )
+            
+            adapter = session.get_adapter( 'https://' )
+            
+            self.assertIs( session_manager.GetSessionForDomain( MOCK_DOMAIN ).get_adapter( 'https://' ), adapter )
+            
+            new_options.SetInteger( 'max_network_jobs_per_domain', 2 )
+            
+            session_manager.Reinitialise()
+            
+            session = session_manager.GetSessionForDomain( MOCK_DOMAIN )
+            
+            self.assertEqual( session.get_adapter( 'https://' )._pool_maxsize, 2 )
+            self.assertEqual( session.get_adapter( 'http://' )._pool_maxsize, 2 )
+            
+        finally:
+            
+            new_options.SetInteger( 'max_network_jobs_per_domain', old_max_network_jobs_per_domain )
+            
+        
+    
@@ -0,0 +1,152 @@
+import ClientDefaults
+import ClientParsing
+import ClientPaths
+import HydrusConstants as HC
+from mock import patch
+import os
+import unittest
+
+SNIPPET = '''<html>
+<body>
+<div class="thumb wide" id="first"><a href="/1" rel="nofollow next">one</a></div>
+<div class="tag dropdown"><a href="/2">two</a></div>
+<div rel="next"><a href="/3">three</a></div>
+<table><tr><td><a href="/4"><!-- comment --><span></span>four</a></td></tr></table>
+<link rel="next alternate" href="/5">
+</body>
+</html>'''
+
+class TestParsing( unittest.TestCase ):
+    
+    def _GetFormula( self, tag_rules, content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE ):
+        
+        return ClientParsing.ParseFormulaHTML( tag_rules = tag_rules, content_to_fetch = content_to_fetch, attribute_to_fetch = 'href' )
+        
+    
+    def _TestFormulaParsesSame( self, formula, html, expected_result = None ):
+        
+        self.assertTrue( formula.CanParseWithLXML() )
+        
+        soup_result = formula.ParseSoup( ClientParsing.GetSoup( html ) )
+        lxml_result = formula.ParseLXMLTree( ClientParsing.GetLXMLTree( html ) )
+        
+        self.assertEqual( soup_result, lxml_result )
+        
+        if expected_result is not None:
+            
+            self.assertEqual( lxml_result, expected_result )
+            
+        
+    
+    def test_fast_html_parsing_default_parsers( self ):
+        
+        # the default parsers are read from pngs through a temp path, which otherwise needs the client's options
+        
+        with patch.object( ClientPaths, 'GetTempPathOverride', return_value = None ):
+            
+            page_parsers = ClientDefaults.GetDefaultParsers()
+            
+        
+        self.assertGreater( len( page_parsers ), 0 )
+        
+        formulae = ClientParsing.GetHTMLFormulaeFromPageParsers( page_parsers )
+        
+        fast_formulae = [ formula for formula in formulae if formula.CanParseWithLXML() ]
+        
+        self.assertGreater( len( fast_formulae ), 0 )
+        
+        for filename in ( 'muh_booru_file_page.html', 'muh_booru_gallery_page.html' ):
+            
+            with open( os.path.join( HC.STATIC_DIR, 'testing', filename ), 'rb' ) as f:
+                
+                html = f.read().decode( 'utf-8' )
+                
+            
+            self.assertTrue( ClientParsing.CanParseHTMLWithLXML( html ) )
+            
+            soup = ClientParsing.GetSoup( html )
+            lxml_tree = ClientParsing.GetLXMLTree( html )
+            
+            num_with_results = 0
+            
+            for formula in fast_formulae:
+                
+                soup_result = formula.ParseSoup( soup )
+                lxml_result = formula.ParseLXMLTree( lxml_tree )
+                
+                self.assertEqual( soup_result, lxml_result )
+                
+                if len( lxml_result ) > 0:
+                    
+                    num_with_results += 1
+                    
+                
+            
+            self.assertGreater( num_with_results, 0 )
+            
+        
+    
+    def test_fast_html_parsing_rules( self ):
+        
+        # multi-valued attributes match on any of their values, or all of them exactly
+        
+        formula = self._GetFormula( [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_attributes = { 'class' : 'thumb' } ), ClientParsing.ParseRuleHTML( tag_name = 'a' ) ] )
+        
+        self._TestFormulaParsesSame( formula, SNIPPET, [ '/1' ] )
+        
+        formula = self._GetFormula( [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_attributes = { 'class' : 'tag dropdown' } ), ClientParsing.ParseRuleHTML( tag_name = 'a' ) ] )
+        
+        self._TestFormulaParsesSame( formula, SNIPPET, [ '/2' ] )
+        
+        # rel is only multi-valued on some tags
+        
+        formula = self._GetFormula( [ ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_attributes = { 'rel' : 'next' } ) ] )
+        
+        self._TestFormulaParsesSame( formula, SNIPPET, [ '/1', '/5' ] )
+        
+        formula = self._GetFormula( [ ClientParsing.ParseRuleHTML( tag_attributes = { 'rel' : 'next' }, tag_name = 'div' ), ClientParsing.ParseRuleHTML( tag_name = 'a' ) ] )
+        
+        self._TestFormulaParsesSame( formula, SNIPPET, [ '/3' ] )
+        
+        # indices, ascending and strings
+        
+        formula = self._GetFormula( [ ClientParsing.ParseRuleHTML( tag_name = 'a', tag_index = 2 ) ] )
+        
+        self._TestFormulaParsesSame( formula, SNIPPET, [ '/3' ] )
+        
+        formula = self._GetFormula( [ ClientParsing.ParseRuleHTML( tag_name = 'span' ), ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_ASCENDING, tag_name = 'a' ) ] )
+        
+        self._TestFormulaParsesSame( formula, SNIPPET, [ '/4' ] )
+        
+        formula = self._GetFormula( [ ClientParsing.ParseRuleHTML( tag_name = 'td' ) ], content_to_fetch = ClientParsing.HTML_CONTENT_STRING )
+        
+        self._TestFormulaParsesSame( formula, SNIPPET, [ 'four' ] )
+        
+        string_match = ClientParsing.StringMatch( match_type = ClientParsing.STRING_MATCH_FIXED, match_value = 'three' )
+        
+        formula = self._GetFormula( [ ClientParsing.ParseRuleHTML( tag_name = 'a', should_test_tag_string = True, tag_string_string_match = string_match ) ] )
+        
+        self._TestFormulaParsesSame( formula, SNIPPET, [ '/3' ] )
+        
+        # things lxml cannot do the same as html5lib
+        
+        formula = self._GetFormula( [ ClientParsing.ParseRuleHTML( tag_name = 'tbody' ), ClientParsing.ParseRuleHTML( tag_name = 'a' ) ] )
+        
+        self.assertFalse( formula.CanParseWithLXML() )
+        
+        formula = self._GetFormula( [ ClientParsing.ParseRuleHTML( tag_name = 'a' ) ], content_to_fetch = ClientParsing.HTML_CONTENT_HTML )
+        
+        self.assertFalse( formula.CanParseWithLXML() )
+        
+        # bytes with no declared charset are decoded the same way for both
+        
+        formula = self._GetFormula( [ ClientParsing.ParseRuleHTML( tag_name = 'p' ) ], content_to_fetch = ClientParsing.HTML_CONTENT_STRING )
+        
+        self._TestFormulaParsesSame( formula, u'<html><body><p>caf\xe9 \u2014 \u65e5\u672c</p></body></html>'.encode( 'utf-8' ), [ u'caf\xe9 \u2014 \u65e5\u672c' ] )
+        self._TestFormulaParsesSame( formula, u'<html><body><p>\u201ccaf\xe9\u201d</p></body></html>'.encode( 'windows-1252' ), [ u'\u201ccaf\xe9\u201d' ] )
+        self._TestFormulaParsesSame( formula, u'<html><head><meta charset="shift_jis"></head><body><p>\u65e5\u672c</p></body></html>'.encode( 'shift_jis' ), [ u'\u65e5\u672c' ] )
+        
+        self.assertTrue( ClientParsing.CanParseHTMLWithLXML( SNIPPET ) )
+        self.assertFalse( ClientParsing.CanParseHTMLWithLXML( 'some text and <a href="/1">a link</a>' ) )
+        
+    
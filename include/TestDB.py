@@ -11,12 +11,14 @@ import ClientImporting
 import ClientImportLocal
 import ClientImportOptions
 import ClientImportFileSeeds
+import ClientMedia
 import ClientRatings
 import ClientSearch
 import ClientServices
 import collections
 import HydrusConstants as HC
 import HydrusData
+import HydrusDB
 import HydrusExceptions
 import HydrusVideoHandling
 import HydrusGlobals as HG
@@ -790,6 +792,44 @@ class TestClientDB( unittest.TestCase ):
             
         
     
+    def test_import_files( self ):
+        
+        TestClientDB._clear_db()
+        
+        file_import_jobs = []
+        
+        for filename in ( 'muh_jpg.jpg', 'muh_png.png', 'muh_jpg.jpg' ):
+            
+            path = os.path.join( HC.STATIC_DIR, 'testing', filename )
+            
+            file_import_job = ClientImportFileSeeds.FileImportJob( path )
+            
+            file_import_job.GenerateHashAndStatus()
+            
+            file_import_job.GenerateInfo()
+            
+            file_import_jobs.append( file_import_job )
+            
+        
+        statuses_and_notes = self._write( 'import_files', file_import_jobs )
+        
+        statuses = [ status for ( status, note ) in statuses_and_notes ]
+        
+        self.assertEqual( statuses, [ CC.STATUS_SUCCESSFUL_AND_NEW, CC.STATUS_SUCCESSFUL_AND_NEW, CC.STATUS_SUCCESSFUL_BUT_REDUNDANT ] )
+        
+        hashes = [ file_import_job.GetHash() for file_import_job in file_import_jobs[:2] ]
+        
+        media_results = self._read( 'media_results', hashes )
+        
+        self.assertEqual( { media_result.GetHash() for media_result in media_results }, set( hashes ) )
+        self.assertEqual( { media_result.GetMime() for media_result in media_results }, { HC.IMAGE_JPEG, HC.IMAGE_PNG } )
+        
+        for media_result in media_results:
+            
+            self.assertTrue( media_result.GetLocationsManager().GetInbox() )
+            
+        
+    
     def test_import_folders( self ):
         
         import_folder_1 = ClientImportLocal.ImportFolder( 'imp 1', path = TestConstants.DB_DIR, mimes = HC.VIDEO, publish_files_to_popup_button = False )
@@ -898,6 +938,49 @@ class TestClientDB( unittest.TestCase ):
         self.assertEqual( ( status, hash ), ( CC.STATUS_DELETED, hash ) )
         
     
+    def test_keyframe_timestamps( self ):
+        
+        path = os.path.join( HC.STATIC_DIR, 'testing', 'muh_webm.webm' )
+        
+        keyframe_timestamps = HydrusVideoHandling.GetFFMPEGKeyframeTimestamps( path )
+        
+        self.assertEqual( keyframe_timestamps[0], 0 )
+        self.assertEqual( keyframe_timestamps, sorted( keyframe_timestamps ) )
+        
+        hash = HydrusData.GenerateKey()
+        
+        self.assertEqual( self._read( 'keyframe_timestamps', hash ), None )
+        
+        self._write( 'keyframe_timestamps', hash, keyframe_timestamps )
+        
+        self.assertEqual( self._read( 'keyframe_timestamps', hash ), keyframe_timestamps )
+        
+        #
+        
+        TestClientDB._clear_db()
+        
+        file_import_job = ClientImportFileSeeds.FileImportJob( path )
+        
+        file_import_job.GenerateHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        hash = file_import_job.GetHash()
+        
+        self._write( 'keyframe_timestamps', hash, keyframe_timestamps )
+        
+        for service_key in ( CC.LOCAL_FILE_SERVICE_KEY, CC.TRASH_SERVICE_KEY ):
+            
+            content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, ( hash, ) )
+            
+            self._write( 'content_updates', { service_key : ( content_update, ) } )
+            
+        
+        self.assertEqual( self._read( 'keyframe_timestamps', hash ), None )
+        
+    
     def test_media_results( self ):
         
         TestClientDB._clear_db()
@@ -958,6 +1041,153 @@ class TestClientDB( unittest.TestCase ):
         self.assertEqual( mr_num_frames, None )
         self.assertEqual( mr_num_words, None )
         
+        ( ( pd_file_info_manager, pd_inbox, pd_current_to_timestamps ), ) = self._read( 'media_result_placeholder_data', ( 1, ) )
+        
+        self.assertEqual( pd_file_info_manager.ToTuple(), mr_file_info_manager.ToTuple() )
+        self.assertEqual( pd_inbox, True )
+        self.assertEqual( pd_current_to_timestamps[ CC.LOCAL_FILE_SERVICE_KEY ], mr_locations_manager.GetTimestamp( CC.LOCAL_FILE_SERVICE_KEY ) )
+        
+        pager = ClientMedia.MediaResultPager()
+        
+        placeholders = pager.AddPlaceholderData( self._read( 'media_result_placeholder_data', ( 1, ) ) )
+        
+        HG.test_controller.SetRead( 'media_results_from_ids', self._read( 'media_results_from_ids', ( 1, ) ) )
+        
+        collection = ClientMedia.MediaCollection( CC.LOCAL_FILE_SERVICE_KEY, placeholders )
+        
+        ClientMedia.ReleaseMediaResultPlaceholders( [ collection ] )
+        
+        self.assertTrue( ClientMedia.HasUnloadedMediaResultPlaceholders( [ collection ] ) )
+        
+        # the tests run on the gui thread, which never loads from an accessor
+        
+        self.assertEqual( placeholders[0].GetTagsManager().GetCurrent(), set() )
+        self.assertEqual( placeholders[0].GetLocationsManager().GetCurrent(), mr_locations_manager.GetCurrent() )
+        self.assertEqual( ClientData.GetMediasTagCount( [ collection ] )[0], collections.Counter() )
+        
+        self.assertTrue( ClientMedia.HasUnloadedMediaResultPlaceholders( [ collection ] ) )
+        
+        ClientMedia.LoadMediaResultPlaceholders( [ collection ] )
+        
+        self.assertFalse( ClientMedia.HasUnloadedMediaResultPlaceholders( [ collection ] ) )
+        self.assertEqual( placeholders[0].GetLoadedMediaResult().GetHashId(), 1 )
+        
+        ClientMedia.ReleaseMediaResultPlaceholders( [ collection ] )
+        
+        self.assertEqual( pager.LoadPage( placeholders[0] ).GetHashId(), 1 )
+        
+        size_asc = ClientMedia.MediaSort( ( 'system', CC.SORT_FILES_BY_FILESIZE ), CC.SORT_ASC )
+        size_desc = ClientMedia.MediaSort( ( 'system', CC.SORT_FILES_BY_FILESIZE ), CC.SORT_DESC )
+        import_time_asc = ClientMedia.MediaSort( ( 'system', CC.SORT_FILES_BY_IMPORT_TIME ), CC.SORT_ASC )
+        
+        self.assertEqual( self._read( 'sorted_hash_ids', CC.LOCAL_FILE_SERVICE_KEY, ( 1, 12345 ), ( size_asc, import_time_asc ) ), [ 12345, 1 ] )
+        self.assertEqual( self._read( 'sorted_hash_ids', CC.LOCAL_FILE_SERVICE_KEY, ( 1, 12345 ), ( size_desc, import_time_asc ) ), [ 1, 12345 ] )
+        self.assertEqual( self._read( 'sorted_hash_ids', CC.LOCAL_FILE_SERVICE_KEY, ( 12345, 1 ), ( import_time_asc, size_asc ) ), [ 12345, 1 ] )
+        
+        for ( name, num_media_results, time_took ) in self._read( 'media_results_benchmark', 10 ):
+            
+            self.assertEqual( num_media_results, 1 )
+            
+        
+    
+    def test_media_results_order( self ):
+        
+        TestClientDB._clear_db()
+        
+        hash_ids = []
+        
+        for filename in ( 'hydrus.png', 'hydrus_small.png', 'hydrus_32.png' ):
+            
+            path = os.path.join( HC.STATIC_DIR, filename )
+            
+            file_import_job = ClientImportFileSeeds.FileImportJob( path )
+            
+            file_import_job.GenerateHashAndStatus()
+            
+            file_import_job.GenerateInfo()
+            
+            self._write( 'import_file', file_import_job )
+            
+            ( media_result, ) = self._read( 'media_results', ( file_import_job.GetHash(), ) )
+            
+            hash_ids.append( media_result.GetHashId() )
+            
+        
+        # hold one result so it comes out of the weakref cache while the others are loaded fresh
+        
+        ( cached_media_result, ) = self._read( 'media_results_from_ids', ( hash_ids[0], ) )
+        
+        size_asc = ClientMedia.MediaSort( ( 'system', CC.SORT_FILES_BY_FILESIZE ), CC.SORT_ASC )
+        size_desc = ClientMedia.MediaSort( ( 'system', CC.SORT_FILES_BY_FILESIZE ), CC.SORT_DESC )
+        
+        for media_sort in ( size_asc, size_desc ):
+            
+            sorted_hash_ids = self._read( 'sorted_hash_ids', CC.LOCAL_FILE_SERVICE_KEY, hash_ids, ( media_sort, ) )
+            
+            media_results = self._read( 'media_results_from_ids', sorted_hash_ids )
+            
+            self.assertEqual( [ media_result.GetHashId() for media_result in media_results ], sorted_hash_ids )
+            
+            sizes = [ media_result.GetSize() for media_result in media_results ]
+            
+            self.assertEqual( sizes, sorted( sizes, reverse = media_sort is size_desc ) )
+            
+        
+        self.assertEqual( cached_media_result.GetHashId(), hash_ids[0] )
+        
+    
+    def test_media_result_summaries( self ):
+        
+        TestClientDB._clear_db()
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        file_import_job = ClientImportFileSeeds.FileImportJob( path )
+        
+        file_import_job.GenerateHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        hash = file_import_job.GetHash()
+        
+        def get_comparable_media_result():
+            
+            ( media_result, ) = self._read( 'media_results_from_ids', ( 1, ) )
+            
+            ( file_info_manager, tags_manager, locations_manager, ratings_manager ) = media_result.ToTuple()
+            
+            return ( file_info_manager.ToTuple(), locations_manager.GetCurrent(), locations_manager.GetDeleted(), locations_manager.GetURLs(), locations_manager.GetTimestamp( CC.LOCAL_FILE_SERVICE_KEY ) )
+            
+        
+        normal_media_result = get_comparable_media_result()
+        
+        new_options = self._read( 'serialisable', HydrusSerialisable.SERIALISABLE_TYPE_CLIENT_OPTIONS )
+        
+        new_options.SetBoolean( 'db_cache_media_result_summaries', True )
+        
+        self._write( 'serialisable', new_options )
+        
+        # the first read fills the summary, the second reads it back
+        
+        self.assertEqual( get_comparable_media_result(), normal_media_result )
+        self.assertEqual( get_comparable_media_result(), normal_media_result )
+        
+        url = 'http://example.com/muh_file'
+        
+        service_keys_to_content_updates = { CC.COMBINED_LOCAL_FILE_SERVICE_KEY : ( HydrusData.ContentUpdate( HC.CONTENT_TYPE_URLS, HC.CONTENT_UPDATE_ADD, ( ( url, ), ( hash, ) ) ), ) }
+        
+        self._write( 'content_updates', service_keys_to_content_updates )
+        
+        self.assertEqual( get_comparable_media_result()[3], { url } )
+        
+        new_options.SetBoolean( 'db_cache_media_result_summaries', False )
+        
+        self._write( 'serialisable', new_options )
+        
+        self.assertEqual( get_comparable_media_result()[3], { url } )
+        
     
     def test_tag_censorship( self ):
         
@@ -1051,6 +1281,39 @@ class TestClientDB( unittest.TestCase ):
         self.assertTrue( result, ( pixiv_id, password ) )
         
     
+    def test_read_connections( self ):
+        
+        ( db, c ) = self._db._InitReadCursor()
+        
+        try:
+            
+            ( num_hashes, ) = c.execute( 'SELECT COUNT( * ) FROM hashes;' ).fetchone()
+            
+            with HydrusDB.TemporaryIntegerTable( c, range( 10 ), 'hash_id' ) as temp_table_name:
+                
+                self.assertEqual( c.execute( 'SELECT COUNT( * ) FROM ' + temp_table_name + ';' ).fetchone(), ( 10, ) )
+                
+            
+            with self.assertRaises( sqlite3.DatabaseError ) as context:
+                
+                c.execute( 'INSERT INTO hashes ( hash ) VALUES ( ? );', ( sqlite3.Binary( os.urandom( 32 ) ), ) )
+                
+            
+            self.assertIn( 'not authorized', str( context.exception ) )
+            
+            job = HydrusData.JobDatabase( 'read', True, 'media_results_from_ids', ( 1, ) )
+            
+            self._db._ProcessConcurrentReadJob( c, job )
+            
+            job.GetResult()
+            
+        finally:
+            
+            c.close()
+            db.close()
+            
+        
+    
     def test_repo_downloads( self ):
         
         result = self._read( 'downloads' )
@@ -1297,6 +1560,117 @@ class TestServerDB( unittest.TestCase ):
         self._admin_account_key = result
         
     
+    def _test_repository_updates( self ):
+        
+        admin_account = self._read( 'account', HC.SERVER_ADMIN_KEY, self._admin_account_key )
+        
+        tag_service_key = HydrusData.GenerateKey()
+        
+        services = self._read( 'services' )
+        
+        services.append( HydrusNetwork.GenerateService( tag_service_key, HC.TAG_REPOSITORY, 'tag repo', 100 ) )
+        
+        service_keys_to_access_keys = self._write( 'services', admin_account, services )
+        
+        account_key = self._read( 'account_key_from_access_key', tag_service_key, service_keys_to_access_keys[ tag_service_key ] )
+        
+        account = self._read( 'account', tag_service_key, account_key )
+        
+        # one tag's hashes need more than one 25,000-strong chunk
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( 25010 ) ]
+        
+        tags_to_hashes = {}
+        
+        tags_to_hashes[ 'lots' ] = hashes
+        tags_to_hashes[ 'some' ] = hashes[ : 300 ]
+        tags_to_hashes[ 'series:few' ] = hashes[ 5 : 10 ]
+        
+        deleted_tags_to_hashes = { 'some' : hashes[ 100 : 200 ] }
+        
+        begin = HydrusData.GetNow()
+        
+        client_to_server_update = HydrusNetwork.ClientToServerUpdate()
+        
+        for ( tag, tag_hashes ) in tags_to_hashes.items():
+            
+            client_to_server_update.AddContent( HC.CONTENT_UPDATE_PEND, HydrusNetwork.Content( HC.CONTENT_TYPE_MAPPINGS, ( tag, tag_hashes ) ) )
+            
+        
+        self._write( 'update', tag_service_key, account, client_to_server_update )
+        
+        client_to_server_update = HydrusNetwork.ClientToServerUpdate()
+        
+        for ( tag, tag_hashes ) in deleted_tags_to_hashes.items():
+            
+            client_to_server_update.AddContent( HC.CONTENT_UPDATE_PETITION, HydrusNetwork.Content( HC.CONTENT_TYPE_MAPPINGS, ( tag, tag_hashes ) ), 'test' )
+            
+        
+        self._write( 'update', tag_service_key, account, client_to_server_update )
+        
+        end = HydrusData.GetNow()
+        
+        updates = self._read( 'immediate_update', tag_service_key, account, begin, end )
+        
+        hash_ids_to_hashes = {}
+        tag_ids_to_tags = {}
+        
+        new_mappings = []
+        deleted_mappings = []
+        
+        for update in updates:
+            
+            if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
+                
+                hash_ids_to_hashes.update( update.GetHashIdsToHashes() )
+                tag_ids_to_tags.update( update.GetTagIdsToTags() )
+                
+            else:
+                
+                new_mappings.extend( update.GetNewMappings() )
+                deleted_mappings.extend( update.GetDeletedMappings() )
+                
+            
+        
+        def convert_to_tags_to_chunks( mappings ):
+            
+            tags_to_chunks = collections.defaultdict( list )
+            
+            for ( tag_id, hash_ids ) in mappings:
+                
+                tags_to_chunks[ tag_ids_to_tags[ tag_id ] ].append( { hash_ids_to_hashes[ hash_id ] for hash_id in hash_ids } )
+                
+            
+            return tags_to_chunks
+            
+        
+        def check_against_old_grouping( mappings, expected_tags_to_hashes ):
+            
+            # the old way grouped every tag's hashes into one dict up front and then split each list into chunks
+            
+            tags_to_chunks = convert_to_tags_to_chunks( mappings )
+            
+            self.assertEqual( set( tags_to_chunks.keys() ), set( expected_tags_to_hashes.keys() ) )
+            
+            for ( tag, expected_hashes ) in expected_tags_to_hashes.items():
+                
+                chunks = tags_to_chunks[ tag ]
+                
+                expected_chunks = HydrusData.SplitListIntoChunks( expected_hashes, 25000 )
+                
+                self.assertEqual( sorted( len( chunk ) for chunk in chunks ), sorted( len( chunk ) for chunk in expected_chunks ) )
+                self.assertEqual( set( itertools.chain.from_iterable( chunks ) ), set( expected_hashes ) )
+                
+            
+        
+        current_tags_to_hashes = { tag : [ hash for hash in tag_hashes if hash not in deleted_tags_to_hashes.get( tag, [] ) ] for ( tag, tag_hashes ) in tags_to_hashes.items() }
+        
+        check_against_old_grouping( new_mappings, current_tags_to_hashes )
+        check_against_old_grouping( deleted_mappings, deleted_tags_to_hashes )
+        
+        self.assertEqual( len( convert_to_tags_to_chunks( new_mappings )[ 'lots' ] ), 2 )
+        
+    
     def _test_service_creation( self ):
         
         self._tag_service_key = HydrusData.GenerateKey()
@@ -1337,6 +1711,8 @@ class TestServerDB( unittest.TestCase ):
         
         self._test_init_server_admin()
         
+        self._test_repository_updates()
+        
         # broke since service rewrite
         #self._test_service_creation()
         
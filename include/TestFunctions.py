@@ -5,6 +5,8 @@ import os
 import TestConstants
 import unittest
 import HydrusData
+import HydrusDB
+import HydrusPubSub
 import ClientConstants as CC
 
 class TestFunctions( unittest.TestCase ):
@@ -41,6 +43,93 @@ class TestFunctions( unittest.TestCase ):
         self.assertEqual( ClientData.ConvertServiceKeysToTagsToServiceKeysToContentUpdates( { hash }, service_keys_to_tags ), content_updates )
         
     
+    def test_db_job_metrics( self ):
+        
+        job_metrics = HydrusDB.JobMetrics()
+        
+        for i in range( 100 ):
+            
+            job_metrics.ReportJob( 'media_results', 0.001, 0.01 if i < 90 else 1.0, 5, i % 2 == 0 )
+            
+        
+        job_metrics.ReportJob( 'file_query_ids', 0.0, 100000.0, HydrusDB.GetResultNumRows( None ), False )
+        
+        snapshot = { row[0] : row[1:] for row in job_metrics.GetSnapshot() }
+        
+        ( num_jobs, num_concurrent, queue_times, execution_times, num_rows ) = snapshot[ 'media_results' ]
+        
+        self.assertEqual( num_jobs, 100 )
+        self.assertEqual( num_concurrent, 50 )
+        self.assertEqual( num_rows, 500 )
+        
+        # percentiles are the tops of sqrt( 2 )-wide buckets
+        
+        for ( t, expected ) in zip( queue_times + execution_times, ( 0.001, 0.001, 0.001, 0.01, 1.0, 1.0 ) ):
+            
+            self.assertTrue( expected <= t < expected * 1.5 )
+            
+        
+        ( num_jobs, num_concurrent, queue_times, execution_times, num_rows ) = snapshot[ 'file_query_ids' ]
+        
+        self.assertEqual( num_rows, 0 )
+        self.assertEqual( execution_times, ( HydrusDB.JOB_METRICS_BUCKET_BOUNDARIES[-1], ) * 3 )
+        
+        self.assertEqual( len( job_metrics.GetSnapshot( all_time = True ) ), 2 )
+        
+    
+    def test_pubsub( self ):
+        
+        class Listener( object ):
+            
+            def __init__( self ):
+                
+                self.calls = []
+                
+            
+            def Hear( self, *args ):
+                
+                self.calls.append( args )
+                
+            
+        
+        pubsub = HydrusPubSub.HydrusPubSub( None )
+        
+        listener = Listener()
+        
+        pubsub.sub( listener, 'Hear', 'refresh_query' )
+        pubsub.sub( listener, 'Hear', 'refresh_query' )
+        pubsub.sub( listener, 'Hear', 'undo' )
+        
+        page_key = HydrusData.GenerateKey()
+        
+        for i in range( 3 ):
+            
+            pubsub.pub( 'refresh_query', page_key )
+            pubsub.pub( 'undo' )
+            
+        
+        pubsub.pub( 'refresh_query', [ page_key ] )
+        
+        pubsub.Process()
+        
+        self.assertEqual( listener.calls, [ (), (), ( page_key, ), (), ( [ page_key ], ) ] )
+        
+        stats = { row[0] : row[1:4] for row in pubsub.GetTopicStats() }
+        
+        self.assertEqual( stats[ 'refresh_query' ], ( 4, 2, 2 ) )
+        self.assertEqual( stats[ 'undo' ], ( 3, 0, 3 ) )
+        
+        del listener
+        
+        pubsub.pub( 'undo' )
+        
+        pubsub.Process()
+        
+        stats = { row[0] : row[1:4] for row in pubsub.GetTopicStats() }
+        
+        self.assertEqual( stats[ 'undo' ], ( 4, 0, 3 ) )
+        
+    
     def test_number_conversion( self ):
         
         i = 123456789
@@ -522,3 +522,46 @@ class TestBandwidthTracker( unittest.TestCase ):
             
         
     
+    def test_bandwidth_tracker_history( self ):
+        
+        bandwidth_tracker = HydrusNetworking.BandwidthTracker()
+        
+        now = HydrusData.GetNow()
+        
+        for seconds_ago in ( 300, 30, 20 ):
+            
+            with patch.object( HydrusData, 'GetNow', return_value = now - seconds_ago ):
+                
+                bandwidth_tracker.ReportDataUsed( 1024 )
+                bandwidth_tracker.ReportRequestUsed()
+                
+            
+        
+        with patch.object( HydrusData, 'GetNow', return_value = now ):
+            
+            self.assertEqual( bandwidth_tracker.GetUsage( HC.BANDWIDTH_TYPE_REQUESTS, 25 ), 1 )
+            self.assertEqual( bandwidth_tracker.GetUsage( HC.BANDWIDTH_TYPE_REQUESTS, 60 ), 2 )
+            self.assertEqual( bandwidth_tracker.GetUsage( HC.BANDWIDTH_TYPE_DATA, 60 ), 2048 )
+            
+            self.assertEqual( bandwidth_tracker.GetWaitingEstimate( HC.BANDWIDTH_TYPE_REQUESTS, 60, 1 ), 40 )
+            self.assertEqual( bandwidth_tracker.GetWaitingEstimate( HC.BANDWIDTH_TYPE_REQUESTS, 60, 2 ), 30 )
+            self.assertEqual( bandwidth_tracker.GetWaitingEstimate( HC.BANDWIDTH_TYPE_REQUESTS, 60, 3 ), 0 )
+            
+            dupe_bandwidth_tracker = bandwidth_tracker.Duplicate()
+            
+            for time_delta in ( 1, 25, 60, 3600, 86400, None ):
+                
+                self.assertEqual( dupe_bandwidth_tracker.GetUsage( HC.BANDWIDTH_TYPE_DATA, time_delta ), bandwidth_tracker.GetUsage( HC.BANDWIDTH_TYPE_DATA, time_delta ) )
+                self.assertEqual( dupe_bandwidth_tracker.GetUsage( HC.BANDWIDTH_TYPE_REQUESTS, time_delta ), bandwidth_tracker.GetUsage( HC.BANDWIDTH_TYPE_REQUESTS, time_delta ) )
+                
+            
+        
+        # the seconds history only goes back a few minutes
+        
+        with patch.object( HydrusData, 'GetNow', return_value = now + 600 ):
+            
+            self.assertEqual( bandwidth_tracker.GetUsage( HC.BANDWIDTH_TYPE_REQUESTS, 200 ), 0 )
+            self.assertEqual( bandwidth_tracker.GetUsage( HC.BANDWIDTH_TYPE_REQUESTS, 3600 ), 3 )
+            
+        
+    
@@ -1,6 +1,7 @@
 import collections
 import HydrusConstants as HC
 import HydrusTags
+from mock import patch
 import os
 import TestConstants
 import unittest
@@ -677,6 +678,41 @@ class TestTagParents( unittest.TestCase ):
         self.assertEqual( self._tag_parents_manager.ExpandTags( CC.COMBINED_TAG_SERVICE_KEY, [ 'pending_b' ] ), { 'pending_b' } )
         
     
+    def test_refresh( self ):
+        
+        old_tag_parents = HG.test_controller.Read( 'tag_parents' )
+        
+        tag_parents_manager = ClientCaches.TagParentsManager( HG.client_controller )
+        
+        tag_parents = collections.defaultdict( HydrusData.default_dict_set )
+        
+        tag_parents[ self._first_key ][ HC.CONTENT_STATUS_CURRENT ] = { ( 'child', 'mother' ), ( 'new_child', 'new_parent' ) }
+        
+        HG.test_controller.SetRead( 'tag_parents', tag_parents )
+        
+        try:
+            
+            with patch.object( HG.test_controller, 'pub' ) as pub:
+                
+                tag_parents_manager.NotifyNewParents()
+                tag_parents_manager.RefreshParentsIfDirty()
+                
+            
+        finally:
+            
+            HG.test_controller.SetRead( 'tag_parents', old_tag_parents )
+            
+        
+        ( topic, changed_tags ) = pub.call_args[0]
+        
+        self.assertEqual( topic, 'notify_new_parents_gui' )
+        self.assertIn( 'new_child', changed_tags )
+        self.assertIn( 'sister', changed_tags )
+        self.assertNotIn( 'not_exist', changed_tags )
+        
+        self.assertEqual( tag_parents_manager.GetParents( self._first_key, 'new_child' ), [ 'new_parent' ] )
+        
+    
 class TestTagSiblings( unittest.TestCase ):
     
     @classmethod
@@ -773,6 +809,64 @@ class TestTagSiblings( unittest.TestCase ):
         self.assertEqual( self._tag_siblings_manager.CollapseTagsToCount( self._first_key, { 'deleted_a' : 10, 'deleted_b' : 5 } ), { 'deleted_a' : 10, 'deleted_b' : 5 } )
         
     
+    def test_incremental_refresh( self ):
+        
+        graph = ClientCaches.TagPairsGraph( ClientCaches.CollapseTagSiblingPairs )
+        
+        self.assertEqual( graph.SetPairs( [ { ( 'a', 'b' ), ( 'x', 'y' ) } ] ), { 'a' : ( None, 'b' ), 'x' : ( None, 'y' ) } )
+        self.assertEqual( graph.SetPairs( [ { ( 'a', 'b' ), ( 'x', 'y' ) } ] ), {} )
+        self.assertEqual( graph.SetPairs( [ { ( 'a', 'b' ), ( 'b', 'c' ), ( 'x', 'y' ) } ] ), { 'a' : ( 'b', 'c' ), 'b' : ( None, 'c' ) } )
+        self.assertEqual( graph.SetPairs( [ { ( 'b', 'c' ), ( 'x', 'y' ) } ] ), { 'a' : ( 'c', None ) } )
+        
+        self.assertEqual( graph.GetTagsToValues(), { 'b' : 'c', 'x' : 'y' } )
+        
+        #
+        
+        old_tag_siblings = HG.test_controller.Read( 'tag_siblings' )
+        
+        tag_siblings_manager = ClientCaches.TagSiblingsManager( HG.client_controller )
+        
+        tag_siblings = collections.defaultdict( HydrusData.default_dict_set )
+        
+        tag_siblings[ self._first_key ][ HC.CONTENT_STATUS_CURRENT ] = { ( 'chain_a', 'chain_b' ), ( 'chain_b', 'chain_c' ), ( 'chain_c', 'chain_d' ) }
+        
+        HG.test_controller.SetRead( 'tag_siblings', tag_siblings )
+        
+        try:
+            
+            with patch.object( HG.test_controller, 'pub' ) as pub:
+                
+                tag_siblings_manager.NotifyNewSiblings()
+                tag_siblings_manager.RefreshSiblingsIfDirty()
+                
+                topics_to_changed_tags = { call[0][0] : call[0][1] for call in pub.call_args_list if len( call[0] ) > 1 }
+                
+                pub.reset_mock()
+                
+                tag_siblings_manager.NotifyNewSiblings()
+                tag_siblings_manager.RefreshSiblingsIfDirty()
+                
+                self.assertEqual( [ call for call in pub.call_args_list if len( call[0] ) > 1 ], [] )
+                
+            
+        finally:
+            
+            HG.test_controller.SetRead( 'tag_siblings', old_tag_siblings )
+            
+        
+        self.assertEqual( set( topics_to_changed_tags.keys() ), { 'notify_new_siblings_tags_data', 'notify_new_siblings_gui' } )
+        self.assertEqual( topics_to_changed_tags[ 'notify_new_siblings_gui' ], topics_to_changed_tags[ 'notify_new_siblings_tags_data' ] )
+        self.assertIn( 'chain_a', topics_to_changed_tags[ 'notify_new_siblings_gui' ] )
+        self.assertNotIn( 'not_exist', topics_to_changed_tags[ 'notify_new_siblings_gui' ] )
+        
+        self.assertEqual( tag_siblings_manager.GetSibling( self._first_key, 'chain_a' ), 'chain_d' )
+        self.assertEqual( tag_siblings_manager.GetSibling( self._first_key, 'tree_1' ), None )
+        self.assertEqual( tag_siblings_manager.GetSibling( self._second_key, 'current_a' ), None )
+        
+        self.assertEqual( set( tag_siblings_manager.GetAllSiblings( self._first_key, 'chain_d' ) ), { 'chain_a', 'chain_b', 'chain_c', 'chain_d' } )
+        self.assertEqual( set( tag_siblings_manager.GetAllSiblings( self._first_key, 'tree_6' ) ), { 'tree_6' } )
+        
+    
     def test_no_loop( self ):
         
         self.assertEqual( self._tag_siblings_manager.GetSibling( self._first_key, 'closed_loop' ), None )
@@ -29,6 +29,7 @@ from include import TestClientImportOptions
 from include import TestClientImportSubscriptions
 from include import TestClientListBoxes
 from include import TestClientNetworking
+from include import TestClientParsing
 from include import TestConstants
 from include import TestDialogs
 from include import TestDB
@@ -54,6 +55,7 @@ from include import ClientCaches
 from include import ClientData
 from include import ClientOptions
 from include import HydrusData
+from include import HydrusDB
 from include import HydrusPaths
 
 only_run = None
@@ -96,6 +98,12 @@ class Controller( object ):
         
         HydrusData.ShowText = show_text
         
+        # the dbs log a table of their job metrics as they shut down, which is just noise for all the test dbs
+        
+        def dump_job_metrics( db ): pass
+        
+        HydrusDB.HydrusDB._DumpJobMetrics = dump_job_metrics
+        
         self._reads = {}
         
         self._reads[ 'local_booru_share_keys' ] = []
@@ -460,6 +468,7 @@ class Controller( object ):
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientConstants ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientData ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientImportOptions ) )
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestClientParsing ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestFunctions ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestHydrusSerialisable ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestHydrusSessions ) )
@@ -557,6 +566,19 @@ class Controller( object ):
                 return ( CC.STATUS_SUCCESSFUL_AND_NEW, '' )
                 
             
+        elif name == 'import_files':
+            
+            ( file_import_jobs, ) = args
+            
+            if True in ( file_import_job.GetHash().encode( 'hex' ) == 'a593942cb7ea9ffcd8ccf2f0fa23c338e23bfecd9a3e508dfc0bcf07501ead08' for file_import_job in file_import_jobs ):
+                
+                raise Exception( 'File failed to import for some reason!' )
+                
+            else:
+                
+                return [ ( CC.STATUS_SUCCESSFUL_AND_NEW, '' ) for file_import_job in file_import_jobs ]
+                
+            
         
     
 if __name__ == '__main__':